@@ -0,0 +1,310 @@
+"""
+Benchmark suite for file-manager-meta.
+
+Generates reproducible synthetic trees, times each command and the cache layer with a cold and a warm
+cache, and writes the results as JSON so runs can be compared between commits:
+
+    python benchmarks/run_benchmarks.py --output before.json
+    python benchmarks/run_benchmarks.py --output after.json --compare before.json
+
+"Cold" runs start from an empty application cache, "warm" runs reuse the cache left by the cold run.
+The OS page cache is not dropped, so both modes measure the application, not the disk.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from rich.console import Console
+from rich.table import Table
+
+from synthetic_tree import PROFILES, generate_tree
+
+console = Console()
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Silences the commands' console output and answers 'no' to any prompt."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        stdin = sys.stdin
+        sys.stdin = io.StringIO("n\n" * 100)
+        try:
+            yield
+        finally:
+            sys.stdin = stdin
+
+
+def _timed(fn) -> tuple[float, dict]:
+    """Runs fn and returns its wall time and the per-phase breakdown it recorded."""
+    from file_manager_meta.metrics import metrics
+    metrics.reset()
+    with _quiet():
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+    return elapsed, metrics.to_dict()
+
+
+def _phase_walk(tree: Path, work: Path):
+    from file_manager_meta.walker import walk_files
+    return lambda: sum(1 for _ in walk_files(tree))
+
+
+def _phase_cache(tree: Path, work: Path):
+    # The cache layer alone: a cold run hashes and stores every file, a warm run only looks them up
+    from file_manager_meta.cache_manager import init_cache
+    from file_manager_meta.hashes import calculate_hashes
+    from file_manager_meta.walker import walk_files
+
+    def run():
+        conn, _ = init_cache(tree)
+        try:
+            for record in walk_files(tree):
+                calculate_hashes(record, conn)
+        finally:
+            conn.close()
+    return run
+
+
+def _phase_report(tree: Path, work: Path):
+    from file_manager_meta.report import generate_report
+    return lambda: generate_report(tree)
+
+
+def _phase_deduplicate(tree: Path, work: Path):
+    from file_manager_meta.deduplicate import deduplicate_files
+    return lambda: deduplicate_files(tree, dry_run=True, keep_rule="oldest")
+
+
+def _phase_deduplicate_threads(tree: Path, work: Path):
+    from file_manager_meta.deduplicate import deduplicate_files
+    return lambda: deduplicate_files(tree, dry_run=True, keep_rule="oldest", executor_kind="threads")
+
+
+def _phase_sort(tree: Path, work: Path):
+    # sort moves files, so it runs on a fresh copy each time
+    from file_manager_meta.sort import organizer
+    return lambda: organizer(work, work, "ext")
+
+
+def _phase_repair(tree: Path, work: Path):
+    from file_manager_meta.repair import repair_extension
+    return lambda: repair_extension([work])
+
+
+PHASES = {
+    "walk": (_phase_walk, False),
+    "cache": (_phase_cache, False),
+    "report": (_phase_report, False),
+    "deduplicate": (_phase_deduplicate, False),
+    "deduplicate_threads": (_phase_deduplicate_threads, False),
+    "sort": (_phase_sort, True),
+    "repair": (_phase_repair, True),
+}
+
+
+# Modules a bare `import file_manager_meta.cli` must not load; each command imports its own
+LAZY_MODULES = [
+    "sqlite3", "exiftool", "concurrent.futures",
+    "file_manager_meta.cache_manager", "file_manager_meta.deduplicate", "file_manager_meta.metadata_updater",
+    "file_manager_meta.repair", "file_manager_meta.report", "file_manager_meta.sort", "file_manager_meta.watcher",
+]
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import file_manager_meta.cli
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def measure_startup(base: Path, repeat: int) -> dict:
+    """Times the CLI import and a full `cache path` run in fresh interpreters, and lists eagerly loaded modules."""
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).resolve().parent.parent / "src"), XDG_CACHE_HOME=str(base / "cache_startup"))
+    import_times, cache_path_times = [], []
+    loaded = []
+    for _ in range(max(repeat, 3)):
+        probe = subprocess.run([sys.executable, "-c", _IMPORT_PROBE], capture_output=True, text=True, check=True, env=env)
+        result = json.loads(probe.stdout)
+        import_times.append(result["seconds"])
+        loaded = result["loaded"]
+
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "file_manager_meta.cli", "cache", "path", str(base)],
+                       capture_output=True, check=True, env=env)
+        cache_path_times.append(time.perf_counter() - start)
+    startup = {"import_seconds": min(import_times), "cache_path_seconds": min(cache_path_times), "eagerly_loaded": loaded}
+    console.print(f"  startup: import {startup['import_seconds']:.3f}s, `cache path` {startup['cache_path_seconds']:.3f}s")
+    if loaded:
+        console.print(f"  [red]Loaded at CLI import time: {', '.join(loaded)}[/red]")
+    return startup
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _tree_stats(tree: Path) -> tuple[int, int]:
+    files = 0
+    total = 0
+    for dir_path, _, file_names in os.walk(tree):
+        for name in file_names:
+            files += 1
+            total += os.path.getsize(os.path.join(dir_path, name))
+    return files, total
+
+
+def run_profile(profile: str, phases: list[str], base: Path, seed: int, scale: float, repeat: int) -> dict:
+    tree = generate_tree(base / profile / "tree", profile, seed=seed, scale=scale)
+    files, total_bytes = _tree_stats(tree)
+    result = {"files": files, "bytes": total_bytes, "phases": {}}
+
+    for phase in phases:
+        make_runner, mutates_tree = PHASES[phase]
+        if phase == "repair" and not shutil.which("exiftool"):
+            result["phases"][phase] = {"skipped": "exiftool not found in PATH"}
+            continue
+
+        timings = {"cold": [], "warm": []}
+        details = {}
+        for _ in range(repeat):
+            cache_home = base / profile / f"cache_{phase}"
+            shutil.rmtree(cache_home, ignore_errors=True)
+            os.environ["XDG_CACHE_HOME"] = str(cache_home)
+            for mode in ("cold", "warm"):
+                work = base / profile / "work"
+                if mutates_tree:
+                    # Same path every time so the warm run finds the cold run's cache entries
+                    shutil.rmtree(work, ignore_errors=True)
+                    shutil.copytree(tree, work)
+                elapsed, detail = _timed(make_runner(tree, work))
+                timings[mode].append(elapsed)
+                if elapsed == min(timings[mode]):
+                    details[mode] = {key: detail[key] for key in ("phases", "timers", "counters", "derived")}
+        # The fastest run is the least disturbed by unrelated system activity
+        result["phases"][phase] = {mode: min(values) for mode, values in timings.items()}
+        result["phases"][phase]["detail"] = details
+        console.print(f"  {profile:20} {phase:20} cold {result['phases'][phase]['cold']:8.3f}s   "
+                      f"warm {result['phases'][phase]['warm']:8.3f}s")
+    return result
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_seconds: float) -> bool:
+    """Prints a comparison table. Returns True if any phase regressed beyond the threshold."""
+    table = Table(title=f"Comparison with {baseline['meta'].get('commit') or 'baseline'}")
+    table.add_column("Profile")
+    table.add_column("Phase")
+    table.add_column("Mode")
+    table.add_column("Baseline", justify="right")
+    table.add_column("Current", justify="right")
+    table.add_column("Change", justify="right")
+
+    regressed = False
+    startup, old_startup = current.get("startup"), baseline.get("startup")
+    if startup:
+        if startup["eagerly_loaded"]:
+            regressed = True
+        if old_startup:
+            for key in ("import_seconds", "cache_path_seconds"):
+                old, new = old_startup[key], startup[key]
+                change = (new - old) / old if old else 0.0
+                is_regression = change > threshold and new - old > min_seconds / 10
+                regressed |= is_regression
+                change_text = f"[red]{change:+.1%}[/red]" if is_regression else f"{change:+.1%}"
+                table.add_row("startup", key.removesuffix("_seconds"), "-", f"{old:.3f}s", f"{new:.3f}s", change_text)
+
+    for profile, result in current["results"].items():
+        old_phases = baseline["results"].get(profile, {}).get("phases", {})
+        for phase, timings in result["phases"].items():
+            for mode in ("cold", "warm"):
+                old = old_phases.get(phase, {}).get(mode)
+                new = timings.get(mode)
+                if old is None or new is None:
+                    continue
+                change = (new - old) / old if old else 0.0
+                is_regression = change > threshold and new - old > min_seconds
+                regressed |= is_regression
+                change_text = f"{change:+.1%}"
+                if is_regression:
+                    change_text = f"[red]{change_text}[/red]"
+                elif change < -threshold:
+                    change_text = f"[green]{change_text}[/green]"
+                table.add_row(profile, phase, mode, f"{old:.3f}s", f"{new:.3f}s", change_text)
+    console.print(table)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark file-manager-meta on synthetic trees.")
+    parser.add_argument("--profile", action="append", choices=sorted(PROFILES), help="Tree profile (repeatable, default: all).")
+    parser.add_argument("--phase", action="append", choices=list(PHASES), help="Phase to time (repeatable, default: all).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the tree generator.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for file counts and sizes.")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per phase; the fastest is kept.")
+    parser.add_argument("--workdir", type=Path, help="Where trees are generated (default: a temporary directory).")
+    parser.add_argument("--output", type=Path, help="Write results as JSON to this file.")
+    parser.add_argument("--compare", type=Path, help="Baseline JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown reported as a regression.")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="Ignore regressions smaller than this.")
+    parser.add_argument("--skip-startup", action="store_true", help="Don't measure CLI startup time.")
+    args = parser.parse_args()
+
+    profiles = args.profile or list(PROFILES)
+    phases = args.phase or list(PHASES)
+    base = args.workdir or Path(tempfile.mkdtemp(prefix="fmm_bench_"))
+
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "seed": args.seed,
+            "scale": args.scale,
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    try:
+        if not args.skip_startup:
+            console.print("[cyan]CLI startup[/cyan]")
+            results["startup"] = measure_startup(base, args.repeat)
+        for profile in profiles:
+            console.print(f"[cyan]Profile {profile}[/cyan]")
+            results["results"][profile] = run_profile(profile, phases, base, args.seed, args.scale, args.repeat)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(base, ignore_errors=True)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        console.print(f"Results written to [green]{args.output}[/green]")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if compare(results, baseline, args.threshold, args.min_seconds):
+            sys.exit(1)
+    elif results.get("startup", {}).get("eagerly_loaded"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
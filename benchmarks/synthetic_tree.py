@@ -0,0 +1,79 @@
+"""Reproducible synthetic directory trees for the benchmark suite."""
+import random
+from pathlib import Path
+
+# Headers ExifTool recognises, so extensionless files can be repaired
+MEDIA_HEADERS = {
+    "jpg": b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00",
+    "png": b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00",
+    "pdf": b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n",
+}
+EXTENSIONS = ["txt", "jpg", "png", "pdf", "mp4", "log", "csv"]
+
+
+def _write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def many_small(root: Path, rng: random.Random, scale: float):
+    """Thousands of small files spread over a flat set of directories."""
+    for i in range(int(5000 * scale)):
+        ext = rng.choice(EXTENSIONS)
+        _write(root / f"dir{i % 50:03d}" / f"file{i:06d}.{ext}", rng.randbytes(rng.randint(0, 8192)))
+
+
+def few_huge(root: Path, rng: random.Random, scale: float):
+    """A handful of large files, two of them identical."""
+    size = int(64 * 1024 * 1024 * scale)
+    shared = rng.randbytes(size)
+    _write(root / "huge_a.bin", shared)
+    _write(root / "huge_b.bin", shared)
+    for i in range(2):
+        _write(root / f"huge_unique{i}.bin", rng.randbytes(size))
+
+
+def heavy_duplication(root: Path, rng: random.Random, scale: float):
+    """Few distinct contents, each copied many times, plus same-size files that differ."""
+    contents = [rng.randbytes(rng.randint(1024, 256 * 1024)) for _ in range(20)]
+    for i in range(int(2000 * scale)):
+        data = contents[i % len(contents)]
+        if i % 7 == 0:
+            # Same size as a duplicate group but different content in the last byte
+            data = data[:-1] + bytes([(data[-1] + 1) % 256])
+        _write(root / f"copies{i % 40:02d}" / f"copy{i:05d}.dat", data)
+
+
+def deep_nesting(root: Path, rng: random.Random, scale: float):
+    """Long directory chains with a few files at every level."""
+    for chain in range(int(20 * scale) or 1):
+        current = root / f"chain{chain:02d}"
+        for depth in range(40):
+            current = current / f"level{depth:02d}"
+            for i in range(3):
+                _write(current / f"f{i}.txt", rng.randbytes(rng.randint(0, 2048)))
+
+
+def extensionless_media(root: Path, rng: random.Random, scale: float):
+    """Media files whose extension was lost, for repair and sort's no-extension path."""
+    kinds = list(MEDIA_HEADERS)
+    for i in range(int(500 * scale)):
+        kind = kinds[i % len(kinds)]
+        _write(root / f"media{i % 10}" / f"IMG_{i:05d}", MEDIA_HEADERS[kind] + rng.randbytes(rng.randint(512, 64 * 1024)))
+
+
+PROFILES = {
+    "many_small": many_small,
+    "few_huge": few_huge,
+    "heavy_duplication": heavy_duplication,
+    "deep_nesting": deep_nesting,
+    "extensionless_media": extensionless_media,
+}
+
+
+def generate_tree(root: Path, profile: str, seed: int = 0, scale: float = 1.0) -> Path:
+    """Creates the tree for a profile under root. The same seed and scale always produce the same bytes."""
+    rng = random.Random(f"{profile}:{seed}")
+    root.mkdir(parents=True, exist_ok=True)
+    PROFILES[profile](root, rng, scale)
+    return root
@@ -0,0 +1,484 @@
+import time
+from functools import partial
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+
+from file_manager_meta.cache_manager import CacheWriter, init_cache, rename_cached_files
+from file_manager_meta.deduplicate import match_candidates, iter_verified_sets, order_by_keep_rule
+from file_manager_meta.deletion import create_trash_run, iter_removals
+from file_manager_meta.enums import PipelineStage
+from file_manager_meta.ingest import LibraryIndex, check_quarantine_dir, iter_library_matches, quarantine_file
+from file_manager_meta.layout import resolve_read_order
+from file_manager_meta.metadata_updater import collect_files, iter_metadata_updates
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.repair import detect_file_types
+from file_manager_meta.report import hash_file_for_report
+from file_manager_meta.scan_store import MemoryScanStore, open_scan_store
+from file_manager_meta.scheduler import open_executor, schedule
+from file_manager_meta.scrub import iter_scrub
+from file_manager_meta.sharding import combine_shards, drop_changed_files, open_shards
+from file_manager_meta.similarity import scan_similarity
+from file_manager_meta.sort import sort_file, iter_empty_directory_removals
+from file_manager_meta.throttle import throttle_open
+from file_manager_meta.tuning import tune
+from file_manager_meta.walker import walk_files, is_excluded_file
+
+# Headless entry points for using the package as a library: generators of plain result objects that
+# never print, prompt or draw progress bars. The CLI commands are the rich presentation of the same steps.
+
+# Error of a Move for a file that sort_files() leaves alone because it has no extension
+NO_EXTENSION = "no extension"
+
+
+class HashedFile(NamedTuple):
+    path: Path
+    size: int
+    md5: str | None  # The digests are None if the file couldn't be read
+    sha1: str | None
+    sha256: str | None
+
+
+class DuplicateSet(NamedTuple):
+    size: int
+    keep: FileRecord  # The file the keep rule keeps
+    duplicates: list[FileRecord]
+
+
+class Removal(NamedTuple):
+    path: Path
+    error: str | None  # None if the file was deleted or moved to the trash
+
+
+class Move(NamedTuple):
+    source: Path
+    destination: Path | None  # None if the file wasn't moved
+    error: str | None
+
+
+class ScrubbedFile(NamedTuple):
+    path: Path
+    size: int
+    outcome: str  # 'verified', 'mismatch' (content changed behind its cached digests), 'unreadable' or 'changed'
+
+
+class SimilarPair(NamedTuple):
+    files: list[Path]  # A file and any identical to it
+    similar_files: list[Path]
+    shared_bytes: int
+    similarity: float  # Share of the two files' distinct content they have in common
+    containment: float  # Share of the smaller file's distinct content found in the other
+
+
+class SimilarityReport(NamedTuple):
+    pairs: list[SimilarPair]  # Most similar first
+    files_scanned: int
+    identical_groups: int
+    total_bytes: int
+    whole_file_savings: int  # What removing identical files would save
+    block_level_savings: int  # Estimate of what block-level deduplication would save
+
+
+class MetadataUpdate(NamedTuple):
+    path: Path
+    outcome: str  # 'updated', 'dry_run', 'skipped' or 'error'
+    message: str
+
+
+class IngestedFile(NamedTuple):
+    path: Path
+    library_file: Path | None  # The library file with the same content, None for a new file
+    quarantined_to: Path | None  # Where the duplicate was moved, with a quarantine_dir
+    error: str | None  # Why the file couldn't be read (it then counts as new) or quarantined
+
+
+class PipelineResult(NamedTuple):
+    stage: str  # The PipelineStage that produced the result
+    result: Move | DuplicateSet | Removal | HashedFile
+
+
+def iter_files(directory: Path) -> Iterator[FileRecord]:
+    """Yields a FileRecord for every regular file under directory, skipping system and hidden entries."""
+    return walk_files(directory)
+
+
+def hash_files(directory: Path, read_order: str = "auto", device_workers: int | None = None,
+               executor_kind: str = "processes") -> Iterator[HashedFile]:
+    """Yields the MD5, SHA-1 and SHA-256 of every file under directory as each is hashed, using and filling the cache."""
+    read_order = resolve_read_order(directory, read_order)
+    init_cache(directory)[0].close()  # Creates the database before workers open it
+    with metrics.phase("walk"):
+        records = list(walk_files(directory))
+    workers = tune(directory).workers
+    writer = CacheWriter(directory) if executor_kind == "threads" else None
+    hash_file = partial(hash_file_for_report, root_directory=directory, writer=writer)
+    try:
+        with open_executor(executor_kind, workers) as executor, metrics.pool(workers), metrics.phase("hashing"):
+            for record, hashes in schedule(executor, hash_file, records, workers, lambda r: r.size,
+                                           largest_first=read_order == "size", read_order=read_order,
+                                           device_workers=device_workers):
+                yield HashedFile(record.path, record.size, hashes.get("md5"), hashes.get("sha1"), hashes.get("sha256"))
+    finally:
+        if writer:
+            writer.close()
+
+
+def find_duplicates(directory: Path, keep_rule: str = "oldest", verify: bool = False, tree_hash: bool = False,
+                    memory_limit_mb: int | None = None, read_order: str = "auto", device_workers: int | None = None,
+                    executor_kind: str = "processes") -> Iterator[DuplicateSet]:
+    """
+    Yields every set of files under directory with the same content, the same way as 'deduplicate --dry-run'.
+    Nothing is deleted; pass the sets to remove_duplicates() for that.
+    """
+    read_order = resolve_read_order(directory, read_order)
+    init_cache(directory)[0].close()
+    store = open_scan_store(memory_limit_mb)
+    writer = None
+    try:
+        with metrics.phase("walk"):
+            store.add_all(walk_files(directory))
+        workers = tune(directory, device_workers).workers
+        writer = CacheWriter(directory) if executor_kind == "threads" else None
+        with open_executor(executor_kind, workers) as executor, metrics.pool(workers):
+            if not match_candidates(executor, workers, store, directory, None, writer, tree_hash, read_order,
+                                     device_workers):
+                return
+            if writer:
+                writer.close()
+                writer = None
+            if verify:
+                duplicate_sets = iter_verified_sets(executor, store.iter_duplicate_sets(), workers, read_order,
+                                                     device_workers)
+            else:
+                duplicate_sets = (files for _, files in store.iter_duplicate_sets())
+            for files in duplicate_sets:
+                order_by_keep_rule(files, keep_rule)
+                yield DuplicateSet(files[0].size, files[0], files[1:])
+    finally:
+        if writer:
+            writer.close()
+        store.close()
+
+
+def remove_duplicates(directory: Path, duplicate_sets: Iterable[DuplicateSet],
+                      trash_dir: Path | None = None) -> Iterator[Removal]:
+    """
+    Deletes the duplicates of each set (keeping set.keep), or moves them into a new staging directory in
+    trash_dir, yielding the outcome of each file; a file that fails doesn't stop the rest. Raises
+    ValueError if trash_dir isn't on the same filesystem as directory.
+    """
+    staging_dir = create_trash_run(directory, trash_dir) if trash_dir else None
+    conn, _ = init_cache(directory, check_same_thread=False)
+    try:
+        paths = (record.path for duplicate_set in duplicate_sets for record in duplicate_set.duplicates)
+        for path, error in iter_removals(paths, directory, staging_dir, conn):
+            yield Removal(path, error)
+    finally:
+        conn.close()
+
+
+def sort_files(directory: Path, new_directory: Path | None = None, sort_by: str = "ext",
+               date_granularity: str | None = None) -> Iterator[Move]:
+    """
+    Moves every file under directory into new_directory (default: directory) by extension, date or size,
+    yielding each move, then removes the directories left empty. Files without an extension aren't moved.
+    """
+    new_directory = new_directory or directory
+    # Collected up front so files moved into new_directory are never walked again
+    with metrics.phase("walk"):
+        records = list(walk_files(directory))
+    conn, _ = init_cache(directory, check_same_thread=False)
+    moves = []
+    try:
+        with metrics.phase("move"):
+            for record in records:
+                if not record.path.suffix:
+                    yield Move(record.path, None, NO_EXTENSION)
+                    continue
+                try:
+                    new_directory.mkdir(exist_ok=True)
+                    destination = sort_file(record, new_directory, sort_by, date_granularity)
+                except OSError as e:
+                    yield Move(record.path, None, str(e))
+                    continue
+                if destination:
+                    moves.append((record.path, destination))
+                yield Move(record.path, destination, None)
+    finally:
+        # The cached hashes follow the moved files, as in the pipeline's sort stage
+        rename_cached_files(conn, moves)
+        conn.close()
+    with metrics.phase("cleanup"):
+        for _ in iter_empty_directory_removals(directory):
+            pass
+
+
+def repair_extensions(paths: Iterable[Path]) -> Iterator[Move]:
+    """
+    Gives every file without an extension under paths (files or directories) the extension of its
+    real type, found in the cache or with ExifTool, yielding each rename.
+    """
+    paths = list(paths)
+    if not paths:
+        return
+    root_directory = paths[0] if paths[0].is_dir() else paths[0].parent
+    records = []
+    with metrics.phase("walk"):
+        for path in paths:
+            if path.is_dir():
+                records.extend(walk_files(path))
+            elif path.is_file() and not is_excluded_file(path, root_directory) and not path.is_symlink():
+                records.append(FileRecord.from_path(path))
+    missing = [record for record in records if not record.path.suffix]
+    if not missing:
+        return
+    conn, _ = init_cache(root_directory, check_same_thread=False)
+    try:
+        yield from _rename_to_detected_types(conn, missing)
+    finally:
+        conn.close()
+
+
+def _rename_to_detected_types(conn, missing: list[FileRecord], dry_run: bool = False) -> Iterator[Move]:
+    """
+    Gives each file the extension of its real type, yielding each rename; renamed records get their new path.
+    In a dry run nothing is renamed, and each file is yielded with the name it would get.
+    """
+    try:
+        file_types = detect_file_types(conn, missing)
+    except Exception as e:
+        for record in missing:
+            yield Move(record.path, None, f"ExifTool failed: {e}")
+        return
+    renames = []
+    try:
+        with metrics.phase("rename"):
+            for record in missing:
+                new_extension = file_types.get(record.path)
+                if not new_extension:
+                    yield Move(record.path, None, "file type not found")
+                    continue
+                new_path = record.path.with_suffix(f".{new_extension}")
+                if dry_run:
+                    yield Move(record.path, new_path, None)
+                    continue
+                if new_path.exists():
+                    yield Move(record.path, None, f"{new_path.name} already exists")
+                    continue
+                source = record.path
+                try:
+                    throttle_open()
+                    source.rename(new_path)
+                except OSError as e:
+                    yield Move(source, None, str(e))
+                    continue
+                metrics.count("files_renamed")
+                renames.append((source, new_path))
+                record.path = new_path
+                yield Move(source, new_path, None)
+    finally:
+        # The cached hashes follow the renamed files
+        rename_cached_files(conn, renames)
+
+
+def scrub_files(directory: Path, max_bytes: int | None = None, max_seconds: float | None = None,
+                executor_kind: str = "processes") -> Iterator[ScrubbedFile]:
+    """
+    Rereads the unchanged files of directory's cache, least recently verified first and within the byte and/or
+    time budget, yielding whether each still has its cached digests, the same way as 'scrub'. The cached
+    digests of files that no longer match are dropped.
+    """
+    conn, _ = init_cache(directory, check_same_thread=False)
+    try:
+        for record, outcome in iter_scrub(directory, conn, int(time.time()), max_bytes, max_seconds, executor_kind,
+                                          {"missing": 0, "changed": 0}):
+            yield ScrubbedFile(record.path, record.size, outcome)
+    finally:
+        conn.close()
+
+
+def find_similar(directory: Path, threshold: float = 0.5, read_order: str = "auto", device_workers: int | None = None,
+                 executor_kind: str = "processes", memory_limit_mb: int | None = None) -> SimilarityReport:
+    """Finds the pairs of files under directory sharing at least threshold of their content, the same way as 'similar'."""
+    scan = scan_similarity(directory, threshold, None, read_order, device_workers, executor_kind, memory_limit_mb)
+    pairs = [SimilarPair(scan.groups[a], scan.groups[b], shared_bytes, similarity, containment)
+             for similarity, containment, shared_bytes, a, b in scan.pairs]
+    return SimilarityReport(pairs, sum(len(paths) for paths in scan.groups),
+                            sum(1 for paths in scan.groups if len(paths) > 1), scan.total_bytes,
+                            scan.whole_file_savings, scan.total_bytes - scan.unique_chunk_bytes)
+
+
+def find_sharded_duplicates(directory: Path, shard_files: list[Path], keep_rule: str = "oldest",
+                            memory_limit_mb: int | None = None, executor_kind: str = "processes") -> Iterator[DuplicateSet]:
+    """
+    Yields the duplicate sets of a sharded scan of directory, combining its shard files the same way as 'merge'.
+    Files changed since their shard was scanned are left out. Raises ValueError if the shard files aren't
+    all the shards of one scan of directory.
+    """
+    shards = open_shards(directory, shard_files)
+    store = open_scan_store(memory_limit_mb)
+    try:
+        combine_shards(directory, shards, store, executor_kind)
+        for files in drop_changed_files(files for _, files in store.iter_duplicate_sets()):
+            order_by_keep_rule(files, keep_rule)
+            yield DuplicateSet(files[0].size, files[0], files[1:])
+    finally:
+        store.close()
+        for conn, _ in shards:
+            conn.close()
+
+
+def update_metadata_dates(paths: Iterable[Path], dry_run: bool = False, tag: str | None = None, no_backup: bool = False,
+                          force: bool = False) -> Iterator[MetadataUpdate]:
+    """
+    Sets the date tags of every file under paths (files or directories, hidden files included) to the date
+    in its name, yielding the outcome of each, the same way as 'update-metadata-date'.
+    """
+    root_directory, records, errors = collect_files(list(paths))
+    for path, error in errors:
+        yield MetadataUpdate(path, "error", f"Error accessing {path}: {error}")
+    if not records:
+        return
+    for record, (outcome, _, message) in iter_metadata_updates(records, root_directory, dry_run=dry_run, tag=tag,
+                                                                no_backup=no_backup, force=force):
+        yield MetadataUpdate(record.path, outcome, message.strip())
+
+
+def run_pipeline(directory: Path, stages: Iterable[str] = tuple(PipelineStage), new_directory: Path | None = None,
+                 sort_by: str = "ext", date_granularity: str | None = None, keep_rule: str = "oldest",
+                 dry_run: bool = False, verify: bool = False, trash_dir: Path | None = None,
+                 executor_kind: str = "processes") -> Iterator[PipelineResult]:
+    """
+    Runs the stages over a single walk of directory, always in the order repair, deduplicate, sort, report,
+    the same way as 'pipeline'. Yields each result with its stage: a Move per file renamed by repair or moved
+    by sort, a DuplicateSet per set then a Removal per duplicate, and a HashedFile per file in the report.
+    In a dry run nothing changes: renames are yielded with the name they would get, and sorted files with no
+    destination. Raises ValueError if new_directory isn't inside directory, or trash_dir isn't on the same
+    filesystem as directory.
+    """
+    stages = {PipelineStage(stage) for stage in stages}
+    new_directory = new_directory or directory
+    if PipelineStage.SORT in stages and not new_directory.resolve().is_relative_to(directory.resolve()):
+        # Moved files must stay under the directory whose cache holds their hashes
+        raise ValueError(f"{new_directory} isn't inside {directory}")
+    staging_dir = create_trash_run(directory, trash_dir) if trash_dir and not dry_run and \
+        PipelineStage.DEDUPLICATE in stages else None
+    with metrics.phase("walk"):
+        records = list(walk_files(directory))
+    if not records:
+        return
+    conn, _ = init_cache(directory, check_same_thread=False)
+    workers = tune(directory).workers
+    writer = CacheWriter(directory) if executor_kind == "threads" else None
+    planned_renames = {}
+    try:
+        with open_executor(executor_kind, workers) as executor, metrics.pool(workers):
+            if PipelineStage.REPAIR in stages:
+                missing = [record for record in records if not record.path.suffix]
+                if missing:
+                    for move in _rename_to_detected_types(conn, missing, dry_run):
+                        if dry_run and move.destination:
+                            planned_renames[move.source] = move.destination
+                        yield PipelineResult(PipelineStage.REPAIR, move)
+
+            if PipelineStage.DEDUPLICATE in stages:
+                store = MemoryScanStore()
+                store.add_all(records)
+                duplicates = []
+                if match_candidates(executor, workers, store, directory, None, writer):
+                    if verify:
+                        duplicate_sets = iter_verified_sets(executor, store.iter_duplicate_sets(), workers, "size", None)
+                    else:
+                        duplicate_sets = (files for _, files in store.iter_duplicate_sets())
+                    for files in duplicate_sets:
+                        order_by_keep_rule(files, keep_rule)
+                        duplicates.extend(record.path for record in files[1:])
+                        yield PipelineResult(PipelineStage.DEDUPLICATE, DuplicateSet(files[0].size, files[0], files[1:]))
+                if duplicates and not dry_run:
+                    if writer:
+                        writer.flush()  # Otherwise entries of deleted files could be written back after they are dropped
+                    removed = set()
+                    with metrics.phase("delete"):
+                        for path, error in iter_removals(duplicates, directory, staging_dir, conn):
+                            if not error:
+                                removed.add(path)
+                            yield PipelineResult(PipelineStage.DEDUPLICATE, Removal(path, error))
+                    records = [record for record in records if record.path not in removed]
+
+            if PipelineStage.SORT in stages:
+                if writer:
+                    writer.flush()  # Entries still buffered under the old paths would be written after the move
+                moves = []
+                try:
+                    with metrics.phase("move"):
+                        for record in records:
+                            if not planned_renames.get(record.path, record.path).suffix:
+                                yield PipelineResult(PipelineStage.SORT, Move(record.path, None, NO_EXTENSION))
+                                continue
+                            if dry_run:
+                                yield PipelineResult(PipelineStage.SORT, Move(record.path, None, None))
+                                continue
+                            source = record.path
+                            try:
+                                new_directory.mkdir(exist_ok=True)
+                                destination = sort_file(record, new_directory, sort_by, date_granularity)
+                            except OSError as e:
+                                yield PipelineResult(PipelineStage.SORT, Move(source, None, str(e)))
+                                continue
+                            if destination:
+                                moves.append((source, destination))
+                                record.path = destination
+                            yield PipelineResult(PipelineStage.SORT, Move(source, destination, None))
+                finally:
+                    rename_cached_files(conn, moves)
+                if not dry_run:
+                    with metrics.phase("cleanup"):
+                        for _ in iter_empty_directory_removals(directory):
+                            pass
+
+            if PipelineStage.REPORT in stages:
+                # Files hashed by the deduplicate stage are cache hits under their new paths
+                hash_file = partial(hash_file_for_report, root_directory=directory, writer=writer)
+                with metrics.phase("hashing"):
+                    for record, hashes in schedule(executor, hash_file, records, workers, lambda r: r.size,
+                                                   largest_first=True):
+                        yield PipelineResult(PipelineStage.REPORT, HashedFile(record.path, record.size, hashes.get("md5"),
+                                                                              hashes.get("sha1"), hashes.get("sha256")))
+    finally:
+        if writer:
+            writer.close()
+        conn.close()
+
+
+def check_ingest(ingest: Path, library: Path, quarantine_dir: Path | None = None,
+                 executor_kind: str = "processes") -> Iterator[IngestedFile]:
+    """
+    Yields every file of the ingest folder with the library file holding the same content, or None for a new
+    file, the same way as 'ingest-check': the library is only read through its cache. With quarantine_dir,
+    duplicates are moved into it. Raises ValueError if quarantine_dir is inside ingest and not left out of its walk.
+    """
+    if quarantine_dir:
+        problem = check_quarantine_dir(ingest, quarantine_dir)
+        if problem:
+            raise ValueError(problem)
+    conn, _ = init_cache(library, check_same_thread=False)
+    try:
+        with metrics.phase("index"):
+            index = LibraryIndex(conn)
+        candidates = []
+        with metrics.phase("walk"):
+            for record in walk_files(ingest):
+                if index.has_size(record.size):
+                    candidates.append(record)
+                else:
+                    yield IngestedFile(record.path, None, None, None)
+        for record, hashes, match in iter_library_matches(candidates, index, ingest, executor_kind):
+            if not hashes:
+                yield IngestedFile(record.path, None, None, "unreadable")
+            elif match and quarantine_dir:
+                destination, error = quarantine_file(record, ingest, quarantine_dir)
+                yield IngestedFile(record.path, match, None if error else destination, error)
+            else:
+                yield IngestedFile(record.path, match, None, None)
+    finally:
+        conn.close()
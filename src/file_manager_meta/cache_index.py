@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import typer
+from rich.console import Console
+
+from file_manager_meta.cache_manager import init_cache, iter_cached_rows, upsert_cached_rows, HASH_COLUMNS, DATE_COLUMNS, \
+    TREE_HASH_COLUMN
+from file_manager_meta.metrics import metrics
+from file_manager_meta.walker import walk_files
+
+console = Console()
+
+# Version of the index file layout, kept in its PRAGMA user_version
+INDEX_FORMAT_VERSION = 2
+INDEX_FORMAT = "file-manager-meta-index"
+IMPORT_BATCH_SIZE = 1000
+
+# Entries are keyed by the path relative to the indexed directory, with '/' separators, so the same share
+# mounted elsewhere (or on another OS) finds them; size and mtime_ns are the validity stamp
+_INDEX_COLUMNS = ("relative_path", "mtime_ns", "size") + HASH_COLUMNS + ("exiftool_file_type",) + DATE_COLUMNS + \
+                 (TREE_HASH_COLUMN, "dates_text")
+# Columns added by each format version, read as NULL from older indexes
+_COLUMNS_ADDED = {2: (TREE_HASH_COLUMN, "dates_text")}
+
+
+def _relative_path(path: str, directory: Path) -> str | None:
+    for root in (directory, directory.absolute()):
+        try:
+            return Path(path).relative_to(root).as_posix()
+        except ValueError:
+            continue
+    return None
+
+
+def export_cache_index(directory: Path, output: Path):
+    """Writes the cached hashes of a directory to a portable index file that other machines can import."""
+    conn, db_path = init_cache(directory)
+    temp_path = output.with_name(output.name + ".tmp")
+    exported = 0
+    try:
+        if temp_path.exists():
+            temp_path.unlink()
+        index = sqlite3.connect(temp_path)
+        try:
+            index.execute("PRAGMA journal_mode = OFF")
+            index.execute("PRAGMA synchronous = OFF")
+            index.execute("""
+                CREATE TABLE entries (
+                    relative_path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    md5 BLOB,
+                    sha1 BLOB,
+                    sha256 BLOB,
+                    exiftool_file_type TEXT,
+                    create_date INTEGER,
+                    date_time_original INTEGER,
+                    file_modify_date INTEGER,
+                    tree_sha256 BLOB,
+                    dates_text TEXT
+                ) WITHOUT ROWID
+            """)
+            index.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            with metrics.phase("export"):
+                batch = []
+                for path, *values in iter_cached_rows(conn):
+                    relative_path = _relative_path(path, directory)
+                    if relative_path is None:
+                        continue
+                    batch.append((relative_path, *values))
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        index.executemany(f"INSERT OR REPLACE INTO entries VALUES ({', '.join('?' * len(_INDEX_COLUMNS))})", batch)
+                        exported += len(batch)
+                        batch = []
+                index.executemany(f"INSERT OR REPLACE INTO entries VALUES ({', '.join('?' * len(_INDEX_COLUMNS))})", batch)
+                exported += len(batch)
+            index.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("format", INDEX_FORMAT),
+                ("source_directory", str(directory.absolute())),
+                ("created_at", time.strftime("%Y-%m-%dT%H:%M:%S%z")),
+                ("entries", str(exported)),
+            ])
+            index.execute(f"PRAGMA user_version = {INDEX_FORMAT_VERSION}")
+            index.commit()
+        finally:
+            index.close()
+        # Written then renamed, so a reader never sees a half-written index
+        os.replace(temp_path, output)
+    except (OSError, sqlite3.Error) as e:
+        console.print(f"[bold red]Error exporting cache index to {output}: {e}[/bold red]")
+        raise typer.Exit(code=1)
+    finally:
+        conn.close()
+    metrics.count("index_entries_exported", exported)
+    console.print(f"[green]Exported {exported} cache entries of {directory} to {output}[/green]")
+
+
+def _open_index(index_path: Path) -> tuple[sqlite3.Connection, int]:
+    try:
+        index = sqlite3.connect(f"{index_path.absolute().as_uri()}?mode=ro", uri=True)
+        version = index.execute("PRAGMA user_version").fetchone()[0]
+        meta = dict(index.execute("SELECT key, value FROM meta"))
+    except sqlite3.Error as e:
+        console.print(f"[bold red]{index_path} is not a cache index: {e}[/bold red]")
+        raise typer.Exit(code=1)
+    if meta.get("format") != INDEX_FORMAT:
+        console.print(f"[bold red]{index_path} is not a cache index.[/bold red]")
+        raise typer.Exit(code=1)
+    if version > INDEX_FORMAT_VERSION:
+        console.print(f"[bold red]{index_path} was written by a newer version of file-manager-meta (format {version}).[/bold red]")
+        raise typer.Exit(code=1)
+    console.print(f"Index of [cyan]{meta.get('source_directory')}[/cyan], created {meta.get('created_at')}, "
+                  f"{meta.get('entries')} entries.")
+    return index, version
+
+
+def import_cache_index(directory: Path, index_path: Path):
+    """
+    Loads a portable index into the cache of directory. An entry is trusted only if the local file
+    has exactly the size and mtime_ns it was indexed with; the others are left to be hashed as usual.
+    """
+    index, version = _open_index(index_path)
+    conn, db_path = init_cache(directory)
+    imported = stale = unknown = 0
+    try:
+        with metrics.phase("import"):
+            batch = []
+            missing = {column for added_in, columns in _COLUMNS_ADDED.items() if added_in > version for column in columns}
+            lookup = (f"SELECT {', '.join('NULL' if column in missing else column for column in _INDEX_COLUMNS[1:])} "
+                      "FROM entries WHERE relative_path = ?")
+            for record in walk_files(directory):
+                row = index.execute(lookup, (record.path.relative_to(directory).as_posix(),)).fetchone()
+                if row is None:
+                    unknown += 1
+                    continue
+                mtime_ns, size, *values = row
+                if mtime_ns != record.mtime_ns or size != record.size:
+                    stale += 1
+                    continue
+                batch.append((str(record.path), mtime_ns, size, *values))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    upsert_cached_rows(conn, batch)
+                    imported += len(batch)
+                    batch = []
+            upsert_cached_rows(conn, batch)
+            imported += len(batch)
+    finally:
+        conn.close()
+        index.close()
+
+    metrics.count("index_entries_imported", imported)
+    console.rule("Cache Import Summary")
+    console.print(f"[green]Entries imported:[/green] {imported}")
+    console.print(f"[yellow]Files changed since indexed (will be rehashed):[/yellow] {stale}")
+    console.print(f"[dim]Files not in the index:[/dim] {unknown}")
+    console.print(f"Cache database: [dim]{db_path}[/dim]")
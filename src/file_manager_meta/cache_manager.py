@@ -1,107 +1,551 @@
+import calendar
+import json
 import sqlite3
 import os
-import hashlib
+import re
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-import platform  # To detect OS for platform-specific cache dir
 
 import typer
 from rich.console import Console
 from rich.table import Table
 
+from file_manager_meta.cache_paths import _get_cache_dir, _get_cache_db_path
+
 console = Console()
 
 
-# Function to get platform-specific cache directory
-def _get_cache_dir() -> Path:
-    if platform.system() == "Windows":
-        # LOCALAPPDATA is preferred for non-roaming data
-        return Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local")) / "file-manager-meta" / "cache"
-    elif platform.system() == "Darwin":  # macOS
-        return Path.home() / "Library" / "Caches" / "file-manager-meta"
-    else:  # Linux and other Unix-like systems
-        return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "file-manager-meta"
+# Version of the cache layout, kept in PRAGMA user_version. Databases written by older versions
+# are migrated when opened (see _MIGRATIONS); version 1 is the original text-only layout.
+SCHEMA_VERSION = 5
+
+HASH_COLUMNS = ("md5", "sha1", "sha256")
+DATE_COLUMNS = ("create_date", "date_time_original", "file_modify_date")
+# Root of the parallel tree hash of large files (see hashes.tree_hash_file), computed on request only
+TREE_HASH_COLUMN = "tree_sha256"
+# How dates are exchanged with the rest of the application (ExifTool's format)
+DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
+# ExifTool dates may also carry subseconds and a time zone offset, e.g. "2021:06:01 12:30:45.120+02:00"
+_DATE_PATTERN = re.compile(r"(\d{4}):(\d{2}):(\d{2}) (\d{2}):(\d{2}):(\d{2})(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?")
+
+# Digests are stored as raw bytes and dates as integer epochs, and WITHOUT ROWID makes the path
+# the table's own key instead of a second copy of it in a separate index
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS file_hashes (
+        path TEXT PRIMARY KEY,
+        mtime_ns INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        md5 BLOB,
+        sha1 BLOB,
+        sha256 BLOB,
+        exiftool_file_type TEXT,
+        create_date INTEGER,
+        date_time_original INTEGER,
+        file_modify_date INTEGER,
+        last_verified INTEGER,
+        tree_sha256 BLOB,
+        dates_text TEXT
+    ) WITHOUT ROWID
+    """,
+    # The scrub command checks the least recently verified files first
+    "CREATE INDEX IF NOT EXISTS file_hashes_last_verified ON file_hashes (last_verified)",
+    # Last known state of each directory, kept current by the watch command and report --usage.
+    # usage holds the disk-usage aggregates of the directory's own files as JSON (see usage.py)
+    """
+    CREATE TABLE IF NOT EXISTS directory_snapshot (
+        path TEXT PRIMARY KEY,
+        mtime_ns INTEGER NOT NULL,
+        file_count INTEGER NOT NULL,
+        total_size INTEGER NOT NULL,
+        updated_at REAL NOT NULL,
+        usage TEXT
+    )
+    """,
+    # Content-defined chunks of each file, for the similar command; rechunked only when the file changes.
+    # Chunks refer to their file by id, so a path is stored once however many chunks the file has.
+    """
+    CREATE TABLE IF NOT EXISTS chunked_files (
+        file_id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        mtime_ns INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        chunker TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS file_chunks (
+        file_id INTEGER NOT NULL,
+        chunk_index INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        fingerprint BLOB NOT NULL,
+        PRIMARY KEY (file_id, chunk_index)
+    ) WITHOUT ROWID
+    """,
+]
+
+
+def _digest_to_blob(digest: str | None) -> bytes | None:
+    try:
+        return bytes.fromhex(digest) if digest else None
+    except ValueError:
+        return None
+
+
+def _date_to_epoch(date: str | None) -> int | None:
+    # The wall-clock time of a date is stored as if it were UTC and read back the same way; subseconds and
+    # the time zone offset don't fit in the epoch and are kept by _dates_text instead
+    if not date:
+        return None
+    match = _DATE_PATTERN.fullmatch(date.strip())
+    if not match:
+        return None
+    try:
+        return calendar.timegm(datetime(*map(int, match.groups())).timetuple())
+    except ValueError:
+        return None  # E.g. "0000:00:00 00:00:00", ExifTool's unset date
 
 
-# Function to generate unique DB path for a given directory
-def _get_cache_db_path(directory: Path) -> Path:
-    cache_dir = _get_cache_dir()
-    cache_dir.mkdir(parents=True, exist_ok=True)  # Ensure cache directory exists
+def _epoch_to_date(epoch: int | None) -> str | None:
+    if epoch is None:
+        return None
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime(DATE_FORMAT)
 
-    # Use a hash of the absolute path of the analyzed directory for uniqueness
-    dir_hash = hashlib.md5(str(directory.absolute()).encode('utf-8')).hexdigest()
-    db_name = f"cache_{dir_hash}.db"
-    return cache_dir / db_name
 
+def _dates_text(hashes: dict) -> str | None:
+    """The dates that their epoch doesn't give back exactly, as JSON in their original text, or None."""
+    texts = {column: hashes[column] for column in DATE_COLUMNS
+             if hashes.get(column) and _epoch_to_date(_date_to_epoch(hashes[column])) != hashes[column]}
+    return json.dumps(texts) if texts else None
 
-def init_cache(directory: Path) -> tuple[sqlite3.Connection, Path]:
+
+def _read_date(epoch: int | None, text: str | None) -> str | None:
+    # The original text only stands while the epoch stored next to it is still the one it gave
+    if text is not None and _date_to_epoch(text) == epoch:
+        return text
+    return _epoch_to_date(epoch)
+
+
+def _migrate_v1_to_v2(conn: sqlite3.Connection):
+    """Converts the text layout. Only rows still matching the file on disk are kept, now stamped with mtime_ns."""
+    conn.execute("ALTER TABLE file_hashes RENAME TO file_hashes_v1")
+    # The chunk index was keyed by path; it is rebuilt by the next similar run
+    conn.execute("DROP TABLE IF EXISTS file_chunks")
+    conn.execute("DROP TABLE IF EXISTS chunked_files")
+    for statement in _SCHEMA:
+        conn.execute(statement)
+
+    migrated = []
+    for path, mtime, size, *values in conn.execute(f"""
+            SELECT path, mtime, size, {", ".join(HASH_COLUMNS)}, exiftool_file_type, {", ".join(DATE_COLUMNS)}
+            FROM file_hashes_v1"""):
+        # The old REAL mtime can't be turned back into exact nanoseconds, so each file is stat'ed once
+        try:
+            stat_info = os.stat(path)
+        except OSError:
+            continue
+        if stat_info.st_mtime != mtime or stat_info.st_size != size:
+            continue  # Stale entry, it would never be used again
+        # Dates that don't fit an epoch exactly are kept as text (see _dates_text), never dropped
+        hashes = dict(zip(HASH_COLUMNS + ("exiftool_file_type",) + DATE_COLUMNS, values))
+        migrated.append(_to_row(path, stat_info.st_mtime_ns, size, hashes))
+    conn.executemany(_INSERT_HASHES, migrated)
+    conn.execute("DROP TABLE file_hashes_v1")
+
+
+def _migrate_v2_to_v3(conn: sqlite3.Connection):
+    """Adds the usage aggregates to directory snapshots. Existing snapshots have none until their directory is rescanned."""
+    columns = [info[1] for info in conn.execute("PRAGMA table_info(directory_snapshot)")]
+    if "usage" not in columns:  # Already there if the table was created by the v1 migration
+        conn.execute("ALTER TABLE directory_snapshot ADD COLUMN usage TEXT")
+
+
+def _migrate_v3_to_v4(conn: sqlite3.Connection):
+    """Adds the time each file's digests were last verified by scrub. Existing entries count as never verified."""
+    columns = [info[1] for info in conn.execute("PRAGMA table_info(file_hashes)")]
+    if "last_verified" not in columns:  # Already there if the table was created by the v1 migration
+        conn.execute("ALTER TABLE file_hashes ADD COLUMN last_verified INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS file_hashes_last_verified ON file_hashes (last_verified)")
+
+
+def _migrate_v4_to_v5(conn: sqlite3.Connection):
+    """Adds the tree hash of large files, computed the next time one is needed."""
+    columns = [info[1] for info in conn.execute("PRAGMA table_info(file_hashes)")]
+    if TREE_HASH_COLUMN not in columns:  # Already there if the table was created by the v1 migration
+        conn.execute(f"ALTER TABLE file_hashes ADD COLUMN {TREE_HASH_COLUMN} BLOB")
+
+
+# Migration from each version to the next
+_MIGRATIONS = {
+    1: _migrate_v1_to_v2,
+    2: _migrate_v2_to_v3,
+    3: _migrate_v3_to_v4,
+    4: _migrate_v4_to_v5,
+}
+
+
+def _upgrade_schema(conn: sqlite3.Connection, db_path: Path):
+    """Creates the schema in a new database, or migrates an older one to SCHEMA_VERSION."""
+    if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        return
+    # Several worker processes may open the database at once; the write lock lets only one of them upgrade it
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == 0:
+            has_tables = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'file_hashes'").fetchone()
+            version = 1 if has_tables else SCHEMA_VERSION
+            if not has_tables:
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+        if version > SCHEMA_VERSION:
+            conn.rollback()
+            console.print(f"[bold red]The cache database {db_path} was written by a newer version of file-manager-meta "
+                          f"(schema {version}). Upgrade, or run 'file-manager-meta cache recreate'.[/bold red]")
+            raise typer.Exit(code=1)
+        migrated = version < SCHEMA_VERSION
+        while version < SCHEMA_VERSION:
+            _MIGRATIONS[version](conn)
+            version += 1
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    if migrated:
+        console.print(f"[dim]Cache database migrated to schema version {SCHEMA_VERSION}.[/dim]")
+        conn.execute("VACUUM")  # Give the space of the old layout back
+
+
+def init_cache(directory: Path, check_same_thread: bool = True) -> tuple[sqlite3.Connection, Path]:
     """Initializes the database for a given directory and returns a connection object and its path."""
     db_path = _get_cache_db_path(directory)
     try:
-        conn = sqlite3.connect(db_path, timeout=30)
+        conn = sqlite3.connect(db_path, timeout=30, check_same_thread=check_same_thread)
+        _upgrade_schema(conn, db_path)
     except sqlite3.OperationalError as e:
         console.print(f"[bold red]Error connecting to cache database: {e}. This might be due to a locked database file. Try running 'file-manager-meta cache clear-all' to clear all caches.[/bold red]")
         raise typer.Exit(code=1)
-    # Create table if it doesn't exist
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS file_hashes (
-            path TEXT PRIMARY KEY,
-            mtime REAL NOT NULL,
-            size INTEGER NOT NULL,
-            md5 TEXT,
-            sha1 TEXT,
-            sha256 TEXT,
-            exiftool_file_type TEXT,
-            create_date TEXT,
-            date_time_original TEXT,
-            file_modify_date TEXT
-        );
-    """)
-    conn.commit()
     return conn, db_path
 
 
+# Connections opened by pool workers, kept for the life of the worker thread (see worker_connection)
+_worker_connections = threading.local()
+
+
+def worker_connection(directory: Path) -> sqlite3.Connection:
+    """
+    Returns this worker's connection to a directory's cache, opening it on first use.
+    Pool workers run many small tasks, so reusing one connection avoids reopening the database for each file.
+    Each thread gets its own, as SQLite connections can't be shared between threads.
+    """
+    connections = _worker_connections.__dict__.setdefault("by_directory", {})
+    conn = connections.get(directory)
+    if conn is None:
+        conn, _ = init_cache(directory)
+        connections[directory] = conn
+    return conn
+
+
+class CacheWriter:
+    """
+    Collects cache updates from many worker threads and writes them through a single connection,
+    in one transaction per batch instead of one commit per file.
+    """
+
+    def __init__(self, directory: Path, batch_size: int = 500):
+        self.conn, _ = init_cache(directory, check_same_thread=False)
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def put(self, file_path: Path, stat_info, hashes: dict):
+        with self._lock:
+            self._pending.append((file_path, stat_info, hashes))
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        for file_path, stat_info, hashes in self._pending:
+            _write_cached_hashes(self.conn, file_path, stat_info, hashes)
+        self.conn.commit()
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def _to_row(file_path, mtime_ns: int, size: int, hashes: dict) -> tuple:
+    return (
+        str(file_path), mtime_ns, size,
+        *(_digest_to_blob(hashes.get(column)) for column in HASH_COLUMNS),
+        hashes.get("exiftool_file_type"),
+        *(_date_to_epoch(hashes.get(column)) for column in DATE_COLUMNS),
+        _digest_to_blob(hashes.get(TREE_HASH_COLUMN)),
+        _dates_text(hashes),
+    )
+
+
+_INSERT_HASHES = f"""
+    INSERT INTO file_hashes (path, mtime_ns, size, {", ".join(HASH_COLUMNS)}, exiftool_file_type, {", ".join(DATE_COLUMNS)}, {TREE_HASH_COLUMN}, dates_text)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# An upsert that only overwrites the fields it is given, so e.g. storing dates keeps the hashes.
+# When the file has changed since the row was written, the fields it isn't given are cleared instead.
+_SAME_FILE = "mtime_ns = excluded.mtime_ns AND size = excluded.size"
+# The texts of the dates given are dropped (their epochs replace them), then the new texts are merged in
+_KEPT_DATES_TEXT = "dates_text"
+for _column in DATE_COLUMNS:
+    _KEPT_DATES_TEXT = f"CASE WHEN excluded.{_column} IS NULL THEN {_KEPT_DATES_TEXT} ELSE json_remove({_KEPT_DATES_TEXT}, '$.{_column}') END"
+_UPSERT_HASHES = _INSERT_HASHES + "ON CONFLICT (path) DO UPDATE SET " + ", ".join(
+    f"{column} = CASE WHEN {_SAME_FILE} THEN COALESCE(excluded.{column}, {column}) ELSE excluded.{column} END"
+    for column in HASH_COLUMNS + ("exiftool_file_type",) + DATE_COLUMNS + (TREE_HASH_COLUMN,)
+) + (
+    f", dates_text = CASE WHEN {_SAME_FILE} THEN COALESCE(json_patch({_KEPT_DATES_TEXT}, excluded.dates_text), "
+    f"{_KEPT_DATES_TEXT}, excluded.dates_text) ELSE excluded.dates_text END"
+) + f", last_verified = CASE WHEN {_SAME_FILE} THEN last_verified END, mtime_ns = excluded.mtime_ns, size = excluded.size"
+
+
 def get_cached_hashes(conn: sqlite3.Connection, file_path: Path, stat_info) -> dict | None:
     """Retrieves cached hashes if the file is unchanged."""
     cursor = conn.cursor()
     cursor.execute(
-        "SELECT mtime, size, md5, sha1, sha256, exiftool_file_type, create_date, date_time_original, file_modify_date FROM file_hashes WHERE path = ?",
+        f"SELECT mtime_ns, size, {', '.join(HASH_COLUMNS)}, exiftool_file_type, {', '.join(DATE_COLUMNS)}, {TREE_HASH_COLUMN}, dates_text "
+        "FROM file_hashes WHERE path = ?",
         (str(file_path),)
     )
     row = cursor.fetchone()
     if row:
-        mtime, size, md5, sha1, sha256, exiftool_file_type, create_date, date_time_original, file_modify_date = row
+        mtime_ns, size, md5, sha1, sha256, exiftool_file_type, create_date, date_time_original, file_modify_date, tree_sha256, dates_text = row
         # Check if file metadata matches the cached metadata
-        if mtime == stat_info.st_mtime and size == stat_info.st_size:
+        if mtime_ns == stat_info.st_mtime_ns and size == stat_info.st_size:
+            texts = json.loads(dates_text) if dates_text else {}
             return {
-                "md5": md5,
-                "sha1": sha1,
-                "sha256": sha256,
+                "md5": md5.hex() if md5 else None,
+                "sha1": sha1.hex() if sha1 else None,
+                "sha256": sha256.hex() if sha256 else None,
                 "exiftool_file_type": exiftool_file_type,
-                "create_date": create_date,
-                "date_time_original": date_time_original,
-                "file_modify_date": file_modify_date
+                "create_date": _read_date(create_date, texts.get("create_date")),
+                "date_time_original": _read_date(date_time_original, texts.get("date_time_original")),
+                "file_modify_date": _read_date(file_modify_date, texts.get("file_modify_date")),
+                TREE_HASH_COLUMN: tree_sha256.hex() if tree_sha256 else None,
             }
     return None
 
 
 def set_cached_hashes(conn: sqlite3.Connection, file_path: Path, stat_info, hashes: dict):
-    """Inserts or updates a file's hashes and ExifTool file type in the cache."""
-    conn.execute(
-        """REPLACE INTO file_hashes (path, mtime, size, md5, sha1, sha256, exiftool_file_type, create_date, date_time_original, file_modify_date)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-        (
-            str(file_path),
-            stat_info.st_mtime,
-            stat_info.st_size,
-            hashes.get("md5"),
-            hashes.get("sha1"),
-            hashes.get("sha256"),
-            hashes.get("exiftool_file_type"),
-            hashes.get("create_date"),
-            hashes.get("date_time_original"),
-            hashes.get("file_modify_date"),
+    """Inserts or updates a file's hashes and ExifTool file type in the cache. Fields not given are kept."""
+    _write_cached_hashes(conn, file_path, stat_info, hashes)
+    conn.commit()
+
+
+def _write_cached_hashes(conn: sqlite3.Connection, file_path: Path, stat_info, hashes: dict):
+    conn.execute(_UPSERT_HASHES, _to_row(file_path, stat_info.st_mtime_ns, stat_info.st_size, hashes))
+
+
+def iter_cached_rows(conn: sqlite3.Connection):
+    """
+    Yields every file_hashes row in its stored form: (path, mtime_ns, size, digests as bytes, file type,
+    dates as epochs, tree hash as bytes, original text of the dates as JSON).
+    """
+    yield from conn.execute(
+        f"SELECT path, mtime_ns, size, {', '.join(HASH_COLUMNS)}, exiftool_file_type, {', '.join(DATE_COLUMNS)}, "
+        f"{TREE_HASH_COLUMN}, dates_text FROM file_hashes")
+
+
+def upsert_cached_rows(conn: sqlite3.Connection, rows):
+    """Writes rows in the form yielded by iter_cached_rows, in one transaction. Fields a row leaves empty keep their cached value."""
+    conn.executemany(_UPSERT_HASHES, rows)
+    conn.commit()
+
+
+def iter_scrub_candidates(conn: sqlite3.Connection, verified_before: int):
+    """
+    Yields (path, mtime_ns, size, md5, sha1, sha256, tree_sha256 as hex) of every hashed file not verified since
+    verified_before, least recently verified first. Entries stamped meanwhile are not yielded again.
+    """
+    for path, mtime_ns, size, *digests in conn.execute(f"""
+            SELECT path, mtime_ns, size, {', '.join(HASH_COLUMNS)}, {TREE_HASH_COLUMN} FROM file_hashes
+            WHERE (md5 IS NOT NULL OR tree_sha256 IS NOT NULL) AND (last_verified IS NULL OR last_verified < ?)
+            ORDER BY last_verified""", (verified_before,)):
+        yield path, mtime_ns, size, *(digest.hex() if digest else None for digest in digests)
+
+
+def set_last_verified(conn: sqlite3.Connection, entries, verified_at: int):
+    """Stamps (path, mtime_ns, size) entries as verified, unless the file changed meanwhile."""
+    conn.executemany("UPDATE file_hashes SET last_verified = ? WHERE path = ? AND mtime_ns = ? AND size = ?",
+                     ((verified_at, *entry) for entry in entries))
+    conn.commit()
+
+
+def clear_cached_digests(conn: sqlite3.Connection, entries):
+    """
+    Drops the digests, tree hash and chunks of (path, mtime_ns, size) entries whose content no longer matches them,
+    so no command trusts them again; the next hashing run stores the file's current digests. Other fields are kept.
+    """
+    entries = [(str(path), mtime_ns, size) for path, mtime_ns, size in entries]
+    if not entries:
+        return
+    conn.executemany(
+        f"UPDATE file_hashes SET {', '.join(f'{column} = NULL' for column in HASH_COLUMNS)}, {TREE_HASH_COLUMN} = NULL, "
+        "last_verified = NULL WHERE path = ? AND mtime_ns = ? AND size = ?", entries)
+    params = [(path,) for path, _, _ in entries]
+    conn.executemany("DELETE FROM file_chunks WHERE file_id IN (SELECT file_id FROM chunked_files WHERE path = ?)", params)
+    conn.executemany("DELETE FROM chunked_files WHERE path = ?", params)
+    conn.commit()
+
+
+def get_verification_status(conn: sqlite3.Connection) -> tuple[int, int, int | None]:
+    """Returns (hashed files, files never verified, epoch of the oldest verification)."""
+    return conn.execute(
+        "SELECT COUNT(*), COUNT(*) - COUNT(last_verified), MIN(last_verified) FROM file_hashes "
+        "WHERE md5 IS NOT NULL OR tree_sha256 IS NOT NULL"
+    ).fetchone()
+
+
+def has_cached_chunks(conn: sqlite3.Connection, file_path: Path, stat_info, chunker: str) -> bool:
+    """Tells whether the cached chunks of a file are current, without loading them."""
+    row = conn.execute("SELECT mtime_ns, size, chunker FROM chunked_files WHERE path = ?", (str(file_path),)).fetchone()
+    return row == (stat_info.st_mtime_ns, stat_info.st_size, chunker)
+
+
+def get_cached_chunks(conn: sqlite3.Connection, file_path: Path, stat_info, chunker: str) -> list[tuple[int, bytes]] | None:
+    """Retrieves the cached (length, fingerprint) chunks of a file if it is unchanged and was cut by the same chunker."""
+    row = conn.execute("SELECT file_id, mtime_ns, size, chunker FROM chunked_files WHERE path = ?", (str(file_path),)).fetchone()
+    if not row or row[1:] != (stat_info.st_mtime_ns, stat_info.st_size, chunker):
+        return None
+    return conn.execute(
+        "SELECT length, fingerprint FROM file_chunks WHERE file_id = ? ORDER BY chunk_index", (row[0],)
+    ).fetchall()
+
+
+def set_cached_chunks(conn: sqlite3.Connection, entries, chunker: str):
+    """Replaces the cached chunks of several files in one transaction. entries holds (file_path, stat_info, chunks)."""
+    for file_path, stat_info, chunks in entries:
+        conn.execute(
+            """INSERT INTO chunked_files (path, mtime_ns, size, chunker) VALUES (?, ?, ?, ?)
+               ON CONFLICT (path) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size, chunker = excluded.chunker""",
+            (str(file_path), stat_info.st_mtime_ns, stat_info.st_size, chunker)
+        )
+        file_id = conn.execute("SELECT file_id FROM chunked_files WHERE path = ?", (str(file_path),)).fetchone()[0]
+        conn.execute("DELETE FROM file_chunks WHERE file_id = ?", (file_id,))
+        conn.executemany(
+            "INSERT INTO file_chunks (file_id, chunk_index, length, fingerprint) VALUES (?, ?, ?, ?)",
+            ((file_id, index, length, fingerprint) for index, (length, fingerprint) in enumerate(chunks))
         )
+    conn.commit()
+
+
+def remove_cached_hashes(conn: sqlite3.Connection, file_path: Path):
+    """Drops the cache entry of a file that no longer exists."""
+    remove_cached_files(conn, [file_path])
+
+
+def remove_cached_files(conn: sqlite3.Connection, file_paths):
+    """Drops the cache entries of files that no longer exist, in one transaction."""
+    params = [(str(file_path),) for file_path in file_paths]
+    if not params:
+        return
+    conn.executemany("DELETE FROM file_hashes WHERE path = ?", params)
+    conn.executemany("DELETE FROM file_chunks WHERE file_id IN (SELECT file_id FROM chunked_files WHERE path = ?)", params)
+    conn.executemany("DELETE FROM chunked_files WHERE path = ?", params)
+    conn.commit()
+
+
+def rename_cached_files(conn: sqlite3.Connection, renames):
+    """
+    Moves the cache entries of renamed or moved files, given as (old path, new path) pairs, to their new paths.
+    A rename keeps a file's size and modification time, so its cached hashes stay valid.
+    """
+    params = [(str(new_path), str(old_path)) for old_path, new_path in renames if new_path != old_path]
+    if not params:
+        return
+    # Entries left at the new paths by files that were there before are stale
+    stale = [(new_path,) for new_path, _ in params]
+    conn.executemany("DELETE FROM file_hashes WHERE path = ?", stale)
+    conn.executemany("DELETE FROM file_chunks WHERE file_id IN (SELECT file_id FROM chunked_files WHERE path = ?)", stale)
+    conn.executemany("DELETE FROM chunked_files WHERE path = ?", stale)
+    conn.executemany("UPDATE file_hashes SET path = ? WHERE path = ?", params)
+    conn.executemany("UPDATE chunked_files SET path = ? WHERE path = ?", params)
+    conn.commit()
+
+
+def _descendant_range(dir_path: Path) -> tuple[str, str]:
+    # Every path below dir_path sorts between "dir" + sep and "dir" + the character after sep
+    prefix = str(dir_path) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def remove_cached_tree(conn: sqlite3.Connection, dir_path: Path):
+    """Drops the cache entries and directory snapshots of a removed directory and everything below it."""
+    low, high = _descendant_range(dir_path)
+    conn.execute("DELETE FROM file_hashes WHERE path >= ? AND path < ?", (low, high))
+    conn.execute("DELETE FROM file_chunks WHERE file_id IN (SELECT file_id FROM chunked_files WHERE path >= ? AND path < ?)", (low, high))
+    conn.execute("DELETE FROM chunked_files WHERE path >= ? AND path < ?", (low, high))
+    conn.execute("DELETE FROM directory_snapshot WHERE path = ? OR (path >= ? AND path < ?)", (str(dir_path), low, high))
+    conn.commit()
+
+
+def ensure_digest_index(conn: sqlite3.Connection):
+    """
+    Indexes file_hashes by size and MD5, for looking files up by content (ingest-check). Built on first use
+    only, as it takes a while on a large library; SQLite keeps it current from then on.
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS file_hashes_size_md5 ON file_hashes (size, md5)")
+    conn.commit()
+
+
+def iter_cached_digests(conn: sqlite3.Connection):
+    """Yields (size, MD5 as bytes) of every hashed file, in size order. Needs ensure_digest_index() to be fast."""
+    yield from conn.execute("SELECT size, md5 FROM file_hashes WHERE md5 IS NOT NULL ORDER BY size")
+
+
+def find_cached_by_digest(conn: sqlite3.Connection, size: int, md5: str) -> list[tuple[str, int, str | None]]:
+    """Returns (path, mtime_ns, SHA-256) of every cached file with this size and MD5, as of when it was hashed."""
+    return [(path, mtime_ns, sha256.hex() if sha256 else None) for path, mtime_ns, sha256 in conn.execute(
+        "SELECT path, mtime_ns, sha256 FROM file_hashes WHERE size = ? AND md5 = ?", (size, _digest_to_blob(md5)))]
+
+
+def iter_cached_paths(conn: sqlite3.Connection):
+    """Yields the path of every file in the cache."""
+    for (path,) in conn.execute("SELECT path FROM file_hashes"):
+        yield Path(path)
+
+
+def set_directory_snapshot(conn: sqlite3.Connection, dir_path: Path, mtime_ns: int, usage: dict, commit: bool = True):
+    """Stores the state of a directory and the usage aggregates of its own files (from usage.summarize_files)."""
+    conn.execute(
+        "REPLACE INTO directory_snapshot (path, mtime_ns, file_count, total_size, updated_at, usage) VALUES (?, ?, ?, ?, ?, ?)",
+        (str(dir_path), mtime_ns, usage["files"], usage["bytes"], time.time(), json.dumps(usage, separators=(",", ":")))
     )
+    if commit:
+        conn.commit()
+
+
+def get_directory_snapshots(conn: sqlite3.Connection, dir_path: Path) -> dict[str, tuple[int, dict | None]]:
+    """Returns {path: (mtime_ns, usage aggregates or None)} for dir_path and every directory below it."""
+    low, high = _descendant_range(dir_path)
+    return {
+        path: (mtime_ns, json.loads(usage) if usage else None)
+        for path, mtime_ns, usage in conn.execute(
+            "SELECT path, mtime_ns, usage FROM directory_snapshot WHERE path = ? OR (path >= ? AND path < ?)",
+            (str(dir_path), low, high))
+    }
+
+
+def remove_directory_snapshots(conn: sqlite3.Connection, paths):
+    conn.executemany("DELETE FROM directory_snapshot WHERE path = ?", ((path,) for path in paths))
     conn.commit()
 
 
@@ -124,7 +568,14 @@ def view_cache_contents(directory: Path):
 
         cursor.execute("SELECT * FROM file_hashes")
         for row in cursor.fetchall():
-            table.add_row(*[str(item) for item in row])
+            cells = []
+            for column, item in zip(columns, row):
+                if isinstance(item, bytes):
+                    item = item.hex()
+                elif column in DATE_COLUMNS or column == "last_verified":
+                    item = _epoch_to_date(item)
+                cells.append(str(item))
+            table.add_row(*cells)
 
         console.print(table)
 
@@ -188,6 +639,3 @@ def clear_all_caches():
     else:
         console.print(f"[yellow]No cache files found to clear in {cache_dir}.[/yellow]")
 
-
-# Make _get_cache_db_path public for cli.py
-get_cache_file_path = _get_cache_db_path
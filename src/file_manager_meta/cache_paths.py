@@ -0,0 +1,32 @@
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+# Kept free of sqlite3/rich imports so `cache path` and other quick commands start fast
+
+
+# Function to get platform-specific cache directory
+def _get_cache_dir() -> Path:
+    if sys.platform == "win32":
+        # LOCALAPPDATA is preferred for non-roaming data
+        return Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local")) / "file-manager-meta" / "cache"
+    elif sys.platform == "darwin":  # macOS
+        return Path.home() / "Library" / "Caches" / "file-manager-meta"
+    else:  # Linux and other Unix-like systems
+        return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "file-manager-meta"
+
+
+# Function to generate unique DB path for a given directory
+def _get_cache_db_path(directory: Path) -> Path:
+    cache_dir = _get_cache_dir()
+    cache_dir.mkdir(parents=True, exist_ok=True)  # Ensure cache directory exists
+
+    # Use a hash of the absolute path of the analyzed directory for uniqueness
+    dir_hash = hashlib.md5(str(directory.absolute()).encode('utf-8')).hexdigest()
+    db_name = f"cache_{dir_hash}.db"
+    return cache_dir / db_name
+
+
+# Make _get_cache_db_path public for cli.py
+get_cache_file_path = _get_cache_db_path
@@ -0,0 +1,98 @@
+import hashlib
+import random
+import re
+from pathlib import Path
+
+from file_manager_meta.metrics import metrics
+from file_manager_meta.throttle import throttle_open, throttle_read
+
+# FastCDC-style content-defined chunking: cut points depend on the bytes around them, not on their
+# offset, so an insertion only changes the chunks it touches and the rest of the file still matches.
+MIN_CHUNK_SIZE = 4 * 1024
+AVG_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 64 * 1024
+READ_SIZE = 4 * 1024 * 1024
+
+# Identifies the algorithm and parameters above in the cache, so chunks cut differently are never compared
+CHUNKER_ID = f"cdc-mul-{MIN_CHUNK_SIZE}-{AVG_CHUNK_SIZE}-{MAX_CHUNK_SIZE}"
+
+# Instead of rolling a hash byte by byte in Python, the whole buffer is read as one little-endian integer and
+# multiplied by a random 256-bit constant: byte i of the product mixes byte i with the 32 before it, and carries
+# only flow towards later bytes, so it never depends on what follows. Both steps run in C, as does the regex
+# search for cut points in the product. Bytes go through a random substitution first, so zeros don't stay zeros.
+# Both are seeded, so chunk boundaries are the same on every run and machine.
+_SUBSTITUTION = bytes(random.Random("cdc:substitution").sample(range(256), 256))
+_MULTIPLIER = random.Random("cdc:multiplier").getrandbits(256) | 1
+
+
+def _zero_bits(bits: int) -> re.Pattern:
+    """Matches where the next `bits` bits of the mixed bytes are zero, which happens once every 2**bits bytes."""
+    whole_bytes, rest = divmod(bits, 8)
+    pattern = rb"\x00" * whole_bytes
+    if rest:
+        pattern += rb"[\x00-\x%02x]" % ((1 << (8 - rest)) - 1)
+    return re.compile(pattern)
+
+
+_AVG_BITS = AVG_CHUNK_SIZE.bit_length() - 1
+# Normalized chunking: a harder condition before the average size and an easier one after it,
+# which keeps chunk sizes close to the average
+_CUT_SMALL = _zero_bits(_AVG_BITS + 2)
+_CUT_LARGE = _zero_bits(_AVG_BITS - 2)
+
+
+def _mix(data: bytes) -> bytes:
+    """Returns bytes aligned with data (and a little longer), each a hash of the data byte at its offset and the ones before it."""
+    mixed = int.from_bytes(data.translate(_SUBSTITUTION), "little") * _MULTIPLIER
+    return mixed.to_bytes(len(data) + _MULTIPLIER.bit_length() // 8 + 1, "little")
+
+
+def _cut_point(mixed: bytes, start: int, end: int) -> int:
+    """Returns the end offset of the chunk starting at start, looking at most at mixed[start:end] (see _mix)."""
+    length = end - start
+    if length <= MIN_CHUNK_SIZE:
+        return end
+    if length > MAX_CHUNK_SIZE:
+        end = start + MAX_CHUNK_SIZE
+    normal = min(start + AVG_CHUNK_SIZE, end)
+    # Bytes before the minimum size can never be a cut point, so they are not searched
+    match = _CUT_SMALL.search(mixed, start + MIN_CHUNK_SIZE, normal) or _CUT_LARGE.search(mixed, normal, end)
+    return match.end() if match else end
+
+
+def chunk_file(file_path: Path) -> list[tuple[int, bytes]] | None:
+    """
+    Splits a file into content-defined chunks.
+    Returns (length, fingerprint) for each chunk in file order, or None if the file can't be read.
+    """
+    chunks = []
+    bytes_read = 0
+    try:
+        throttle_open()
+        with metrics.timer("chunking"), open(file_path, "rb") as f:
+            buffer = b""
+            offset = 0
+            at_end = False
+            while True:
+                # Keep at least one maximal chunk buffered, so a cut point is never forced by the buffer edge
+                if not at_end and len(buffer) - offset < MAX_CHUNK_SIZE:
+                    data = f.read(READ_SIZE)
+                    bytes_read += len(data)
+                    throttle_read(len(data))
+                    at_end = not data
+                    buffer = buffer[offset:] + data
+                    mixed = _mix(buffer)
+                    offset = 0
+                    continue
+                if offset >= len(buffer):
+                    break
+                cut = _cut_point(mixed, offset, len(buffer))
+                chunk = buffer[offset:cut]
+                chunks.append((len(chunk), hashlib.blake2b(chunk, digest_size=16).digest()))
+                offset = cut
+    except OSError:
+        return None
+    finally:
+        metrics.count("bytes_read", bytes_read)
+        metrics.count("files_chunked")
+    return chunks
@@ -1,3 +1,6 @@
+import json
+
+import click
 import typer
 
 from pathlib import Path
@@ -6,29 +9,161 @@ from typing import List, Optional
 
 from rich.console import Console
 
-from file_manager_meta.enums import SortBy, KeepRule, DateGranularity
-from file_manager_meta.sort import organizer
-from file_manager_meta.repair import repair_extension
-from file_manager_meta.report import generate_report
-from file_manager_meta.deduplicate import deduplicate_files
-from file_manager_meta.metadata_updater import update_metadata_date # New import
-from file_manager_meta.cache_manager import view_cache_contents, clear_cache, get_cache_file_path, recreate_database, \
-    clear_all_caches  # New import
+from file_manager_meta.enums import SortBy, KeepRule, DateGranularity, ReadOrder, ExecutorKind, PipelineStage, DuplicateAction
+from file_manager_meta.metrics import metrics
+
+# Command modules are imported inside each command, so a run only loads what it uses
+# (exiftool, sqlite3, concurrent.futures...) and `--help` or `cache path` start fast.
 
 app = typer.Typer()
 console = Console()
 
+READ_ORDER_HELP = ("Order in which files are read: 'size' (largest first), 'inode' or 'fiemap' (on-disk position, "
+                   "for spinning disks), or 'auto' (fiemap on spinning disks, size elsewhere).")
+DEVICE_WORKERS_HELP = "Files read at once per device with --read-order inode/fiemap (default: 1 on spinning disks)."
+EXECUTOR_HELP = ("Run hashing in worker 'processes', or in 'threads' sharing one cache writer: "
+                 "faster to start and lighter on memory.")
+TREE_HASH_HELP = ("Identify files of 256 MB or more by a tree hash of 16 MB leaves read in parallel, "
+                  "so one large file uses every core. Kept in its own cache column.")
+SHARD_HELP = ("Scan only shard i of N (e.g. 2/4) and save its results to --shard-output, to be combined with 'merge'. "
+              "Top-level entries are split between shards by the hash of their name.")
+TRASH_HELP = ("Move duplicates into a staging directory inside this trash, on the same filesystem, instead of deleting them. "
+              "Empty it later with 'purge-trash'.")
+JSON_HELP = "Write one JSON object per result to stdout (JSON Lines), ending with a summary, instead of tables."
+QUIET_HELP = "Print only the summary, without tables or progress bars."
+SHARD_OUTPUT_HELP = "Shard results file (default: <command>-shard-<i>-of-<N>.fmm in the current directory)."
+
+
+def _check_shard(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return value
+    index, _, count = value.partition("/")
+    if not (index.isdigit() and count.isdigit() and 1 <= int(index) <= int(count)):
+        raise typer.BadParameter("expected i/N with 1 <= i <= N, e.g. 2/4")
+    return value
+
+
+def _scan_shard(directory: Path, kind: str, shard: str, shard_output: Optional[Path], **options):
+    from file_manager_meta.sharding import scan_shard
+    index, count = map(int, shard.split("/"))
+    scan_shard(directory, kind, index, count, shard_output or Path(f"{kind}-shard-{index}-of-{count}.fmm"), **options)
+
+
+def _check_size(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return value
+    from file_manager_meta.filters import parse_size
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+
+def _emit(record_type: str, **fields):
+    """Writes one JSON Lines record to stdout."""
+    typer.echo(json.dumps({"type": record_type, **fields}, default=str))
+
+
+def _emit_summary(json_output: bool, **counts):
+    if json_output:
+        _emit("summary", **counts)
+    else:
+        for name, value in counts.items():
+            typer.echo(f"{name.replace('_', ' ').capitalize()}: {value}")
+
+
+def _check_headless(json_output: bool, quiet: bool, **unsupported):
+    if json_output or quiet:
+        for option, value in unsupported.items():
+            if value:
+                raise typer.BadParameter(f"can't be combined with --{option.replace('_', '-')}",
+                                         param_hint="--json" if json_output else "--quiet")
+
+
+@app.callback()
+def main(
+        ctx: typer.Context,
+        stats_json: Annotated[Optional[Path], typer.Option(
+            help="Write per-phase timings, throughput and cache hit rates of the run to this JSON file.")] = None,
+        prometheus_textfile: Annotated[Optional[Path], typer.Option(
+            help="Write the same metrics in Prometheus textfile collector format.")] = None,
+        max_read_rate: Annotated[Optional[float], typer.Option(
+            min=0.1, help="Limit file reads of all workers together to this many MB per second.")] = None,
+        max_open_rate: Annotated[Optional[float], typer.Option(
+            min=0.1, help="Limit files opened, moved or deleted to this many per second.")] = None,
+        target_latency: Annotated[Optional[float], typer.Option(
+            min=0.1, help="Lower the read rate while reading 1 MB takes longer than this many milliseconds, "
+                          "and raise it back towards --max-read-rate when storage recovers.")] = None,
+        low_priority: Annotated[bool, typer.Option(
+            help="Run at the lowest CPU priority and, on Linux, the lowest best-effort I/O priority.")] = False,
+        workers: Annotated[Optional[int], typer.Option(
+            min=1, help="Use this many worker processes or threads instead of the number tuned for the storage.")] = None,
+        read_block_size: Annotated[Optional[int], typer.Option(
+            min=4, help="Read files in blocks of this many KB instead of the size tuned for the storage.")] = None,
+        batch_size: Annotated[Optional[int], typer.Option(
+            min=1, help="Send small files to workers in batches of this many MB instead of the tuned size.")] = None,
+        retune: Annotated[bool, typer.Option(
+            help="Calibrate the storage again instead of reusing the settings saved for its device.")] = False,
+        exclude: Annotated[Optional[List[str]], typer.Option(
+            help="Skip entries matching this gitignore-style pattern (repeatable), e.g. 'node_modules/', '@eaDir/', "
+                 "'*.tmp', 'build/**'. A leading '!' re-includes. Excluded directories are never walked.")] = None,
+        include: Annotated[Optional[List[str]], typer.Option(
+            help="Only look at files matching this pattern (repeatable), e.g. '*.jpg' or 'photos/'.")] = None,
+        ignore_file: Annotated[Optional[List[Path]], typer.Option(
+            exists=True, dir_okay=False, help="Read exclude patterns from this gitignore-style file (repeatable).")] = None,
+        ext: Annotated[Optional[List[str]], typer.Option(
+            help="Only look at files with this extension (repeatable or comma-separated), e.g. jpg,png.")] = None,
+        min_size: Annotated[Optional[str], typer.Option(
+            callback=_check_size, help="Skip files smaller than this, e.g. 4K or 1.5M.")] = None,
+        max_size: Annotated[Optional[str], typer.Option(
+            callback=_check_size, help="Skip files larger than this, e.g. 2G.")] = None,
+):
+    """Organizes, repairs, reports on and deduplicates files using their metadata."""
+    metrics.reset()
+    metrics.command = ctx.invoked_subcommand
+    if target_latency and not max_read_rate:
+        raise typer.BadParameter("needs --max-read-rate, the rate it adapts below", param_hint="--target-latency")
+    if max_read_rate or max_open_rate or low_priority:
+        from file_manager_meta.throttle import configure
+        configure(max_read_rate * 1024 * 1024 if max_read_rate else None, max_open_rate,
+                  target_latency / 1000 if target_latency else None, low_priority)
+    if exclude or include or ignore_file or ext or min_size is not None or max_size is not None:
+        from file_manager_meta.filters import configure as configure_filters
+        configure_filters(exclude or (), include or (), ignore_file or (),
+                          [e.strip() for value in ext for e in value.split(",") if e.strip()] if ext else None,
+                          min_size, max_size)
+    if workers or read_block_size or batch_size or retune:
+        from file_manager_meta.tuning import configure as configure_tuning
+        configure_tuning(workers, read_block_size * 1024 if read_block_size else None,
+                         batch_size * 1024 * 1024 if batch_size else None, retune)
+
+    def write_stats():
+        # Runs when the command finishes, also when it fails or is interrupted
+        if stats_json:
+            metrics.write_json(stats_json)
+        if prometheus_textfile:
+            metrics.write_prometheus(prometheus_textfile)
+
+    ctx.call_on_close(write_stats)
+
 
 @app.command()
 def sort(directory: Annotated[Path, typer.Argument(exists=True, dir_okay=True, help="Directory to sort")],
          new_directory: Annotated[Path, typer.Option(dir_okay=True, help="New directory for sorted files")] = None,
-         sort_by: Annotated[SortBy, typer.Option(case_sensitive=False, prompt=True,
-                                                 help="Sorting criterion: 'ext', 'date', or 'size'")] = "ext",
+         sort_by: Annotated[Optional[SortBy], typer.Option(
+             case_sensitive=False, help="Sorting criterion: 'ext', 'date', or 'size' (asked for if not given, "
+                                        "'ext' with --json or --quiet)")] = None,
          date_granularity: Annotated[Optional[DateGranularity], typer.Option(
              help="Granularity for date sorting: 'year', 'month', or 'day'. Only valid with --sort-by date."
          )] = None,
+         json_output: Annotated[bool, typer.Option("--json", help=JSON_HELP)] = False,
+         quiet: Annotated[bool, typer.Option(help=QUIET_HELP)] = False,
          ):
     """Sorts files by extension, creation date, or size for better organization."""
+    if sort_by is None:
+        # Headless runs never prompt
+        sort_by = SortBy.EXT if json_output or quiet else SortBy(typer.prompt(
+            "Sort by", default=SortBy.EXT.value, type=click.Choice([choice.value for choice in SortBy], case_sensitive=False)))
     if date_granularity and sort_by != SortBy.DATE:
         console.print("[red]--date-granularity is only valid when --sort-by is 'date'.[/red]")
         raise typer.Exit(code=1)
@@ -36,20 +171,90 @@ def sort(directory: Annotated[Path, typer.Argument(exists=True, dir_okay=True, h
     if not new_directory:
         new_directory = directory
 
+    if json_output or quiet:
+        # Files without an extension are only counted; there is no prompt to repair them
+        from file_manager_meta.api import sort_files, NO_EXTENSION
+        counts = {"files_sorted": 0, "files_without_extension": 0, "files_failed": 0}
+        for move in sort_files(directory, new_directory, sort_by.value, date_granularity.value if date_granularity else None):
+            if move.destination:
+                counts["files_sorted"] += 1
+            else:
+                counts["files_without_extension" if move.error == NO_EXTENSION else "files_failed"] += 1
+            if json_output:
+                _emit("move", **move._asdict())
+        _emit_summary(json_output, **counts)
+        return
+
+    from file_manager_meta.sort import organizer
     organizer(directory, new_directory, sort_by.value, date_granularity.value if date_granularity else None)
 
 
 @app.command()
 def report(directory: Annotated[Path, typer.Argument(exists=True, help="Directory to report")],
            output: Annotated[Path, typer.Option(help="Output HTML file path")] = None,
+           memory_limit: Annotated[Optional[int], typer.Option(
+               help="Memory budget in MB. Spills the scan to disk so memory stays bounded on huge trees.")] = None,
+           read_order: Annotated[ReadOrder, typer.Option(case_sensitive=False, help=READ_ORDER_HELP)] = ReadOrder.AUTO,
+           device_workers: Annotated[Optional[int], typer.Option(min=1, help=DEVICE_WORKERS_HELP)] = None,
+           executor: Annotated[ExecutorKind, typer.Option(case_sensitive=False, help=EXECUTOR_HELP)] = ExecutorKind.PROCESSES,
+           shard: Annotated[Optional[str], typer.Option(callback=_check_shard, help=SHARD_HELP)] = None,
+           shard_output: Annotated[Optional[Path], typer.Option(dir_okay=False, help=SHARD_OUTPUT_HELP)] = None,
+           usage: Annotated[bool, typer.Option(
+               help="Report disk usage (directory sizes, file types, size distribution, largest files) instead of hashes.")] = False,
+           top: Annotated[int, typer.Option(min=1, max=100, help="Rows in each --usage table.")] = 20,
+           rescan: Annotated[bool, typer.Option(
+               help="With --usage, stat every file again instead of reusing the totals of unchanged directories.")] = False,
+           json_output: Annotated[bool, typer.Option("--json", help=JSON_HELP)] = False,
+           quiet: Annotated[bool, typer.Option(help=QUIET_HELP)] = False,
            ):
     """Generates a detailed report of file hashes, grouped by subfolder, and identifies duplicate file sets."""
-    generate_report(directory, output)
+    _check_headless(json_output, quiet, usage=usage, shard=shard, output=output, memory_limit=memory_limit)
+    if json_output or quiet:
+        from file_manager_meta.api import hash_files
+        files_by_md5 = {}
+        file_count = 0
+        for hashed in hash_files(directory, read_order=read_order.value, device_workers=device_workers,
+                                 executor_kind=executor.value):
+            file_count += 1
+            if hashed.md5:
+                files_by_md5.setdefault(hashed.md5, []).append(hashed.path)
+            if json_output:
+                _emit("file", **hashed._asdict())
+        duplicate_sets = [sorted(paths) for paths in files_by_md5.values() if len(paths) > 1]
+        if json_output:
+            for paths in duplicate_sets:
+                _emit("duplicate_set", files=paths)
+        _emit_summary(json_output, files_scanned=file_count, duplicate_sets=len(duplicate_sets))
+        return
+    if usage:
+        from file_manager_meta.usage import report_usage
+        report_usage(directory, output, top=top, rescan=rescan)
+        return
+    if shard:
+        _scan_shard(directory, "report", shard, shard_output, memory_limit_mb=memory_limit, read_order=read_order.value,
+                    device_workers=device_workers, executor_kind=executor.value)
+        return
+    from file_manager_meta.report import generate_report
+    generate_report(directory, output, memory_limit_mb=memory_limit, read_order=read_order.value, device_workers=device_workers,
+                    executor_kind=executor.value)
 
 
 @app.command()
-def repair(paths: Annotated[List[Path], typer.Argument(exists=True, help="Paths to repair (files or directories)")]):
+def repair(paths: Annotated[List[Path], typer.Argument(exists=True, help="Paths to repair (files or directories)")],
+           json_output: Annotated[bool, typer.Option("--json", help=JSON_HELP)] = False,
+           quiet: Annotated[bool, typer.Option(help=QUIET_HELP)] = False,
+           ):
     """Repair files with missing or incorrect extensions."""
+    if json_output or quiet:
+        from file_manager_meta.api import repair_extensions
+        counts = {"files_renamed": 0, "files_not_renamed": 0}
+        for move in repair_extensions(paths):
+            counts["files_renamed" if move.destination else "files_not_renamed"] += 1
+            if json_output:
+                _emit("rename", **move._asdict())
+        _emit_summary(json_output, **counts)
+        return
+    from file_manager_meta.repair import repair_extension
     repair_extension(paths)
 
 
@@ -59,14 +264,315 @@ def deduplicate(
         keep: Annotated[
             KeepRule, typer.Option(case_sensitive=False, help="Rule to decide which file to keep.")] = KeepRule.oldest,
         dry_run: Annotated[bool, typer.Option(help="Perform a dry run without deleting files.")] = False,
+        verify: Annotated[bool, typer.Option(help="Confirm hash-matched sets byte by byte before deleting.")] = False,
+        memory_limit: Annotated[Optional[int], typer.Option(
+            help="Memory budget in MB. Spills the scan to disk so memory stays bounded on huge trees.")] = None,
+        read_order: Annotated[ReadOrder, typer.Option(case_sensitive=False, help=READ_ORDER_HELP)] = ReadOrder.AUTO,
+        device_workers: Annotated[Optional[int], typer.Option(min=1, help=DEVICE_WORKERS_HELP)] = None,
+        executor: Annotated[ExecutorKind, typer.Option(case_sensitive=False, help=EXECUTOR_HELP)] = ExecutorKind.PROCESSES,
+        tree_hash: Annotated[bool, typer.Option(help=TREE_HASH_HELP)] = False,
+        shard: Annotated[Optional[str], typer.Option(callback=_check_shard, help=SHARD_HELP)] = None,
+        shard_output: Annotated[Optional[Path], typer.Option(dir_okay=False, help=SHARD_OUTPUT_HELP)] = None,
+        trash: Annotated[Optional[Path], typer.Option(file_okay=False, help=TRASH_HELP)] = None,
+        json_output: Annotated[bool, typer.Option("--json", help=JSON_HELP)] = False,
+        quiet: Annotated[bool, typer.Option(help=QUIET_HELP)] = False,
 ):
     """Finds and deletes duplicate files."""
+    _check_headless(json_output, quiet, shard=shard)
+    if shard:
+        # A shard only records what it found; files are deleted by 'merge --delete'
+        _scan_shard(directory, "deduplicate", shard, shard_output, memory_limit_mb=memory_limit, read_order=read_order.value,
+                    device_workers=device_workers, executor_kind=executor.value)
+        return
     if not dry_run:
         typer.confirm(
+            f"You are not in dry-run mode. Files will be moved to {trash}. Are you sure?" if trash else
             "You are not in dry-run mode. Files will be permanently deleted. Are you sure?",
-            abort=True,
+            abort=True, err=json_output,
+        )
+    if json_output or quiet:
+        from file_manager_meta.api import find_duplicates
+        _remove_headless(directory, json_output, dry_run, trash, find_duplicates(
+            directory, keep_rule=keep.value, verify=verify, memory_limit_mb=memory_limit, read_order=read_order.value,
+            device_workers=device_workers, executor_kind=executor.value, tree_hash=tree_hash))
+        return
+    from file_manager_meta.deduplicate import deduplicate_files
+    deduplicate_files(directory, dry_run=dry_run, keep_rule=keep.value, verify=verify, memory_limit_mb=memory_limit,
+                      read_order=read_order.value, device_workers=device_workers, executor_kind=executor.value,
+                      tree_hash=tree_hash, trash_dir=trash)
+
+
+def _emit_duplicate_set(duplicate_set, **fields):
+    _emit("duplicate_set", **fields, size=duplicate_set.size, keep=duplicate_set.keep.path,
+          duplicates=[record.path for record in duplicate_set.duplicates])
+
+
+def _remove_headless(directory: Path, json_output: bool, dry_run: bool, trash_dir: Optional[Path], duplicate_sets):
+    """Lists the duplicate sets, and removes their duplicates unless in a dry run, in JSON Lines or as a summary."""
+    from file_manager_meta.api import remove_duplicates
+    counts = {"duplicate_sets": 0, "duplicate_files": 0}
+
+    def announce(duplicate_sets):
+        for duplicate_set in duplicate_sets:
+            counts["duplicate_sets"] += 1
+            counts["duplicate_files"] += len(duplicate_set.duplicates)
+            if json_output:
+                _emit_duplicate_set(duplicate_set)
+            yield duplicate_set
+
+    removed_count = failed_count = 0
+    try:
+        if dry_run:
+            for _ in announce(duplicate_sets):
+                pass
+            _emit_summary(json_output, **counts)
+            return
+        for removal in remove_duplicates(directory, announce(duplicate_sets), trash_dir):
+            if removal.error:
+                failed_count += 1
+            else:
+                removed_count += 1
+            if json_output:
+                _emit("removal", **removal._asdict())
+    except ValueError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(code=1)
+    _emit_summary(json_output, **counts, **{"files_moved_to_trash" if trash_dir else "files_deleted": removed_count},
+                  files_not_removed=failed_count)
+    if failed_count:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def merge(
+        directory: Annotated[Path, typer.Argument(exists=True, dir_okay=True, help="Directory that was scanned in shards")],
+        shard_files: Annotated[List[Path], typer.Argument(exists=True, dir_okay=False, help="Results of every shard (--shard-output)")],
+        delete: Annotated[bool, typer.Option(help="Delete the duplicates instead of only listing them.")] = False,
+        keep: Annotated[
+            KeepRule, typer.Option(case_sensitive=False, help="Rule to decide which file to keep.")] = KeepRule.oldest,
+        output: Annotated[Optional[Path], typer.Option(help="Also save the results as an HTML report.")] = None,
+        memory_limit: Annotated[Optional[int], typer.Option(
+            help="Memory budget in MB. Spills the merged sets to disk so memory stays bounded on huge trees.")] = None,
+        executor: Annotated[ExecutorKind, typer.Option(case_sensitive=False, help=EXECUTOR_HELP)] = ExecutorKind.PROCESSES,
+        trash: Annotated[Optional[Path], typer.Option(file_okay=False, help=TRASH_HELP)] = None,
+        json_output: Annotated[bool, typer.Option("--json", help=JSON_HELP)] = False,
+        quiet: Annotated[bool, typer.Option(help=QUIET_HELP)] = False,
+):
+    """Combines the results of a sharded 'deduplicate' or 'report' scan into the final duplicate sets."""
+    _check_headless(json_output, quiet, output=output)
+    if delete:
+        typer.confirm(
+            f"Files will be moved to {trash}. Are you sure?" if trash else "Files will be permanently deleted. Are you sure?",
+            abort=True, err=json_output,
         )
-    deduplicate_files(directory, dry_run=dry_run, keep_rule=keep.value)
+    if json_output or quiet:
+        from file_manager_meta.api import find_sharded_duplicates
+        _remove_headless(directory, json_output, not delete, trash, find_sharded_duplicates(
+            directory, shard_files, keep_rule=keep.value, memory_limit_mb=memory_limit, executor_kind=executor.value))
+        return
+    from file_manager_meta.sharding import merge_shards
+    merge_shards(directory, shard_files, delete=delete, keep_rule=keep.value, output=output, memory_limit_mb=memory_limit,
+                 executor_kind=executor.value, trash_dir=trash)
+
+
+@app.command()
+def pipeline(
+        directory: Annotated[Path, typer.Argument(exists=True, dir_okay=True, help="Directory to process")],
+        stage: Annotated[Optional[List[PipelineStage]], typer.Option(
+            case_sensitive=False, help="Stage to run; repeat for several (default: all). They always run in the order "
+                                       "repair, deduplicate, sort, report.")] = None,
+        sort_by: Annotated[SortBy, typer.Option(case_sensitive=False, help="Sorting criterion: 'ext', 'date', or 'size'")] = SortBy.EXT,
+        new_directory: Annotated[Optional[Path], typer.Option(
+            file_okay=False, help="Directory (inside DIRECTORY) for sorted files.")] = None,
+        date_granularity: Annotated[Optional[DateGranularity], typer.Option(
+            help="Granularity for date sorting: 'year', 'month', or 'day'. Only valid with --sort-by date.")] = None,
+        keep: Annotated[
+            KeepRule, typer.Option(case_sensitive=False, help="Rule to decide which file to keep.")] = KeepRule.oldest,
+        dry_run: Annotated[bool, typer.Option(help="Show what would be renamed, deleted and sorted without changing anything.")] = False,
+        verify: Annotated[bool, typer.Option(help="Confirm hash-matched sets byte by byte before deleting.")] = False,
+        trash: Annotated[Optional[Path], typer.Option(file_okay=False, help=TRASH_HELP)] = None,
+        output: Annotated[Optional[Path], typer.Option(help="Output HTML file path for the report stage.")] = None,
+        executor: Annotated[ExecutorKind, typer.Option(case_sensitive=False, help=EXECUTOR_HELP)] = ExecutorKind.PROCESSES,
+        json_output: Annotated[bool, typer.Option("--json", help=JSON_HELP)] = False,
+        quiet: Annotated[bool, typer.Option(help=QUIET_HELP)] = False,
+):
+    """Runs repair, deduplicate, sort and report in a single pass over the tree, sharing one walk, cache and worker pool."""
+    _check_headless(json_output, quiet, output=output)
+    stages = stage or list(PipelineStage)
+    if date_granularity and sort_by != SortBy.DATE:
+        console.print("[red]--date-granularity is only valid when --sort-by is 'date'.[/red]")
+        raise typer.Exit(code=1)
+    if not dry_run and PipelineStage.DEDUPLICATE in stages:
+        typer.confirm(
+            f"You are not in dry-run mode. Duplicates will be moved to {trash}. Are you sure?" if trash else
+            "You are not in dry-run mode. Duplicates will be permanently deleted. Are you sure?",
+            abort=True, err=json_output,
+        )
+    if json_output or quiet:
+        _pipeline_headless(directory, json_output, stages, new_directory=new_directory, sort_by=sort_by.value,
+                           date_granularity=date_granularity.value if date_granularity else None, keep_rule=keep.value,
+                           dry_run=dry_run, verify=verify, trash_dir=trash, executor_kind=executor.value)
+        return
+    from file_manager_meta.pipeline import run_pipeline
+    run_pipeline(directory, stages, new_directory=new_directory, sort_by=sort_by.value,
+                 date_granularity=date_granularity.value if date_granularity else None, keep_rule=keep.value,
+                 dry_run=dry_run, verify=verify, trash_dir=trash, output=output, executor_kind=executor.value)
+
+
+# Summary counts of each stage of a headless pipeline
+_PIPELINE_COUNTS = {
+    PipelineStage.REPAIR: ("files_renamed", "files_not_renamed"),
+    PipelineStage.DEDUPLICATE: ("duplicate_sets", "files_removed", "files_not_removed"),
+    PipelineStage.SORT: ("files_sorted", "files_not_sorted"),
+    PipelineStage.REPORT: ("files_hashed", "files_not_hashed"),
+}
+
+
+def _pipeline_headless(directory: Path, json_output: bool, stages: List[PipelineStage], **options):
+    from file_manager_meta.api import run_pipeline, DuplicateSet, Removal, HashedFile
+    counts = {name: 0 for stage in PipelineStage if stage in stages for name in _PIPELINE_COUNTS[stage]}
+    try:
+        for stage, result in run_pipeline(directory, stages, **options):
+            if isinstance(result, DuplicateSet):
+                counts["duplicate_sets"] += 1
+                if json_output:
+                    _emit_duplicate_set(result, stage=stage.value)
+                continue
+            if isinstance(result, HashedFile):
+                record_type, outcome = "file", "files_not_hashed" if result.md5 is None else "files_hashed"
+            elif isinstance(result, Removal):
+                record_type, outcome = "removal", "files_not_removed" if result.error else "files_removed"
+            elif stage == PipelineStage.REPAIR:
+                record_type, outcome = "rename", "files_not_renamed" if result.error else "files_renamed"
+            else:
+                # In a dry run, files are counted as sorted without a destination
+                record_type, outcome = "move", "files_not_sorted" if result.error else "files_sorted"
+            counts[outcome] += 1
+            if json_output:
+                _emit(record_type, stage=stage.value, **result._asdict())
+    except ValueError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(code=1)
+    _emit_summary(json_output, **counts)
+
+
+@app.command("purge-trash")
+def purge_trash_command(
+        trash: Annotated[Path, typer.Argument(exists=True, file_okay=False, help="Trash directory given to --trash")],
+        older_than: Annotated[float, typer.Option(min=0, help="Only purge runs older than this many days.")] = 0,
+):
+    """Permanently deletes the files moved to a trash directory by 'deduplicate --trash' or 'merge --trash'."""
+    typer.confirm(f"Files in {trash} will be permanently deleted. Are you sure?", abort=True)
+    from file_manager_meta.deletion import purge_trash
+    purge_trash(trash, older_than_days=older_than)
+
+
+@app.command("ingest-check")
+def ingest_check_command(
+        ingest: Annotated[Path, typer.Argument(exists=True, file_okay=False, help="Folder of newly arrived files")],
+        library: Annotated[Path, typer.Argument(exists=True, file_okay=False,
+                                                help="Library to check against, through its cache (hash it first with report or deduplicate)")],
+        on_duplicate: Annotated[DuplicateAction, typer.Option(
+            case_sensitive=False, help="What to do with files already in the library: 'report' them, 'skip' them "
+                                       "(print only the new files' paths) or 'quarantine' them.")] = DuplicateAction.REPORT,
+        quarantine: Annotated[Optional[Path], typer.Option(
+            file_okay=False, help="Directory duplicates are moved into with --on-duplicate quarantine.")] = None,
+        executor: Annotated[ExecutorKind, typer.Option(case_sensitive=False, help=EXECUTOR_HELP)] = ExecutorKind.PROCESSES,
+        json_output: Annotated[bool, typer.Option("--json", help=JSON_HELP)] = False,
+        quiet: Annotated[bool, typer.Option(help=QUIET_HELP)] = False,
+):
+    """Checks which incoming files already exist in a library, hashing only those whose size occurs in it."""
+    if json_output or quiet:
+        # Every record tells whether its file is new, so 'skip' lists the same as 'report'
+        if on_duplicate == DuplicateAction.QUARANTINE and not quarantine:
+            raise typer.BadParameter("is required with --on-duplicate quarantine", param_hint="--quarantine")
+        from file_manager_meta.api import check_ingest
+        counts = {"incoming_files": 0, "already_in_library": 0, "new_files": 0, "unreadable_files": 0}
+        if on_duplicate == DuplicateAction.QUARANTINE:
+            counts.update(files_quarantined=0, files_not_quarantined=0)
+        try:
+            for checked in check_ingest(ingest, library, quarantine if on_duplicate == DuplicateAction.QUARANTINE else None,
+                                        executor_kind=executor.value):
+                counts["incoming_files"] += 1
+                if checked.library_file:
+                    counts["already_in_library"] += 1
+                    if on_duplicate == DuplicateAction.QUARANTINE:
+                        counts["files_not_quarantined" if checked.error else "files_quarantined"] += 1
+                else:
+                    counts["new_files"] += 1
+                    if checked.error:
+                        counts["unreadable_files"] += 1
+                if json_output:
+                    _emit("ingest", **checked._asdict())
+        except ValueError as e:
+            typer.echo(str(e), err=True)
+            raise typer.Exit(code=1)
+        _emit_summary(json_output, **counts)
+        if counts.get("files_not_quarantined"):
+            raise typer.Exit(code=1)
+        return
+    from file_manager_meta.ingest import check_ingest
+    check_ingest(ingest, library, action=on_duplicate.value, quarantine_dir=quarantine, executor_kind=executor.value)
+
+
+@app.command()
+def scrub(
+        directory: Annotated[Path, typer.Argument(exists=True, dir_okay=True, help="Directory whose cached digests to verify")],
+        max_gb: Annotated[Optional[float], typer.Option(min=0.001, help="Stop after reading this many GB.")] = None,
+        max_minutes: Annotated[Optional[float], typer.Option(min=0.01, help="Stop after this many minutes.")] = None,
+        executor: Annotated[ExecutorKind, typer.Option(case_sensitive=False, help=EXECUTOR_HELP)] = ExecutorKind.PROCESSES,
+        json_output: Annotated[bool, typer.Option("--json", help=JSON_HELP)] = False,
+        quiet: Annotated[bool, typer.Option(help=QUIET_HELP)] = False,
+):
+    """Rereads unchanged files, least recently verified first, and flags any whose content no longer matches its cached digests."""
+    max_bytes = int(max_gb * 1024 ** 3) if max_gb else None
+    max_seconds = max_minutes * 60 if max_minutes else None
+    if json_output or quiet:
+        from file_manager_meta.api import scrub_files
+        counts = {"verified": 0, "mismatch": 0, "unreadable": 0, "changed": 0}
+        for scrubbed in scrub_files(directory, max_bytes, max_seconds, executor_kind=executor.value):
+            counts[scrubbed.outcome] += 1
+            if json_output:
+                _emit("verification", **scrubbed._asdict())
+        _emit_summary(json_output, files_verified=counts["verified"], digest_mismatches=counts["mismatch"],
+                      unreadable_files=counts["unreadable"], changed_while_read=counts["changed"])
+        if counts["mismatch"] or counts["unreadable"]:
+            raise typer.Exit(code=1)
+        return
+    from file_manager_meta.scrub import scrub_cache
+    scrub_cache(directory, max_bytes=max_bytes, max_seconds=max_seconds, executor_kind=executor.value)
+
+
+@app.command()
+def similar(
+        directory: Annotated[Path, typer.Argument(exists=True, dir_okay=True, help="Directory to scan for similar files")],
+        threshold: Annotated[float, typer.Option(min=0.0, max=1.0,
+                                                 help="Minimum share of common content (0-1) for a pair to be reported.")] = 0.5,
+        limit: Annotated[int, typer.Option(min=1, help="Maximum number of pairs to show.")] = 50,
+        read_order: Annotated[ReadOrder, typer.Option(case_sensitive=False, help=READ_ORDER_HELP)] = ReadOrder.AUTO,
+        device_workers: Annotated[Optional[int], typer.Option(min=1, help=DEVICE_WORKERS_HELP)] = None,
+        executor: Annotated[ExecutorKind, typer.Option(case_sensitive=False, help=EXECUTOR_HELP)] = ExecutorKind.PROCESSES,
+        memory_limit: Annotated[Optional[int], typer.Option(
+            help="Memory budget in MB. Counts the chunks files share on disk so memory stays bounded on huge trees.")] = None,
+        json_output: Annotated[bool, typer.Option("--json", help=JSON_HELP)] = False,
+        quiet: Annotated[bool, typer.Option(help=QUIET_HELP)] = False,
+):
+    """Finds partial and near duplicates by comparing content-defined chunks, and estimates block-level dedup savings."""
+    if json_output or quiet:
+        # Every pair above the threshold is written; --limit only shortens the table
+        from file_manager_meta.api import find_similar
+        report = find_similar(directory, threshold=threshold, read_order=read_order.value, device_workers=device_workers,
+                              executor_kind=executor.value, memory_limit_mb=memory_limit)
+        if json_output:
+            for pair in report.pairs:
+                _emit("similar_pair", **pair._asdict())
+        summary = report._asdict()
+        del summary["pairs"]
+        _emit_summary(json_output, **summary, similar_pairs=len(report.pairs))
+        return
+    from file_manager_meta.similarity import find_similar_files
+    find_similar_files(directory, threshold=threshold, limit=limit, read_order=read_order.value, device_workers=device_workers,
+                       executor_kind=executor.value, memory_limit_mb=memory_limit)
 
 
 @app.command("update-metadata-date")
@@ -76,11 +582,36 @@ def update_metadata_date_command(
     tag: Annotated[Optional[str], typer.Option(help="Specific ExifTool tag to update (e.g., CreateDate, DateTimeOriginal).")] = None,
     no_backup: Annotated[bool, typer.Option(help="Do not create _original backup files.")] = False,
     force: Annotated[bool, typer.Option(help="Force update even if dates already match.")] = False,
+    json_output: Annotated[bool, typer.Option("--json", help=JSON_HELP)] = False,
+    quiet: Annotated[bool, typer.Option(help=QUIET_HELP)] = False,
 ):
     """Updates file metadata date to match the date found in the filename."""
+    if json_output or quiet:
+        from file_manager_meta.api import update_metadata_dates
+        counts = {"updated": 0, "dry_run": 0, "skipped": 0, "error": 0}
+        for update in update_metadata_dates(paths, dry_run=dry_run, tag=tag, no_backup=no_backup, force=force):
+            counts[update.outcome] += 1
+            if json_output:
+                _emit("metadata_update", **update._asdict())
+        _emit_summary(json_output, files_updated=counts["updated"], files_in_dry_run=counts["dry_run"],
+                      files_skipped=counts["skipped"], files_with_errors=counts["error"])
+        return
+    from file_manager_meta.metadata_updater import update_metadata_date
     update_metadata_date(paths, dry_run=dry_run, tag=tag, no_backup=no_backup, force=force)
 
 
+@app.command()
+def watch(
+        directory: Annotated[Path, typer.Argument(exists=True, dir_okay=True, help="Directory to watch")],
+        rescan_interval: Annotated[float, typer.Option(help="Seconds between full rescans when inotify is unavailable.")] = 300,
+        settle: Annotated[float, typer.Option(help="Seconds a directory must be quiet before its new files are hashed.")] = 2.0,
+        executor: Annotated[ExecutorKind, typer.Option(case_sensitive=False, help=EXECUTOR_HELP)] = ExecutorKind.PROCESSES,
+):
+    """Watches a directory and keeps its cache warm by hashing new or modified files in the background."""
+    from file_manager_meta.watcher import watch_directory
+    watch_directory(directory, rescan_interval=rescan_interval, settle_seconds=settle, executor_kind=executor.value)
+
+
 # Create a Typer app for cache commands
 cache_app = typer.Typer(name="cache", help="Manage the application's cache.")
 
@@ -89,6 +620,7 @@ cache_app = typer.Typer(name="cache", help="Manage the application's cache.")
 def cache_view(
         directory: Annotated[Path, typer.Argument(exists=True, dir_okay=True, help="Directory whose cache to view.")]):
     """View the contents of the cache database for a specific directory."""
+    from file_manager_meta.cache_manager import view_cache_contents
     view_cache_contents(directory)
 
 
@@ -100,6 +632,7 @@ def cache_clear(
         f"This will permanently delete the cache database for {directory}. Are you sure?",
         abort=True,
     )
+    from file_manager_meta.cache_manager import clear_cache
     clear_cache(directory)
 
 
@@ -111,6 +644,7 @@ def cache_recreate(directory: Annotated[
         f"This will permanently delete and recreate the cache database for {directory}. Are you sure?",
         abort=True,
     )
+    from file_manager_meta.cache_manager import recreate_database
     recreate_database(directory)
 
 
@@ -121,6 +655,7 @@ def cache_clear_all():
         "This will permanently delete ALL cache databases for the application. Are you sure?",
         abort=True,
     )
+    from file_manager_meta.cache_manager import clear_all_caches
     clear_all_caches()
 
 
@@ -128,10 +663,29 @@ def cache_clear_all():
 def cache_path(directory: Annotated[
     Path, typer.Argument(exists=True, dir_okay=True, help="Directory whose cache path to view.")]):
     """Show the path to the cache database for a specific directory."""
+    from file_manager_meta.cache_paths import get_cache_file_path
     db_path = get_cache_file_path(directory)
     console.print(f"Cache database path for [cyan]{directory}[/cyan]: [green]{db_path}[/green]")
 
 
+@cache_app.command("export")
+def cache_export(
+        directory: Annotated[Path, typer.Argument(exists=True, dir_okay=True, help="Directory whose cache to export.")],
+        output: Annotated[Path, typer.Argument(dir_okay=False, help="Index file to write.")]):
+    """Export the cached hashes of a directory to a portable index, keyed by relative path."""
+    from file_manager_meta.cache_index import export_cache_index
+    export_cache_index(directory, output)
+
+
+@cache_app.command("import")
+def cache_import(
+        directory: Annotated[Path, typer.Argument(exists=True, dir_okay=True, help="Directory whose cache to fill.")],
+        index: Annotated[Path, typer.Argument(exists=True, dir_okay=False, help="Index file written by 'cache export'.")]):
+    """Import a portable index, trusting only entries whose size and modification time still match."""
+    from file_manager_meta.cache_index import import_cache_index
+    import_cache_index(directory, index)
+
+
 # Register the cache_app as a subcommand of the main app
 app.add_typer(cache_app)
 
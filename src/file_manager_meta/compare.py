@@ -0,0 +1,136 @@
+import hashlib
+import mmap
+from contextlib import ExitStack
+from pathlib import Path
+
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.sparse import extent_map, update_with_zeros, zero_block
+from file_manager_meta.throttle import throttle_open, throttle_read
+
+BLOCK_SIZE = 1024 * 1024  # Bytes compared per member on each lockstep step
+MAX_OPEN_FILES = 64  # Larger groups are compared in batches (see split_large_group)
+HASH_NAMES = ("md5", "sha1", "sha256")
+
+
+def _open_block_reader(stack: ExitStack, file_path: Path):
+    """
+    Returns a function that reads a block at a given offset, backed by mmap when possible,
+    and the file's extent map if it is sparse.
+    """
+    throttle_open()
+    f = stack.enter_context(open(file_path, "rb"))
+    extents = extent_map(f.fileno())
+    try:
+        mm = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return (lambda offset, length: mm[offset:offset + length]), extents
+    except (ValueError, OSError):
+        # Empty files and some special filesystems cannot be mapped; fall back to plain reads
+        def read_block(offset, length):
+            f.seek(offset)
+            return f.read(length)
+        return read_block, extents
+
+
+def _split(files: list[FileRecord], block_size: int, hash_names: tuple[str, ...]) -> list[tuple[list[FileRecord], dict]]:
+    """
+    Compares files of the same size block by block, all members in lockstep, optionally hashing each group's
+    content as it goes (one stream per group, copied when a group splits). Returns the groups of two or more
+    byte-identical files, each with its digest objects.
+    """
+    size = files[0].size if files else 0
+    with metrics.timer("compare"), ExitStack() as stack:
+        readers = {}
+        extent_maps = {}
+        for record in files:
+            try:
+                readers[record.path], extent_maps[record.path] = _open_block_reader(stack, record.path)
+            except OSError:
+                continue  # Unreadable files cannot be confirmed as duplicates
+
+        groups = [([record for record in files if record.path in readers],
+                   {name: hashlib.new(name) for name in hash_names})]
+        offset = 0
+        while offset < size:
+            groups = [(group, digests) for group, digests in groups if len(group) > 1]
+            if not groups:
+                break
+            length = min(block_size, size - offset)
+            maps = [extent_maps[record.path] for group, _ in groups for record in group]
+            if all(maps) and all(extents.is_hole(offset, offset + length) for extents in maps):
+                # A hole in every remaining file reads as the same zeros: jump to the next allocated byte
+                next_offset = min(extents.next_data(offset) for extents in maps)
+                metrics.count("sparse_bytes_skipped", (next_offset - offset) * len(maps))
+                for _, digests in groups:
+                    update_with_zeros(digests.values(), next_offset - offset)
+                offset = next_offset
+                continue
+            next_groups = []
+            for group, digests in groups:
+                members_by_block = {}
+                for record in group:
+                    extents = extent_maps[record.path]
+                    if extents and extents.is_hole(offset, offset + length):
+                        block = zero_block(length)
+                        metrics.count("sparse_bytes_skipped", length)
+                    else:
+                        try:
+                            block = readers[record.path](offset, length)
+                        except OSError:
+                            continue
+                        metrics.count("bytes_read", len(block))
+                        throttle_read(len(block))
+                    members_by_block.setdefault(block, []).append(record)
+                for block, members in members_by_block.items():
+                    if len(members) < 2:
+                        continue  # Unique from here on, so no longer read or hashed
+                    # Only a group that splits needs its own copy of the digests so far
+                    members_digests = digests if len(members_by_block) == 1 else \
+                        {name: digest.copy() for name, digest in digests.items()}
+                    for digest in members_digests.values():
+                        digest.update(block)
+                    next_groups.append((members, members_digests))
+            groups = next_groups
+            offset += length
+        return [(group, digests) for group, digests in groups if len(group) > 1]
+
+
+def split_by_content(files: list[FileRecord], block_size: int = BLOCK_SIZE) -> list[list[FileRecord]]:
+    """
+    Compares files of the same size block by block, all members in lockstep.
+    A group is split as soon as its members diverge, and members that become unique stop being read.
+    Returns only the groups of two or more byte-identical files.
+    """
+    return [group for group, _ in _split(files, block_size, ())]
+
+
+def split_and_hash_by_content(files: list[FileRecord], block_size: int = BLOCK_SIZE) -> list[tuple[list[FileRecord], dict]]:
+    """
+    Like split_by_content, but also returns the MD5, SHA-1 and SHA-256 of each group, hashed from the blocks
+    already read for the comparison, so the members can be cached like hashed files.
+    """
+    return [(group, {name: digest.hexdigest() for name, digest in digests.items()})
+            for group, digests in _split(files, block_size, HASH_NAMES)]
+
+
+def split_large_group(files: list[FileRecord], max_open_files: int = MAX_OPEN_FILES) -> list[list[FileRecord]]:
+    """
+    split_by_content for groups with more members than files may be open at once: each batch of members is
+    compared with a reference member, and those that differ from it are compared again among themselves.
+    """
+    groups = []
+    remaining = files
+    while len(remaining) > 1:
+        reference = remaining[0]
+        matched = [reference]
+        leftovers = []
+        for start in range(1, len(remaining), max_open_files - 1):
+            batch = remaining[start:start + max_open_files - 1]
+            same = next((group for group in split_by_content([reference, *batch]) if group[0] is reference), [])
+            matched.extend(same[1:])
+            same_ids = {id(record) for record in same}
+            leftovers.extend(record for record in batch if id(record) not in same_ids)
+        if len(matched) > 1:
+            groups.append(matched)
+        remaining = leftovers
+    return groups
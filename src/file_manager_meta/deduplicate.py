@@ -1,174 +1,341 @@
-import os
-from collections import defaultdict
 from pathlib import Path
 from datetime import datetime
 from rich.console import Console
+from rich.progress import Progress
 from rich.table import Table
-from concurrent.futures import ProcessPoolExecutor # New import
+from functools import partial
 
-from file_manager_meta.hashes import calculate_hashes
-from file_manager_meta.cache_manager import init_cache
+from file_manager_meta.hashes import calculate_hashes, calculate_tree_hash, TREE_HASH_MIN_SIZE
+from file_manager_meta.cache_manager import CacheWriter, init_cache, worker_connection, get_cached_hashes, set_cached_hashes
+from file_manager_meta.compare import split_by_content, split_and_hash_by_content, split_large_group, MAX_OPEN_FILES
+from file_manager_meta.deletion import open_trash, remove_files, print_failures
+from file_manager_meta.layout import resolve_read_order
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.scan_store import open_scan_store
+from file_manager_meta.scheduler import open_executor, schedule
+from file_manager_meta.tuning import tune
+from file_manager_meta.walker import walk_files
+
+# Size groups this small are compared byte by byte instead of being hashed
+MAX_COMPARE_GROUP_SIZE = 3
+# Content keys of sets found by the comparison stage, which need no verification
+COMPARED_KEY_PREFIX = "cmp:"
+# Content keys of large files identified by their tree hash rather than their MD5
+TREE_KEY_PREFIX = "tree:"
 
 def format_size(size_in_bytes):
     if size_in_bytes < 1024:
         return f"{size_in_bytes} B"
     if size_in_bytes < 1024 * 1024:
         return f"{size_in_bytes / 1024:.1f} KB"
-    return f"{size_in_bytes / (1024 * 1024):.1f} MB"
+    if size_in_bytes < 1024 ** 3:
+        return f"{size_in_bytes / (1024 * 1024):.1f} MB"
+    if size_in_bytes < 1024 ** 4:
+        return f"{size_in_bytes / 1024 ** 3:.1f} GB"
+    return f"{size_in_bytes / 1024 ** 4:.1f} TB"
 
 def format_timestamp(ts):
     return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
 
 # Helper function for multiprocessing
-def _process_file_for_deduplication(file_path: Path, root_directory: Path):
-    # Each process needs its own connection
-    conn, _ = init_cache(root_directory) # _get_cache_db_path is called inside init_cache
-    try:
-        hashes = calculate_hashes(file_path, conn)
-        return file_path, hashes.get("md5")
-    finally:
-        conn.close()
+def _process_file_for_deduplication(record: FileRecord, root_directory: Path, writer: CacheWriter | None = None,
+                                    tree_hash: bool = False):
+    # Each worker needs its own connection, reused across its tasks
+    conn = worker_connection(root_directory)
+    # Every file of a size group is of the same size, so they all get the same kind of key
+    if tree_hash and record.size >= TREE_HASH_MIN_SIZE:
+        digest = calculate_tree_hash(record, conn, writer)
+        return f"{TREE_KEY_PREFIX}{digest}" if digest else None
+    hashes = calculate_hashes(record, conn, writer)
+    return hashes.get("md5")
+
+def _match_small_group(files: list[FileRecord], root_directory: Path,
+                       writer: CacheWriter | None = None) -> list[tuple[str | None, list[FileRecord]]]:
+    """
+    Finds the duplicates of a small size group: by MD5 when the cache knows some of its members (hashing
+    the others), and otherwise byte by byte, caching the hashes of every duplicate found so the next run
+    reads nothing. Returns (content key, files) pairs; the key is None for sets confirmed byte by byte.
+    """
+    conn = worker_connection(root_directory)
+    cached = []
+    for record in files:
+        with metrics.timer("cache_lookup"):
+            cached_hashes = get_cached_hashes(conn, record.path, record)
+        cached.append(cached_hashes)
+        if cached_hashes and cached_hashes.get("md5"):
+            metrics.count("cache_hits_full")
+            record.hashes = cached_hashes
+
+    if any(record.hashes and record.hashes.get("md5") for record in files):
+        files_by_md5 = {}
+        for record in files:
+            md5 = calculate_hashes(record, conn, writer).get("md5")
+            if md5:
+                files_by_md5.setdefault(md5, []).append(record)
+        return [(md5, group) for md5, group in files_by_md5.items() if len(group) > 1]
+
+    metrics.count("cache_misses", len(files))
+    partial_hashes = {id(record): cached_hashes for record, cached_hashes in zip(files, cached)}
+    groups = []
+    for group, hashes in split_and_hash_by_content(files):
+        groups.append(group)
+        for record in group:
+            # A partial hit only holds other data (e.g. the ExifTool file type), which must survive the update
+            record.hashes = {**(partial_hashes[id(record)] or {}), **hashes}
+            with metrics.timer("cache_write"):
+                if writer:
+                    writer.put(record.path, record, record.hashes)
+                else:
+                    set_cached_hashes(conn, record.path, record, record.hashes)
+    return [(None, group) for group in groups]
+
+def _process_candidate_for_deduplication(candidate, root_directory: Path, writer: CacheWriter | None = None,
+                                         tree_hash: bool = False):
+    # A list is a small size group to compare byte by byte, a record is a file to hash
+    if isinstance(candidate, list):
+        return _match_small_group(candidate, root_directory, writer)
+    return _process_file_for_deduplication(candidate, root_directory, writer, tree_hash)
+
+def _verify_duplicate_set(item: tuple[str, list[FileRecord]]) -> list[list[FileRecord]]:
+    content_key, files = item
+    if content_key.startswith(COMPARED_KEY_PREFIX):
+        return [files]
+    if len(files) > MAX_OPEN_FILES:
+        return split_large_group(files)
+    return split_by_content(files)
+
+def _candidate_size(candidate) -> int:
+    # Bytes a worker reads for a candidate, at most
+    if isinstance(candidate, list):
+        return candidate[0].size * len(candidate)
+    return candidate.size
+
+def _candidate_record(candidate) -> FileRecord:
+    # The first member stands for a compared group when ordering reads by disk position
+    return candidate[0] if isinstance(candidate, list) else candidate
+
+def _duplicate_set_size(item: tuple[str, list[FileRecord]]) -> int:
+    return _candidate_size(item[1])
+
+def _duplicate_set_record(item: tuple[str, list[FileRecord]]) -> FileRecord:
+    return item[1][0]
+
+def _iter_candidates(store):
+    # Size groups come largest first, so the scheduler gets the biggest files first without sorting
+    for files in store.iter_size_groups():
+        if len(files) <= MAX_COMPARE_GROUP_SIZE:
+            yield files
+        else:
+            yield from files
+
+def iter_verified_sets(executor, duplicate_sets, workers: int, read_order: str, device_workers: int | None):
+    for _, groups in schedule(executor, _verify_duplicate_set, duplicate_sets, workers, _duplicate_set_size,
+                              read_order=read_order, record_of=_duplicate_set_record, device_workers=device_workers):
+        yield from groups
+
+def order_by_keep_rule(files: list[FileRecord], keep_rule: str) -> list[FileRecord]:
+    """Sorts a duplicate set in place so the file to keep comes first."""
+    if keep_rule == 'oldest':
+        files.sort(key=lambda f: f.ctime_ns)
+    return files
+
+def match_candidates(executor, workers: int, store, directory: Path, console: Console | None, writer: CacheWriter | None = None,
+                      tree_hash: bool = False, read_order: str = "size", device_workers: int | None = None) -> bool:
+    """
+    Compares the small size groups of the store byte by byte (see _match_small_group) and hashes the files of the others,
+    recording each file's content key in the store. Returns False if no two files share a size.
+    Progress is shown on console, if given.
+    """
+    candidate_count = 0
+    candidate_bytes = 0
+    for size, count in store.iter_size_counts():
+        candidate_count += 1 if count <= MAX_COMPARE_GROUP_SIZE else count
+        candidate_bytes += size * count
+
+    process_candidate = partial(_process_candidate_for_deduplication, root_directory=directory, writer=writer,
+                                tree_hash=tree_hash)
+    candidates_found = False
+    compared_groups = 0
+    with metrics.phase("hashing"), \
+            Progress(console=console or Console(quiet=True), transient=True, disable=console is None) as progress:
+        task = progress.add_task("[green]Comparing and hashing candidates[/green]", total=candidate_count)
+        for candidate, result in schedule(executor, process_candidate, _iter_candidates(store), workers,
+                                          _candidate_size, total_bytes=candidate_bytes,
+                                          progress=progress, task_id=task, read_order=read_order,
+                                          record_of=_candidate_record, device_workers=device_workers):
+            candidates_found = True
+            if isinstance(candidate, list):
+                for content_key, group in result:
+                    if content_key is None:
+                        compared_groups += 1
+                        content_key = f"{COMPARED_KEY_PREFIX}{compared_groups}"
+                    for record in group:
+                        store.add_match(record, content_key)
+            elif result:
+                store.add_match(candidate, result)
+    return candidates_found
+
+def _report_dry_run(console: Console, duplicate_sets, keep_rule: str) -> tuple[int, int]:
+    """Prints the KEEP/DELETE plan for each set. Returns (sets found, files that would be deleted)."""
+    set_count = 0
+    delete_count = 0
+    for files in duplicate_sets:
+        if set_count == 0:
+            console.print("\n[yellow]Dry run mode enabled. The following actions would be taken:[/yellow]\n")
+        set_count += 1
+        table = Table(title=f"Duplicate Set {set_count} (Size: {format_size(files[0].size)})\n")
+        table.add_column("Status", style="bold")
+        table.add_column("File Path", style="cyan", no_wrap=True)
+        table.add_column("Created On")
+
+        order_by_keep_rule(files, keep_rule)
+        
+        file_to_keep = files[0]
+        table.add_row(
+            "[green]KEEP[/green]",
+            str(file_to_keep.path),
+            format_timestamp(file_to_keep.st_ctime)
+        )
+
+        for file_to_delete in files[1:]:
+            table.add_row(
+                "[red]DELETE[/red]",
+                str(file_to_delete.path),
+                format_timestamp(file_to_delete.st_ctime)
+            )
+            delete_count += 1
+        
+        console.print(table)
+    return set_count, delete_count
 
-def deduplicate_files(directory: Path, dry_run: bool, keep_rule: str):
+def _delete_duplicates(console: Console, duplicate_sets, keep_rule: str, directory: Path,
+                       staging_dir: Path | None = None, conn=None) -> tuple[int, list[FileRecord]]:
+    """
+    Deletes all but the kept file of each set, or moves them into staging_dir (see deletion.open_trash).
+    Returns (sets found, records of the files that were removed).
+    """
+    set_count = 0
+    files_to_delete = []
+    for files in duplicate_sets:
+        set_count += 1
+        order_by_keep_rule(files, keep_rule)
+        files_to_delete.extend(files[1:])
+
+    if not files_to_delete:
+        return set_count, []
+
+    table = Table(title="Files to be Moved to the Trash" if staging_dir else "Files to be Permanently Deleted")
+    table.add_column("File Path", style="red")
+    for record in files_to_delete:
+        table.add_row(str(record.path))
+    console.print(table)
+
+    if staging_dir:
+        console.print(f"\nMoving {len(files_to_delete)} files to [cyan]{staging_dir}[/cyan]...")
+    else:
+        console.print(f"\nProceeding with deletion of {len(files_to_delete)} files...")
+    removed, failures = remove_files(console, [record.path for record in files_to_delete], directory, staging_dir, conn=conn)
+    if failures:
+        print_failures(console, failures, directory)
+        console.print(f"\n[bold red]{len(failures)} files could not be removed; the rest were.[/bold red]")
+    else:
+        console.print("\n[green]Deletion complete.[/green]")
+    removed = set(removed)
+    return set_count, [record for record in files_to_delete if record.path in removed]
+
+def deduplicate_files(directory: Path, dry_run: bool, keep_rule: str, verify: bool = False, memory_limit_mb: int | None = None,
+                      read_order: str = "auto", device_workers: int | None = None, executor_kind: str = "processes",
+                      tree_hash: bool = False, trash_dir: Path | None = None):
     console = Console()
     console.print(f"Starting duplicate scan in [cyan]{directory}[/cyan]...\n")
+    # Checked before scanning, so an unusable trash doesn't cost a full scan
+    staging_dir = open_trash(console, directory, trash_dir) if trash_dir and not dry_run else None
+    read_order = resolve_read_order(directory, read_order)
+    if read_order != "size":
+        console.print(f"Reading files in on-disk order ({read_order}).")
 
     # Initialize cache in main process to ensure DB file exists
     conn, db_path = init_cache(directory)
     conn.close() # Close immediately, workers will open their own
     console.print(f"Using cache database: [dim]{db_path}[/dim]")
 
-    # --- Step 1: Collect all file paths ---
-    console.print("Step 1: Collecting all file paths...")
-    all_file_paths = []
-    for dir_path, dir_names, file_names in os.walk(directory):
-        # Modify dir_names in-place to skip system/hidden directories
-        dir_names[:] = [d for d in dir_names if d not in ['System Volume Information', '$RECYCLE.BIN']]
-        dir_names[:] = [d for d in dir_names if not d.startswith('.')] # Skip hidden directories
-
-        for file_name in file_names:
-            file_path = Path(dir_path) / file_name
-            # Skip hidden files
-            if file_path.name.startswith('.'):
-                continue
-
-            try:
-                if file_path.is_file() and not file_path.is_symlink():
-                    all_file_paths.append(file_path)
-            except OSError:
-                continue
-    
-    if not all_file_paths:
-        console.print("[green]No files found to scan.[/green]")
-        return
-
-    # --- Step 2: Group files by size ---
-    console.print("Step 2: Grouping files by size...")
-    files_by_size = defaultdict(list)
-    for file_path in all_file_paths:
-        try:
-            file_size = file_path.stat().st_size
-            files_by_size[file_size].append(file_path)
-        except OSError:
-            continue
-
-    # Filter out unique files (those with unique sizes)
-    candidate_files_for_hashing = []
-    for size, files in files_by_size.items():
-        if len(files) > 1:
-            candidate_files_for_hashing.extend(files)
-    
-    if not candidate_files_for_hashing:
-        console.print("[green]No potential duplicate files found based on size.[/green]")
-        return
-
-    # --- Step 3: Calculate hashes in parallel ---
-    console.print("Step 3: Calculating hashes for candidate files (in parallel, using cache)...")
-    hash_map = defaultdict(list)
-    
-    # Use ProcessPoolExecutor for parallel hashing
-    with ProcessPoolExecutor() as executor:
-        # Submit tasks and collect results
-        # Pass root_directory to each worker so they can init their own cache
-        results = executor.map(_process_file_for_deduplication, candidate_files_for_hashing, [directory] * len(candidate_files_for_hashing))
-        
-        for file_path, md5_hash in results:
-            if md5_hash:
-                hash_map[md5_hash].append(file_path)
-
-    # --- Step 4: Identify duplicate sets and report/delete ---
-    duplicate_sets = [files for files in hash_map.values() if len(files) > 1]
-
-    # Calculate total files to delete (or would be deleted) for summary
-    total_files_to_delete_count = sum(len(files) - 1 for files in duplicate_sets)
-
-    if not duplicate_sets:
-        console.print("[green]No duplicate files found.[/green]")
-        return
-
-    if dry_run:
-        # --- Detailed Dry Run Report ---
-        console.print("\n[yellow]Dry run mode enabled. The following actions would be taken:[/yellow]\n")
-        for i, files in enumerate(duplicate_sets):
-            table = Table(title=f"Duplicate Set {i + 1} (Size: {format_size(files[0].stat().st_size)})\n")
-            table.add_column("Status", style="bold")
-            table.add_column("File Path", style="cyan", no_wrap=True)
-            table.add_column("Created On")
-
-            if keep_rule == 'oldest':
-                files.sort(key=lambda f: f.stat().st_ctime)
-            
-            file_to_keep = files[0]
-            table.add_row(
-                "[green]KEEP[/green]",
-                str(file_to_keep),
-                format_timestamp(file_to_keep.stat().st_ctime)
-            )
+    store = open_scan_store(memory_limit_mb)
+    if memory_limit_mb:
+        console.print(f"Bounded-memory mode: the scan is spilled to disk (limit: {memory_limit_mb} MB).")
+    writer = None
 
-            for file_to_delete in files[1:]:
-                table.add_row(
-                    "[red]DELETE[/red]",
-                    str(file_to_delete),
-                    format_timestamp(file_to_delete.stat().st_ctime)
-                )
-            
-            console.print(table)
-        
-        console.print(f"\n[yellow]Dry run complete. {total_files_to_delete_count} files would be deleted.[/yellow]")
+    try:
+        # --- Step 1: Collect all files ---
+        console.print("Step 1: Collecting all file paths...")
+        with metrics.phase("walk"):
+            store.add_all(walk_files(directory))
+        total_files_scanned = len(store)
 
-    else:
-        files_to_delete = []
-        for files in duplicate_sets:
-            if keep_rule == 'oldest':
-                files.sort(key=lambda f: f.stat().st_ctime)
-            files_to_delete.extend(files[1:])
-
-        if not files_to_delete:
-            console.print("[bold yellow]No files to delete.[/bold yellow]")
+        if not total_files_scanned:
+            console.print("[green]No files found to scan.[/green]")
             return
 
-        table = Table(title="Files to be Permanently Deleted")
-        table.add_column("File Path", style="red")
-        for file_path in files_to_delete:
-            table.add_row(str(file_path))
-        console.print(table)
-        
-        console.print(f"\nProceeding with deletion of {len(files_to_delete)} files...")
-        try:
-            for file_path in files_to_delete:
-                os.remove(file_path)
-            console.print("\n[green]Deletion complete.[/green]")
-        except Exception as e:
-            console.print(f"\n[bold red]An error occurred during deletion: {e}[/bold red]")
+        # Only a few batches per worker are queued, so candidates are streamed from the store
+        workers = tune(directory, device_workers).workers
+        # Threads share one batched cache writer; processes each write through their own connection
+        writer = CacheWriter(directory) if executor_kind == "threads" else None
+        with open_executor(executor_kind, workers) as executor, metrics.pool(workers):
+            # --- Step 2: Group files by size, compare small groups and hash the rest ---
+            # Files with a unique size can't have duplicates and are never read
+            console.print("Step 2: Grouping files by size and comparing or hashing candidates (in parallel, using cache)...")
+            candidates_found = match_candidates(executor, workers, store, directory, console, writer, tree_hash,
+                                                 read_order, device_workers)
+            if writer:
+                writer.close()
+                writer = None
+
+            if not candidates_found:
+                console.print("[green]No potential duplicate files found based on size.[/green]")
+                return
+
+            # --- Step 3: Optionally confirm hash matches byte for byte ---
+            if verify:
+                console.print("Step 3: Verifying hash-matched sets byte by byte...")
+                duplicate_sets = iter_verified_sets(executor, store.iter_duplicate_sets(), workers, read_order,
+                                                     device_workers)
+            else:
+                duplicate_sets = (files for _, files in store.iter_duplicate_sets())
+
+            # --- Step 4: Report/delete duplicate sets ---
+            # Verification is lazy, so its time is part of this phase
+            if dry_run:
+                with metrics.phase("report"):
+                    set_count, files_to_delete_count = _report_dry_run(console, duplicate_sets, keep_rule)
+                if set_count:
+                    console.print(f"\n[yellow]Dry run complete. {files_to_delete_count} files would be deleted.[/yellow]")
+            else:
+                with metrics.phase("delete"):
+                    set_count, deleted = _delete_duplicates(console, duplicate_sets, keep_rule, directory, staging_dir)
+                files_to_delete_count = len(deleted)
+                if set_count and not files_to_delete_count:
+                    console.print("[bold yellow]No files to delete.[/bold yellow]")
+                    return
+
+        if not set_count:
+            console.print("[green]No duplicate files found.[/green]")
+            return
+    finally:
+        if writer:
+            writer.close()
+        store.close()
     
     # Summary at the end
     console.rule("Deduplication Task Summary")
-    console.print(f"[green]Total files scanned:[/green] {len(all_file_paths)}")
-    console.print(f"[green]Duplicate sets found:[/green] {len(duplicate_sets)}")
-    if total_files_to_delete_count > 0:
+    console.print(f"[green]Total files scanned:[/green] {total_files_scanned}")
+    console.print(f"[green]Duplicate sets found:[/green] {set_count}")
+    if files_to_delete_count > 0:
         if dry_run:
-            console.print(f"[yellow]Files that would be deleted:[/yellow] {total_files_to_delete_count}")
+            console.print(f"[yellow]Files that would be deleted:[/yellow] {files_to_delete_count}")
         else:
-            console.print(f"[green]Files successfully deleted:[/green] {len(files_to_delete)}")
+            if staging_dir:
+                console.print(f"[green]Files moved to the trash:[/green] {files_to_delete_count} ({staging_dir})")
+            else:
+                console.print(f"[green]Files successfully deleted:[/green] {files_to_delete_count}")
     else:
-        console.print("[green]No files were deleted.[/green]")
\ No newline at end of file
+        console.print("[green]No files were deleted.[/green]")
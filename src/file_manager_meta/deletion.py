@@ -0,0 +1,196 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import typer
+from rich.console import Console
+from rich.progress import Progress
+from rich.table import Table
+
+from file_manager_meta.cache_manager import init_cache, remove_cached_files
+from file_manager_meta.filters import active_filter
+from file_manager_meta.metrics import metrics
+from file_manager_meta.scheduler import bounded_map
+from file_manager_meta.throttle import throttle_open
+
+# Unlinks mostly wait on the filesystem (especially over the network), so far more threads than CPUs pay off
+DELETE_WORKERS = 16
+# Removed files are dropped from the cache in batches of this many
+CACHE_BATCH_SIZE = 500
+# Name of each run's staging directory inside the trash, which purge_trash() parses back
+TRASH_RUN_FORMAT = "%Y%m%d-%H%M%S"
+
+
+def create_trash_run(directory: Path, trash_dir: Path) -> Path:
+    """
+    Checks that files under directory can be moved into trash_dir with a rename, i.e. that both are on
+    the same filesystem, and creates this run's staging directory in it. Returns the staging directory.
+    Raises ValueError if trash_dir can't be used.
+    """
+    resolved_trash, resolved_directory = trash_dir.resolve(), directory.resolve()
+    if resolved_trash.is_relative_to(resolved_directory) and \
+            not active_filter().excludes_path(resolved_trash, resolved_directory, is_dir=True):
+        # The trashed files would be found again as duplicates by the next scan
+        raise ValueError(f"{trash_dir} is inside {directory}; use a hidden directory (e.g. {directory / '.trash'}) "
+                         f"or one outside it.")
+    try:
+        trash_dir.mkdir(parents=True, exist_ok=True)
+        same_filesystem = trash_dir.stat().st_dev == directory.stat().st_dev
+    except OSError as e:
+        raise ValueError(f"Cannot use {trash_dir} as the trash: {e}")
+    if not same_filesystem:
+        raise ValueError(f"{trash_dir} is not on the same filesystem as {directory}; "
+                         f"files can only be moved into a trash on the same filesystem.")
+
+    name = datetime.now().strftime(TRASH_RUN_FORMAT)
+    staging_dir = trash_dir / name
+    suffix = 1
+    while True:
+        try:
+            staging_dir.mkdir()
+            return staging_dir
+        except FileExistsError:
+            suffix += 1
+            staging_dir = trash_dir / f"{name}-{suffix}"
+
+
+def open_trash(console: Console, directory: Path, trash_dir: Path) -> Path:
+    """Like create_trash_run(), but prints the problem and exits if trash_dir can't be used."""
+    try:
+        return create_trash_run(directory, trash_dir)
+    except ValueError as e:
+        console.print(f"[bold red]{e}[/bold red]")
+        raise typer.Exit(code=1)
+
+
+def _remove_file(path: Path, directory: Path, staging_dir: Path | None) -> str | None:
+    """Deletes one file, or moves it into the staging directory under its path relative to directory. Returns an error or None."""
+    try:
+        throttle_open()
+        if staging_dir is None:
+            os.remove(path)
+        else:
+            destination = staging_dir / path.relative_to(directory)
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            os.rename(path, destination)
+    except (OSError, ValueError) as e:
+        return getattr(e, "strerror", None) or str(e)
+    return None
+
+
+def iter_removals(paths: Iterable[Path], directory: Path, staging_dir: Path | None = None,
+                  conn=None) -> Iterator[tuple[Path, str | None]]:
+    """
+    Deletes (or moves into staging_dir) the given files under directory with a pool of threads, yielding
+    (path, error or None) as each finishes. A file that fails doesn't stop the rest. Removed files are
+    dropped from the cache through conn, if given, so the next run doesn't look for them.
+    """
+    uncached = []
+    remove = partial(_remove_file, directory=directory, staging_dir=staging_dir)
+    removed_count = failed_count = 0
+    try:
+        with ThreadPoolExecutor(max_workers=DELETE_WORKERS, thread_name_prefix="fmm-delete") as executor:
+            for path, error in bounded_map(executor, remove, paths, DELETE_WORKERS * 4):
+                if error:
+                    failed_count += 1
+                else:
+                    removed_count += 1
+                    if conn:
+                        uncached.append(path)
+                        if len(uncached) >= CACHE_BATCH_SIZE:
+                            remove_cached_files(conn, uncached)
+                            uncached = []
+                yield path, error
+    finally:
+        if conn:
+            remove_cached_files(conn, uncached)
+        metrics.count("files_trashed" if staging_dir else "files_deleted", removed_count)
+        metrics.count("files_not_removed", failed_count)
+
+
+def remove_files(console: Console, paths: list[Path], directory: Path, staging_dir: Path | None = None,
+                 update_cache: bool = True, conn=None) -> tuple[list[Path], list[tuple[Path, str]]]:
+    """
+    Removes the given files with iter_removals(), showing progress. Uses directory's cache (through conn
+    if given) unless update_cache is False. Returns (removed paths, [(path, error) of each failure]).
+    """
+    removed = []
+    failures = []
+    own_conn = update_cache and conn is None
+    if own_conn:
+        conn = init_cache(directory)[0]
+    elif not update_cache:
+        conn = None
+    try:
+        with Progress(console=console, transient=True) as progress:
+            task = progress.add_task("[red]Removing files[/red]", total=len(paths))
+            for path, error in iter_removals(paths, directory, staging_dir, conn):
+                progress.advance(task)
+                if error:
+                    failures.append((path, error))
+                else:
+                    removed.append(path)
+    finally:
+        if own_conn:
+            conn.close()
+    return removed, failures
+
+
+def print_failures(console: Console, failures: list[tuple[Path, str]], directory: Path):
+    table = Table(title="Files That Could Not Be Removed")
+    table.add_column("File Path", style="red")
+    table.add_column("Error")
+    for path, error in failures:
+        table.add_row(str(path.relative_to(directory)) if path.is_relative_to(directory) else str(path), error)
+    console.print(table)
+
+
+def purge_trash(trash_dir: Path, older_than_days: float = 0):
+    """
+    Permanently deletes the staging directories left in trash_dir by 'deduplicate --trash' that are older
+    than older_than_days. Anything else in trash_dir is left alone.
+    """
+    console = Console()
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    runs = []
+    for entry in sorted(trash_dir.iterdir()):
+        try:
+            created = datetime.strptime(entry.name[:15], TRASH_RUN_FORMAT)
+        except ValueError:
+            continue
+        if entry.is_dir() and not entry.is_symlink() and created <= cutoff:
+            runs.append(entry)
+    if not runs:
+        console.print("[green]Nothing to purge.[/green]")
+        return
+
+    # --- Step 1: Delete the files of every run in parallel ---
+    console.print(f"Purging {len(runs)} trash runs from [cyan]{trash_dir}[/cyan]...")
+    directories = []
+    paths = []
+    for run in runs:
+        for dir_path, _, file_names in os.walk(run):
+            directories.append(dir_path)
+            paths.extend(Path(dir_path) / name for name in file_names)
+    with metrics.phase("delete"):
+        # Trashed files were already dropped from the cache when they were moved
+        removed, failures = remove_files(console, paths, trash_dir, update_cache=False)
+
+    # --- Step 2: Remove the emptied directories, deepest first ---
+    for dir_path in reversed(directories):
+        try:
+            os.rmdir(dir_path)
+        except OSError:
+            pass  # Still holds a file that couldn't be deleted
+
+    if failures:
+        print_failures(console, failures, trash_dir)
+    console.rule("Purge Task Summary")
+    console.print(f"[green]Trash runs purged:[/green] {len(runs)}")
+    console.print(f"[green]Files deleted:[/green] {len(removed)}")
+    if failures:
+        console.print(f"[bold red]Files that could not be deleted:[/bold red] {len(failures)}")
+        raise typer.Exit(code=1)
@@ -15,3 +15,28 @@ class DateGranularity(str, Enum):
     YEAR = "year"
     MONTH = "month"
     DAY = "day"
+
+
+class ReadOrder(str, Enum):
+    AUTO = "auto"
+    SIZE = "size"
+    INODE = "inode"
+    FIEMAP = "fiemap"
+
+
+class ExecutorKind(str, Enum):
+    PROCESSES = "processes"
+    THREADS = "threads"
+
+
+class PipelineStage(str, Enum):
+    REPAIR = "repair"
+    DEDUPLICATE = "deduplicate"
+    SORT = "sort"
+    REPORT = "report"
+
+
+class DuplicateAction(str, Enum):
+    REPORT = "report"
+    SKIP = "skip"
+    QUARANTINE = "quarantine"
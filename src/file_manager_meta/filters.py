@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+# Entries no command looks at unless a later rule re-includes them: hidden names and Windows system folders
+DEFAULT_RULES = (".*", "System Volume Information/", "$RECYCLE.BIN/")
+SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+_GLOB_CHARACTERS = re.compile(r"[*?\[]")
+
+
+def parse_size(value: str) -> int:
+    """Parses a size such as 500, 64K, 1.5M or 2G (binary units) into bytes. Raises ValueError."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([BKMGT]?)i?B?\s*", value, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"invalid size {value!r}, expected e.g. 500, 64K, 1.5M or 2G")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """Translates a gitignore glob: * and ? stop at '/', ** crosses directories, [...] is a character class."""
+    regex = []
+    i = 0
+    while i < len(pattern):
+        character = pattern[i]
+        if pattern.startswith("**/", i):
+            regex.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex.append(".*")
+            i += 2
+            continue
+        if character == "*":
+            regex.append("[^/]*")
+        elif character == "?":
+            regex.append("[^/]")
+        elif character == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1:end]
+            regex.append("[" + ("^" + body[1:] if body.startswith("!") else body).replace("\\", "\\\\") + "]")
+            i = end
+        elif character == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex.append(re.escape(pattern[i]))
+        else:
+            regex.append(re.escape(character))
+        i += 1
+    return "".join(regex)
+
+
+class _Rule(NamedTuple):
+    pattern: str  # Without the leading '!', leading '/' and trailing '/'
+    negated: bool
+    dir_only: bool
+    anchored: bool  # Matched against the path relative to the root rather than the name alone
+
+
+def _parse_rule(line: str) -> _Rule | None:
+    line = line.rstrip("\n").rstrip()
+    if not line or line.startswith("#"):
+        return None
+    negated = line.startswith("!")
+    if negated or line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    anchored = "/" in line
+    return _Rule(line.lstrip("/"), negated, dir_only, anchored) if line else None
+
+
+class _RuleGroup:
+    """
+    Consecutive rules of the same polarity, compiled together: literal names go into sets and
+    globs into one alternation per kind, so an entry is tested once per group instead of once per rule.
+    """
+
+    def __init__(self, rules: list[_Rule]):
+        self.negated = rules[0].negated
+        literal = [rule for rule in rules if not rule.anchored and not _GLOB_CHARACTERS.search(rule.pattern)
+                   and "\\" not in rule.pattern]
+        self.names = frozenset(rule.pattern for rule in literal if not rule.dir_only)
+        self.dir_names = frozenset(rule.pattern for rule in literal if rule.dir_only)
+        globs = [rule for rule in rules if rule not in literal]
+
+        def compile_alternation(selected):
+            return re.compile("|".join(f"(?:{_glob_to_regex(rule.pattern)})" for rule in selected)) if selected else None
+
+        self.name_regex = compile_alternation([rule for rule in globs if not rule.anchored and not rule.dir_only])
+        self.dir_name_regex = compile_alternation([rule for rule in globs if not rule.anchored and rule.dir_only])
+        self.path_regex = compile_alternation([rule for rule in globs if rule.anchored and not rule.dir_only])
+        self.dir_path_regex = compile_alternation([rule for rule in globs if rule.anchored and rule.dir_only])
+        self.has_path_rules = bool(self.path_regex or self.dir_path_regex)
+
+    def matches(self, relative_dir: str, name: str, is_dir: bool) -> bool:
+        if name in self.names or (is_dir and name in self.dir_names):
+            return True
+        if self.name_regex and self.name_regex.fullmatch(name):
+            return True
+        if is_dir and self.dir_name_regex and self.dir_name_regex.fullmatch(name):
+            return True
+        if self.has_path_rules:
+            path = f"{relative_dir}/{name}" if relative_dir else name
+            if self.path_regex and self.path_regex.fullmatch(path):
+                return True
+            if is_dir and self.dir_path_regex and self.dir_path_regex.fullmatch(path):
+                return True
+        return False
+
+
+def _compile_groups(rules: list[_Rule]) -> list[_RuleGroup]:
+    groups = []
+    run = []
+    for rule in rules:
+        if run and rule.negated != run[0].negated:
+            groups.append(_RuleGroup(run))
+            run = []
+        run.append(rule)
+    if run:
+        groups.append(_RuleGroup(run))
+    return groups
+
+
+class PathFilter:
+    """
+    Decides which entries of a tree are walked, from gitignore-style exclude rules (the last matching rule
+    wins, '!' re-includes, a trailing '/' matches directories only, a '/' elsewhere anchors the pattern to
+    the root) plus optional include patterns, extensions and size bounds for files.
+    An excluded directory is never descended into, and a file excluded by name is never stat'ed.
+    """
+
+    def __init__(self, excludes: Iterable[str] = DEFAULT_RULES, includes: Iterable[str] = (),
+                 extensions: Iterable[str] | None = None, min_size: int | None = None, max_size: int | None = None):
+        excludes, includes = list(excludes), list(includes)
+        self._groups = _compile_groups([rule for rule in map(_parse_rule, excludes) if rule])
+        include_rules = []
+        for rule in map(_parse_rule, includes):
+            if not rule or rule.negated:
+                continue
+            # A directory included by pattern stands for everything under it; like any rule without a
+            # leading or inner '/', the pattern matches it at any depth
+            below = rule.pattern if rule.anchored else f"**/{rule.pattern}"
+            include_rules.append(rule._replace(pattern=f"{below}/**", dir_only=False, anchored=True))
+            if not rule.dir_only:
+                include_rules.append(rule)
+        self._includes = _RuleGroup(include_rules) if include_rules else None
+        self._extensions = frozenset(f".{extension.lower().lstrip('.')}" for extension in extensions) \
+            if extensions else None
+        self.min_size = min_size
+        self.max_size = max_size
+        # Identifies what the filter lets through, so results kept across runs can tell they were made with it
+        settings = [excludes, includes, sorted(self._extensions or ()), self._extensions is None, min_size, max_size]
+        self.fingerprint = hashlib.sha1(json.dumps(settings).encode()).hexdigest()[:16]
+
+    def _excluded_by_rules(self, relative_dir: str, name: str, is_dir: bool) -> bool:
+        for group in reversed(self._groups):
+            if group.matches(relative_dir, name, is_dir):
+                return not group.negated
+        return False
+
+    def excludes_dir(self, relative_dir: str, name: str) -> bool:
+        """True if the directory name, in relative_dir (relative to the root, '' for the root itself), is pruned."""
+        return self._excluded_by_rules(relative_dir, name, is_dir=True)
+
+    def excludes_file(self, relative_dir: str, name: str) -> bool:
+        """True if the file is left out by its name or path alone, before it is stat'ed."""
+        if self._excluded_by_rules(relative_dir, name, is_dir=False):
+            return True
+        if self._extensions is not None and os.path.splitext(name)[1].lower() not in self._extensions:
+            return True
+        return self._includes is not None and not self._includes.matches(relative_dir, name, is_dir=False)
+
+    def excludes_size(self, size: int) -> bool:
+        return (self.min_size is not None and size < self.min_size) or (self.max_size is not None and size > self.max_size)
+
+    def excludes_path(self, path: Path, root: Path, is_dir: bool) -> bool:
+        """True if path, or any directory between root and it, is excluded, i.e. a walk of root never reaches it."""
+        parts = path.relative_to(root).parts
+        for depth, name in enumerate(parts[:-1]):
+            if self.excludes_dir("/".join(parts[:depth]), name):
+                return True
+        return bool(parts) and self._excluded_by_rules("/".join(parts[:-1]), parts[-1], is_dir)
+
+
+def relative_dir(dir_path: str, root: str) -> str:
+    """dir_path relative to root with '/' separators, as filter rules see it; '' for the root itself."""
+    relative = os.path.relpath(dir_path, root)
+    if relative == ".":
+        return ""
+    return relative.replace(os.sep, "/") if os.sep != "/" else relative
+
+
+def read_ignore_file(path: Path) -> list[str]:
+    """The rules of a gitignore-style file, one per line."""
+    return path.read_text(encoding="utf-8").splitlines()
+
+
+# The filter of this run, set by configure() from the global options
+_active = PathFilter()
+
+
+def configure(excludes: Iterable[str] = (), includes: Iterable[str] = (), ignore_files: Iterable[Path] = (),
+              extensions: Iterable[str] | None = None, min_size: int | None = None, max_size: int | None = None):
+    """Compiles the filter of this run: the default rules, then the ignore files' rules, then excludes, in that order."""
+    global _active
+    rules = list(DEFAULT_RULES)
+    for ignore_file in ignore_files:
+        rules.extend(read_ignore_file(ignore_file))
+    rules.extend(excludes)
+    _active = PathFilter(rules, includes, extensions, min_size, max_size)
+
+
+def active_filter() -> PathFilter:
+    return _active
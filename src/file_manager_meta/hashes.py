@@ -1,8 +1,57 @@
 import hashlib
+import os
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial, lru_cache
 from pathlib import Path
 
-from file_manager_meta.cache_manager import get_cached_hashes, set_cached_hashes
+from file_manager_meta.cache_manager import CacheWriter, get_cached_hashes, set_cached_hashes, TREE_HASH_COLUMN
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.sparse import ExtentMap, extent_map, update_with_zeros
+from file_manager_meta.throttle import throttle_open, throttle_read, record_latency
+
+# hashlib releases the GIL for buffers this large, so worker threads hash in parallel
+READ_BUFFER_SIZE = 1024 * 1024
+# Tree hash: a file is split into leaves of TREE_LEAF_SIZE bytes, hashed in parallel with SHA-256, and the root
+# is the SHA-256 of the leaf digests in order. Changing the leaf size changes every root, so it is fixed.
+TREE_LEAF_SIZE = 16 * 1024 * 1024
+# Smaller files are hashed as a whole even when tree hashing is requested
+TREE_HASH_MIN_SIZE = 256 * 1024 * 1024
+
+
+class BufferPool:
+    """Reusable read buffers, so hashing many files doesn't allocate a new buffer for every read."""
+
+    def __init__(self, buffer_size: int):
+        self.buffer_size = buffer_size
+        self._free = queue.SimpleQueue()
+
+    @contextmanager
+    def buffer(self):
+        try:
+            buffer = self._free.get_nowait()
+        except queue.Empty:
+            buffer = bytearray(self.buffer_size)
+        try:
+            yield memoryview(buffer)
+        finally:
+            self._free.put(buffer)
+
+
+# One pool per process, shared by its threads; it never holds more buffers than there are concurrent readers
+_buffer_pool = BufferPool(READ_BUFFER_SIZE)
+
+
+def set_read_buffer_size(size: int):
+    """Reads files in blocks of size bytes from now on (see tuning)."""
+    global _buffer_pool
+    if size != _buffer_pool.buffer_size:
+        _buffer_pool = BufferPool(size)
 
 def _calculate_hashes_from_file(file_path: Path) -> dict:
     """Calculates MD5, SHA-1, and SHA-256 hashes for a given file."""
@@ -11,35 +60,225 @@ def _calculate_hashes_from_file(file_path: Path) -> dict:
         "sha1": hashlib.sha1(),
         "sha256": hashlib.sha256(),
     }
+    bytes_read = 0
     try:
-        with open(file_path, "rb") as f:
-            while chunk := f.read(8192):
-                for algorithm in hashes.values():
-                    algorithm.update(chunk)
+        throttle_open()
+        with metrics.timer("hashing"), open(file_path, "rb", buffering=0) as f, _buffer_pool.buffer() as buffer:
+            extents = extent_map(f.fileno())
+            # A file without holes is one piece read to EOF; the holes of a sparse one are hashed as zeros unread
+            for start, end, is_data in extents.segments(0, extents.size) if extents else [(0, None, True)]:
+                if not is_data:
+                    update_with_zeros(hashes.values(), end - start)
+                    metrics.count("sparse_bytes_skipped", end - start)
+                    continue
+                f.seek(start)
+                remaining = None if end is None else end - start
+                while remaining is None or remaining:
+                    view = buffer if remaining is None else buffer[:min(remaining, len(buffer))]
+                    started = time.perf_counter()
+                    length = f.readinto(view)
+                    if not length:
+                        break
+                    record_latency(time.perf_counter() - started, length)
+                    throttle_read(length)
+                    bytes_read += length
+                    if remaining is not None:
+                        remaining -= length
+                    chunk = view[:length]
+                    for algorithm in hashes.values():
+                        algorithm.update(chunk)
         return {name: algorithm.hexdigest() for name, algorithm in hashes.items()}
     except (IOError, OSError):
         # Return empty dict if file can't be read
         return {}
+    finally:
+        metrics.count("bytes_read", bytes_read)
+        metrics.count("files_hashed")
+
+# Threads reading the leaves of one file, created on first use in each process
+_leaf_executor = None
+_leaf_executor_lock = threading.Lock()
+# (limit, semaphore) bounding the leaves read at once over the whole run, every thread and worker process
+# together; set by limit_leaf_reads() in the main process and handed to pool workers by open_executor()
+_leaf_slots = None
+
+
+def _forget_leaf_executor():
+    global _leaf_executor
+    _leaf_executor = None  # Its threads don't exist in a forked child
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_leaf_executor)
+
+
+def limit_leaf_reads(limit: int):
+    """Lets the run read at most limit leaves at once, over all of its workers. Call before any pool is created."""
+    import multiprocessing
+    set_leaf_slots((limit, multiprocessing.BoundedSemaphore(limit)))
+
+
+def leaf_slots():
+    """The run's leaf limit, for open_executor() to pass on to pool workers."""
+    return _leaf_slots
+
+
+def set_leaf_slots(slots):
+    """Puts the run's leaf limit (see limit_leaf_reads) in force in this process."""
+    global _leaf_slots, _leaf_executor
+    with _leaf_executor_lock:
+        _leaf_slots = slots
+        if _leaf_executor is not None:
+            _leaf_executor.shutdown(wait=False)
+            _leaf_executor = None  # Recreated with the new size on next use
+
 
-def calculate_hashes(file_path: Path, conn: sqlite3.Connection) -> dict:
+def _get_leaf_executor() -> ThreadPoolExecutor:
+    global _leaf_executor
+    with _leaf_executor_lock:
+        if _leaf_executor is None:
+            # More threads than the run may read leaves at once would only wait
+            threads = _leaf_slots[0] if _leaf_slots else os.cpu_count() or 1
+            _leaf_executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="fmm-leaf")
+        return _leaf_executor
+
+
+@contextmanager
+def _leaf_slot():
+    if _leaf_slots is None:
+        yield
+        return
+    semaphore = _leaf_slots[1]
+    with metrics.timer("leaf_slot_wait"):
+        semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+@lru_cache(maxsize=1)
+def _zero_leaf_digest() -> bytes:
+    return hashlib.sha256(bytes(TREE_LEAF_SIZE)).digest()
+
+
+def _hash_leaf(file_path: Path, fd: int | None, extents: ExtentMap | None, offset: int) -> tuple[bytes, int, int]:
+    """Hashes the leaf starting at offset. Returns its digest, the bytes it covers and the bytes actually read."""
+    if extents and offset + TREE_LEAF_SIZE <= extents.size and extents.is_hole(offset, offset + TREE_LEAF_SIZE):
+        # Every leaf of a hole has the same digest, so a mostly empty image costs almost nothing
+        metrics.count("sparse_bytes_skipped", TREE_LEAF_SIZE)
+        return _zero_leaf_digest(), TREE_LEAF_SIZE, 0
+    leaf = hashlib.sha256()
+    covered = bytes_read = 0
+    with _leaf_slot():
+        # With preadv every leaf reads the shared descriptor at its own offset; elsewhere each leaf opens the file
+        f = open(file_path, "rb", buffering=0) if fd is None else None
+        try:
+            if extents:
+                segments = extents.segments(offset, min(offset + TREE_LEAF_SIZE, extents.size))
+            else:
+                segments = [(offset, offset + TREE_LEAF_SIZE, True)]
+            with _buffer_pool.buffer() as buffer:
+                for start, end, is_data in segments:
+                    if not is_data:
+                        update_with_zeros([leaf], end - start)
+                        metrics.count("sparse_bytes_skipped", end - start)
+                        covered += end - start
+                        continue
+                    if f:
+                        f.seek(start)
+                    remaining = end - start
+                    while remaining:
+                        view = buffer[:min(remaining, len(buffer))]
+                        started = time.perf_counter()
+                        length = f.readinto(view) if f else os.preadv(fd, [view], end - remaining)
+                        if not length:
+                            return leaf.digest(), covered, bytes_read  # Shorter than expected
+                        record_latency(time.perf_counter() - started, length)
+                        throttle_read(length)
+                        leaf.update(view[:length])
+                        covered += length
+                        bytes_read += length
+                        remaining -= length
+        finally:
+            if f:
+                f.close()
+    return leaf.digest(), covered, bytes_read
+
+
+def tree_hash_file(file_path: Path, size: int) -> str | None:
     """
-    Gets hashes for a file, using the cache if possible.
+    Calculates the tree hash of a file (see TREE_LEAF_SIZE), reading its leaves in parallel so a single
+    large file uses every core and keeps several reads queued on the disk. None if the file can't be read.
     """
+    bytes_read = 0
     try:
-        stat_info = file_path.stat()
-    except (IOError, OSError):
-        return {}
+        throttle_open()
+        with metrics.timer("tree_hashing"), open(file_path, "rb", buffering=0) as f:
+            fd = f.fileno() if hasattr(os, "preadv") else None
+            extents = extent_map(f.fileno())
+            leaves = list(_get_leaf_executor().map(partial(_hash_leaf, file_path, fd, extents),
+                                                   range(0, size, TREE_LEAF_SIZE)))
+        bytes_read = sum(length for _, _, length in leaves)
+        if sum(covered for _, covered, _ in leaves) != size or (extents and extents.size != size):
+            return None  # Changed while being read
+        return hashlib.sha256(b"".join(digest for digest, _, _ in leaves)).hexdigest()
+    except OSError:
+        return None
+    finally:
+        metrics.count("bytes_read", bytes_read)
+        metrics.count("files_tree_hashed")
+
+
+def calculate_tree_hash(record: FileRecord, conn: sqlite3.Connection, writer: CacheWriter | None = None) -> str | None:
+    """Gets the tree hash of a file, using the cache if possible. Other cached fields are kept."""
+    with metrics.timer("cache_lookup"):
+        cached_hashes = get_cached_hashes(conn, record.path, record)
+    if cached_hashes and cached_hashes.get(TREE_HASH_COLUMN):
+        metrics.count("cache_hits_full")
+        return cached_hashes[TREE_HASH_COLUMN]
+    metrics.count("cache_misses")
+
+    tree_hash = tree_hash_file(record.path, record.size)
+    if tree_hash:
+        with metrics.timer("cache_write"):
+            if writer:
+                writer.put(record.path, record, {TREE_HASH_COLUMN: tree_hash})
+            else:
+                set_cached_hashes(conn, record.path, record, {TREE_HASH_COLUMN: tree_hash})
+    return tree_hash
+
+
+def calculate_hashes(record: FileRecord, conn: sqlite3.Connection, writer: CacheWriter | None = None) -> dict:
+    """
+    Gets hashes for a file, using the cache if possible.
+    The result is also kept on the record so later stages don't look it up again.
+    New hashes go through writer when one is shared by several threads, and straight to conn otherwise.
+    """
+    if record.hashes and record.hashes.get("md5"):
+        return record.hashes
 
     # 1. Try to get hashes from cache
-    cached_hashes = get_cached_hashes(conn, file_path, stat_info)
-    if cached_hashes:
+    with metrics.timer("cache_lookup"):
+        cached_hashes = get_cached_hashes(conn, record.path, record)
+    if cached_hashes and cached_hashes.get("md5"):
+        metrics.count("cache_hits_full")
+        record.hashes = cached_hashes
         return cached_hashes
+    # A partial hit only holds other data (e.g. the ExifTool file type), which must survive the update
+    metrics.count("cache_hits_partial" if cached_hashes else "cache_misses")
 
     # 2. If not in cache or changed, calculate fresh hashes
-    fresh_hashes = _calculate_hashes_from_file(file_path)
+    fresh_hashes = _calculate_hashes_from_file(record.path)
 
     # 3. Store the new hashes in the cache
     if fresh_hashes:
-        set_cached_hashes(conn, file_path, stat_info, fresh_hashes)
+        fresh_hashes = {**(cached_hashes or {}), **fresh_hashes}
+        with metrics.timer("cache_write"):
+            if writer:
+                writer.put(record.path, record, fresh_hashes)
+            else:
+                set_cached_hashes(conn, record.path, record, fresh_hashes)
+        record.hashes = fresh_hashes
     
-    return fresh_hashes
\ No newline at end of file
+    return fresh_hashes
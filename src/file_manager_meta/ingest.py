@@ -0,0 +1,235 @@
+import shutil
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Iterator
+
+import typer
+from rich.console import Console
+from rich.progress import Progress
+from rich.table import Table
+
+from file_manager_meta.cache_manager import init_cache, ensure_digest_index, iter_cached_digests, find_cached_by_digest
+from file_manager_meta.deletion import print_failures
+from file_manager_meta.enums import DuplicateAction
+from file_manager_meta.filters import active_filter
+from file_manager_meta.hashes import _calculate_hashes_from_file
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.scheduler import open_executor, schedule
+from file_manager_meta.throttle import throttle_open
+from file_manager_meta.tuning import tune
+from file_manager_meta.walker import walk_files
+
+# Bloom filter sizing: with 12 bits per entry and 4 probes, about 0.6% of the files that aren't in the
+# library still look like probable hits, which only costs an indexed lookup in the cache
+BLOOM_BITS_PER_ENTRY = 12
+BLOOM_PROBES = 4
+
+
+class BloomFilter:
+    """A set of (size, MD5) keys in a fixed bit array: no false negatives, and rare false positives."""
+
+    def __init__(self, capacity: int):
+        self.bit_count = max(64, capacity * BLOOM_BITS_PER_ENTRY)
+        self.bits = bytearray((self.bit_count + 7) // 8)
+
+    def _positions(self, size: int, md5: bytes) -> list[int]:
+        # MD5 is already uniformly distributed, so its two halves serve as the hashes of double hashing
+        first = int.from_bytes(md5[:8], "little") ^ size
+        step = int.from_bytes(md5[8:], "little") | 1
+        return [(first + i * step) % self.bit_count for i in range(BLOOM_PROBES)]
+
+    def add(self, size: int, md5: bytes):
+        for position in self._positions(size, md5):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: tuple[int, bytes]) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(*key))
+
+
+class LibraryIndex:
+    """
+    What a library holds, from its cache: the distinct sizes of its hashed files in a sorted array and a
+    Bloom filter over (size, MD5), kept in memory. Probable hits are confirmed in the cache and on disk.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        ensure_digest_index(conn)
+        self.file_count = conn.execute("SELECT COUNT(*) FROM file_hashes WHERE md5 IS NOT NULL").fetchone()[0]
+        self.sizes = array("q")
+        self.bloom = BloomFilter(self.file_count)
+        for size, md5 in iter_cached_digests(conn):
+            if not self.sizes or self.sizes[-1] != size:
+                self.sizes.append(size)
+            self.bloom.add(size, md5)
+
+    def has_size(self, size: int) -> bool:
+        i = bisect_left(self.sizes, size)
+        return i < len(self.sizes) and self.sizes[i] == size
+
+    def find(self, record: FileRecord, hashes: dict) -> Path | None:
+        """The library file with the same content as record, still unchanged since it was hashed, or None."""
+        if (record.size, bytes.fromhex(hashes["md5"])) not in self.bloom:
+            return None
+        for path, mtime_ns, sha256 in find_cached_by_digest(self.conn, record.size, hashes["md5"]):
+            if sha256 and sha256 != hashes["sha256"]:
+                continue  # Same MD5, different content
+            library_path = Path(path)
+            try:
+                stat_info = library_path.stat()
+            except OSError:
+                continue  # Gone since it was hashed
+            if stat_info.st_mtime_ns != mtime_ns or stat_info.st_size != record.size:
+                continue  # Changed since it was hashed
+            if (stat_info.st_dev, stat_info.st_ino) == (record.dev, record.ino):
+                continue  # The incoming file itself, when the ingest folder is inside the library
+            return library_path
+        metrics.count("library_unconfirmed_hits")
+        return None
+
+
+def _hash_incoming(record: FileRecord) -> dict:
+    # Incoming files are new by definition, so they are hashed without going through a cache
+    return _calculate_hashes_from_file(record.path)
+
+
+def check_quarantine_dir(ingest: Path, quarantine_dir: Path) -> str | None:
+    """Returns why duplicates can't be moved into quarantine_dir, or None if they can."""
+    resolved_quarantine, resolved_ingest = quarantine_dir.resolve(), ingest.resolve()
+    if resolved_quarantine.is_relative_to(resolved_ingest) and \
+            not active_filter().excludes_path(resolved_quarantine, resolved_ingest, is_dir=True):
+        return f"{quarantine_dir} is inside {ingest}; use a hidden directory or one outside it."
+    return None
+
+
+def quarantine_file(record: FileRecord, ingest: Path, quarantine_dir: Path) -> tuple[Path, str | None]:
+    """Moves a duplicate into quarantine_dir under its path relative to the ingest folder. Returns (destination, error)."""
+    destination = quarantine_dir / record.path.relative_to(ingest)
+    if destination.exists():
+        return destination, f"{destination} already exists"
+    try:
+        throttle_open()
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(record.path, destination)
+    except OSError as e:
+        return destination, e.strerror or str(e)
+    metrics.count("files_quarantined")
+    return destination, None
+
+
+def _quarantine(console: Console, duplicates: list[tuple[FileRecord, Path]], ingest: Path,
+                quarantine_dir: Path) -> tuple[int, list[tuple[Path, str]]]:
+    """Moves each duplicate into quarantine_dir. Returns (moved, failures)."""
+    moved = 0
+    failures = []
+    with metrics.phase("quarantine"), Progress(console=console, transient=True) as progress:
+        task = progress.add_task("[yellow]Quarantining duplicates[/yellow]", total=len(duplicates))
+        for record, _ in duplicates:
+            progress.advance(task)
+            _, error = quarantine_file(record, ingest, quarantine_dir)
+            if error:
+                failures.append((record.path, error))
+            else:
+                moved += 1
+    return moved, failures
+
+
+def iter_library_matches(candidates: list[FileRecord], index: LibraryIndex, ingest: Path, executor_kind: str,
+                         progress: Progress | None = None, task_id=None) -> Iterator[tuple[FileRecord, dict, Path | None]]:
+    """
+    Hashes the incoming candidates in parallel, yielding each with its hashes (empty if it couldn't be read)
+    and the library file with the same content, or None.
+    """
+    workers = tune(ingest).workers
+    with open_executor(executor_kind, workers) as executor, metrics.pool(workers), metrics.phase("hashing"):
+        for record, hashes in schedule(executor, _hash_incoming, candidates, workers, lambda r: r.size,
+                                       largest_first=True, progress=progress, task_id=task_id):
+            yield record, hashes, index.find(record, hashes) if hashes else None
+
+
+def check_ingest(ingest: Path, library: Path, action: str = "report", quarantine_dir: Path | None = None,
+                 executor_kind: str = "processes"):
+    """
+    Tells which files of an ingest folder are already in a library, without scanning the library: its sizes
+    and digests come from its cache. Only incoming files whose size occurs in the library are hashed.
+    Duplicates are listed, left out of the list of new files ('skip'), or moved into quarantine_dir.
+    """
+    # With 'skip', stdout only carries the new files, for the next step of the ingest
+    console = Console(stderr=action == DuplicateAction.SKIP)
+    if action == DuplicateAction.QUARANTINE:
+        if not quarantine_dir:
+            console.print("[red]--quarantine is required with --on-duplicate quarantine.[/red]")
+            raise typer.Exit(code=1)
+        problem = check_quarantine_dir(ingest, quarantine_dir)
+        if problem:
+            console.print(f"[red]{problem}[/red]")
+            raise typer.Exit(code=1)
+    console.print(f"Checking [cyan]{ingest}[/cyan] against the library [cyan]{library}[/cyan]...\n")
+
+    conn, db_path = init_cache(library)
+    console.print(f"Using library cache: [dim]{db_path}[/dim]")
+    duplicates = []
+    unreadable = []
+    try:
+        # --- Step 1: Load the library's sizes and digests ---
+        console.print("Step 1: Indexing the library's hashed files in memory...")
+        with metrics.phase("index"):
+            index = LibraryIndex(conn)
+        console.print(f"  {index.file_count} hashed files, {len(index.sizes)} distinct sizes.")
+        if not index.file_count:
+            console.print("[yellow]The library's cache holds no hashes yet; run 'report' or 'deduplicate' "
+                          "on it first.[/yellow]")
+
+        # --- Step 2: Keep the incoming files whose size occurs in the library ---
+        console.print("Step 2: Collecting incoming files...")
+        with metrics.phase("walk"):
+            records = list(walk_files(ingest))
+        candidates = [record for record in records if index.has_size(record.size)]
+
+        # --- Step 3: Hash the candidates and look them up ---
+        if candidates:
+            console.print(f"Step 3: Hashing {len(candidates)} files with a size found in the library (in parallel)...")
+            with Progress(console=console, transient=True) as progress:
+                task = progress.add_task("[green]Hashing incoming files[/green]", total=len(candidates))
+                for record, hashes, match in iter_library_matches(candidates, index, ingest, executor_kind,
+                                                                  progress, task):
+                    if not hashes:
+                        unreadable.append(record)
+                    elif match:
+                        duplicates.append((record, match))
+    finally:
+        conn.close()
+
+    duplicate_paths = {record.path for record, _ in duplicates}
+    new_files = [record for record in records if record.path not in duplicate_paths]
+    if duplicates:
+        table = Table(title="Already in the Library")
+        table.add_column("Incoming File", style="yellow")
+        table.add_column("Library File", style="cyan")
+        for record, match in sorted(duplicates, key=lambda duplicate: duplicate[0].path):
+            table.add_row(str(record.path.relative_to(ingest)), str(match))
+        console.print(table)
+
+    quarantined = 0
+    failures = []
+    if action == DuplicateAction.QUARANTINE and duplicates:
+        quarantined, failures = _quarantine(console, duplicates, ingest, quarantine_dir)
+        if failures:
+            print_failures(console, failures, ingest)
+    elif action == DuplicateAction.SKIP:
+        for record in new_files:
+            typer.echo(record.path)
+
+    console.rule("Ingest Check Summary")
+    console.print(f"[green]Incoming files:[/green] {len(records)}")
+    console.print(f"[green]Files hashed (size found in the library):[/green] {len(candidates)}")
+    console.print(f"[yellow]Already in the library:[/yellow] {len(duplicates)}")
+    console.print(f"[green]New files:[/green] {len(new_files)}")
+    if unreadable:
+        console.print(f"[bold red]Unreadable (counted as new):[/bold red] {len(unreadable)}")
+    if action == DuplicateAction.QUARANTINE:
+        console.print(f"[green]Moved to quarantine:[/green] {quarantined} ({quarantine_dir})")
+    if failures:
+        raise typer.Exit(code=1)
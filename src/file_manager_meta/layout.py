@@ -0,0 +1,76 @@
+import os
+import struct
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+from file_manager_meta.records import FileRecord
+
+# FIEMAP ioctl (from <linux/fiemap.h>): asks the filesystem where a file's extents are on disk
+FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP_HEADER = struct.Struct("QQIIII")  # fm_start, fm_length, fm_flags, fm_mapped_extents, fm_extent_count, fm_reserved
+_FIEMAP_EXTENT = struct.Struct("QQQQQIIII")  # fe_logical, fe_physical, fe_length, reserved64[2], fe_flags, reserved[3]
+
+
+@lru_cache(maxsize=None)
+def is_rotational(dev: int) -> bool:
+    """True if the block device holding dev is a spinning disk, as reported by Linux sysfs. False elsewhere."""
+    if not sys.platform.startswith("linux"):
+        return False
+    device_dir = Path(f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}")
+    try:
+        device_dir = device_dir.resolve(strict=True)
+        if (device_dir / "partition").exists():
+            device_dir = device_dir.parent  # The queue settings belong to the whole disk
+        return (device_dir / "queue" / "rotational").read_text().strip() == "1"
+    except OSError:
+        return False  # Not a block device (tmpfs, network filesystems...)
+
+
+def first_extent_offset(file_path: Path) -> int | None:
+    """Physical byte offset of a file's first extent, via FIEMAP. None where FIEMAP is unsupported or the file has no extents."""
+    import fcntl  # Unix only, and only reached on Linux
+    request = bytearray(_FIEMAP_HEADER.size + _FIEMAP_EXTENT.size)
+    _FIEMAP_HEADER.pack_into(request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    try:
+        with open(file_path, "rb") as f:
+            fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, request)
+    except OSError:
+        return None
+    mapped_extents = _FIEMAP_HEADER.unpack_from(request, 0)[3]
+    if not mapped_extents:
+        return None
+    return _FIEMAP_EXTENT.unpack_from(request, _FIEMAP_HEADER.size)[1]
+
+
+def resolve_read_order(directory: Path, read_order: str) -> str:
+    """Turns 'auto' into 'fiemap' when the directory is on a spinning disk and 'size' otherwise."""
+    if read_order != "auto":
+        return read_order
+    try:
+        rotational = is_rotational(directory.stat().st_dev)
+    except OSError:
+        rotational = False
+    if not rotational:
+        return "size"
+    return "fiemap" if sys.platform.startswith("linux") else "inode"
+
+
+def physical_sort_keys(records: list[FileRecord], use_fiemap: bool) -> list[tuple]:
+    """
+    Returns a sort key per record that follows the files' position on disk.
+    The inode number is a cheap proxy, as most filesystems allocate inodes and data close together;
+    FIEMAP gives the real offset of the first extent. Devices where FIEMAP fails fall back to inodes.
+    """
+    use_fiemap = use_fiemap and sys.platform.startswith("linux")
+    fiemap_unsupported = set()
+    keys = []
+    for record in records:
+        offset = None
+        if use_fiemap and record.dev not in fiemap_unsupported:
+            offset = first_extent_offset(record.path)
+            if offset is None and record.size:
+                fiemap_unsupported.add(record.dev)
+        # Offsets and inode numbers aren't comparable, so each kind sorts on its own
+        keys.append((record.dev, 0, offset) if offset is not None else (record.dev, 1, record.ino))
+    return keys
@@ -4,12 +4,16 @@ from datetime import datetime
 from pathlib import Path
 from typing import List, Optional
 from concurrent.futures import ProcessPoolExecutor # New import
+from functools import partial
 
 import exiftool
 from rich.console import Console
 from rich.progress import Progress
 
 from file_manager_meta.cache_manager import init_cache, get_cached_hashes, set_cached_hashes # New import
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.scheduler import schedule
 
 console = Console()
 
@@ -76,18 +80,22 @@ def _parse_date_from_filename(filename: str) -> Optional[datetime]:
 
     return None
 
-def _process_file_for_metadata_update(file_path: Path, root_directory_for_cache: Path, dry_run: bool, tag: Optional[str], no_backup: bool, force: bool, verbose: bool):
+def _process_file_for_metadata_update(record: FileRecord, root_directory_for_cache: Path, dry_run: bool, tag: Optional[str], no_backup: bool, force: bool, verbose: bool):
     # Each process needs its own cache connection
     conn, _ = init_cache(root_directory_for_cache)
+    file_path = record.path
     try:
-        stat_info = file_path.stat()
-        cached_data = get_cached_hashes(conn, file_path, stat_info)
+        cached_data = get_cached_hashes(conn, file_path, record)
 
         filename_date = _parse_date_from_filename(file_path.name)
         if not filename_date:
             return "skipped", file_path.name, f"No date found in filename for {file_path.name}."
 
         current_metadata_date = None
+        if cached_data and cached_data.get('create_date'):
+            metrics.count("cache_hits_full")
+        else:
+            metrics.count("cache_hits_partial" if cached_data else "cache_misses")
         # Try to get metadata date from cache first
         if cached_data and cached_data.get('create_date'):
             try:
@@ -97,7 +105,7 @@ def _process_file_for_metadata_update(file_path: Path, root_directory_for_cache:
 
         # If not in cache or invalid, read with exiftool
         if not current_metadata_date:
-            with exiftool.ExifToolHelper() as et:
+            with metrics.timer("exiftool"), exiftool.ExifToolHelper() as et:
                 metadata = et.get_tags(str(file_path), tags=['CreateDate', 'DateTimeOriginal', 'FileModifyDate'])
                 if metadata and metadata[0]:
                     for date_tag in ['CreateDate', 'DateTimeOriginal', 'FileModifyDate']:
@@ -111,7 +119,7 @@ def _process_file_for_metadata_update(file_path: Path, root_directory_for_cache:
             
             # Cache the newly read metadata dates
             if current_metadata_date:
-                set_cached_hashes(conn, file_path, stat_info, {
+                set_cached_hashes(conn, file_path, record, {
                     "create_date": current_metadata_date.strftime('%Y:%m:%d %H:%M:%S'),
                     "date_time_original": current_metadata_date.strftime('%Y:%m:%d %H:%M:%S'),
                     "file_modify_date": current_metadata_date.strftime('%Y:%m:%d %H:%M:%S'),
@@ -137,7 +145,7 @@ def _process_file_for_metadata_update(file_path: Path, root_directory_for_cache:
         if dry_run:
             return "dry_run", file_path.name, f"Would update {file_path.name} with date and time: {new_date_str} (tags: {list(tags_to_write.keys())})." + (" (No backup would be created)." if no_backup else "")
         else:
-            with exiftool.ExifToolHelper() as et: # Re-open ExifTool for writing
+            with metrics.timer("exiftool"), exiftool.ExifToolHelper() as et: # Re-open ExifTool for writing
                 exiftool_params = [] # Renamed to avoid confusion
                 if no_backup:
                     exiftool_params.append("-overwrite_original")
@@ -145,7 +153,7 @@ def _process_file_for_metadata_update(file_path: Path, root_directory_for_cache:
                 et.set_tags(str(file_path), tags_to_write, params=exiftool_params)
             
             # Update cache after successful write
-            set_cached_hashes(conn, file_path, stat_info, {
+            set_cached_hashes(conn, file_path, record, {
                 "create_date": new_date_str,
                 "date_time_original": new_date_str,
                 "file_modify_date": new_date_str,
@@ -160,30 +168,69 @@ def _process_file_for_metadata_update(file_path: Path, root_directory_for_cache:
     finally:
         conn.close()
 
-def update_metadata_date(paths: List[Path], dry_run: bool = False, tag: Optional[str] = None, no_backup: bool = False, force: bool = False, verbose: bool = False):
-    console.print(f"Starting metadata date update for {len(paths)} paths...\n")
+def _walk_all_files(directory: Path, errors: list | None = None):
+    """
+    Yields a FileRecord for every file under directory, hidden ones included: unlike the walker,
+    dates are updated in every file the user points at, whatever the run's filter. Files that can't
+    be stat'ed are added to errors as (path, error), if given.
+    """
+    for dir_path, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            file_path = Path(dir_path) / file_name
+            try:
+                yield FileRecord.from_path(file_path)
+            except OSError as e:
+                if errors is not None:
+                    errors.append((file_path, e))
 
-    # Determine the root directory for cache based on input paths
+def collect_files(paths: List[Path]) -> tuple[Optional[Path], list[FileRecord], list[tuple[Path, OSError]]]:
+    """
+    Returns the directory whose cache the run uses, the files under paths (files or directories)
+    and (path, error) for those that couldn't be stat'ed.
+    """
     root_directory_for_cache = None
     if paths:
         if paths[0].is_dir():
             root_directory_for_cache = paths[0]
         else:
             root_directory_for_cache = paths[0].parent
-    
-    if not root_directory_for_cache:
-        console.print("[red]No valid paths provided for metadata update.[/red]")
-        return
 
     files_to_process = []
+    errors = []
     for input_path in paths:
         if input_path.is_file():
-            files_to_process.append(input_path)
+            try:
+                files_to_process.append(FileRecord.from_path(input_path))
+            except OSError as e:
+                errors.append((input_path, e))
         elif input_path.is_dir():
-            for dir_path, _, file_names in os.walk(input_path):
-                for file_name in file_names:
-                    files_to_process.append(Path(dir_path) / file_name)
-    
+            with metrics.phase("walk"):
+                files_to_process.extend(_walk_all_files(input_path, errors))
+    return root_directory_for_cache, files_to_process, errors
+
+def iter_metadata_updates(records: list[FileRecord], root_directory_for_cache: Path, dry_run: bool = False,
+                          tag: Optional[str] = None, no_backup: bool = False, force: bool = False, verbose: bool = False,
+                          progress: Progress | None = None, task_id=None):
+    """Updates the files in parallel, yielding (record, (result type, file name, message)) as each finishes."""
+    workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor, metrics.pool(workers), metrics.phase("processing"):
+        process_file = partial(_process_file_for_metadata_update, root_directory_for_cache=root_directory_for_cache,
+                               dry_run=dry_run, tag=tag, no_backup=no_backup, force=force, verbose=verbose)
+        for record, result in schedule(executor, process_file, records, workers, lambda record: record.size,
+                                       largest_first=True, progress=progress, task_id=task_id):
+            metrics.count(f"files_{result[0]}")
+            yield record, result
+
+def update_metadata_date(paths: List[Path], dry_run: bool = False, tag: Optional[str] = None, no_backup: bool = False, force: bool = False, verbose: bool = False):
+    console.print(f"Starting metadata date update for {len(paths)} paths...\n")
+
+    root_directory_for_cache, files_to_process, errors = collect_files(paths)
+    if not root_directory_for_cache:
+        console.print("[red]No valid paths provided for metadata update.[/red]")
+        return
+    for file_path, e in errors:
+        console.print(f"[bold red]Error accessing {file_path}: {e}[/bold red]")
+
     if not files_to_process:
         console.print("[yellow]No files found to process.[/yellow]")
         return
@@ -195,29 +242,24 @@ def update_metadata_date(paths: List[Path], dry_run: bool = False, tag: Optional
 
     with Progress() as progress:
         task = progress.add_task("[green]Processing files[/green]", total=len(files_to_process))
-        
-        # Use ProcessPoolExecutor for parallel processing
-        with ProcessPoolExecutor() as executor:
-            # Prepare arguments for each worker
-            args = [(file_path, root_directory_for_cache, dry_run, tag, no_backup, force, verbose) for file_path in files_to_process]
-            
-            for result_type, file_name, message in executor.map(_process_file_for_metadata_update, *zip(*args)):
-                progress.update(task, description=f"[green]Processing {file_name}[/green]")
-                if result_type == "updated":
-                    updated_count += 1
-                    if verbose:
-                        console.print(f"[green]{message}[/green]")
-                elif result_type == "skipped":
-                    skipped_count += 1
-                    if verbose:
-                        console.print(f"[dim]{message}[/dim]")
-                elif result_type == "dry_run":
-                    dry_run_count += 1
-                    console.print(f"[yellow]{message}[/yellow]") # Always print dry run messages
-                elif result_type == "error":
-                    error_count += 1
-                    console.print(f"[bold red]{message}[/bold red]") # Always print error messages
-                progress.advance(task)
+        for _, (result_type, file_name, message) in iter_metadata_updates(
+                files_to_process, root_directory_for_cache, dry_run=dry_run, tag=tag, no_backup=no_backup, force=force,
+                verbose=verbose, progress=progress, task_id=task):
+            progress.update(task, description=f"[green]Processing {file_name}[/green]")
+            if result_type == "updated":
+                updated_count += 1
+                if verbose:
+                    console.print(f"[green]{message}[/green]")
+            elif result_type == "skipped":
+                skipped_count += 1
+                if verbose:
+                    console.print(f"[dim]{message}[/dim]")
+            elif result_type == "dry_run":
+                dry_run_count += 1
+                console.print(f"[yellow]{message}[/yellow]") # Always print dry run messages
+            elif result_type == "error":
+                error_count += 1
+                console.print(f"[bold red]{message}[/bold red]") # Always print error messages
     
     console.print("\n[bold green]Metadata date update complete.[/bold green]")
     console.print(f"[green]Files updated:[/green] {updated_count}")
@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class Metrics:
+    """
+    Per-run timings and counters.
+    `phases` hold wall time of the steps of a command as seen by the main process, `timers` accumulate
+    the duration of fine-grained operations (cache lookups, hashing, ExifTool...) summed over all workers.
+    """
+
+    def __init__(self):
+        # Worker threads update timers and counters concurrently
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.command = None
+        self.started = time.perf_counter()
+        self.phases = defaultdict(float)
+        self.timers = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.worker_busy_seconds = 0.0
+        self.worker_capacity_seconds = 0.0
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timers[name] += elapsed
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    @contextmanager
+    def pool(self, workers: int):
+        """Wraps the lifetime of a worker pool, so worker utilization can be computed against it."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.worker_capacity_seconds += (time.perf_counter() - start) * workers
+
+    def absorb(self, measured_result):
+        """Merges what a worker recorded (see measured_call) and returns the worker's actual result."""
+        result, counters, timers, busy_seconds = measured_result
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] += value
+            for name, value in timers.items():
+                self.timers[name] += value
+            self.worker_busy_seconds += busy_seconds
+        return result
+
+    def to_dict(self) -> dict:
+        wall_seconds = time.perf_counter() - self.started
+        counters = dict(self.counters)
+        lookups = counters.get("cache_hits_full", 0) + counters.get("cache_hits_partial", 0) + counters.get("cache_misses", 0)
+
+        def rate(value, total):
+            return round(value / total, 4) if total else None
+
+        return {
+            "command": self.command,
+            "wall_seconds": round(wall_seconds, 4),
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "timers": {name: round(seconds, 4) for name, seconds in self.timers.items()},
+            "counters": counters,
+            "derived": {
+                "files_per_second": rate(counters.get("files_walked", 0), wall_seconds),
+                "bytes_read_per_second": rate(counters.get("bytes_read", 0), wall_seconds),
+                "cache_full_hit_rate": rate(counters.get("cache_hits_full", 0), lookups),
+                "cache_partial_hit_rate": rate(counters.get("cache_hits_partial", 0), lookups),
+                "cache_miss_rate": rate(counters.get("cache_misses", 0), lookups),
+                "worker_utilization": rate(self.worker_busy_seconds, self.worker_capacity_seconds),
+            },
+        }
+
+    def write_json(self, path: Path):
+        path.write_text(json.dumps(self.to_dict(), indent=2), encoding="utf-8")
+
+    def write_prometheus(self, path: Path):
+        """Writes the metrics in the node_exporter textfile collector format."""
+        data = self.to_dict()
+        labels = f'command="{data["command"] or ""}"'
+        lines = [
+            "# HELP file_manager_meta_wall_seconds Wall time of the last run.",
+            "# TYPE file_manager_meta_wall_seconds gauge",
+            f"file_manager_meta_wall_seconds{{{labels}}} {data['wall_seconds']}",
+            "# HELP file_manager_meta_phase_seconds Wall time per phase of the last run.",
+            "# TYPE file_manager_meta_phase_seconds gauge",
+        ]
+        lines += [f'file_manager_meta_phase_seconds{{{labels},phase="{name}"}} {value}' for name, value in data["phases"].items()]
+        lines += [
+            "# HELP file_manager_meta_timer_seconds Time spent per operation, summed over workers.",
+            "# TYPE file_manager_meta_timer_seconds gauge",
+        ]
+        lines += [f'file_manager_meta_timer_seconds{{{labels},operation="{name}"}} {value}' for name, value in data["timers"].items()]
+        lines += [
+            "# HELP file_manager_meta_count Counters of the last run.",
+            "# TYPE file_manager_meta_count gauge",
+        ]
+        lines += [f'file_manager_meta_count{{{labels},name="{name}"}} {value}' for name, value in data["counters"].items()]
+        lines += [
+            "# HELP file_manager_meta_ratio Derived rates and ratios of the last run.",
+            "# TYPE file_manager_meta_ratio gauge",
+        ]
+        lines += [f'file_manager_meta_ratio{{{labels},name="{name}"}} {value}' for name, value in data["derived"].items() if value is not None]
+        # Written then renamed, so the collector never reads a half-written file
+        temp_path = path.with_name(path.name + ".tmp")
+        temp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(temp_path, path)
+
+
+metrics = Metrics()
+
+
+def measured_call(fn, *args, **kwargs):
+    """
+    Runs fn in a worker process and returns (result, counters, timers, busy seconds) recorded meanwhile,
+    for the parent to merge with metrics.absorb().
+    """
+    metrics.reset()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    busy_seconds = time.perf_counter() - start
+    return result, dict(metrics.counters), dict(metrics.timers), busy_seconds
+
+
+def timed_call(fn, *args, **kwargs):
+    """
+    The thread counterpart of measured_call: worker threads record straight into the shared metrics,
+    so only the busy time is returned alongside the result.
+    """
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, {}, {}, time.perf_counter() - start
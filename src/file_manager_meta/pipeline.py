@@ -0,0 +1,252 @@
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+import typer
+from rich.console import Console
+from rich.progress import Progress
+
+from file_manager_meta.cache_manager import CacheWriter, init_cache, rename_cached_files
+from file_manager_meta.deduplicate import match_candidates, iter_verified_sets, _report_dry_run, _delete_duplicates
+from file_manager_meta.deletion import open_trash
+from file_manager_meta.enums import PipelineStage
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.repair import detect_file_types, _print_exiftool_error
+from file_manager_meta.report import hash_file_for_report, print_report_tables
+from file_manager_meta.scan_store import MemoryScanStore
+from file_manager_meta.scheduler import open_executor, schedule
+from file_manager_meta.sort import sort_file, delete_empty_directory
+from file_manager_meta.throttle import throttle_open
+from file_manager_meta.tuning import tune
+from file_manager_meta.walker import walk_files
+
+
+def _repair_stage(console: Console, records: list[FileRecord], conn,
+                  dry_run: bool) -> tuple[int, int, dict[Path, Path]]:
+    """
+    Gives each file without an extension the one matching its content.
+    Returns (files renamed, types not found, the new path each file would get in a dry run).
+    """
+    missing = [record for record in records if not record.path.suffix]
+    if not missing:
+        return 0, 0, {}
+    try:
+        file_types = detect_file_types(conn, missing)
+    except Exception as e:
+        _print_exiftool_error(e)
+        file_types = {}
+    renames = []
+    with metrics.phase("rename"):
+        for record in missing:
+            new_extension = file_types.get(record.path)
+            if not new_extension:
+                continue
+            new_path = record.path.with_suffix(f".{new_extension}")
+            if dry_run:
+                console.print(f"Would rename [cyan]{record.path.name}[/cyan] to [green]{new_path.name}[/green]")
+                renames.append((record.path, new_path))
+                continue
+            if new_path.exists():
+                console.print(f"[yellow]Not renaming {record.path.name}: {new_path.name} already exists.[/yellow]")
+                continue
+            try:
+                throttle_open()
+                record.path.rename(new_path)
+            except OSError as e:
+                console.print(f"[bold red]Error renaming {record.path.name}: {e}[/bold red]")
+                continue
+            console.print(f"Renamed [cyan]{record.path.name}[/cyan] to [green]{new_path.name}[/green]")
+            renames.append((record.path, new_path))
+            record.path = new_path
+        if not dry_run:
+            rename_cached_files(conn, renames)
+            metrics.count("files_renamed", len(renames))
+    return len(renames), len(missing) - len(file_types), dict(renames) if dry_run else {}
+
+
+def _deduplicate_stage(console: Console, executor, workers: int, records: list[FileRecord], directory: Path, conn,
+                       writer: CacheWriter | None, keep_rule: str, dry_run: bool, verify: bool,
+                       staging_dir: Path | None) -> tuple[int, int, list[FileRecord]]:
+    """
+    Finds the duplicates among the records and removes all but the kept file of each set.
+    Returns (sets found, files deleted or that would be, the records still on disk).
+    """
+    store = MemoryScanStore()
+    store.add_all(records)
+    if not match_candidates(executor, workers, store, directory, console, writer):
+        return 0, 0, records
+    if verify:
+        duplicate_sets = iter_verified_sets(executor, store.iter_duplicate_sets(), workers, "size", None)
+    else:
+        duplicate_sets = (files for _, files in store.iter_duplicate_sets())
+    if dry_run:
+        with metrics.phase("report"):
+            set_count, delete_count = _report_dry_run(console, duplicate_sets, keep_rule)
+        return set_count, delete_count, records
+    if writer:
+        writer.flush()  # Otherwise entries of deleted files could be written back after they are dropped
+    with metrics.phase("delete"):
+        set_count, deleted = _delete_duplicates(console, duplicate_sets, keep_rule, directory, staging_dir, conn=conn)
+    deleted_paths = {record.path for record in deleted}
+    return set_count, len(deleted), [record for record in records if record.path not in deleted_paths]
+
+
+def _sort_stage(console: Console, records: list[FileRecord], directory: Path, new_directory: Path, sort_by: str,
+                date_granularity: Optional[str], conn, dry_run: bool,
+                planned_renames: dict[Path, Path] | None = None) -> tuple[int, int]:
+    """
+    Moves every file with an extension into its place under new_directory. In a dry run, files the repair stage
+    would rename are sorted under their planned names. Returns (files sorted, files without extension).
+    """
+    planned_renames = planned_renames or {}
+    moves = []
+    without_extension = 0
+    with metrics.phase("move"), Progress(console=console, transient=True) as progress:
+        task = progress.add_task(f"[green]Sorting files: {sort_by}", total=len(records))
+        for record in records:
+            progress.advance(task)
+            if not planned_renames.get(record.path, record.path).suffix:
+                without_extension += 1
+                continue
+            if dry_run:
+                moves.append((record.path, None))
+                continue
+            try:
+                new_directory.mkdir(exist_ok=True)
+                destination = sort_file(record, new_directory, sort_by, date_granularity)
+            except OSError as e:
+                console.print(f"[bold red]Error sorting {record.path.name}: {e}[/bold red]")
+                continue
+            if destination:
+                moves.append((record.path, destination))
+                record.path = destination
+        if not dry_run:
+            rename_cached_files(conn, moves)
+    if not dry_run:
+        with metrics.phase("cleanup"):
+            delete_empty_directory(directory)
+    return len(moves), without_extension
+
+
+def _report_stage(console: Console, report_console: Console, executor, workers: int, records: list[FileRecord],
+                  directory: Path, conn, writer: CacheWriter | None, output: Path | None) -> int:
+    """Prints the hash tables of the files where they now are. Returns the number of duplicate sets."""
+    hash_file = partial(hash_file_for_report, root_directory=directory, writer=writer)
+    with metrics.phase("hashing"), Progress(console=console, transient=True) as progress:
+        task = progress.add_task("[green]Hashing files[/green]", total=len(records))
+        # Files hashed by the deduplicate stage are cache hits under their new paths
+        for record, hashes in schedule(executor, hash_file, records, workers, lambda r: r.size, largest_first=True,
+                                       progress=progress, task_id=task):
+            record.hashes = hashes
+    if writer:
+        writer.flush()
+    store = MemoryScanStore()
+    store.add_all(records)
+    with metrics.phase("tables"):
+        total_duplicate_sets = print_report_tables(console, report_console, directory, store, conn, verbose=bool(output))
+    if output:
+        with metrics.phase("export"):
+            html_content = report_console.export_html()
+            custom_css = "<style> body, code { font-size: 0.9em; } </style>"
+            html_content = html_content.replace("</head>", f"{custom_css}</head>")
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(html_content)
+    return total_duplicate_sets
+
+
+def run_pipeline(directory: Path, stages: list[str], new_directory: Path | None = None, sort_by: str = "ext",
+                 date_granularity: Optional[str] = None, keep_rule: str = "oldest", dry_run: bool = False,
+                 verify: bool = False, trash_dir: Path | None = None, output: Path | None = None,
+                 executor_kind: str = "processes"):
+    """
+    Runs repair, deduplicate, sort and report (or the chosen stages, always in that order) over a single walk
+    of directory. Every stage works on the same FileRecords, whose paths follow the files as they are renamed
+    and moved, with one cache connection and one worker pool. Cache entries move with their files, so no
+    stage reads a file again that an earlier stage already hashed.
+    """
+    console = Console()
+    if output and output.suffix != ".html":
+        console.print("Output file must have a .html extension", style="red")
+        raise typer.Exit(code=1)
+    new_directory = new_directory or directory
+    if PipelineStage.SORT in stages and not new_directory.resolve().is_relative_to(directory.resolve()):
+        # Moved files must stay under the directory whose cache holds their hashes
+        console.print(f"[red]--new-directory must be inside {directory} in a pipeline.[/red]")
+        raise typer.Exit(code=1)
+    staging_dir = open_trash(console, directory, trash_dir) if trash_dir and not dry_run and \
+        PipelineStage.DEDUPLICATE in stages else None
+    report_console = Console(record=True) if output else console
+    console.print(f"Starting pipeline ({' -> '.join(stage.value for stage in PipelineStage if stage in stages)}) "
+                  f"in [cyan]{directory}[/cyan]...\n")
+
+    conn, db_path = init_cache(directory)
+    console.print(f"Using cache database: [dim]{db_path}[/dim]")
+    writer = None
+    planned_renames = {}
+    renamed = types_not_found = set_count = deleted_count = sorted_count = without_extension = report_sets = 0
+    try:
+        # --- Step 1: Walk the tree once ---
+        console.print("Step 1: Collecting all file paths...")
+        with metrics.phase("walk"):
+            records = list(walk_files(directory))
+        total_files = len(records)
+        if not records:
+            console.print("[green]No files found to process.[/green]")
+            return
+
+        workers = tune(directory).workers
+        # Threads share one batched cache writer; processes each write through their own connection
+        writer = CacheWriter(directory) if executor_kind == "threads" else None
+        with open_executor(executor_kind, workers) as executor, metrics.pool(workers):
+            # --- Step 2: Repair missing extensions ---
+            if PipelineStage.REPAIR in stages:
+                console.print("Step 2: Repairing missing extensions (using cache)...")
+                renamed, types_not_found, planned_renames = _repair_stage(console, records, conn, dry_run)
+
+            # --- Step 3: Find and delete duplicates ---
+            if PipelineStage.DEDUPLICATE in stages:
+                console.print("Step 3: Comparing and hashing duplicate candidates (in parallel, using cache)...")
+                set_count, deleted_count, records = _deduplicate_stage(console, executor, workers, records, directory, conn,
+                                                                       writer, keep_rule, dry_run, verify, staging_dir)
+
+            # --- Step 4: Sort ---
+            if PipelineStage.SORT in stages:
+                console.print(f"Step 4: Sorting files by {sort_by}...")
+                if writer:
+                    writer.flush()  # Entries still buffered under the old paths would be written after the move
+                sorted_count, without_extension = _sort_stage(console, records, directory, new_directory, sort_by,
+                                                              date_granularity, conn, dry_run, planned_renames)
+
+            # --- Step 5: Report ---
+            if PipelineStage.REPORT in stages:
+                console.print("Step 5: Hashing files and generating report (in parallel, using cache)...")
+                report_sets = _report_stage(console, report_console, executor, workers, records, directory, conn, writer,
+                                            output)
+    finally:
+        if writer:
+            writer.close()
+        conn.close()
+
+    console.rule("Pipeline Task Summary")
+    console.print(f"[green]Total files scanned:[/green] {total_files}")
+    if PipelineStage.REPAIR in stages:
+        console.print(f"[green]Files {'that would be ' if dry_run else ''}renamed:[/green] {renamed}")
+        if types_not_found:
+            console.print(f"[yellow]Files skipped (ExifTool could not determine type):[/yellow] {types_not_found}")
+    if PipelineStage.DEDUPLICATE in stages:
+        console.print(f"[green]Duplicate sets found:[/green] {set_count}")
+        if dry_run:
+            console.print(f"[yellow]Files that would be deleted:[/yellow] {deleted_count}")
+        elif staging_dir:
+            console.print(f"[green]Files moved to the trash:[/green] {deleted_count} ({staging_dir})")
+        else:
+            console.print(f"[green]Files successfully deleted:[/green] {deleted_count}")
+    if PipelineStage.SORT in stages:
+        console.print(f"[green]Files {'that would be ' if dry_run else ''}sorted:[/green] {sorted_count}")
+        if without_extension:
+            console.print(f"[yellow]Files skipped (no extension):[/yellow] {without_extension}")
+    if PipelineStage.REPORT in stages:
+        console.print(f"[green]Duplicate sets in report:[/green] {report_sets}")
+        if output:
+            console.print(f"[green]Report saved to:[/green] {output}")
@@ -0,0 +1,47 @@
+import os
+from pathlib import Path
+
+
+class FileRecord:
+    """A file seen by the walker, carrying the stat fields every pipeline needs so they are read only once."""
+    __slots__ = ("path", "size", "mtime_ns", "ctime_ns", "dev", "ino", "hashes")
+
+    def __init__(self, path: Path, size: int, mtime_ns: int, ctime_ns: int, dev: int, ino: int, hashes: dict | None = None):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.ctime_ns = ctime_ns
+        self.dev = dev
+        self.ino = ino
+        self.hashes = hashes
+
+    @classmethod
+    def from_stat(cls, path: Path, stat_info: os.stat_result) -> "FileRecord":
+        return cls(path, stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ctime_ns, stat_info.st_dev, stat_info.st_ino)
+
+    @classmethod
+    def from_path(cls, path: Path) -> "FileRecord":
+        return cls.from_stat(path, path.stat())
+
+    # The st_* properties let a record stand in for os.stat_result (e.g. in the cache functions)
+    @property
+    def st_size(self) -> int:
+        return self.size
+
+    @property
+    def st_mtime_ns(self) -> int:
+        return self.mtime_ns
+
+    @property
+    def st_mtime(self) -> float:
+        # Same arithmetic as os.stat_result.st_mtime so values compare equal to ones cached by older versions
+        seconds, nanoseconds = divmod(self.mtime_ns, 1_000_000_000)
+        return seconds + nanoseconds * 1e-9
+
+    @property
+    def st_ctime(self) -> float:
+        seconds, nanoseconds = divmod(self.ctime_ns, 1_000_000_000)
+        return seconds + nanoseconds * 1e-9
+
+    def __repr__(self):
+        return f"FileRecord({str(self.path)!r}, size={self.size})"
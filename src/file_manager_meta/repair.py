@@ -1,16 +1,82 @@
-import os
 import exiftool
 from pathlib import Path
 import sqlite3 # For OperationalError
-from typing import List # New import
+from typing import Callable, List # New import
 
 from rich.console import Console
 from rich.progress import Progress
 
-from file_manager_meta.cache_manager import init_cache, get_cached_hashes, set_cached_hashes # Import cache functions
+from file_manager_meta.cache_manager import init_cache, get_cached_hashes, set_cached_hashes, rename_cached_files
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.walker import walk_files, is_excluded_file
 
 console = Console()
 
+def _run_exiftool(records: List[FileRecord], on_result: Callable[[], None] | None = None) -> dict[Path, str]:
+    """
+    Asks ExifTool for the real extension of every file in one batch. Returns {path: extension};
+    on_result is called once per file answered. Raises whatever ExifTool raises if it can't run.
+    """
+    exiftool_results = {}
+    metrics.count("exiftool_files", len(records))
+    with exiftool.ExifToolHelper() as et:
+        metadata_list = et.get_tags([str(r.path) for r in records], tags=['FileTypeExtension'])
+        for m in metadata_list:
+            source_file = m.get('SourceFile')
+            file_type_ext = m.get('File:FileTypeExtension')
+            if source_file and file_type_ext:
+                exiftool_results[Path(source_file)] = file_type_ext.lower()
+            if on_result:
+                on_result()
+    return exiftool_results
+
+def _print_exiftool_error(e: Exception):
+    console.print(f"[bold red]Error running ExifTool: {e}[/bold red]")
+    console.print("[yellow]Please ensure ExifTool is installed and in your system's PATH.[/yellow]")
+
+def _cached_file_types(conn: sqlite3.Connection, records: List[FileRecord],
+                       on_checked: Callable[[], None] | None = None) -> tuple[dict[Path, str], List[FileRecord]]:
+    """Returns ({path: extension} of the files whose type is cached and unchanged, the other records)."""
+    file_types = {}
+    unknown = []
+    with metrics.phase("cache_lookup"):
+        for record in records:
+            cached_data = get_cached_hashes(conn, record.path, record)
+            if cached_data and cached_data.get("exiftool_file_type"):
+                metrics.count("cache_hits_full")
+                file_types[record.path] = cached_data["exiftool_file_type"]
+            else:
+                metrics.count("cache_hits_partial" if cached_data else "cache_misses")
+                unknown.append(record)
+            if on_checked:
+                on_checked()
+    return file_types, unknown
+
+def _exiftool_file_types(conn: sqlite3.Connection, records: List[FileRecord],
+                         on_result: Callable[[], None] | None = None) -> dict[Path, str]:
+    """Asks ExifTool for the type of records in one batch and caches the answers. Raises whatever ExifTool raises."""
+    with metrics.phase("exiftool"):
+        exiftool_results = _run_exiftool(records, on_result)
+    file_types = {}
+    for record in records:
+        new_extension = exiftool_results.get(record.path)
+        if new_extension:
+            set_cached_hashes(conn, record.path, record, {"exiftool_file_type": new_extension})
+            file_types[record.path] = new_extension
+    return file_types
+
+def detect_file_types(conn: sqlite3.Connection, records: List[FileRecord]) -> dict[Path, str]:
+    """
+    Finds the real extension of each file: from the cache when the file is unchanged, otherwise from
+    one ExifTool batch whose answers are cached. Files whose type can't be determined are left out.
+    Raises whatever ExifTool raises if it can't run.
+    """
+    file_types, unknown = _cached_file_types(conn, records)
+    if unknown:
+        file_types.update(_exiftool_file_types(conn, unknown))
+    return file_types
+
 def repair_extension(paths: List[Path]): # Modified signature
     # Determine the root directory for cache based on input paths
     root_directory_for_cache = None
@@ -29,13 +95,13 @@ def repair_extension(paths: List[Path]): # Modified signature
     conn, db_path = init_cache(root_directory_for_cache) # Use determined root
     console.print(f"Using cache database: [dim]{db_path}[/dim]")
 
-    files_to_process_with_exiftool = []
     files_repaired_from_cache = []
     files_repaired_from_exiftool = []
     
     files_skipped_already_had_extension = []
     files_skipped_exiftool_failed = []
     files_skipped_due_to_error = []
+    renames = []
 
     try:
         # --- Step 1: Collect files and check cache ---
@@ -44,24 +110,18 @@ def repair_extension(paths: List[Path]): # Modified signature
         
         for input_path in paths: # Iterate through input paths
             if input_path.is_file():
-                # Skip hidden files
-                if input_path.name.startswith('.'):
+                # Skip hidden (or otherwise excluded) files and symlinks
+                if is_excluded_file(input_path, root_directory_for_cache) or input_path.is_symlink():
                     files_skipped_due_to_error.append(input_path) # Treat as skipped due to hidden
                     continue
-                all_files_to_process.append(input_path)
+                try:
+                    all_files_to_process.append(FileRecord.from_path(input_path))
+                except OSError:
+                    files_skipped_due_to_error.append(input_path)
             elif input_path.is_dir():
-                for dir_path, dir_names, file_names in os.walk(input_path):
-                    # Modify dir_names in-place to skip system/hidden directories
-                    dir_names[:] = [d for d in dir_names if d not in ['System Volume Information', '$RECYCLE.BIN']]
-                    dir_names[:] = [d for d in dir_names if not d.startswith('.')] # Skip hidden directories
-
-                    for file_name in file_names:
-                        file_path = Path(dir_path) / file_name
-                        # Skip hidden files
-                        if file_path.name.startswith('.'):
-                            files_skipped_due_to_error.append(file_path) # Treat as skipped due to hidden
-                            continue
-                        all_files_to_process.append(file_path)
+                # Hidden files are recorded as skipped by the walker
+                with metrics.phase("walk"):
+                    all_files_to_process.extend(walk_files(input_path, skipped=files_skipped_due_to_error))
             else:
                 console.print(f"[yellow]Skipping invalid path: {input_path}[/yellow]")
 
@@ -70,73 +130,45 @@ def repair_extension(paths: List[Path]): # Modified signature
             console.print("[green]No files found to repair.[/green]")
             return
 
+        # Only files without an extension are processed
+        missing = [record for record in all_files_to_process if not record.path.suffix]
+        files_skipped_already_had_extension.extend(record.path for record in all_files_to_process if record.path.suffix)
         with Progress() as progress:
-            task_collect = progress.add_task("[green]Collecting files[/green]", total=total_files)
-            for file_path in all_files_to_process: # Iterate through collected files
-                if file_path.is_file() and not file_path.is_symlink():
-                    if not file_path.suffix: # Only process files without extension
-                        try:
-                            stat_info = file_path.stat()
-                            cached_data = get_cached_hashes(conn, file_path, stat_info)
-                            if cached_data and cached_data.get("exiftool_file_type"):
-                                files_repaired_from_cache.append((file_path, cached_data["exiftool_file_type"]))
-                            else:
-                                files_to_process_with_exiftool.append(file_path)
-                        except (OSError, sqlite3.OperationalError) as e:
-                            console.print(f"[bold red]Error accessing file or cache for {file_path}: {e}[/bold red]")
-                            files_skipped_due_to_error.append(file_path)
-                    else:
-                        files_skipped_already_had_extension.append(file_path) # Skip files that already have an extension
-                else:
-                    files_skipped_due_to_error.append(file_path) # Non-files or symlinks treated as errors for repair
-                progress.advance(task_collect)
+            task_collect = progress.add_task("[green]Checking cache[/green]", total=len(missing))
+            cached_types, files_to_process_with_exiftool = _cached_file_types(
+                conn, missing, lambda: progress.advance(task_collect))
+        files_repaired_from_cache.extend(cached_types.items())
 
         # --- Step 2: Batch process files with ExifTool ---
         if files_to_process_with_exiftool:
             console.print(f"Step 2: Processing {len(files_to_process_with_exiftool)} files with ExifTool...\n")
-            exiftool_results = {}
+            exiftool_types = {}
             with Progress() as progress:
                 task_exiftool = progress.add_task("[green]Running ExifTool[/green]", total=len(files_to_process_with_exiftool))
                 try:
-                    with exiftool.ExifToolHelper() as et:
-                        metadata_list = et.get_tags([str(f) for f in files_to_process_with_exiftool], tags=['FileTypeExtension'])
-                        for m in metadata_list:
-                            source_file = m.get('SourceFile')
-                            file_type_ext = m.get('File:FileTypeExtension')
-                            if source_file and file_type_ext:
-                                exiftool_results[Path(source_file)] = file_type_ext.lower()
-                            progress.advance(task_exiftool)
+                    exiftool_types = _exiftool_file_types(conn, files_to_process_with_exiftool,
+                                                          lambda: progress.advance(task_exiftool))
                 except Exception as e:
-                    console.print(f"[bold red]Error running ExifTool: {e}[/bold red]")
-                    console.print("[yellow]Please ensure ExifTool is installed and in your system's PATH.[/yellow]")
-                    files_skipped_exiftool_failed.extend(files_to_process_with_exiftool) # Mark all as skipped
-
-            # Update cache and prepare for renaming
-            for file_path in files_to_process_with_exiftool:
-                new_extension = exiftool_results.get(file_path)
-                if new_extension:
-                    try:
-                        stat_info = file_path.stat()
-                        set_cached_hashes(conn, file_path, stat_info, {"exiftool_file_type": new_extension})
-                        files_repaired_from_exiftool.append((file_path, new_extension))
-                    except (OSError, sqlite3.OperationalError) as e:
-                        console.print(f"[bold red]Error caching result for {file_path}: {e}[/bold red]")
-                        files_skipped_due_to_error.append(file_path)
-                else:
-                    files_skipped_exiftool_failed.append(file_path) # ExifTool couldn't determine type
+                    _print_exiftool_error(e)
+            files_repaired_from_exiftool.extend(exiftool_types.items())
+            # ExifTool couldn't run or couldn't determine their type
+            files_skipped_exiftool_failed.extend(record.path for record in files_to_process_with_exiftool
+                                                 if record.path not in exiftool_types)
 
         # --- Step 3: Perform renaming and report ---
         console.print("Step 3: Renaming files...")
         renamed_count = 0
-        with Progress() as progress:
+        with metrics.phase("rename"), Progress() as progress:
             task_rename = progress.add_task("[green]Renaming files[/green]", total=len(files_repaired_from_cache) + len(files_repaired_from_exiftool))
             
             for file_path, new_extension in files_repaired_from_cache + files_repaired_from_exiftool:
                 try:
                     new_file_path = file_path.with_suffix(f".{new_extension}")
                     file_path.rename(new_file_path)
+                    renames.append((file_path, new_file_path))
                     console.print(f"Renamed [cyan]{file_path.name}[/cyan] to [green]{new_file_path.name}[/green] (Source: {'Cache' if (file_path, new_extension) in files_repaired_from_cache else 'ExifTool'})")
                     renamed_count += 1
+                    metrics.count("files_renamed")
                 except OSError as e:
                     console.print(f"[bold red]Error renaming {file_path.name}: {e}[/bold red]")
                     files_skipped_due_to_error.append(file_path) # Add to error list
@@ -154,6 +186,8 @@ def repair_extension(paths: List[Path]): # Modified signature
             console.print(f"[red]Files skipped (due to errors):[/red] {len(files_skipped_due_to_error)}")
 
     finally:
+        # The cached hashes follow the renamed files, as in api.repair_extensions
+        rename_cached_files(conn, renames)
         conn.close()
         console.print("[dim]Cache connection closed.[/dim]")
 
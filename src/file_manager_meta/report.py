@@ -1,14 +1,73 @@
-from collections import defaultdict
-import os
+from functools import partial
 from pathlib import Path
 import typer
 from rich.console import Console
+from rich.progress import Progress
 from rich.table import Table
 
 from file_manager_meta.hashes import calculate_hashes
-from file_manager_meta.cache_manager import init_cache
-
-def generate_report(directory: Path, output: Path = None):
+from file_manager_meta.cache_manager import CacheWriter, init_cache, worker_connection
+from file_manager_meta.layout import resolve_read_order
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.scan_store import open_scan_store
+from file_manager_meta.scheduler import open_executor, schedule
+from file_manager_meta.tuning import tune
+from file_manager_meta.walker import walk_files
+
+def hash_file_for_report(record: FileRecord, root_directory: Path, writer: CacheWriter | None = None) -> dict:
+    return calculate_hashes(record, worker_connection(root_directory), writer)
+
+def print_report_tables(console: Console, report_console: Console, directory: Path, store, conn, verbose: bool = False) -> int:
+    """
+    Prints the hash table of each directory in the store and the table of duplicate sets to report_console.
+    Hashes come from the records or the cache. Returns the number of duplicate sets.
+    """
+    for dir_path, records in store.iter_directories():
+        relative_dir_path = dir_path.relative_to(directory)
+        table_title = f"File Hashes in ./{relative_dir_path}" if str(relative_dir_path) != "." else "File Hashes in Root Directory"
+
+        table = Table(title=table_title)
+        table.add_column("File", style="cyan")
+        table.add_column("MD5", style="magenta")
+        table.add_column("SHA-1", style="green")
+        table.add_column("SHA-256", style="yellow")
+
+        for record in records:
+            hashes = calculate_hashes(record, conn)
+            table.add_row(
+                record.path.name,
+                hashes.get("md5"),
+                hashes.get("sha1"),
+                hashes.get("sha256"),
+            )
+            if hashes.get("md5"):
+                store.add_match(record, hashes["md5"])
+
+        report_console.print(table)
+
+        if verbose:
+            console.print(f"Processed directory [cyan]./{relative_dir_path}[/cyan]... OK", style="dim")
+
+    # Duplicates Table
+    total_duplicate_sets = 0
+    duplicates_table = Table(title="Duplicate File Sets")
+    duplicates_table.add_column("Files in Set", no_wrap=True)
+
+    for _, files in store.iter_duplicate_sets():
+        total_duplicate_sets += 1
+        relative_file_paths = sorted(str(record.path.relative_to(directory)) for record in files)
+        duplicates_table.add_row("\n".join(relative_file_paths))
+        duplicates_table.add_section()
+
+    if total_duplicate_sets:
+        report_console.print(duplicates_table)
+    else:
+        report_console.print("No duplicate files found.", style="green")
+    return total_duplicate_sets
+
+def generate_report(directory: Path, output: Path = None, memory_limit_mb: int | None = None,
+                    read_order: str = "auto", device_workers: int | None = None, executor_kind: str = "processes"):
     """Generates a detailed report with file metadata and integrity hashes, and lists duplicate files."""
 
     console = Console()
@@ -20,94 +79,62 @@ def generate_report(directory: Path, output: Path = None):
     conn, db_path = init_cache(directory)
     console.print(f"Using cache database: [dim]{db_path}[/dim]")
 
-    files_by_directory = defaultdict(list)
+    store = open_scan_store(memory_limit_mb)
+    if memory_limit_mb:
+        console.print(f"Bounded-memory mode: the scan is spilled to disk (limit: {memory_limit_mb} MB).")
+    read_order = resolve_read_order(directory, read_order)
+    if read_order != "size":
+        console.print(f"Reading files in on-disk order ({read_order}).")
+    total_duplicate_sets = 0
+    writer = None
 
     try:
         # 1. Collect and group files by directory
-        all_file_paths = []
-        for dir_path, dir_names, file_names in os.walk(directory):
-            # Modify dir_names in-place to skip system/hidden directories
-            dir_names[:] = [d for d in dir_names if d not in ['System Volume Information', '$RECYCLE.BIN']]
-            dir_names[:] = [d for d in dir_names if not d.startswith('.')] # Skip hidden directories
-
-            if file_names:
-                for file_name in file_names:
-                    file_path = Path(dir_path) / file_name
-                    # Skip hidden files
-                    if file_path.name.startswith('.'):
-                        continue
-
-                    try:
-                        if file_path.is_file() and not file_path.is_symlink():
-                            all_file_paths.append(file_path)
-                            files_by_directory[Path(dir_path)].append(file_name)
-                    except OSError:
-                        continue
-
-        hash_map = defaultdict(list)
-
-        # 2. Process and print tables for each directory
+        with metrics.phase("walk"):
+            store.add_all(walk_files(directory))
+
+        # 2. Hash all files in parallel, largest first; workers fill the cache
+        console.print("Hashing files (in parallel, using cache)...")
+        workers = tune(directory).workers
+        # Threads share one batched cache writer; processes each write through their own connection
+        writer = CacheWriter(directory) if executor_kind == "threads" else None
+        hash_file = partial(hash_file_for_report, root_directory=directory, writer=writer)
+        with open_executor(executor_kind, workers) as executor, metrics.pool(workers), metrics.phase("hashing"), \
+                Progress(console=console, transient=True) as progress:
+            task = progress.add_task("[green]Hashing files[/green]", total=len(store))
+            for record, hashes in schedule(executor, hash_file, store.iter_files_by_size(), workers,
+                                           lambda r: r.size, total_bytes=store.total_size(),
+                                           progress=progress, task_id=task, read_order=read_order,
+                                           device_workers=device_workers):
+                # In-memory records keep their hashes; spilled ones find them in the cache below
+                record.hashes = hashes
+        if writer:
+            writer.close()
+            writer = None
+
+        # 3-4. Print tables for each directory and the duplicate sets
         console.print("Generating report (using cache)...")
-        for dir_path in sorted(files_by_directory.keys()):
-            relative_dir_path = dir_path.relative_to(directory)
-            table_title = f"File Hashes in ./{relative_dir_path}" if str(relative_dir_path) != "." else "File Hashes in Root Directory"
-
-            table = Table(title=table_title)
-            table.add_column("File", style="cyan")
-            table.add_column("MD5", style="magenta")
-            table.add_column("SHA-1", style="green")
-            table.add_column("SHA-256", style="yellow")
-
-            for file_name in sorted(files_by_directory[dir_path]):
-                file_path = dir_path / file_name
-                if file_path.is_file():
-                    hashes = calculate_hashes(file_path, conn)
-                    table.add_row(
-                        file_name,
-                        hashes.get("md5"),
-                        hashes.get("sha1"),
-                        hashes.get("sha256"),
-                    )
-                    if hashes.get("md5"):
-                        relative_file_path = str(file_path.relative_to(directory))
-                        hash_map[hashes["md5"]].append(relative_file_path)
-            
-            report_console.print(table)
-
-            if output:
-                console.print(f"Processed directory [cyan]./{relative_dir_path}[/cyan]... OK", style="dim")
-
-        # 3. Duplicates Table
-        duplicates_table = Table(title="Duplicate File Sets")
-        duplicates_table.add_column("Files in Set", no_wrap=True)
-
-        has_duplicates = False
-        for files in hash_map.values():
-            if len(files) > 1:
-                has_duplicates = True
-                duplicates_table.add_row("\n".join(sorted(files)))
-                duplicates_table.add_section()
-
-        if has_duplicates:
-            report_console.print(duplicates_table)
-        else:
-            report_console.print("No duplicate files found.", style="green")
+        with metrics.phase("tables"):
+            total_duplicate_sets = print_report_tables(console, report_console, directory, store, conn, verbose=bool(output))
 
         if output:
-            html_content = report_console.export_html()
-            custom_css = "<style> body, code { font-size: 0.9em; } </style>"
-            html_content = html_content.replace("</head>", f"{custom_css}</head>")
-            with open(output, "w", encoding="utf-8") as f:
-                f.write(html_content)
+            with metrics.phase("export"):
+                html_content = report_console.export_html()
+                custom_css = "<style> body, code { font-size: 0.9em; } </style>"
+                html_content = html_content.replace("</head>", f"{custom_css}</head>")
+                with open(output, "w", encoding="utf-8") as f:
+                    f.write(html_content)
             console.print(f"Report saved to {output}", style="green")
 
     finally:
+        if writer:
+            writer.close()
         conn.close()
         console.print("[dim]Cache connection closed.[/dim]")
         
         # Add summary
-        total_files_processed = len(all_file_paths) # From Step 2
-        total_duplicate_sets = len([files for files in hash_map.values() if len(files) > 1]) # From Step 3
+        total_files_processed = len(store)
+        store.close()
 
         console.rule("Report Task Summary")
         console.print(f"[green]Total files scanned:[/green] {total_files_processed}")
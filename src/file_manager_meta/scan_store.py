@@ -0,0 +1,241 @@
+import os
+import sqlite3
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+
+# Rough in-memory footprint of one buffered row, used to turn a memory limit into batch sizes
+_BYTES_PER_ROW = 512
+
+
+class MemoryScanStore:
+    """Keeps the walk output and content matches in plain Python containers."""
+
+    def __init__(self):
+        self._records = []
+        self._matches = defaultdict(list)
+
+    def add_all(self, records: Iterable[FileRecord]):
+        self._records.extend(records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def iter_size_groups(self) -> Iterator[list[FileRecord]]:
+        """Yields every group of two or more files sharing the same size, largest size first."""
+        files_by_size = defaultdict(list)
+        with metrics.timer("size_grouping"):
+            for record in self._records:
+                files_by_size[record.size].append(record)
+        for size in sorted(files_by_size, reverse=True):
+            if len(files_by_size[size]) > 1:
+                yield files_by_size[size]
+
+    def iter_size_counts(self) -> Iterator[tuple[int, int]]:
+        """Yields (size, file count) for every size shared by two or more files."""
+        counts = defaultdict(int)
+        for record in self._records:
+            counts[record.size] += 1
+        for size, count in counts.items():
+            if count > 1:
+                yield size, count
+
+    def iter_files_by_size(self) -> Iterator[FileRecord]:
+        """Yields every file, largest first."""
+        yield from sorted(self._records, key=lambda r: r.size, reverse=True)
+
+    def total_size(self) -> int:
+        return sum(record.size for record in self._records)
+
+    def iter_directories(self) -> Iterator[tuple[Path, list[FileRecord]]]:
+        """Yields (directory, files) pairs, directories and files sorted by name."""
+        files_by_directory = defaultdict(list)
+        for record in self._records:
+            files_by_directory[record.path.parent].append(record)
+        for dir_path in sorted(files_by_directory):
+            yield dir_path, sorted(files_by_directory[dir_path], key=lambda r: r.path.name)
+
+    def add_match(self, record: FileRecord, content_key: str):
+        """Records that a file's content is identified by content_key (a digest or a comparison group id)."""
+        self._matches[content_key].append(record)
+
+    def iter_duplicate_sets(self) -> Iterator[tuple[str, list[FileRecord]]]:
+        """Yields (content_key, files) for every content key shared by two or more files."""
+        for content_key, files in self._matches.items():
+            if len(files) > 1:
+                yield content_key, files
+
+    def close(self):
+        self._records.clear()
+        self._matches.clear()
+
+
+class SpilledScanStore:
+    """
+    Spills the walk output and content matches into a temporary SQLite database.
+    Size grouping and duplicate detection become SQL aggregates, so only one batch of rows
+    and the current group are held in memory at a time.
+    """
+
+    def __init__(self, memory_limit_mb: int, temp_dir: Path | None = None):
+        memory_limit = memory_limit_mb * 1024 * 1024
+        # A quarter of the budget for SQLite's page cache, a quarter for buffered rows
+        self.batch_size = max(1000, memory_limit // 4 // _BYTES_PER_ROW)
+        fd, db_path = tempfile.mkstemp(prefix="fmm_scan_", suffix=".db", dir=temp_dir)
+        os.close(fd)
+        self._db_path = Path(db_path)
+        self._conn = sqlite3.connect(db_path, isolation_level=None)
+        self._conn.execute(f"PRAGMA cache_size = -{max(2048, memory_limit // 4 // 1024)}")
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute("PRAGMA temp_store = FILE")
+        self._conn.execute("""
+            CREATE TABLE files (
+                directory TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                ctime_ns INTEGER NOT NULL,
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE matches (
+                content_key TEXT NOT NULL,
+                directory TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                ctime_ns INTEGER NOT NULL,
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL
+            )
+        """)
+        self._count = 0
+        self._pending_matches = []
+
+    @staticmethod
+    def _to_row(record: FileRecord) -> tuple:
+        return (str(record.path.parent), record.path.name, record.size, record.mtime_ns, record.ctime_ns, record.dev, record.ino)
+
+    @staticmethod
+    def _from_row(row) -> FileRecord:
+        directory, name, size, mtime_ns, ctime_ns, dev, ino = row
+        return FileRecord(Path(directory) / name, size, mtime_ns, ctime_ns, dev, ino)
+
+    def _write(self, sql: str, rows: list):
+        self._conn.execute("BEGIN")
+        self._conn.executemany(sql, rows)
+        self._conn.execute("COMMIT")
+
+    def add_all(self, records: Iterable[FileRecord]):
+        batch = []
+        for record in records:
+            batch.append(self._to_row(record))
+            if len(batch) >= self.batch_size:
+                self._write("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                self._count += len(batch)
+                batch = []
+        if batch:
+            self._write("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            self._count += len(batch)
+
+    def __len__(self):
+        return self._count
+
+    def _ensure_index(self, name: str, columns: str):
+        # Built after the bulk load, which is much cheaper than maintaining it on every insert
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON files ({columns})")
+
+    def iter_size_groups(self) -> Iterator[list[FileRecord]]:
+        with metrics.timer("size_grouping"):
+            self._ensure_index("files_size", "size")
+            cursor = self._conn.execute("""
+                SELECT directory, name, size, mtime_ns, ctime_ns, dev, ino FROM files
+                WHERE size IN (SELECT size FROM files GROUP BY size HAVING COUNT(*) > 1)
+                ORDER BY size DESC
+            """)
+        group = []
+        for row in cursor:
+            record = self._from_row(row)
+            if group and group[0].size != record.size:
+                yield group
+                group = []
+            group.append(record)
+        if group:
+            yield group
+
+    def iter_size_counts(self) -> Iterator[tuple[int, int]]:
+        self._ensure_index("files_size", "size")
+        yield from self._conn.execute("SELECT size, COUNT(*) FROM files GROUP BY size HAVING COUNT(*) > 1")
+
+    def iter_files_by_size(self) -> Iterator[FileRecord]:
+        self._ensure_index("files_size", "size")
+        cursor = self._conn.execute(
+            "SELECT directory, name, size, mtime_ns, ctime_ns, dev, ino FROM files ORDER BY size DESC")
+        for row in cursor:
+            yield self._from_row(row)
+
+    def total_size(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+    def iter_directories(self) -> Iterator[tuple[Path, list[FileRecord]]]:
+        self._ensure_index("files_directory", "directory, name")
+        cursor = self._conn.execute(
+            "SELECT directory, name, size, mtime_ns, ctime_ns, dev, ino FROM files ORDER BY directory, name")
+        current_directory, files = None, []
+        for row in cursor:
+            if row[0] != current_directory:
+                if files:
+                    yield Path(current_directory), files
+                current_directory, files = row[0], []
+            files.append(self._from_row(row))
+        if files:
+            yield Path(current_directory), files
+
+    def add_match(self, record: FileRecord, content_key: str):
+        self._pending_matches.append((content_key, *self._to_row(record)))
+        if len(self._pending_matches) >= self.batch_size:
+            self._flush_matches()
+
+    def _flush_matches(self):
+        if self._pending_matches:
+            self._write("INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._pending_matches)
+            self._pending_matches = []
+
+    def iter_duplicate_sets(self) -> Iterator[tuple[str, list[FileRecord]]]:
+        self._flush_matches()
+        self._conn.execute("CREATE INDEX IF NOT EXISTS matches_key ON matches (content_key)")
+        cursor = self._conn.execute("""
+            SELECT content_key, directory, name, size, mtime_ns, ctime_ns, dev, ino FROM matches
+            WHERE content_key IN (SELECT content_key FROM matches GROUP BY content_key HAVING COUNT(*) > 1)
+            ORDER BY content_key
+        """)
+        current_key, files = None, []
+        for row in cursor:
+            if row[0] != current_key:
+                if files:
+                    yield current_key, files
+                current_key, files = row[0], []
+            files.append(self._from_row(row[1:]))
+        if files:
+            yield current_key, files
+
+    def close(self):
+        self._conn.close()
+        try:
+            os.remove(self._db_path)
+        except OSError:
+            pass
+
+
+def open_scan_store(memory_limit_mb: int | None = None):
+    """Returns an in-memory store, or an on-disk one when a memory limit is given."""
+    if memory_limit_mb:
+        return SpilledScanStore(memory_limit_mb)
+    return MemoryScanStore()
@@ -0,0 +1,182 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from functools import partial
+from typing import Callable, Iterable, Iterator
+
+from file_manager_meta.hashes import leaf_slots, set_leaf_slots
+from file_manager_meta.layout import is_rotational, physical_sort_keys
+from file_manager_meta.metrics import metrics, measured_call, timed_call
+from file_manager_meta.throttle import lower_priority, worker_initializer
+from file_manager_meta.tuning import active_profile, apply
+
+# Small items are packed into batches of about this many bytes, so each task is worth sending to a worker
+MIN_BATCH_BYTES = 1024 * 1024
+MAX_BATCH_BYTES = 64 * 1024 * 1024
+# Aim for this many batches per worker, enough to even out the end of the run
+BATCHES_PER_WORKER = 16
+MAX_BATCH_ITEMS = 256
+# Fixed cost of an item (open, stat, cache lookup...) counted towards its batch, so empty files still batch sensibly
+ITEM_OVERHEAD_BYTES = 64 * 1024
+
+
+def open_executor(kind: str, workers: int, low_priority: bool = False):
+    """
+    Returns a pool of worker processes ('processes') or threads ('threads').
+    Threads start instantly and share memory, and hashing releases the GIL, so they suit
+    I/O-bound runs and memory-limited machines; processes also parallelize pure-Python work.
+    Worker processes share the run's I/O limits (see throttle.configure) and tree-hash leaf limit
+    (see hashes.limit_leaf_reads), and workers of either kind run at the lowest priority if low_priority is set.
+    """
+    if kind == "threads":
+        # On Linux nice values and I/O priorities belong to each thread, so lowering a worker thread's leaves the rest alone
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fmm-worker",
+                                  initializer=lower_priority if low_priority else None)
+    initializer, initargs = worker_initializer(low_priority)
+    profile = active_profile()
+    slots = leaf_slots()
+    if profile or slots:
+        initializer, initargs = _init_tuned_worker, (profile, slots, initializer, initargs)
+    return ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+
+
+def _init_tuned_worker(profile, slots, initializer, initargs: tuple):
+    # Workers started with spawn don't inherit the main process's settings
+    apply(profile)
+    set_leaf_slots(slots)
+    if initializer:
+        initializer(*initargs)
+
+
+def bounded_map(executor, fn, items: Iterable, max_in_flight: int) -> Iterator[tuple]:
+    """
+    Like executor.map, but submits items lazily and keeps at most max_in_flight tasks queued,
+    so items can be streamed from a generator. Yields (item, result) pairs in completion order.
+    """
+    pending = {}
+    for item in items:
+        pending[executor.submit(fn, item)] = item
+        if len(pending) >= max_in_flight:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+    for future in as_completed(list(pending)):
+        yield pending.pop(future), future.result()
+
+
+def batch_target_bytes(total_bytes: int | None, workers: int) -> int:
+    """Bytes per batch that gives every worker several batches, within sensible bounds, unless the storage profile sets it."""
+    profile = active_profile()
+    if profile and profile.batch_bytes:
+        return profile.batch_bytes
+    if not total_bytes:
+        return MAX_BATCH_BYTES // 4
+    return min(MAX_BATCH_BYTES, max(MIN_BATCH_BYTES, total_bytes // (workers * BATCHES_PER_WORKER)))
+
+
+def iter_batches(items: Iterable, size_of: Callable, target_bytes: int, max_items: int = MAX_BATCH_ITEMS) -> Iterator[list]:
+    """
+    Groups consecutive items into batches of about target_bytes.
+    An item at least that large is a batch of its own; small ones share one until it is full.
+    """
+    batch = []
+    batch_bytes = 0
+    for item in items:
+        item_bytes = size_of(item) + ITEM_OVERHEAD_BYTES
+        if item_bytes >= target_bytes:
+            yield [item]
+            continue
+        batch.append(item)
+        batch_bytes += item_bytes
+        if batch_bytes >= target_bytes or len(batch) >= max_items:
+            yield batch
+            batch = []
+            batch_bytes = 0
+    if batch:
+        yield batch
+
+
+def _run_batch(fn, batch: list) -> list:
+    return [fn(item) for item in batch]
+
+
+def _dispatch_per_device(executor, fn, batches_by_device: dict, device_limits: dict, max_in_flight: int) -> Iterator[tuple]:
+    """
+    Submits each device's batches in order, with at most device_limits[dev] of them running at once,
+    so a spinning disk serves one sequential reader instead of seeking between several.
+    Yields (batch, result) pairs in completion order.
+    """
+    pending = {}
+    in_flight = defaultdict(int)
+    while batches_by_device or pending:
+        for dev in list(batches_by_device):
+            while in_flight[dev] < device_limits[dev] and len(pending) < max_in_flight:
+                batch = next(batches_by_device[dev], None)
+                if batch is None:
+                    del batches_by_device[dev]
+                    break
+                pending[executor.submit(fn, batch)] = (dev, batch)
+                in_flight[dev] += 1
+        if not pending:
+            break
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            dev, batch = pending.pop(future)
+            in_flight[dev] -= 1
+            yield batch, future.result()
+
+
+def _physical_batches(items: list, size_of: Callable, record_of: Callable, use_fiemap: bool, target_bytes: int) -> dict:
+    """Sorts the items of each device by their position on disk and batches neighbours together."""
+    records = [record_of(item) for item in items]
+    with metrics.timer("layout"):
+        keys = physical_sort_keys(records, use_fiemap)
+    items_by_device = defaultdict(list)
+    for index in sorted(range(len(items)), key=keys.__getitem__):
+        items_by_device[records[index].dev].append(items[index])
+    return {dev: iter_batches(device_items, size_of, target_bytes) for dev, device_items in items_by_device.items()}
+
+
+def schedule(executor, fn, items: Iterable, workers: int, size_of: Callable, total_bytes: int | None = None,
+             largest_first: bool = False, progress=None, task_id=None,
+             read_order: str = "size", record_of: Callable | None = None, device_workers: int | None = None) -> Iterator[tuple]:
+    """
+    Runs fn on every item in a worker pool and yields (item, result) pairs in completion order.
+
+    With read_order "size", items are dispatched largest first, so a huge file never starts last and
+    leaves a single core busy, and small items are packed into size-balanced batches to keep per-task
+    overhead low. Only a few batches per worker are queued at a time, so items can be streamed.
+    Pass largest_first=True to sort the items here; streamed items are expected to come already sorted.
+
+    With read_order "inode" or "fiemap", the items of each device are read in the order they sit on disk
+    (record_of gives the FileRecord of an item) and at most device_workers batches run per device,
+    by default one on spinning disks and one per worker elsewhere. The items are collected first.
+
+    Metrics recorded in the workers are merged into the run's metrics, and the task of a rich Progress
+    advances by one per finished item. With a process pool, fn and the items must be picklable;
+    size_of always runs in the calling thread.
+    """
+    wrapper = timed_call if isinstance(executor, ThreadPoolExecutor) else measured_call
+    run_batch = partial(wrapper, _run_batch, fn)
+    if read_order in ("inode", "fiemap"):
+        items = list(items)
+        if total_bytes is None:
+            total_bytes = sum(size_of(item) for item in items)
+        batches_by_device = _physical_batches(items, size_of, record_of or (lambda item: item),
+                                              read_order == "fiemap", batch_target_bytes(total_bytes, workers))
+        device_limits = {dev: device_workers or (1 if is_rotational(dev) else workers) for dev in batches_by_device}
+        finished = _dispatch_per_device(executor, run_batch, batches_by_device, device_limits, max_in_flight=workers * 2)
+    else:
+        if largest_first:
+            items = sorted(items, key=size_of, reverse=True)
+            if total_bytes is None:
+                total_bytes = sum(size_of(item) for item in items)
+        batches = iter_batches(items, size_of, batch_target_bytes(total_bytes, workers))
+        finished = bounded_map(executor, run_batch, batches, max_in_flight=workers * 2)
+
+    for batch, measured_results in finished:
+        results = metrics.absorb(measured_results)
+        metrics.count("batches_dispatched")
+        for item, result in zip(batch, results):
+            if progress is not None:
+                progress.advance(task_id)
+            yield item, result
@@ -0,0 +1,183 @@
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+import typer
+from rich.console import Console
+from rich.progress import Progress
+from rich.table import Table
+
+from file_manager_meta.cache_manager import init_cache, iter_scrub_candidates, set_last_verified, get_verification_status, \
+    clear_cached_digests
+from file_manager_meta.deduplicate import format_size
+from file_manager_meta.hashes import _calculate_hashes_from_file, tree_hash_file, TREE_HASH_MIN_SIZE
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.scheduler import open_executor, schedule
+from file_manager_meta.tuning import tune
+
+# Verified entries are stamped in the cache in batches of this many files
+STAMP_BATCH_SIZE = 500
+
+# Outcomes of verifying one file
+VERIFIED = "verified"
+MISMATCH = "mismatch"
+UNREADABLE = "unreadable"
+CHANGED = "changed"
+
+
+class _ScrubItem:
+    """A cached entry to verify: the file as stat'ed now and the digests recorded when it was hashed."""
+    __slots__ = ("record", "digests")
+
+    def __init__(self, record: FileRecord, digests: dict):
+        self.record = record
+        self.digests = digests
+
+
+def _verify_file(item: _ScrubItem) -> str:
+    expected = dict(item.digests)
+    tree_hash = expected.pop("tree_sha256")
+    if tree_hash and item.record.size >= TREE_HASH_MIN_SIZE:
+        # A large file with a tree hash is verified by it alone, reading its leaves in parallel
+        fresh_tree_hash = tree_hash_file(item.record.path, item.record.size)
+        fresh = {"tree_sha256": fresh_tree_hash} if fresh_tree_hash else {}
+        expected = {"tree_sha256": tree_hash}
+    else:
+        fresh = _calculate_hashes_from_file(item.record.path)
+    if not fresh:
+        return UNREADABLE
+    try:
+        stat_info = item.record.path.stat()
+    except OSError:
+        return CHANGED
+    if stat_info.st_mtime_ns != item.record.mtime_ns or stat_info.st_size != item.record.size:
+        return CHANGED  # Written to while it was being read; the next hashing run picks it up
+    if any(digest and fresh[name] != digest for name, digest in expected.items()):
+        return MISMATCH
+    return VERIFIED
+
+
+def _iter_budgeted(conn, started_at: int, max_bytes: int | None, deadline: float | None, skipped: dict):
+    """
+    Yields the unchanged files to verify, least recently verified first, until the byte budget is used
+    or the deadline passes. A file is started while budget remains, so one larger than the budget still gets verified.
+    """
+    planned_bytes = 0
+    for path, mtime_ns, size, md5, sha1, sha256, tree_sha256 in iter_scrub_candidates(conn, started_at):
+        if max_bytes is not None and planned_bytes >= max_bytes:
+            return
+        if deadline is not None and time.monotonic() >= deadline:
+            return
+        try:
+            record = FileRecord.from_path(Path(path))
+        except OSError:
+            skipped["missing"] += 1
+            continue
+        if record.mtime_ns != mtime_ns or record.size != size:
+            skipped["changed"] += 1  # Its digests are stale, not wrong; the next report/deduplicate rehashes it
+            continue
+        planned_bytes += size
+        yield _ScrubItem(record, {"md5": md5, "sha1": sha1, "sha256": sha256, "tree_sha256": tree_sha256})
+
+
+def iter_scrub(directory: Path, conn, started_at: int, max_bytes: int | None, max_seconds: float | None,
+               executor_kind: str, skipped: dict) -> Iterator[tuple[FileRecord, str]]:
+    """
+    Verifies the files picked for this run (see _iter_budgeted), yielding each with its outcome as it finishes.
+    Verified files are stamped in the cache as they go, and the cached digests of files that no longer match
+    are dropped. Files skipped because they are gone or changed are counted in skipped.
+    """
+    deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+    pending_stamps = []
+    mismatches = []
+    outcomes = {VERIFIED: 0, MISMATCH: 0}
+    try:
+        workers = tune(directory).workers
+        items = _iter_budgeted(conn, started_at, max_bytes, deadline, skipped)
+        with open_executor(executor_kind, workers) as executor, metrics.pool(workers), metrics.phase("hashing"):
+            # Files are read in the order they were picked, oldest verification first
+            for item, outcome in schedule(executor, _verify_file, items, workers, lambda i: i.record.size):
+                if outcome == VERIFIED:
+                    outcomes[VERIFIED] += 1
+                    pending_stamps.append((str(item.record.path), item.record.mtime_ns, item.record.size))
+                    if len(pending_stamps) >= STAMP_BATCH_SIZE:
+                        set_last_verified(conn, pending_stamps, started_at)
+                        pending_stamps = []
+                elif outcome == MISMATCH:
+                    # Left unstamped, as are unreadable files, so the next run checks them again first
+                    outcomes[MISMATCH] += 1
+                    mismatches.append((item.record.path, item.record.mtime_ns, item.record.size))
+                yield item.record, outcome
+    finally:
+        set_last_verified(conn, pending_stamps, started_at)
+        # Digests that no longer match would still make deduplicate treat the file as a copy of its old content
+        clear_cached_digests(conn, mismatches)
+        metrics.count("files_verified", outcomes[VERIFIED])
+        metrics.count("digest_mismatches", outcomes[MISMATCH])
+
+
+def scrub_cache(directory: Path, max_bytes: int | None = None, max_seconds: float | None = None,
+                executor_kind: str = "processes"):
+    """
+    Rereads files whose size and modification time haven't changed since they were hashed and checks
+    that their content still has the cached digests; a mismatch means the data changed without the file
+    being written, e.g. bit rot. Each run verifies the least recently verified files first, within a byte
+    and/or time budget, so repeated runs cover the whole tree in turn.
+    """
+    console = Console()
+    console.print(f"Starting scrub of [cyan]{directory}[/cyan]...\n")
+    conn, db_path = init_cache(directory)
+    console.print(f"Using cache database: [dim]{db_path}[/dim]")
+    budget = []
+    if max_bytes is not None:
+        budget.append(format_size(max_bytes))
+    if max_seconds is not None:
+        budget.append(f"{max_seconds / 60:g} minutes")
+    if budget:
+        console.print(f"Budget for this run: {' or '.join(budget)}.")
+
+    started_at = int(time.time())
+    skipped = {"missing": 0, "changed": 0}
+    outcomes = {VERIFIED: 0, MISMATCH: 0, UNREADABLE: 0, CHANGED: 0}
+    problems = []
+    verified_bytes = 0
+    try:
+        with Progress(console=console, transient=True) as progress:
+            task = progress.add_task("[green]Verifying files[/green]", total=max_bytes)
+            for record, outcome in iter_scrub(directory, conn, started_at, max_bytes, max_seconds, executor_kind, skipped):
+                outcomes[outcome] += 1
+                progress.advance(task, record.size)
+                if outcome == VERIFIED:
+                    verified_bytes += record.size
+                elif outcome in (MISMATCH, UNREADABLE):
+                    problems.append((record, outcome))
+        hashed_count, never_verified, oldest_verification = get_verification_status(conn)
+    finally:
+        conn.close()
+
+    if problems:
+        table = Table(title="Possible Corruption")
+        table.add_column("File", style="red")
+        table.add_column("Problem")
+        for record, outcome in problems:
+            problem = "content no longer matches its cached digests" if outcome == MISMATCH else "read error"
+            table.add_row(str(record.path.relative_to(directory)), problem)
+        console.print(table)
+        if outcomes[MISMATCH]:
+            console.print("[yellow]The cached digests of files that no longer match were dropped; "
+                          "check them against a backup before the next report or deduplicate hashes them again.[/yellow]")
+
+    console.rule("Scrub Task Summary")
+    console.print(f"[green]Files verified:[/green] {outcomes[VERIFIED]} ({format_size(verified_bytes)})")
+    if outcomes[MISMATCH] or outcomes[UNREADABLE]:
+        console.print(f"[bold red]Digest mismatches:[/bold red] {outcomes[MISMATCH]}")
+        console.print(f"[bold red]Unreadable files:[/bold red] {outcomes[UNREADABLE]}")
+    console.print(f"[yellow]Changed since hashed (skipped):[/yellow] {skipped['changed'] + outcomes[CHANGED]}")
+    console.print(f"[yellow]Missing (skipped):[/yellow] {skipped['missing']}")
+    console.print(f"[green]Hashed files never verified:[/green] {never_verified} of {hashed_count}")
+    if oldest_verification is not None and not never_verified:
+        console.print(f"[green]Oldest verification:[/green] {datetime.fromtimestamp(oldest_verification):%Y-%m-%d %H:%M:%S}")
+    if problems:
+        raise typer.Exit(code=1)
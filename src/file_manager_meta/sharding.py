@@ -0,0 +1,410 @@
+import hashlib
+import heapq
+import os
+import sqlite3
+import time
+from collections import Counter
+from functools import partial
+from itertools import groupby
+from pathlib import Path
+from typing import Iterator
+
+import typer
+from rich.console import Console
+from rich.progress import Progress
+from rich.table import Table
+
+from file_manager_meta.cache_manager import CacheWriter, init_cache
+from file_manager_meta.deduplicate import _report_dry_run, _delete_duplicates
+from file_manager_meta.deletion import open_trash
+from file_manager_meta.layout import resolve_read_order
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.report import hash_file_for_report
+from file_manager_meta.scan_store import open_scan_store
+from file_manager_meta.scheduler import open_executor, schedule
+from file_manager_meta.tuning import tune
+from file_manager_meta.walker import scan_directory, walk_files
+
+console = Console()
+
+# Version of the shard file layout, kept in its PRAGMA user_version
+SHARD_FORMAT_VERSION = 1
+SHARD_FORMAT = "file-manager-meta-shard"
+WRITE_BATCH_SIZE = 1000
+
+_FILE_COLUMNS = "directory, name, size, mtime_ns, ctime_ns, dev, ino, md5, sha1, sha256"
+
+
+def shard_of(name: str, shard_count: int) -> int:
+    """The shard (1 to shard_count) a top-level entry belongs to. Stable across runs, hosts and Python versions."""
+    digest = hashlib.blake2b(name.encode("utf-8", "surrogateescape"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shard_count + 1
+
+
+def walk_shard(directory: Path, shard_index: int, shard_count: int) -> Iterator[FileRecord]:
+    """
+    Yields the files of one shard of the tree. The entries directly under directory (sub-directories
+    and files) are split between the shards by the hash of their name, so every file belongs to exactly one.
+    """
+    records, sub_directories = scan_directory(str(directory))
+    yield from (record for record in records if shard_of(record.path.name, shard_count) == shard_index)
+    for sub_directory in sub_directories:
+        if shard_of(os.path.basename(sub_directory), shard_count) == shard_index:
+            yield from walk_files(Path(sub_directory), root=directory)
+
+
+def _to_row(record: FileRecord, directory: Path, hashes: dict | None = None) -> tuple:
+    hashes = hashes or {}
+    relative_path = record.path.relative_to(directory)
+    return (relative_path.parent.as_posix(), relative_path.name, record.size, record.mtime_ns, record.ctime_ns,
+            record.dev, record.ino, hashes.get("md5"), hashes.get("sha1"), hashes.get("sha256"))
+
+
+def _from_row(row, directory: Path) -> FileRecord:
+    relative_directory, name, size, mtime_ns, ctime_ns, dev, ino = row[:7]
+    return FileRecord(directory / relative_directory / name, size, mtime_ns, ctime_ns, dev, ino)
+
+
+def _create_shard_file(path: Path, kind: str, directory: Path, shard_index: int, shard_count: int) -> sqlite3.Connection:
+    if path.exists():
+        path.unlink()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("""
+        CREATE TABLE files (
+            directory TEXT NOT NULL,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            ctime_ns INTEGER NOT NULL,
+            dev INTEGER NOT NULL,
+            ino INTEGER NOT NULL,
+            md5 TEXT,
+            sha1 TEXT,
+            sha256 TEXT,
+            PRIMARY KEY (directory, name)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+        ("format", SHARD_FORMAT),
+        ("kind", kind),
+        ("shard_index", str(shard_index)),
+        ("shard_count", str(shard_count)),
+        ("source_directory", str(directory.absolute())),
+        ("host", os.uname().nodename if hasattr(os, "uname") else os.environ.get("COMPUTERNAME", "")),
+        ("created_at", time.strftime("%Y-%m-%dT%H:%M:%S%z")),
+    ])
+    conn.execute(f"PRAGMA user_version = {SHARD_FORMAT_VERSION}")
+    return conn
+
+
+def scan_shard(directory: Path, kind: str, shard_index: int, shard_count: int, output: Path,
+               memory_limit_mb: int | None = None, read_order: str = "auto", device_workers: int | None = None,
+               executor_kind: str = "processes"):
+    """
+    Scans one shard of the tree and writes its files and hashes to a shard file, to be combined by merge_shards.
+    'report' shards hash every file; 'deduplicate' shards only hash files whose size is shared within
+    the shard, and merge_shards hashes the few whose size is only shared with files of other shards.
+    Nothing is deleted.
+    """
+    console.print(f"Scanning shard [bold]{shard_index}/{shard_count}[/bold] of [cyan]{directory}[/cyan] for {kind}...\n")
+    read_order = resolve_read_order(directory, read_order)
+    conn, db_path = init_cache(directory)
+    conn.close()
+    console.print(f"Using cache database: [dim]{db_path}[/dim]")
+
+    temp_path = output.with_name(output.name + ".tmp")
+    store = open_scan_store(memory_limit_mb)
+    shard_conn = _create_shard_file(temp_path, kind, directory, shard_index, shard_count)
+    writer = None
+    hashed = 0
+    try:
+        # --- Step 1: Collect the files of this shard ---
+        console.print("Step 1: Collecting the file paths of this shard...")
+        with metrics.phase("walk"):
+            store.add_all(walk_shard(directory, shard_index, shard_count))
+            batch = []
+            for record in store.iter_files_by_size():
+                batch.append(_to_row(record, directory))
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    shard_conn.executemany(f"INSERT INTO files VALUES ({', '.join('?' * 10)})", batch)
+                    batch = []
+            shard_conn.executemany(f"INSERT INTO files VALUES ({', '.join('?' * 10)})", batch)
+            shard_conn.commit()
+
+        # --- Step 2: Hash the files (all of them, or the ones sharing a size) ---
+        if kind == "report":
+            candidates, candidate_count = store.iter_files_by_size(), len(store)
+        else:
+            candidates = (record for files in store.iter_size_groups() for record in files)
+            candidate_count = sum(count for _, count in store.iter_size_counts())
+        console.print(f"Step 2: Hashing {candidate_count} files (in parallel, using cache)...")
+        workers = tune(directory).workers
+        writer = CacheWriter(directory) if executor_kind == "threads" else None
+        hash_file = partial(hash_file_for_report, root_directory=directory, writer=writer)
+        update = "UPDATE files SET md5 = ?, sha1 = ?, sha256 = ? WHERE directory = ? AND name = ?"
+        with open_executor(executor_kind, workers) as executor, metrics.pool(workers), metrics.phase("hashing"), \
+                Progress(console=console, transient=True) as progress:
+            task = progress.add_task("[green]Hashing files[/green]", total=candidate_count)
+            batch = []
+            for record, hashes in schedule(executor, hash_file, candidates, workers, lambda r: r.size,
+                                           progress=progress, task_id=task, read_order=read_order,
+                                           device_workers=device_workers):
+                if not hashes.get("md5"):
+                    continue
+                row = _to_row(record, directory, hashes)
+                batch.append((*row[7:], *row[:2]))
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    shard_conn.executemany(update, batch)
+                    hashed += len(batch)
+                    batch = []
+            shard_conn.executemany(update, batch)
+            hashed += len(batch)
+            shard_conn.commit()
+        file_count = len(store)
+    finally:
+        if writer:
+            writer.close()
+        shard_conn.close()
+        store.close()
+    # Written then renamed, so merge never picks up a half-written shard
+    os.replace(temp_path, output)
+
+    console.rule("Shard Summary")
+    console.print(f"[green]Files in shard {shard_index}/{shard_count}:[/green] {file_count}")
+    console.print(f"[green]Files hashed:[/green] {hashed}")
+    console.print(f"[green]Shard results saved to:[/green] {output}")
+
+
+def _open_shard(path: Path) -> tuple[sqlite3.Connection, dict]:
+    try:
+        conn = sqlite3.connect(f"{path.absolute().as_uri()}?mode=ro", uri=True)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+    except sqlite3.Error as e:
+        raise ValueError(f"{path} is not a shard file: {e}")
+    if meta.get("format") != SHARD_FORMAT:
+        conn.close()
+        raise ValueError(f"{path} is not a shard file.")
+    if version > SHARD_FORMAT_VERSION:
+        conn.close()
+        raise ValueError(f"{path} was written by a newer version of file-manager-meta (format {version}).")
+    return conn, meta
+
+
+def _same_directory(source_directory: str, directory: Path) -> bool:
+    source = Path(source_directory)
+    return source == directory.absolute() or source.resolve() == directory.resolve()
+
+
+def _check_shards(directory: Path, shard_files: list[Path], shards) -> list[str]:
+    """Returns what keeps the shards from being all the shards of one split of directory, of one kind, each given once."""
+    problems = [f"{path} is a shard of {meta.get('source_directory')}, not of {directory}."
+                for path, (_, meta) in zip(shard_files, shards)
+                if not _same_directory(meta.get("source_directory", ""), directory)]
+    if problems:
+        return problems
+    kinds = {meta.get("kind") for _, meta in shards}
+    if len(kinds) > 1:
+        return [f"The shard files come from different scans ({', '.join(sorted(map(str, kinds)))})."]
+    shard_counts = {int(meta["shard_count"]) for _, meta in shards}
+    if len(shard_counts) > 1:
+        return [f"The shard files come from different splits ({', '.join(map(str, sorted(shard_counts)))} shards)."]
+    shard_count = shard_counts.pop()
+    indexes = Counter(int(meta["shard_index"]) for _, meta in shards)
+    repeated = sorted(index for index, count in indexes.items() if count > 1)
+    missing = sorted(set(range(1, shard_count + 1)) - set(indexes))
+    if repeated:
+        problems.append(f"Shards given more than once: {', '.join(f'{i}/{shard_count}' for i in repeated)}")
+    if missing:
+        problems.append(f"Missing shards: {', '.join(f'{i}/{shard_count}' for i in missing)}")
+    return problems
+
+
+def open_shards(directory: Path, shard_files: list[Path]) -> list[tuple[sqlite3.Connection, dict]]:
+    """
+    Opens the shard files, checking that they are all the shards of one split of directory,
+    of one kind, each given once. Raises ValueError, with one line per problem, if they aren't.
+    """
+    shards = []
+    try:
+        for path in shard_files:
+            shards.append(_open_shard(path))
+        problems = _check_shards(directory, shard_files, shards)
+        if problems:
+            raise ValueError("\n".join(problems))
+    except ValueError:
+        for conn, _ in shards:
+            conn.close()
+        raise
+    return sorted(shards, key=lambda shard: int(shard[1]["shard_index"]))
+
+
+def _hash_cross_shard_files(directory: Path, shards, shared_sizes: set, store, executor_kind: str,
+                            console: Console | None) -> int:
+    """
+    Hashes the files whose size is only shared with files of other shards, which no shard hashed,
+    and adds them to the store. Files are stat'ed again, so ones changed since their shard was scanned
+    are hashed as they are now. Returns the number of files hashed. Progress is shown on console, if given.
+    """
+    leftovers = []
+    for conn, _ in shards:
+        for row in conn.execute(f"SELECT {_FILE_COLUMNS} FROM files WHERE md5 IS NULL"):
+            if row[2] in shared_sizes:
+                try:
+                    leftovers.append(FileRecord.from_path(_from_row(row, directory).path))
+                except OSError:
+                    continue
+    if not leftovers:
+        return 0
+
+    if console:
+        console.print(f"Hashing {len(leftovers)} files whose size is shared with other shards (in parallel, using cache)...")
+    workers = tune(directory).workers
+    writer = CacheWriter(directory) if executor_kind == "threads" else None
+    hash_file = partial(hash_file_for_report, root_directory=directory, writer=writer)
+    try:
+        with open_executor(executor_kind, workers) as executor, metrics.pool(workers), \
+                Progress(console=console or Console(quiet=True), transient=True, disable=console is None) as progress:
+            task = progress.add_task("[green]Hashing files[/green]", total=len(leftovers))
+            for record, hashes in schedule(executor, hash_file, leftovers, workers, lambda r: r.size,
+                                           largest_first=True, progress=progress, task_id=task):
+                if hashes.get("md5"):
+                    store.add_match(record, hashes["md5"])
+    finally:
+        if writer:
+            writer.close()
+    return len(leftovers)
+
+
+def combine_shards(directory: Path, shards, store, executor_kind: str, console: Console | None = None) -> tuple[int, int]:
+    """
+    Adds every file of the shards that shares its size with another, over all shards, to the store with its
+    content key, hashing the ones that only match across shards. Returns (files in the shards, files hashed).
+    The steps are shown on console, if given.
+    """
+    # --- Step 1: Find the sizes shared by two or more files over all shards ---
+    if console:
+        console.print("Step 1: Combining file sizes...")
+    with metrics.phase("size_grouping"):
+        size_counts = Counter()
+        total_files = 0
+        for conn, _ in shards:
+            for size, count in conn.execute("SELECT size, COUNT(*) FROM files GROUP BY size"):
+                size_counts[size] += count
+                total_files += count
+        shared_sizes = {size for size, count in size_counts.items() if count > 1}
+        del size_counts
+
+    # --- Step 2: Collect the shards' hashes, and hash files that only match across shards ---
+    if console:
+        console.print("Step 2: Combining hashes...")
+    with metrics.phase("hashing"):
+        for conn, _ in shards:
+            for row in conn.execute(f"SELECT {_FILE_COLUMNS} FROM files WHERE md5 IS NOT NULL"):
+                if row[2] in shared_sizes:
+                    store.add_match(_from_row(row, directory), row[7])
+        cross_shard_hashed = _hash_cross_shard_files(directory, shards, shared_sizes, store, executor_kind, console)
+    return total_files, cross_shard_hashed
+
+
+def drop_changed_files(duplicate_sets):
+    """Leaves out files that changed or disappeared since their shard was scanned, and sets left with one file."""
+    for files in duplicate_sets:
+        unchanged = []
+        for record in files:
+            try:
+                stat_info = record.path.stat()
+            except OSError:
+                continue
+            if stat_info.st_size == record.size and stat_info.st_mtime_ns == record.mtime_ns:
+                unchanged.append(record)
+        if len(unchanged) > 1:
+            yield unchanged
+
+
+def _print_directory_tables(report_console: Console, directory: Path, shards):
+    """Prints the per-directory hash tables of report shards, in one name order across all shards."""
+    cursors = [conn.execute(f"SELECT {_FILE_COLUMNS} FROM files ORDER BY directory, name") for conn, _ in shards]
+    for relative_directory, rows in groupby(heapq.merge(*cursors, key=lambda row: (row[0], row[1])), key=lambda row: row[0]):
+        table_title = f"File Hashes in ./{relative_directory}" if relative_directory != "." else "File Hashes in Root Directory"
+        table = Table(title=table_title)
+        table.add_column("File", style="cyan")
+        table.add_column("MD5", style="magenta")
+        table.add_column("SHA-1", style="green")
+        table.add_column("SHA-256", style="yellow")
+        for row in rows:
+            table.add_row(row[1], *row[7:])
+        report_console.print(table)
+
+
+def merge_shards(directory: Path, shard_files: list[Path], delete: bool = False, keep_rule: str = "oldest",
+                 output: Path | None = None, memory_limit_mb: int | None = None, executor_kind: str = "processes",
+                 trash_dir: Path | None = None):
+    """
+    Combines the shard files of a sharded scan into the final duplicate sets, as if the whole tree
+    had been scanned at once. Prints the sets, or deletes the duplicates with delete=True (moving them
+    into trash_dir if given), and optionally saves an HTML report (with the per-directory hash tables when all shards are 'report' shards).
+    """
+    if output and output.suffix != ".html":
+        console.print("Output file must have a .html extension", style="red")
+        raise typer.Exit(code=1)
+    console.print(f"Merging {len(shard_files)} shards of [cyan]{directory}[/cyan]...\n")
+    staging_dir = open_trash(console, directory, trash_dir) if trash_dir and delete else None
+    try:
+        shards = open_shards(directory, shard_files)
+    except ValueError as e:
+        for problem in str(e).splitlines():
+            console.print(f"[bold red]{problem}[/bold red]")
+        raise typer.Exit(code=1)
+    for _, meta in shards:
+        console.print(f"Shard {meta['shard_index']}/{meta['shard_count']} ({meta['kind']}) from [cyan]{meta.get('host')}[/cyan], "
+                      f"created {meta.get('created_at')}")
+    store = open_scan_store(memory_limit_mb)
+    report_console = Console(record=True) if output else console
+    try:
+        total_files, cross_shard_hashed = combine_shards(directory, shards, store, executor_kind, console)
+
+        # --- Step 3: Report/delete duplicate sets ---
+        if output and shards[0][1]["kind"] == "report":
+            with metrics.phase("tables"):
+                _print_directory_tables(report_console, directory, shards)
+        duplicate_sets = (files for _, files in store.iter_duplicate_sets())
+        if delete:
+            with metrics.phase("delete"):
+                set_count, deleted = _delete_duplicates(console, drop_changed_files(duplicate_sets), keep_rule,
+                                                        directory, staging_dir)
+                files_to_delete_count = len(deleted)
+        else:
+            with metrics.phase("report"):
+                set_count, files_to_delete_count = _report_dry_run(report_console, duplicate_sets, keep_rule)
+
+        if output:
+            with metrics.phase("export"):
+                if not set_count:
+                    report_console.print("No duplicate files found.", style="green")
+                html_content = report_console.export_html()
+                custom_css = "<style> body, code { font-size: 0.9em; } </style>"
+                html_content = html_content.replace("</head>", f"{custom_css}</head>")
+                with open(output, "w", encoding="utf-8") as f:
+                    f.write(html_content)
+    finally:
+        store.close()
+        for conn, _ in shards:
+            conn.close()
+
+    console.rule("Merge Task Summary")
+    console.print(f"[green]Total files scanned:[/green] {total_files} in {len(shards)} shards")
+    console.print(f"[green]Files hashed across shards:[/green] {cross_shard_hashed}")
+    console.print(f"[green]Duplicate sets found:[/green] {set_count}")
+    if staging_dir:
+        console.print(f"[green]Files moved to the trash:[/green] {files_to_delete_count} ({staging_dir})")
+    elif delete:
+        console.print(f"[green]Files successfully deleted:[/green] {files_to_delete_count}")
+    else:
+        console.print(f"[yellow]Files that would be deleted:[/yellow] {files_to_delete_count}")
+    if output:
+        console.print(f"[green]Report saved to:[/green] {output}")
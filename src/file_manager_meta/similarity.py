@@ -0,0 +1,339 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+from collections import defaultdict
+from itertools import combinations
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+
+from rich.console import Console
+from rich.progress import Progress
+from rich.table import Table
+
+from file_manager_meta.cache_manager import init_cache, get_cached_chunks, has_cached_chunks, set_cached_chunks
+from file_manager_meta.chunking import CHUNKER_ID, chunk_file
+from file_manager_meta.deduplicate import format_size
+from file_manager_meta.layout import resolve_read_order
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.scheduler import open_executor, schedule
+from file_manager_meta.tuning import tune
+from file_manager_meta.walker import walk_files
+
+# Chunks shared by more files than this (runs of zeros, common headers...) say little about similarity
+# and would make pair counting quadratic, so they only count towards the space estimate
+MAX_CHUNK_POSTINGS = 256
+# Chunk lists are written to the cache in batches of this many files
+CACHE_WRITE_BATCH = 256
+# Rough in-memory footprint of one buffered posting, used to turn a memory limit into batch sizes
+_BYTES_PER_POSTING = 128
+
+
+class MemoryPostings:
+    """Keeps the distinct chunks of every group of identical files in a dict of fingerprint -> group indexes."""
+
+    def __init__(self):
+        self._postings = defaultdict(list)
+        self._lengths = {}
+
+    def add_group(self, group_index: int, distinct: dict[bytes, int]):
+        """Records the distinct chunks (fingerprint -> length) of a group. Groups are added in index order."""
+        for fingerprint, length in distinct.items():
+            self._postings[fingerprint].append(group_index)
+            self._lengths[fingerprint] = length
+
+    def unique_bytes(self) -> int:
+        """Returns the bytes of the distinct chunks of all groups together."""
+        return sum(self._lengths.values())
+
+    def iter_shared_bytes(self) -> Iterator[tuple[tuple[int, int], int]]:
+        """Yields ((a, b), bytes of the distinct chunks both groups have) for every pair of groups a < b with chunks in common."""
+        shared = defaultdict(int)
+        for fingerprint, group_indexes in self._postings.items():
+            if 1 < len(group_indexes) <= MAX_CHUNK_POSTINGS:
+                length = self._lengths[fingerprint]
+                for pair in combinations(group_indexes, 2):
+                    shared[pair] += length
+        yield from shared.items()
+
+    def close(self):
+        self._postings.clear()
+        self._lengths.clear()
+
+
+class SpilledPostings:
+    """
+    Spills the postings into a temporary SQLite database. The chunks two groups share are counted
+    with a self-join that SQLite aggregates on disk, so only one batch of postings is held in memory.
+    """
+
+    def __init__(self, memory_limit_mb: int, temp_dir: Path | None = None):
+        memory_limit = memory_limit_mb * 1024 * 1024
+        # A quarter of the budget for SQLite's page cache, a quarter for buffered postings
+        self.batch_size = max(1000, memory_limit // 4 // _BYTES_PER_POSTING)
+        fd, db_path = tempfile.mkstemp(prefix="fmm_similar_", suffix=".db", dir=temp_dir)
+        os.close(fd)
+        self._db_path = Path(db_path)
+        self._conn = sqlite3.connect(db_path, isolation_level=None)
+        self._conn.execute(f"PRAGMA cache_size = -{max(2048, memory_limit // 4 // 1024)}")
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute("PRAGMA temp_store = FILE")
+        self._conn.execute("""
+            CREATE TABLE postings (
+                fingerprint BLOB NOT NULL,
+                group_index INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            )
+        """)
+        self._pending = []
+
+    def add_group(self, group_index: int, distinct: dict[bytes, int]):
+        self._pending.extend((fingerprint, group_index, length) for fingerprint, length in distinct.items())
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", self._pending)
+            self._conn.execute("COMMIT")
+            self._pending = []
+
+    def _ensure_index(self):
+        self._flush()
+        # Built after the bulk load, which is much cheaper than maintaining it on every insert
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_fingerprint ON postings (fingerprint, group_index)")
+
+    def unique_bytes(self) -> int:
+        self._ensure_index()
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(length), 0) FROM (SELECT MAX(length) AS length FROM postings GROUP BY fingerprint)"
+        ).fetchone()[0]
+
+    def iter_shared_bytes(self) -> Iterator[tuple[tuple[int, int], int]]:
+        self._ensure_index()
+        cursor = self._conn.execute("""
+            SELECT a.group_index, b.group_index, SUM(a.length) FROM postings AS a
+            JOIN postings AS b ON b.fingerprint = a.fingerprint AND b.group_index > a.group_index
+            WHERE a.fingerprint IN (SELECT fingerprint FROM postings GROUP BY fingerprint HAVING COUNT(*) BETWEEN 2 AND ?)
+            GROUP BY a.group_index, b.group_index
+        """, (MAX_CHUNK_POSTINGS,))
+        for a, b, shared_bytes in cursor:
+            yield (a, b), shared_bytes
+
+    def close(self):
+        self._conn.close()
+        try:
+            os.remove(self._db_path)
+        except OSError:
+            pass
+
+
+def open_postings(memory_limit_mb: int | None = None):
+    """Returns in-memory postings, or on-disk ones when a memory limit is given."""
+    if memory_limit_mb:
+        return SpilledPostings(memory_limit_mb)
+    return MemoryPostings()
+
+
+def _chunk_record(record):
+    return chunk_file(record.path)
+
+
+def _chunk_files(records, directory: Path, conn, console: Console | None, read_order: str,
+                 device_workers: int | None, executor_kind: str) -> list[FileRecord]:
+    """
+    Brings the cached chunks of every file up to date, chunking only new or changed files.
+    Returns the records of the files whose chunks are now in the cache (the readable ones).
+    Progress and unreadable files are shown on console, if given.
+    """
+    chunked = []
+    to_chunk = []
+    with metrics.phase("cache_lookup"):
+        for record in records:
+            if has_cached_chunks(conn, record.path, record, CHUNKER_ID):
+                metrics.count("cache_hits_full")
+                chunked.append(record)
+            else:
+                metrics.count("cache_misses")
+                to_chunk.append(record)
+
+    if not to_chunk:
+        return chunked
+    if console:
+        console.print(f"Chunking {len(to_chunk)} new or changed files ({len(chunked)} found in the cache)...")
+
+    workers = tune(directory).workers
+    pending_writes = []
+    with Progress(console=console or Console(quiet=True), disable=console is None) as progress, \
+            open_executor(executor_kind, workers) as executor, metrics.pool(workers), metrics.phase("chunking"):
+        task = progress.add_task("[green]Chunking files[/green]", total=len(to_chunk))
+        for record, chunks in schedule(executor, _chunk_record, to_chunk, workers, lambda r: r.size,
+                                       largest_first=True, progress=progress, task_id=task,
+                                       read_order=read_order, device_workers=device_workers):
+            if chunks is None:
+                if console:
+                    console.print(f"[bold red]Error reading {record.path.relative_to(directory)}, skipped.[/bold red]")
+                continue
+            chunked.append(record)
+            pending_writes.append((record.path, record, chunks))
+            if len(pending_writes) >= CACHE_WRITE_BATCH:
+                with metrics.timer("cache_write"):
+                    set_cached_chunks(conn, pending_writes, CHUNKER_ID)
+                pending_writes = []
+    if pending_writes:
+        with metrics.timer("cache_write"):
+            set_cached_chunks(conn, pending_writes, CHUNKER_ID)
+    return chunked
+
+
+def _iter_cached_chunks(conn, records: Iterable[FileRecord]) -> Iterator[tuple[Path, list[tuple[int, bytes]]]]:
+    """Yields (path, chunks) for each file, reading one file's chunks from the cache at a time."""
+    for record in records:
+        chunks = get_cached_chunks(conn, record.path, record, CHUNKER_ID)
+        if chunks:
+            yield record.path, chunks
+
+
+def _group_identical(chunk_lists: Iterable[tuple[Path, list]], postings) -> tuple[list[list[Path]], list[int]]:
+    """
+    Groups files with the same chunk sequence (whole-file duplicates) and adds the distinct chunks of each
+    group to postings. Returns the paths and the bytes of distinct chunks of each group.
+    """
+    group_of_key = {}
+    groups = []
+    distinct_bytes = []
+    for path, chunks in chunk_lists:
+        key = hashlib.blake2b(b"".join(fingerprint for _, fingerprint in chunks), digest_size=16).digest()
+        group_index = group_of_key.get(key)
+        if group_index is None:
+            group_index = group_of_key[key] = len(groups)
+            distinct = dict((fingerprint, length) for length, fingerprint in chunks)
+            groups.append([])
+            distinct_bytes.append(sum(distinct.values()))
+            postings.add_group(group_index, distinct)
+        groups[group_index].append(path)
+    for paths in groups:
+        paths.sort()
+    return groups, distinct_bytes
+
+
+def _score_pairs(postings, distinct_bytes: list[int], threshold: float) -> list[tuple[float, float, int, int, int]]:
+    """
+    Compares the groups that share chunks. Returns (similarity, containment, shared bytes, group a, group b)
+    for every pair at least threshold similar, most similar first.
+    """
+    pairs = []
+    for (a, b), shared_bytes in postings.iter_shared_bytes():
+        union_bytes = distinct_bytes[a] + distinct_bytes[b] - shared_bytes
+        similarity = shared_bytes / union_bytes
+        if similarity >= threshold:
+            containment = shared_bytes / min(distinct_bytes[a], distinct_bytes[b])
+            pairs.append((similarity, containment, shared_bytes, a, b))
+    pairs.sort(reverse=True)
+    return pairs
+
+
+class SimilarityScan(NamedTuple):
+    groups: list[list[Path]]  # Files with the same content, each group sorted
+    pairs: list[tuple[float, float, int, int, int]]  # (similarity, containment, shared bytes, group a, group b)
+    total_bytes: int  # Size of all the files scanned
+    whole_file_savings: int  # What keeping one file of each group would save
+    unique_chunk_bytes: int  # What block-level deduplication would keep
+
+
+def scan_similarity(directory: Path, threshold: float = 0.5, console: Console | None = None, read_order: str = "auto",
+                    device_workers: int | None = None, executor_kind: str = "processes",
+                    memory_limit_mb: int | None = None) -> SimilarityScan:
+    """
+    Chunks the files under directory (using the cache) and compares the chunk sets of every group of identical
+    files, keeping the pairs at least threshold similar. The steps are shown on console, if given.
+    """
+    def step(message: str):
+        if console:
+            console.print(message)
+
+    conn, db_path = init_cache(directory)
+    step(f"Using cache database: [dim]{db_path}[/dim]")
+    read_order = resolve_read_order(directory, read_order)
+    if read_order != "size":
+        step(f"Reading files in on-disk order ({read_order}).")
+    postings = open_postings(memory_limit_mb)
+
+    try:
+        # --- Step 1: Collect all files ---
+        step("Step 1: Collecting all file paths...")
+        with metrics.phase("walk"):
+            records = [record for record in walk_files(directory) if record.size]
+        if not records:
+            step("[green]No files found to scan.[/green]")
+            return SimilarityScan([], [], 0, 0, 0)
+        sizes = {record.path: record.size for record in records}
+
+        # --- Step 2: Split new or changed files into chunks ---
+        step("Step 2: Splitting files into content-defined chunks (using cache)...")
+        chunked = _chunk_files(records, directory, conn, console, read_order, device_workers, executor_kind)
+
+        # --- Step 3: Compare the chunk sets of every file ---
+        step("Step 3: Comparing shared chunks...")
+        with metrics.phase("compare"):
+            groups, distinct_bytes = _group_identical(_iter_cached_chunks(conn, chunked), postings)
+            pairs = _score_pairs(postings, distinct_bytes, threshold)
+            unique_chunk_bytes = postings.unique_bytes()
+    finally:
+        conn.close()
+        postings.close()
+
+    total_bytes = sum(sizes[path] for paths in groups for path in paths)
+    whole_file_savings = sum((len(paths) - 1) * sizes[paths[0]] for paths in groups)
+    return SimilarityScan(groups, pairs, total_bytes, whole_file_savings, unique_chunk_bytes)
+
+
+def find_similar_files(directory: Path, threshold: float = 0.5, limit: int = 50, read_order: str = "auto",
+                       device_workers: int | None = None, executor_kind: str = "processes",
+                       memory_limit_mb: int | None = None):
+    """
+    Finds partial and near duplicates: files that share a large part of their content-defined chunks,
+    such as appended logs or edited versions of a document. Also estimates what block-level
+    deduplication would save compared to removing whole-file duplicates. Chunks are read back from the
+    cache one file at a time; with memory_limit_mb the postings of all chunks are kept on disk too.
+    """
+    console = Console()
+    console.print(f"Starting similarity scan in [cyan]{directory}[/cyan]...\n")
+    groups, pairs, total_bytes, whole_file_savings, unique_chunk_bytes = scan_similarity(
+        directory, threshold, console, read_order, device_workers, executor_kind, memory_limit_mb)
+    if not groups:
+        return
+
+    # --- Step 4: Report ---
+    def describe(group_index: int) -> str:
+        paths = groups[group_index]
+        text = str(paths[0].relative_to(directory))
+        if len(paths) > 1:
+            text += f" [dim](+{len(paths) - 1} identical)[/dim]"
+        return text
+
+    if pairs:
+        table = Table(title=f"Similar Files (similarity >= {threshold:.0%})")
+        table.add_column("File", style="cyan")
+        table.add_column("Similar To", style="cyan")
+        table.add_column("Shared", justify="right")
+        table.add_column("Similarity", justify="right")
+        table.add_column("Contained", justify="right")
+        for similarity, containment, shared_bytes, a, b in pairs[:limit]:
+            table.add_row(describe(a), describe(b), format_size(shared_bytes), f"{similarity:.1%}", f"{containment:.1%}")
+        console.print(table)
+        if len(pairs) > limit:
+            console.print(f"[dim]{len(pairs) - limit} more pairs not shown (see --limit).[/dim]")
+    else:
+        console.print("[green]No similar files found.[/green]")
+
+    console.rule("Similarity Task Summary")
+    console.print(f"[green]Total files scanned:[/green] {sum(len(paths) for paths in groups)}")
+    console.print(f"[green]Groups of identical files:[/green] {sum(1 for paths in groups if len(paths) > 1)}")
+    console.print(f"[green]Similar pairs found:[/green] {len(pairs)}")
+    console.print(f"[green]Total size:[/green] {format_size(total_bytes)}")
+    console.print(f"[green]Savings from removing identical files:[/green] {format_size(whole_file_savings)}")
+    console.print(f"[green]Estimated savings with block-level deduplication:[/green] {format_size(total_bytes - unique_chunk_bytes)}")
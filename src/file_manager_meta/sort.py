@@ -1,6 +1,6 @@
 import os
 from datetime import datetime
-from typing import Optional
+from typing import Iterator, Optional
 
 import typer
 from pathlib import Path
@@ -11,6 +11,10 @@ from rich.table import Table
 
 from file_manager_meta.repair import repair_extension
 from file_manager_meta.enums import SortBy, DateGranularity
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.throttle import throttle_open
+from file_manager_meta.walker import walk_files
 
 console = Console()
 
@@ -18,52 +22,35 @@ def organizer(directory: Path, new_directory: Path, sort_by: SortBy, date_granul
     files_without_extension = []
     skipped_files = []
     sorted_count = 0 # New counter for successfully sorted files
-    total_files = sum(len(files) for _, _, files in os.walk(directory))
+    # Collected up front so files moved into new_directory are never walked again
+    with metrics.phase("walk"):
+        records = list(walk_files(directory))
+    total_files = len(records)
 
-    with Progress("[progress.description]{task.description}", BarColumn(), TaskProgressColumn()) as progress:
+    with metrics.phase("move"), Progress("[progress.description]{task.description}", BarColumn(), TaskProgressColumn()) as progress:
         task = progress.add_task(f"[green]Sorting files: {sort_by}", total=total_files)
 
-        for dir_path, dir_names, file_names in os.walk(directory):
-            # Modify dir_names in-place to skip system/hidden directories
-            dir_names[:] = [d for d in dir_names if d not in ['System Volume Information', '$RECYCLE.BIN']]
-            dir_names[:] = [d for d in dir_names if not d.startswith('.')] # Skip hidden directories
+        for record in records:
+            if not record.path.suffix:
+                files_without_extension.append(record)
+                progress.advance(task)
+                continue
 
-            for file in file_names:
-                file_path = Path(dir_path) / file
-                # Skip hidden files (starting with '.')
-                if file_path.name.startswith('.'):
-                    progress.advance(task)
-                    continue
+            new_directory.mkdir(exist_ok=True)
 
-                if file_path.is_file():
-
-                    if not file_path.suffix:
-                        files_without_extension.append(file_path)
-                        progress.advance(task)
-                        continue
-
-                    new_directory.mkdir(exist_ok=True)
-                    
-                    try:
-                        success = False # Assume failure
-                        if sort_by == SortBy.EXT:
-                            success = sort_by_extension(file_path, new_directory, file)
-                        elif sort_by == SortBy.DATE:
-                            success = sort_by_date(file_path, new_directory, file, date_granularity)
-                        elif sort_by == SortBy.SIZE:
-                            success = sort_by_size(file_path, new_directory, file)
-                        
-                        if success:
-                            sorted_count += 1
-                    except (PermissionError, OSError) as e:
-                        console.print(f"[bold red]Error sorting {file_path.name}: {e}[/bold red]")
-                        skipped_files.append(file_path)
+            try:
+                if sort_file(record, new_directory, sort_by, date_granularity):
+                    sorted_count += 1
+            except (PermissionError, OSError) as e:
+                console.print(f"[bold red]Error sorting {record.path.name}: {e}[/bold red]")
+                skipped_files.append(record.path)
 
-                progress.advance(task)
+            progress.advance(task)
     console.rule(f"Task completed! {sorted_count} files sorted.") # Use sorted_count here
 
     # Deleting empty directories
-    deleted_dirs_count, skipped_dirs_count = delete_empty_directory(directory)
+    with metrics.phase("cleanup"):
+        deleted_dirs_count, skipped_dirs_count = delete_empty_directory(directory)
     console.print(f"[green]Empty directories deleted:[/green] {deleted_dirs_count}")
     if skipped_dirs_count > 0:
         console.print(f"[yellow]Empty directories skipped:[/yellow] {skipped_dirs_count} (due to permissions or other errors)")
@@ -88,16 +75,28 @@ def organizer(directory: Path, new_directory: Path, sort_by: SortBy, date_granul
     if skipped_dirs_count > 0:
         console.print(f"[yellow]Empty directories skipped:[/yellow] {skipped_dirs_count}")
 
-def sort_by_extension(file_path: Path, new_directory: Path, file):
-    extension = file_path.suffix[1:]  # Get the extension without the dot
+def sort_file(record: FileRecord, new_directory: Path, sort_by: SortBy,
+              date_granularity: Optional[DateGranularity] = None) -> Optional[Path]:
+    """Moves one file into its place under new_directory. Returns where it ended up; raises OSError if it can't be moved."""
+    if sort_by == SortBy.EXT:
+        return sort_by_extension(record, new_directory)
+    elif sort_by == SortBy.DATE:
+        return sort_by_date(record, new_directory, date_granularity)
+    elif sort_by == SortBy.SIZE:
+        return sort_by_size(record, new_directory)
+    return None
+
+
+def sort_by_extension(record: FileRecord, new_directory: Path):
+    extension = record.path.suffix[1:]  # Get the extension without the dot
     extension_dir = new_directory / extension
     extension_dir.mkdir(exist_ok=True)
-    return save_file(file_path, extension_dir / file)
+    return save_file(record.path, extension_dir / record.path.name)
 
 
-def sort_by_date(file_path: Path, new_directory: Path, file, date_granularity: Optional[DateGranularity] = None):
+def sort_by_date(record: FileRecord, new_directory: Path, date_granularity: Optional[DateGranularity] = None):
     # Get the creation date of the file
-    creation_datetime = datetime.fromtimestamp(file_path.stat().st_ctime)
+    creation_datetime = datetime.fromtimestamp(record.st_ctime)
     
     # Build the directory path based on granularity
     if date_granularity == DateGranularity.YEAR:
@@ -110,7 +109,7 @@ def sort_by_date(file_path: Path, new_directory: Path, file, date_granularity: O
         date_dir = new_directory / str(creation_datetime.year) / f"{creation_datetime.month:02d}" / f"{creation_datetime.day:02d}"
 
     date_dir.mkdir(parents=True, exist_ok=True)
-    return save_file(file_path, date_dir / file)
+    return save_file(record.path, date_dir / record.path.name)
 
 
 def _format_size_for_dir(size_in_bytes):
@@ -123,16 +122,11 @@ def _format_size_for_dir(size_in_bytes):
     else:
         return f"{size_in_bytes // (1024 * 1024 * 1024)}GB"
 
-def sort_by_size(file_path: Path, new_directory: Path, file):
-    try:
-        size = file_path.stat().st_size
-        size_dir_name = _format_size_for_dir(size)
-        size_dir = new_directory / size_dir_name
-        size_dir.mkdir(exist_ok=True)
-        return save_file(file_path, size_dir / file)
-    except OSError as e:
-        console.print(f"[bold red]Error getting size for {file_path.name}: {e}[/bold red]")
-        return False
+def sort_by_size(record: FileRecord, new_directory: Path):
+    size_dir_name = _format_size_for_dir(record.size)
+    size_dir = new_directory / size_dir_name
+    size_dir.mkdir(exist_ok=True)
+    return save_file(record.path, size_dir / record.path.name)
 
 
 def count_empty_directories(directory: Path) -> int:
@@ -145,6 +139,20 @@ def count_empty_directories(directory: Path) -> int:
     return counter
 
 
+def iter_empty_directory_removals(directory: Path) -> Iterator[tuple[Path, OSError | None]]:
+    """Removes the empty directories under directory, deepest first, yielding (directory, error or None) for each."""
+    for dir_path, dir_names, file_names in os.walk(directory, topdown=False):
+        for dir_name in dir_names:
+            folder = Path(dir_path) / dir_name
+            if not any(folder.iterdir()):  # Check if the folder is empty
+                try:
+                    folder.rmdir()
+                except (PermissionError, OSError) as e:
+                    yield folder, e
+                    continue
+                yield folder, None
+
+
 def delete_empty_directory(directory: Path):
     deleted_count = 0
     skipped_count = 0
@@ -153,23 +161,22 @@ def delete_empty_directory(directory: Path):
     with Progress("[progress.description]{task.description}", BarColumn(), TaskProgressColumn()) as progress:
         task = progress.add_task("[green]Deleting empty directories[/green]", total=total_empty_dirs)
 
-        for dir_path, dir_names, file_names in os.walk(directory, topdown=False):
-            for dir_name in dir_names:
-                folder = Path(dir_path) / dir_name
-                if not any(folder.iterdir()):  # Check if the folder is empty
-                    try:
-                        folder.rmdir()
-                        deleted_count += 1
-                    except (PermissionError, OSError) as e:
-                        console.print(f"[bold red]Error deleting empty directory {folder}: {e}[/bold red]")
-                        skipped_count += 1
-                    progress.advance(task)
+        for folder, error in iter_empty_directory_removals(directory):
+            if error:
+                console.print(f"[bold red]Error deleting empty directory {folder}: {error}[/bold red]")
+                skipped_count += 1
+            else:
+                deleted_count += 1
+            progress.advance(task)
     console.rule(f"Task completed! Empty directories processed.")
     return deleted_count, skipped_count
 
 
-def save_file(file_path: Path, destination_path: Path):
+def save_file(file_path: Path, destination_path: Path) -> Path:
+    """Moves a file to destination_path, adding " (n)" to its name if that is taken. Returns the final path; raises OSError."""
     final_destination = destination_path
+    if destination_path == file_path:
+        return file_path  # Already in place, e.g. when sorting an already sorted tree again
 
     if destination_path.exists():
         base_name = destination_path.stem
@@ -181,12 +188,10 @@ def save_file(file_path: Path, destination_path: Path):
             final_destination = parent / f"{base_name} ({counter}){extension}"
             counter += 1
     
-    try:
-        file_path.rename(final_destination)
-        return True
-    except (PermissionError, OSError) as e:
-        console.print(f"[bold red]Error moving {file_path.name} to {final_destination.name}: {e}[/bold red]")
-        return False
+    throttle_open()
+    file_path.rename(final_destination)
+    metrics.count("files_moved")
+    return final_destination
 
 
 def without_extension(directory: Path, files_without_extension):
@@ -195,7 +200,7 @@ def without_extension(directory: Path, files_without_extension):
     table.add_column("Files", style="magenta")
 
     for idx, file in enumerate(files_without_extension, start=1):
-        table.add_row(str(idx), file.__str__())
+        table.add_row(str(idx), str(file.path))
 
     console.print(table)
 
@@ -203,4 +208,4 @@ def without_extension(directory: Path, files_without_extension):
                               show_default=False)
 
     if user_input:
-        repair_extension(directory)
\ No newline at end of file
+        repair_extension([directory])
\ No newline at end of file
@@ -0,0 +1,107 @@
+import errno
+import os
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Iterator
+
+# Holes of a sparse file read as zeros without touching the disk. SEEK_DATA/SEEK_HOLE (Linux, macOS,
+# FreeBSD) locate them, so readers can skip them and feed the zeros to the digests themselves.
+SEEK_DATA = getattr(os, "SEEK_DATA", None)
+SEEK_HOLE = getattr(os, "SEEK_HOLE", None)
+# Zeros fed to a digest per update in place of a hole
+ZERO_CHUNK_SIZE = 1024 * 1024
+_ZERO_CHUNK = memoryview(bytes(ZERO_CHUNK_SIZE))
+
+
+class ExtentMap:
+    """The allocated ranges of a sparse file as sorted (start, end) pairs; every other byte is a hole."""
+    __slots__ = ("extents", "size", "_starts")
+
+    def __init__(self, extents: list[tuple[int, int]], size: int):
+        self.extents = extents
+        self.size = size
+        self._starts = [start for start, _ in extents]
+
+    def data_bytes(self) -> int:
+        return sum(end - start for start, end in self.extents)
+
+    def is_hole(self, start: int, end: int) -> bool:
+        """True if no allocated byte lies in [start, end)."""
+        i = bisect_right(self._starts, start) - 1
+        if i >= 0 and self.extents[i][1] > start:
+            return False
+        return i + 1 >= len(self.extents) or self.extents[i + 1][0] >= end
+
+    def next_data(self, offset: int) -> int:
+        """Offset of the first allocated byte at or after offset, or the file size if only a hole remains."""
+        i = bisect_right(self._starts, offset) - 1
+        if i >= 0 and self.extents[i][1] > offset:
+            return offset
+        return self.extents[i + 1][0] if i + 1 < len(self.extents) else self.size
+
+    def segments(self, start: int, end: int) -> Iterator[tuple[int, int, bool]]:
+        """Yields (start, end, is_data) pieces covering [start, end) in order."""
+        i = max(bisect_right(self._starts, start) - 1, 0)
+        offset = start
+        for extent_start, extent_end in self.extents[i:]:
+            if extent_start >= end:
+                break
+            if extent_end <= offset:
+                continue
+            if extent_start > offset:
+                yield offset, extent_start, False
+                offset = extent_start
+            data_end = min(extent_end, end)
+            yield offset, data_end, True
+            offset = data_end
+        if offset < end:
+            yield offset, end, False
+
+
+def extent_map(fd: int) -> ExtentMap | None:
+    """
+    Maps the allocated ranges of an open file. None if the file has no holes, or the platform or
+    filesystem can't report them; such a file is simply read whole.
+    """
+    if SEEK_DATA is None:
+        return None
+    stat_info = os.fstat(fd)
+    size = stat_info.st_size
+    # Fewer allocated blocks than the size needs is the cheap sign of a hole (or of compression)
+    if stat_info.st_blocks * 512 >= size:
+        return None
+    extents = []
+    offset = 0
+    try:
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    break  # Only a hole remains up to the end
+                raise
+            end = min(os.lseek(fd, start, SEEK_HOLE), size)
+            extents.append((start, end))
+            offset = end
+    except OSError:
+        return None  # SEEK_DATA not supported by this filesystem
+    finally:
+        os.lseek(fd, 0, os.SEEK_SET)
+    if extents == [(0, size)]:
+        return None  # Compressed, not sparse
+    return ExtentMap(extents, size)
+
+
+def update_with_zeros(digests, length: int):
+    """Feeds length zero bytes to each digest, as reading a hole would, without any I/O."""
+    while length:
+        chunk = _ZERO_CHUNK[:min(length, ZERO_CHUNK_SIZE)]
+        for digest in digests:
+            digest.update(chunk)
+        length -= len(chunk)
+
+
+@lru_cache(maxsize=8)
+def zero_block(length: int) -> bytes:
+    """A block of zeros, shared so comparing many hole blocks doesn't allocate one each time."""
+    return bytes(length)
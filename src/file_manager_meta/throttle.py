@@ -0,0 +1,146 @@
+import os
+import platform
+import sys
+import time
+from typing import NamedTuple
+
+from file_manager_meta.metrics import metrics
+
+# A limiter idle for a while lets this many seconds' worth of work through at once, then holds the rate
+BURST_SECONDS = 0.5
+# Adaptive mode (AIMD): when reads are slower than the target the read rate is multiplied by DECREASE_FACTOR,
+# otherwise it grows by INCREASE_SHARE of the configured maximum; checked at most every ADJUST_INTERVAL seconds
+DECREASE_FACTOR = 0.7
+INCREASE_SHARE = 0.05
+MIN_RATE_SHARE = 0.05
+ADJUST_INTERVAL = 0.5
+# Read latency is averaged per LATENCY_UNIT bytes, so the target doesn't depend on the read block size.
+# A read of a whole unit weighs LATENCY_SMOOTHING in the moving average; smaller reads proportionally less,
+# so the fixed cost of the short last read of a file doesn't look like slow storage.
+LATENCY_UNIT = 1024 * 1024
+LATENCY_SMOOTHING = 0.2
+
+# ioprio_set(2) syscall numbers; other architectures only get nice
+_IOPRIO_SET = {"x86_64": 251, "aarch64": 30, "i686": 289, "armv7l": 314}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_BE = 2
+_IOPRIO_CLASS_SHIFT = 13
+
+# Slots of the shared state array
+_NEXT_READ, _NEXT_OPEN, _READ_RATE, _LATENCY, _LAST_ADJUST = range(5)
+
+
+class ThrottleSettings(NamedTuple):
+    max_read_rate: float | None  # Bytes per second
+    max_open_rate: float | None  # Files opened, moved or deleted per second
+    target_latency: float | None  # Seconds per LATENCY_UNIT bytes read, for adaptive mode
+    low_priority: bool
+
+
+# Set by configure() in the main process and by _init_worker() in pool workers; None means no throttling
+_settings: ThrottleSettings | None = None
+# Shared by every thread and worker process, so the limits hold for the whole run and not per worker
+_state = None
+
+
+def lower_priority():
+    """Moves the current process to the lowest CPU priority and, on Linux, the lowest best-effort I/O priority."""
+    if hasattr(os, "nice"):
+        try:
+            os.nice(19)
+        except OSError:
+            pass
+    syscall_number = _IOPRIO_SET.get(platform.machine())
+    if sys.platform.startswith("linux") and syscall_number:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.syscall(syscall_number, _IOPRIO_WHO_PROCESS, 0, (_IOPRIO_CLASS_BE << _IOPRIO_CLASS_SHIFT) | 7)
+
+
+def configure(max_read_rate: float | None = None, max_open_rate: float | None = None,
+              target_latency: float | None = None, low_priority: bool = False):
+    """
+    Sets the I/O limits of this run. Call before any pool is created; workers inherit them through worker_initializer().
+    Raises ValueError if a limit isn't positive, or target_latency is given without the max_read_rate it adapts below.
+    """
+    global _settings, _state
+    for name, value in (("max_read_rate", max_read_rate), ("max_open_rate", max_open_rate),
+                        ("target_latency", target_latency)):
+        if value is not None and value <= 0:
+            raise ValueError(f"{name} must be positive, got {value}")
+    if target_latency and not max_read_rate:
+        raise ValueError("target_latency needs a max_read_rate, the rate it adapts below")
+    import multiprocessing
+    _settings = ThrottleSettings(max_read_rate, max_open_rate, target_latency, low_priority)
+    _state = multiprocessing.Array("d", [0.0, 0.0, float(max_read_rate or 0), 0.0, 0.0])
+    if low_priority:
+        lower_priority()
+
+
+def _init_worker(state, settings: ThrottleSettings, low_priority: bool):
+    global _settings, _state
+    _state, _settings = state, settings
+    if low_priority:
+        lower_priority()
+
+
+def worker_initializer(low_priority: bool = False) -> tuple:
+    """Returns (initializer, initargs) for a ProcessPoolExecutor, so its workers share the run's limits."""
+    if _settings is None:
+        return (lower_priority, ()) if low_priority else (None, ())
+    return _init_worker, (_state, _settings, low_priority or _settings.low_priority)
+
+
+def _wait_for_slot(slot: int, amount: float, rate: float):
+    # Each request books the next free stretch of time on the shared timeline and sleeps until its start,
+    # so the long-run rate never exceeds `rate` however many workers are asking
+    with _state.get_lock():
+        now = time.monotonic()
+        start = max(_state[slot], now - BURST_SECONDS)
+        _state[slot] = start + amount / rate
+    if start > now:
+        with metrics.timer("throttled"):
+            time.sleep(start - now)
+
+
+def throttle_read(length: int):
+    """Accounts for length bytes read, sleeping as needed to stay under the read rate."""
+    if _settings is None or not _settings.max_read_rate:
+        return
+    _wait_for_slot(_NEXT_READ, length, _state[_READ_RATE])
+
+
+def throttle_open():
+    """Accounts for one file opened, moved or deleted, sleeping as needed to stay under the file rate."""
+    if _settings is None or not _settings.max_open_rate:
+        return
+    _wait_for_slot(_NEXT_OPEN, 1, _settings.max_open_rate)
+
+
+def record_latency(seconds: float, length: int):
+    """Feeds the time a read of length bytes took to the adaptive mode, which lowers the read rate while storage is slow."""
+    if _settings is None or not _settings.target_latency or length <= 0:
+        return
+    units = length / LATENCY_UNIT
+    sample = seconds / units
+    with _state.get_lock():
+        latency = _state[_LATENCY]
+        weight = LATENCY_SMOOTHING * min(units, 1.0)
+        _state[_LATENCY] = latency = sample if not latency else latency + weight * (sample - latency)
+        now = time.monotonic()
+        if now - _state[_LAST_ADJUST] < ADJUST_INTERVAL:
+            return
+        _state[_LAST_ADJUST] = now
+        ceiling = _settings.max_read_rate
+        if latency > _settings.target_latency:
+            _state[_READ_RATE] = max(ceiling * MIN_RATE_SHARE, _state[_READ_RATE] * DECREASE_FACTOR)
+            metrics.count("throttle_decreases")
+        else:
+            _state[_READ_RATE] = min(ceiling, _state[_READ_RATE] + ceiling * INCREASE_SHARE)
+
+
+def current_read_rate() -> float | None:
+    """The read rate in force, which adaptive mode may have lowered. None without a read limit."""
+    if _settings is None or not _settings.max_read_rate:
+        return None
+    return _state[_READ_RATE]
@@ -0,0 +1,321 @@
+import json
+import mmap
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from file_manager_meta.cache_paths import _get_cache_dir
+from file_manager_meta.filters import relative_dir
+from file_manager_meta.layout import is_rotational
+from file_manager_meta.metrics import metrics
+from file_manager_meta.throttle import current_read_rate, throttle_open, throttle_read
+from file_manager_meta.walker import is_excluded
+
+# Tuned settings per storage device, kept across runs; --retune measures again
+PROFILES_FILE_NAME = "storage_profiles.json"
+PROFILES_VERSION = 1
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "lustre", "davfs",
+                       "fuse.sshfs", "fuse.ceph", "fuse.glusterfs", "fuse.rclone", "fuse.s3fs"}
+# Starting points per kind of storage, before calibration: (workers per CPU, read block size, batch bytes).
+# A batch size of None keeps the scheduler's own target, which grows with the run.
+DEFAULTS = {
+    "hdd": (0, 4 * 1024 * 1024, 64 * 1024 * 1024),  # A single worker: several only make the heads seek between them
+    "ssd": (1, 1024 * 1024, None),
+    "nvme": (2, 1024 * 1024, None),
+    "network": (4, 4 * 1024 * 1024, 16 * 1024 * 1024),  # Many requests in flight hide the round trips
+}
+MAX_WORKERS = 64
+# Calibration: random reads from up to CALIBRATION_FILES files of at least CALIBRATION_MIN_FILE_SIZE bytes,
+# CALIBRATION_SECONDS per trial. With less data than CALIBRATION_MIN_BYTES, the defaults are kept.
+CALIBRATION_FILES = 64
+CALIBRATION_MAX_ENTRIES = 10000  # Directory entries looked at while searching for them
+CALIBRATION_MIN_FILE_SIZE = 1024 * 1024
+CALIBRATION_MIN_BYTES = 32 * 1024 * 1024
+CALIBRATION_SECONDS = 0.15
+CALIBRATION_QUEUE_DEPTHS = (1, 4, 16, 64)
+CALIBRATION_BLOCK_SIZES = (256 * 1024, 1024 * 1024, 4 * 1024 * 1024)
+# The smallest setting within this share of the best throughput wins, so noise doesn't pick needless threads
+GOOD_ENOUGH = 0.9
+
+
+class StorageProfile(NamedTuple):
+    kind: str  # 'hdd', 'ssd', 'nvme' or 'network'
+    workers: int
+    read_block_size: int
+    batch_bytes: int | None
+    calibrated: bool
+
+
+class TuningOverrides(NamedTuple):
+    workers: int | None
+    read_block_size: int | None
+    batch_bytes: int | None
+    retune: bool
+
+
+# Set by configure() from the global options; None fields are tuned
+_overrides = TuningOverrides(None, None, None, False)
+# The profile in force in this process, applied by tune() and in pool workers by apply()
+_active: StorageProfile | None = None
+_profiles_lock = threading.Lock()
+
+
+def configure(workers: int | None = None, read_block_size: int | None = None, batch_bytes: int | None = None,
+              retune: bool = False):
+    """Sets the values given on the command line, which take precedence over any tuned ones."""
+    global _overrides
+    _overrides = TuningOverrides(workers, read_block_size, batch_bytes, retune)
+
+
+def apply(profile: StorageProfile | None):
+    """Makes profile the one in force in this process: read buffers and batch sizes follow it."""
+    global _active
+    from file_manager_meta.hashes import set_read_buffer_size, READ_BUFFER_SIZE
+    _active = profile
+    set_read_buffer_size(profile.read_block_size if profile else READ_BUFFER_SIZE)
+
+
+def active_profile() -> StorageProfile | None:
+    return _active
+
+
+def _mount_of(directory: Path) -> tuple[str, str, str] | None:
+    """(source, mount point, filesystem type) of the mount holding directory, from /proc/mounts. None elsewhere."""
+    try:
+        lines = Path("/proc/mounts").read_text().splitlines()
+    except OSError:
+        return None
+    resolved = directory.resolve()
+    best = None
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 3:
+            continue
+        # Spaces and other special characters in mount points are octal escapes
+        mount_point = Path(re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), fields[1]))
+        if resolved.is_relative_to(mount_point) and (best is None or len(mount_point.parts) >= len(best[1].parts)):
+            best = (fields[0], mount_point, fields[2])
+    return (best[0], str(best[1]), best[2]) if best else None
+
+
+def _classify(dev: int, filesystem_type: str | None) -> str:
+    if filesystem_type in NETWORK_FILESYSTEMS:
+        return "network"
+    if is_rotational(dev):
+        return "hdd"
+    if sys.platform.startswith("linux"):
+        try:
+            if "nvme" in str(Path(f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}").resolve(strict=True)):
+                return "nvme"
+        except OSError:
+            pass
+    return "ssd"
+
+
+def _sample_files(directory: Path) -> list[tuple[str, int]]:
+    """(path, size) of the first files of a useful size found breadth-first under directory, skipping hidden entries."""
+    found = []
+    pending = [directory]
+    seen = 0
+    while pending and len(found) < CALIBRATION_FILES and seen < CALIBRATION_MAX_ENTRIES:
+        current = pending.pop(0)
+        parent = relative_dir(str(current), str(directory))
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    seen += 1
+                    if is_excluded(entry.name, entry.is_dir(follow_symlinks=False), parent=parent):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(Path(entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        size = entry.stat(follow_symlinks=False).st_size
+                        if size >= CALIBRATION_MIN_FILE_SIZE:
+                            found.append((entry.path, size))
+        except OSError:
+            continue
+    return found[:CALIBRATION_FILES]
+
+
+def _open_uncached(path: str) -> tuple[int, bool]:
+    """Opens path for reading with O_DIRECT where the filesystem supports it, so reads bypass the page cache. Returns (fd, direct)."""
+    throttle_open()
+    if hasattr(os, "O_DIRECT") and hasattr(os, "preadv"):
+        try:
+            return os.open(path, os.O_RDONLY | os.O_DIRECT), True
+        except OSError:
+            pass  # tmpfs and some network filesystems refuse it
+    return os.open(path, os.O_RDONLY), False
+
+
+def _measure(fds: list[tuple[int, int, bool]], queue_depth: int, block_size: int, cached_reads: dict) -> float:
+    """
+    Bytes per second of random block reads spread over the files, queue_depth at a time. Reads of files opened
+    without O_DIRECT go through the page cache; their (offset, length) are added to cached_reads[fd].
+    """
+    deadline = time.monotonic() + CALIBRATION_SECONDS
+    counts = [0] * queue_depth
+
+    def reader(slot: int):
+        rng = random.Random(slot)
+        # O_DIRECT reads need a page-aligned buffer, which an anonymous mapping is
+        with mmap.mmap(-1, block_size) as buffer:
+            while time.monotonic() < deadline:
+                fd, size, direct = fds[rng.randrange(len(fds))]
+                offset = rng.randrange(0, max(size - block_size, 0) + 1) // 4096 * 4096
+                if direct:
+                    length = os.preadv(fd, [buffer], offset)
+                else:
+                    length = len(os.pread(fd, block_size, offset))
+                    cached_reads[fd].add((offset, length))
+                counts[slot] += length
+                throttle_read(length)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=queue_depth, thread_name_prefix="fmm-calibrate") as executor:
+        list(executor.map(reader, range(queue_depth)))
+    return sum(counts) / (time.monotonic() - started)
+
+
+def _smallest_good_enough(results: dict) -> int:
+    best = max(results.values())
+    return min(setting for setting, throughput in results.items() if throughput >= best * GOOD_ENOUGH)
+
+
+def _drop_cached_reads(cached_reads: dict):
+    """Evicts the ranges the calibration read through the page cache, leaving the rest of the files' cached pages alone."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for fd, ranges in cached_reads.items():
+        for offset, length in ranges:
+            if length:
+                os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+
+
+def _calibrate(directory: Path, kind: str, profile: StorageProfile) -> StorageProfile:
+    """
+    Measures how read throughput on directory's storage grows with the number of reads in flight and
+    with the block size, and picks the smallest of each that gets close to the best. Reads count
+    towards the run's I/O limits (see throttle.configure).
+    """
+    if not hasattr(os, "pread"):
+        return profile
+    samples = _sample_files(directory)
+    if sum(size for _, size in samples) < CALIBRATION_MIN_BYTES:
+        return profile  # Too little to measure; the defaults will do
+    fds = []
+    # Without O_DIRECT, pages the user already had cached make the storage look faster than it is. That only skews
+    # this calibration, while evicting whole files beforehand would slow down whatever the user is doing with them.
+    cached_reads = {}
+    try:
+        for path, size in samples:
+            try:
+                fd, direct = _open_uncached(path)
+            except OSError:
+                continue
+            fds.append((fd, size, direct))
+            if not direct:
+                cached_reads[fd] = set()
+        if not fds:
+            return profile
+        with metrics.timer("calibration"):
+            depths = (1, 2) if kind == "hdd" else CALIBRATION_QUEUE_DEPTHS
+            queue_depth = _smallest_good_enough({depth: _measure(fds, depth, profile.read_block_size, cached_reads)
+                                                 for depth in depths})
+            read_block_size = _smallest_good_enough({size: _measure(fds, queue_depth, size, cached_reads)
+                                                     for size in CALIBRATION_BLOCK_SIZES})
+    except OSError:
+        return profile
+    finally:
+        try:
+            _drop_cached_reads(cached_reads)
+        except OSError:
+            pass
+        for fd, _, _ in fds:
+            os.close(fd)
+    metrics.count("storage_calibrations")
+    cpu_count = os.cpu_count() or 1
+    workers = queue_depth if kind == "hdd" else min(max(cpu_count, queue_depth), cpu_count * 4, MAX_WORKERS)
+    return profile._replace(workers=workers, read_block_size=read_block_size, calibrated=True)
+
+
+def _load_profiles(path: Path) -> dict:
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return data.get("devices", {}) if data.get("version") == PROFILES_VERSION else {}
+
+
+def _save_profiles(path: Path, profiles: dict):
+    temporary = path.with_suffix(".tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary.write_text(json.dumps({"version": PROFILES_VERSION, "devices": profiles}, indent=2))
+        os.replace(temporary, path)
+    except OSError:
+        pass  # Only a cache: the next run calibrates again
+
+
+def storage_profile(directory: Path) -> StorageProfile:
+    """
+    Returns the tuned profile of the storage holding directory: its kind (from sysfs and /proc/mounts)
+    and the worker count, read block size and batch size a short calibration chose for it, as saved
+    for its device by an earlier run or measured now.
+    """
+    try:
+        dev = directory.stat().st_dev
+    except OSError:
+        dev = None
+    mount = _mount_of(directory)
+    key = f"{mount[2]}:{mount[0]}:{mount[1]}" if mount else f"dev:{dev}"
+    path = _get_cache_dir() / PROFILES_FILE_NAME
+    with _profiles_lock:
+        profiles = _load_profiles(path)
+        if key in profiles and not _overrides.retune:
+            try:
+                return StorageProfile(**profiles[key])
+            except TypeError:
+                pass  # Saved by another version
+        kind = _classify(dev, mount[2] if mount else None) if dev is not None else "ssd"
+        workers_per_cpu, read_block_size, batch_bytes = DEFAULTS[kind]
+        profile = StorageProfile(kind, max(1, (os.cpu_count() or 1) * workers_per_cpu), read_block_size, batch_bytes,
+                                 calibrated=False)
+        profile = _calibrate(directory, kind, profile)
+        # Under a read limit the calibration measured the limit, not the device
+        if profile.calibrated and current_read_rate() is None:
+            profiles[key] = profile._asdict()
+            _save_profiles(path, profiles)
+    return profile
+
+
+def tune(directory: Path, device_workers: int | None = None) -> StorageProfile:
+    """
+    Chooses the settings of a run over directory, from the storage profile with the command line
+    overrides on top, and puts them in force. Returns them; .workers is the size of the worker pool.
+    Also bounds the leaves of tree hashes read at once over the whole run: device_workers if given,
+    one on a spinning disk and one per worker elsewhere, like the reads scheduled in on-disk order.
+    """
+    overrides = _overrides
+    if overrides.workers and overrides.read_block_size and overrides.batch_bytes:
+        profile = StorageProfile("manual", overrides.workers, overrides.read_block_size, overrides.batch_bytes,
+                                 calibrated=False)
+    else:
+        profile = storage_profile(directory)
+        profile = profile._replace(workers=overrides.workers or profile.workers,
+                                   read_block_size=overrides.read_block_size or profile.read_block_size,
+                                   batch_bytes=overrides.batch_bytes or profile.batch_bytes)
+    apply(profile)
+    from file_manager_meta.hashes import limit_leaf_reads
+    try:
+        rotational = profile.kind == "hdd" or is_rotational(directory.stat().st_dev)
+    except OSError:
+        rotational = False
+    limit_leaf_reads(device_workers or (1 if rotational else profile.workers))
+    return profile
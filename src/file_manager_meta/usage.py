@@ -0,0 +1,230 @@
+import heapq
+import os
+from pathlib import Path
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from file_manager_meta.cache_manager import init_cache, get_directory_snapshots, set_directory_snapshot, \
+    remove_directory_snapshots
+from file_manager_meta.deduplicate import format_size
+from file_manager_meta.filters import active_filter, relative_dir
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+from file_manager_meta.walker import is_excluded
+
+# Largest files kept per directory; the largest of the tree are always among them
+TOP_FILES = 100
+# Upper bound (exclusive) and label of each size range, smallest first
+SIZE_BUCKETS = [
+    (1024, "< 1 KB"),
+    (64 * 1024, "1 KB - 64 KB"),
+    (1024 * 1024, "64 KB - 1 MB"),
+    (64 * 1024 * 1024, "1 MB - 64 MB"),
+    (1024 * 1024 * 1024, "64 MB - 1 GB"),
+    (None, ">= 1 GB"),
+]
+
+
+def _size_bucket(size: int) -> str:
+    for limit, label in SIZE_BUCKETS:
+        if limit is None or size < limit:
+            return label
+
+
+def summarize_files(records: list[FileRecord]) -> dict:
+    """
+    Aggregates the files of one directory (not its sub-directories): count and bytes in total,
+    per extension and per size range, and its largest files. Stored as the directory's usage in the cache,
+    with the fingerprint of the filter that chose the files.
+    """
+    extensions = {}
+    sizes = {}
+    for record in records:
+        for key, totals in ((record.path.suffix.lower(), extensions), (_size_bucket(record.size), sizes)):
+            entry = totals.setdefault(key, [0, 0])
+            entry[0] += 1
+            entry[1] += record.size
+    return {
+        "files": len(records),
+        "bytes": sum(record.size for record in records),
+        "extensions": extensions,
+        "sizes": sizes,
+        "largest": heapq.nlargest(TOP_FILES, ([record.size, record.path.name] for record in records)),
+        "filter": active_filter().fingerprint,
+    }
+
+
+def _list_directory(dir_path: str, root: str) -> tuple[list[os.DirEntry], list[str]]:
+    """Lists the regular files and sub-directories of one directory, skipping the same entries as the walker, without stat'ing files."""
+    files = []
+    sub_directories = []
+    parent = relative_dir(dir_path, root)
+    for entry in os.scandir(dir_path):
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if not is_excluded(entry.name, is_dir=True, parent=parent):
+                    sub_directories.append(entry.path)
+            elif entry.is_file(follow_symlinks=False) and not is_excluded(entry.name, is_dir=False, parent=parent):
+                files.append(entry)
+        except OSError:
+            continue
+    return files, sub_directories
+
+
+def scan_usage(directory: Path, conn, rescan: bool = False) -> tuple[dict[str, dict], int, int]:
+    """
+    Brings the usage aggregates of every directory under directory up to date in the cache and returns them.
+    A directory whose modification time matches its snapshot has the same entries as when it was summarized,
+    so its files aren't stat'ed again (files modified in place are picked up by watch, or with rescan=True),
+    unless the snapshot was taken with a different filter (--exclude, --ext, --min-size...).
+    Returns ({directory path: usage}, directories reused, directories rescanned).
+    """
+    previous = get_directory_snapshots(conn, directory)
+    fingerprint = active_filter().fingerprint
+    usage_by_directory = {}
+    reused = rescanned = 0
+    pending = [str(directory)]
+    while pending:
+        dir_path = pending.pop()
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+            files, sub_directories = _list_directory(dir_path, str(directory))
+        except OSError:
+            continue
+        known_mtime_ns, usage = previous.get(dir_path, (None, None))
+        if rescan or usage is None or known_mtime_ns != mtime_ns or usage.get("filter") != fingerprint:
+            records = []
+            for entry in files:
+                try:
+                    stat_info = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if not active_filter().excludes_size(stat_info.st_size):
+                    records.append(FileRecord.from_stat(Path(entry.path), stat_info))
+            usage = summarize_files(records)
+            set_directory_snapshot(conn, Path(dir_path), mtime_ns, usage, commit=False)
+            metrics.count("files_walked", len(records))
+            rescanned += 1
+        else:
+            reused += 1
+        usage_by_directory[dir_path] = usage
+        # Reversed so directories are visited in the order they were listed
+        pending.extend(reversed(sub_directories))
+    conn.commit()
+    remove_directory_snapshots(conn, [path for path in previous if path not in usage_by_directory])
+    metrics.count("directories_reused", reused)
+    metrics.count("directories_rescanned", rescanned)
+    return usage_by_directory, reused, rescanned
+
+
+def _recursive_totals(directory: Path, usage_by_directory: dict[str, dict]) -> dict[str, list[int]]:
+    """Returns {directory path: [files, bytes]} including everything below each directory."""
+    totals = {path: [usage["files"], usage["bytes"]] for path, usage in usage_by_directory.items()}
+    root = str(directory)
+    # Deepest first, so a directory's total is complete before it is added to its parent
+    for path in sorted(totals, key=lambda p: p.count(os.sep), reverse=True):
+        parent = os.path.dirname(path)
+        if path != root and parent in totals:
+            totals[parent][0] += totals[path][0]
+            totals[parent][1] += totals[path][1]
+    return totals
+
+
+def _merge_counts(usage_by_directory: dict[str, dict], key: str) -> dict[str, list[int]]:
+    merged = {}
+    for usage in usage_by_directory.values():
+        for name, (count, size) in usage[key].items():
+            entry = merged.setdefault(name, [0, 0])
+            entry[0] += count
+            entry[1] += size
+    return merged
+
+
+def _share(size: int, total: int) -> str:
+    return f"{size / total:.1%}" if total else "-"
+
+
+def report_usage(directory: Path, output: Path | None = None, top: int = 20, rescan: bool = False):
+    """
+    Reports disk usage: recursive size of each directory, file types, size distribution and largest files.
+    The aggregates are kept in the cache, so later runs only summarize the directories that changed.
+    """
+    console = Console()
+    if output and output.suffix != ".html":
+        console.print("Output file must have a .html extension", style="red")
+        raise typer.Exit(code=1)
+    report_console = Console(record=True) if output else console
+
+    conn, db_path = init_cache(directory)
+    console.print(f"Using cache database: [dim]{db_path}[/dim]")
+    try:
+        console.print("Summarizing changed directories (using cache)...")
+        with metrics.phase("walk"):
+            usage_by_directory, reused, rescanned = scan_usage(directory, conn, rescan)
+    finally:
+        conn.close()
+
+    with metrics.phase("tables"):
+        totals = _recursive_totals(directory, usage_by_directory)
+        total_files, total_bytes = totals.get(str(directory), [0, 0])
+
+        table = Table(title="Largest Directories (including sub-directories)")
+        table.add_column("Directory", style="cyan")
+        table.add_column("Files", justify="right")
+        table.add_column("Size", justify="right")
+        table.add_column("Share", justify="right")
+        largest_directories = heapq.nlargest(top, (item for item in totals.items() if item[0] != str(directory)),
+                                             key=lambda item: item[1][1])
+        for path, (files, size) in largest_directories:
+            table.add_row(f"./{Path(path).relative_to(directory)}", str(files), format_size(size), _share(size, total_bytes))
+        report_console.print(table)
+
+        table = Table(title="File Types")
+        table.add_column("Extension", style="cyan")
+        table.add_column("Files", justify="right")
+        table.add_column("Size", justify="right")
+        table.add_column("Share", justify="right")
+        extensions = _merge_counts(usage_by_directory, "extensions")
+        for extension, (files, size) in heapq.nlargest(top, extensions.items(), key=lambda item: item[1][1]):
+            table.add_row(extension or "(none)", str(files), format_size(size), _share(size, total_bytes))
+        if len(extensions) > top:
+            table.caption = f"{len(extensions) - top} more extensions not shown (see --top)"
+        report_console.print(table)
+
+        table = Table(title="Size Distribution")
+        table.add_column("File Size", style="cyan")
+        table.add_column("Files", justify="right")
+        table.add_column("Size", justify="right")
+        table.add_column("Share", justify="right")
+        sizes = _merge_counts(usage_by_directory, "sizes")
+        for _, label in SIZE_BUCKETS:
+            files, size = sizes.get(label, [0, 0])
+            table.add_row(label, str(files), format_size(size), _share(size, total_bytes))
+        report_console.print(table)
+
+        table = Table(title="Largest Files")
+        table.add_column("File", style="cyan")
+        table.add_column("Size", justify="right")
+        largest_files = heapq.nlargest(top, ((size, Path(path) / name) for path, usage in usage_by_directory.items()
+                                             for size, name in usage["largest"]))
+        for size, path in largest_files:
+            table.add_row(str(path.relative_to(directory)), format_size(size))
+        report_console.print(table)
+
+    if output:
+        with metrics.phase("export"):
+            html_content = report_console.export_html()
+            custom_css = "<style> body, code { font-size: 0.9em; } </style>"
+            html_content = html_content.replace("</head>", f"{custom_css}</head>")
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(html_content)
+
+    console.rule("Disk Usage Summary")
+    console.print(f"[green]Total files:[/green] {total_files}")
+    console.print(f"[green]Total size:[/green] {format_size(total_bytes)}")
+    console.print(f"[green]Directories:[/green] {len(usage_by_directory)} "
+                  f"({rescanned} summarized again, {reused} unchanged since the last run)")
+    if output:
+        console.print(f"[green]Report saved to:[/green] {output}")
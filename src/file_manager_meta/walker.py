@@ -0,0 +1,86 @@
+import os
+from pathlib import Path
+from typing import Iterator
+
+from file_manager_meta.filters import active_filter, relative_dir
+from file_manager_meta.metrics import metrics
+from file_manager_meta.records import FileRecord
+
+
+def is_excluded(name: str, is_dir: bool, parent: str = "") -> bool:
+    """
+    True for entries the run's filter leaves out (by default system and hidden ones), which no command looks at.
+    parent is the entry's directory relative to the root of the scan, for anchored rules.
+    """
+    path_filter = active_filter()
+    return path_filter.excludes_dir(parent, name) if is_dir else path_filter.excludes_file(parent, name)
+
+
+def is_excluded_file(path: Path, root: Path) -> bool:
+    """
+    True for a file given by path, e.g. on the command line, that a walk of root would leave out: by a rule on its
+    name or path, or because a directory between root and it is pruned. Files outside root are matched by name only.
+    """
+    path, root = path.absolute(), root.absolute()
+    if not path.is_relative_to(root):
+        root = path.parent
+    path_filter = active_filter()
+    if path_filter.excludes_path(path.parent, root, is_dir=True):
+        return True
+    return path_filter.excludes_file(relative_dir(str(path.parent), str(root)), path.name)
+
+
+def scan_directory(dir_path: str, skipped: list | None = None, root: str | None = None) -> tuple[list[FileRecord], list[str]]:
+    """
+    Lists one directory without descending. Returns the records of its regular files
+    and the paths of the sub-directories that should be walked.
+    Anchored filter rules are matched relative to root (default: dir_path itself).
+    """
+    records = []
+    sub_directories = []
+    try:
+        entries = list(os.scandir(dir_path))
+    except OSError:
+        return records, sub_directories
+
+    path_filter = active_filter()
+    relative = relative_dir(dir_path, root) if root is not None else ""
+    for entry in entries:
+        name = entry.name
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                # Pruned here, so nothing below an excluded directory is ever listed
+                if not path_filter.excludes_dir(relative, name):
+                    sub_directories.append(entry.path)
+                continue
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            if path_filter.excludes_file(relative, name):  # Hidden files and any excluded by name, before the stat
+                if skipped is not None:
+                    skipped.append(Path(entry.path))
+                continue
+            stat_info = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        if path_filter.excludes_size(stat_info.st_size):
+            continue
+        records.append(FileRecord.from_stat(Path(entry.path), stat_info))
+    metrics.count("files_walked", len(records))
+    metrics.count("directories_walked")
+    return records, sub_directories
+
+
+def walk_files(directory: Path, skipped: list | None = None, root: Path | None = None) -> Iterator[FileRecord]:
+    """
+    Yields a FileRecord for every regular file under directory that the run's filter keeps (see filters).
+    Each file is stat'ed exactly once; symlinks are never followed.
+    If a `skipped` list is given, the paths of files excluded by name (e.g. hidden ones) are appended to it.
+    root is where anchored filter rules start, when directory is only part of the tree being scanned.
+    """
+    root = str(root or directory)
+    pending = [str(directory)]
+    while pending:
+        records, sub_directories = scan_directory(pending.pop(), skipped, root)
+        yield from records
+        # Reversed so directories are visited in the order they were listed
+        pending.extend(reversed(sub_directories))
@@ -0,0 +1,271 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from functools import partial
+from pathlib import Path
+
+from rich.console import Console
+
+from file_manager_meta.cache_manager import init_cache, worker_connection, get_cached_hashes, remove_cached_hashes, \
+    remove_cached_files, remove_cached_tree, iter_cached_paths, set_directory_snapshot
+from file_manager_meta.filters import relative_dir
+from file_manager_meta.hashes import calculate_hashes
+from file_manager_meta.metrics import metrics, measured_call
+from file_manager_meta.records import FileRecord
+from file_manager_meta.scheduler import open_executor, schedule
+from file_manager_meta.tuning import tune
+from file_manager_meta.usage import summarize_files
+from file_manager_meta.walker import is_excluded, scan_directory, walk_files
+
+console = Console()
+
+# inotify event masks (from <sys/inotify.h>)
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal ctypes binding to Linux inotify, watching a whole tree one directory at a time."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}  # watch descriptor -> directory path
+
+    def add_watch(self, dir_path: Path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch failed for {dir_path}: {os.strerror(errno)}")
+        self.directories[wd] = dir_path
+
+    def read_events(self, timeout: float):
+        """Yields (directory, name, mask) tuples, waiting at most timeout seconds for the first one."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_length].rstrip(b"\0"))
+            offset += name_length
+            dir_path = self.directories.get(wd)
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+            if dir_path is not None or mask & IN_Q_OVERFLOW:
+                yield dir_path, name, mask
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _hash_into_cache(record: FileRecord, root_directory: Path) -> bool:
+    # Stat again: the file may have changed since it was listed
+    try:
+        record = FileRecord.from_path(record.path)
+    except OSError:
+        return False  # Removed or replaced before its turn came
+    return bool(calculate_hashes(record, worker_connection(root_directory)))
+
+
+class _CacheWarmer:
+    """Keeps the cache of one root current: hashes cache misses in the background and prunes removed files."""
+
+    def __init__(self, directory: Path, executor_kind: str = "processes"):
+        self.directory = directory
+        self.conn, self.db_path = init_cache(directory)
+        self.workers = tune(directory).workers
+        # Background hashing should only use otherwise idle CPU and disk time
+        self.executor = open_executor(executor_kind, self.workers, low_priority=True)
+        self.in_flight = {}  # future -> path
+        self.in_flight_paths = set()
+        self.hashed_count = 0
+
+    def _needs_hashing(self, record: FileRecord) -> bool:
+        if record.path in self.in_flight_paths:
+            return False
+        cached = get_cached_hashes(self.conn, record.path, record)
+        return not (cached and cached.get("md5"))
+
+    def _submit(self, record: FileRecord):
+        if not self._needs_hashing(record):
+            return
+        # A burst of events waits for the workers instead of queueing tasks without bound
+        while len(self.in_flight) >= self.workers * 2:
+            wait(self.in_flight, return_when=FIRST_COMPLETED)
+            self.collect_finished()
+        future = self.executor.submit(measured_call, _hash_into_cache, record, self.directory)
+        self.in_flight[future] = record.path
+        self.in_flight_paths.add(record.path)
+
+    def collect_finished(self):
+        for future in [f for f in self.in_flight if f.done()]:
+            path = self.in_flight.pop(future)
+            self.in_flight_paths.discard(path)
+            try:
+                if metrics.absorb(future.result()):
+                    self.hashed_count += 1
+            except Exception as e:
+                console.print(f"[bold red]Error hashing {path}: {e}[/bold red]")
+
+    def _store_snapshot(self, dir_path: Path, records: list[FileRecord], commit: bool = True) -> bool:
+        try:
+            mtime_ns = dir_path.stat().st_mtime_ns
+        except OSError:
+            return False  # Removed meanwhile; its delete event takes care of the cache
+        set_directory_snapshot(self.conn, dir_path, mtime_ns, summarize_files(records), commit=commit)
+        return True
+
+    def sync_directory(self, dir_path: Path):
+        """Brings one directory's files and snapshot up to date with what is on disk."""
+        records, _ = scan_directory(str(dir_path), root=str(self.directory))
+        if self._store_snapshot(dir_path, records):
+            for record in records:
+                self._submit(record)
+
+    def full_rescan(self) -> int:
+        """
+        Syncs every directory under the root and prunes cache entries of files no longer on disk. The cache misses are
+        streamed through the pool a few batches at a time, like in the other commands. Returns the files hashed.
+        """
+        records_by_directory = {self.directory: []}
+        for record in walk_files(self.directory):
+            records_by_directory.setdefault(record.path.parent, []).append(record)
+        for dir_path, records in records_by_directory.items():
+            self._store_snapshot(dir_path, records, commit=False)
+        self.conn.commit()
+
+        misses = (record for records in records_by_directory.values() for record in records if self._needs_hashing(record))
+        hashed = 0
+        for _, hashed_now in schedule(self.executor, partial(_hash_into_cache, root_directory=self.directory), misses,
+                                      self.workers, lambda record: record.size):
+            hashed += hashed_now
+        self.hashed_count += hashed
+
+        # Files the filter leaves out (hidden ones, --exclude...) keep their entries, e.g. dates cached by update-metadata-date
+        seen = {record.path for records in records_by_directory.values() for record in records}
+        remove_cached_files(self.conn, [cached_path for cached_path in iter_cached_paths(self.conn)
+                                        if cached_path not in seen and not os.path.lexists(cached_path)])
+        return hashed
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.conn.close()
+
+
+def _add_tree_watches(inotify: Inotify, dir_path: Path, root: Path) -> list[Path]:
+    """Watches dir_path and all of its sub-directories (under root, where filter rules start). Returns the directories now watched."""
+    watched = []
+    pending = [dir_path]
+    while pending:
+        current = pending.pop()
+        inotify.add_watch(current)
+        watched.append(current)
+        _, sub_directories = scan_directory(str(current), root=str(root))
+        pending.extend(Path(d) for d in sub_directories)
+    return watched
+
+
+def watch_directory(directory: Path, rescan_interval: float = 300, settle_seconds: float = 2.0,
+                    executor_kind: str = "processes"):
+    """
+    Watches a tree and keeps its cache warm, so later report/deduplicate runs find fresh hashes.
+    Uses inotify on Linux and falls back to a periodic full rescan elsewhere or when inotify is unavailable.
+    """
+    warmer = _CacheWarmer(directory, executor_kind)
+    console.print(f"Watching [cyan]{directory}[/cyan] (cache: [dim]{warmer.db_path}[/dim]). Press Ctrl+C to stop.")
+
+    inotify = None
+    if sys.platform.startswith("linux"):
+        try:
+            inotify = Inotify()
+            _add_tree_watches(inotify, directory, directory)
+            console.print(f"Using inotify on {len(inotify.directories)} directories.")
+        except OSError as e:
+            console.print(f"[yellow]inotify unavailable ({e}); falling back to a rescan every {rescan_interval:g}s.[/yellow]")
+            if inotify:
+                inotify.close()
+            inotify = None
+    else:
+        console.print(f"[yellow]inotify is Linux-only; falling back to a rescan every {rescan_interval:g}s.[/yellow]")
+
+    dirty_directories = {}  # directory -> time of its last event
+    try:
+        # Events arriving meanwhile wait in the kernel's queue; if it overflows, a rescan catches up
+        console.print("Initial scan...")
+        console.print(f"[dim]Hashed {warmer.full_rescan()} files.[/dim]")
+        last_rescan = time.monotonic()
+        while True:
+            if inotify is None:
+                time.sleep(min(rescan_interval, 1.0))
+                if time.monotonic() - last_rescan >= rescan_interval:
+                    warmer.full_rescan()
+                    last_rescan = time.monotonic()
+            else:
+                for dir_path, name, mask in inotify.read_events(timeout=min(settle_seconds, 1.0)):
+                    if mask & IN_Q_OVERFLOW:
+                        # Events were lost, only a rescan can tell what changed
+                        console.print("[yellow]inotify queue overflowed, rescanning...[/yellow]")
+                        warmer.full_rescan()
+                        continue
+                    if not name or is_excluded(name, is_dir=bool(mask & IN_ISDIR),
+                                               parent=relative_dir(str(dir_path), str(directory))):
+                        continue
+                    path = dir_path / name
+                    if mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            try:
+                                for new_directory in _add_tree_watches(inotify, path, directory):
+                                    dirty_directories[new_directory] = time.monotonic()
+                            except OSError as e:
+                                console.print(f"[bold red]Cannot watch {path}: {e}[/bold red]")
+                        elif mask & (IN_DELETE | IN_MOVED_FROM):
+                            remove_cached_tree(warmer.conn, path)
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        remove_cached_hashes(warmer.conn, path)
+                    dirty_directories[dir_path] = time.monotonic()
+
+            # Directories are synced once they have been quiet for settle_seconds, so files still being written aren't hashed
+            now = time.monotonic()
+            for dir_path in [d for d, last_event in dirty_directories.items() if now - last_event >= settle_seconds]:
+                del dirty_directories[dir_path]
+                warmer.sync_directory(dir_path)
+
+            finished_before = warmer.hashed_count
+            warmer.collect_finished()
+            if warmer.hashed_count != finished_before:
+                console.print(f"[dim]Hashed {warmer.hashed_count - finished_before} files "
+                              f"({len(warmer.in_flight)} pending).[/dim]")
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Stopping watch...[/yellow]")
+    finally:
+        if inotify:
+            inotify.close()
+        warmer.close()
+
+    console.rule("Watch Task Summary")
+    console.print(f"[green]Files hashed in the background:[/green] {warmer.hashed_count}")
@@ -0,0 +1,10 @@
+import pytest
+
+from file_manager_meta import filters
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keeps every test's cache databases in its own directory, and the run's filter at the defaults."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(filters, "_active", filters.PathFilter())
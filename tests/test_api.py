@@ -0,0 +1,139 @@
+import json
+import os
+
+import pytest
+from typer.testing import CliRunner
+
+from file_manager_meta import api
+from file_manager_meta.cache_manager import get_cached_hashes, init_cache
+from file_manager_meta.cli import app
+from file_manager_meta.hashes import calculate_hashes
+from file_manager_meta.records import FileRecord
+from file_manager_meta.sharding import scan_shard
+
+
+@pytest.fixture
+def tree(tmp_path):
+    directory = tmp_path / "tree"
+    (directory / "sub").mkdir(parents=True)
+    (directory / "a.txt").write_bytes(b"same content" * 1000)
+    (directory / "sub" / "b.txt").write_bytes(b"same content" * 1000)
+    (directory / "c.bin").write_bytes(os.urandom(50_000))
+    (directory / "noext").write_bytes(b"other")
+    return directory
+
+
+def _files(directory):
+    return sorted(path.relative_to(directory).as_posix() for path in directory.rglob("*") if path.is_file())
+
+
+def test_remove_duplicates_into_the_trash(tree, tmp_path):
+    duplicate_sets = list(api.find_duplicates(tree, executor_kind="threads"))
+    assert len(duplicate_sets) == 1 and len(duplicate_sets[0].duplicates) == 1
+    duplicate = duplicate_sets[0].duplicates[0].path
+
+    removals = list(api.remove_duplicates(tree, duplicate_sets, trash_dir=tmp_path / "trash"))
+    assert removals == [api.Removal(duplicate, None)]
+    assert not duplicate.exists() and duplicate_sets[0].keep.path.exists()
+    assert [path.name for path in (tmp_path / "trash").rglob("*") if path.is_file()] == [duplicate.name]
+
+
+def test_sort_files(tree):
+    moves = {move.source.name: move for move in api.sort_files(tree)}
+    assert moves["noext"] == api.Move(tree / "noext", None, api.NO_EXTENSION)
+    assert moves["c.bin"].destination == tree / "bin" / "c.bin"
+    assert _files(tree) == ["bin/c.bin", "noext", "txt/a.txt", "txt/b.txt"]
+
+
+def test_scrub_files_flags_and_drops_mismatched_digests(tree):
+    corrupt, intact = tree / "c.bin", tree / "a.txt"
+    conn, _ = init_cache(tree)
+    try:
+        for path in (corrupt, intact):
+            calculate_hashes(FileRecord.from_path(path), conn)
+    finally:
+        conn.close()
+    stat_info = corrupt.stat()
+    with open(corrupt, "r+b") as f:
+        f.write(b"rot")
+    os.utime(corrupt, ns=(stat_info.st_atime_ns, stat_info.st_mtime_ns))
+
+    assert sorted(api.scrub_files(tree, executor_kind="threads")) == [
+        api.ScrubbedFile(intact, 12_000, "verified"), api.ScrubbedFile(corrupt, 50_000, "mismatch")]
+    conn, _ = init_cache(tree)
+    try:
+        assert get_cached_hashes(conn, corrupt, FileRecord.from_path(corrupt))["md5"] is None
+        assert get_cached_hashes(conn, intact, FileRecord.from_path(intact))["md5"] is not None
+    finally:
+        conn.close()
+
+
+def test_find_similar(tree):
+    content = os.urandom(300_000)
+    (tree / "log1").write_bytes(content)
+    (tree / "log2").write_bytes(content + os.urandom(100_000))
+    report = api.find_similar(tree, threshold=0.5, executor_kind="threads")
+    assert [(pair.files, pair.similar_files) for pair in report.pairs] in (
+        [([tree / "log1"], [tree / "log2"])], [([tree / "log2"], [tree / "log1"])])
+    # All of log1 but the chunk that ends where log2's appended data starts
+    assert 0.9 < report.pairs[0].containment < 1.0
+    assert report.files_scanned == 6 and report.identical_groups == 1
+    assert report.whole_file_savings == 12_000
+    assert report.block_level_savings >= 12_000 + 250_000
+
+
+def test_find_sharded_duplicates(tree, tmp_path):
+    shard_files = []
+    for index in (1, 2):
+        shard_files.append(tmp_path / f"shard-{index}.fmm")
+        scan_shard(tree, "deduplicate", index, 2, shard_files[-1], executor_kind="threads")
+    duplicate_sets = list(api.find_sharded_duplicates(tree, shard_files, executor_kind="threads"))
+    assert [{duplicate_set.keep.path, *(record.path for record in duplicate_set.duplicates)}
+            for duplicate_set in duplicate_sets] == [{tree / "a.txt", tree / "sub" / "b.txt"}]
+    with pytest.raises(ValueError, match="Missing shards"):
+        list(api.find_sharded_duplicates(tree, shard_files[:1]))
+
+
+def test_run_pipeline(tree):
+    stages = ["deduplicate", "sort", "report"]
+    before = _files(tree)
+    results = list(api.run_pipeline(tree, stages, dry_run=True, executor_kind="threads"))
+    assert _files(tree) == before
+    assert [stage for stage, _ in results] == ["deduplicate"] + ["sort"] * 4 + ["report"] * 4
+
+    results = list(api.run_pipeline(tree, stages, executor_kind="threads"))
+    by_type = {}
+    for stage, result in results:
+        by_type.setdefault(type(result), []).append(result)
+    assert len(by_type[api.DuplicateSet]) == 1
+    assert [removal.error for removal in by_type[api.Removal]] == [None]
+    assert sorted(move.error or "" for move in by_type[api.Move]) == ["", "", api.NO_EXTENSION]
+    # The report hashes the files where the sort stage left them
+    assert sorted(hashed.path.relative_to(tree).as_posix() for hashed in by_type[api.HashedFile]) == _files(tree)
+    assert len(_files(tree)) == 3
+
+
+def test_run_pipeline_rejects_a_new_directory_outside_the_tree(tree, tmp_path):
+    with pytest.raises(ValueError):
+        list(api.run_pipeline(tree, ["sort"], new_directory=tmp_path / "elsewhere"))
+
+
+def test_update_metadata_dates_skips_files_without_a_date(tree):
+    updates = list(api.update_metadata_dates([tree / "c.bin", tree / "sub"], dry_run=True))
+    assert sorted((update.path.name, update.outcome) for update in updates) == [("b.txt", "skipped"), ("c.bin", "skipped")]
+
+
+def test_headless_sort_never_prompts(tree):
+    result = CliRunner().invoke(app, ["sort", str(tree), "--json"], input="")
+    assert result.exit_code == 0, result.output
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert records[-1] == {"type": "summary", "files_sorted": 3, "files_without_extension": 1, "files_failed": 0}
+    assert _files(tree) == ["bin/c.bin", "noext", "txt/a.txt", "txt/b.txt"]
+
+
+def test_interactive_sort_asks_for_the_criterion(tree):
+    (tree / "noext").unlink()
+    result = CliRunner().invoke(app, ["sort", str(tree)], input="size\n")
+    assert result.exit_code == 0, result.output
+    assert "Sort by" in result.output
+    assert not (tree / "txt").exists()
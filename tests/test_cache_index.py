@@ -0,0 +1,73 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from file_manager_meta.cache_index import export_cache_index, import_cache_index
+from file_manager_meta.cache_manager import get_cached_hashes, init_cache, set_cached_hashes
+from file_manager_meta.records import FileRecord
+
+HASHES = {
+    "md5": "5d41402abc4b2a76b9719d911017c592",
+    "sha1": "aaf4c61ddcc5e8a2dabede0f3b482cd9aea9434d",
+    "sha256": "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824",
+    "exiftool_file_type": "JPEG",
+    "create_date": "2021:06:01 12:30:45.120+02:00",
+    "date_time_original": "2021:06:01 12:30:45",
+    "tree_sha256": "ab" * 32,
+}
+
+
+@pytest.fixture
+def exported(tmp_path):
+    """A directory with one cached file, its index, and a copy of the file elsewhere with the same stamp."""
+    source = tmp_path / "source"
+    (source / "sub").mkdir(parents=True)
+    path = source / "sub" / "a.jpg"
+    path.write_bytes(b"hello")
+    conn, _ = init_cache(source)
+    try:
+        set_cached_hashes(conn, path, FileRecord.from_path(path), HASHES)
+    finally:
+        conn.close()
+    index_path = tmp_path / "index.fmi"
+    export_cache_index(source, index_path)
+    target = tmp_path / "target"
+    shutil.copytree(source, target)  # copy2 keeps the modification time
+    return index_path, target / "sub" / "a.jpg"
+
+
+def _cached(path):
+    conn, _ = init_cache(path.parent.parent)
+    try:
+        return get_cached_hashes(conn, path, FileRecord.from_path(path))
+    finally:
+        conn.close()
+
+
+def test_round_trip_keeps_every_field(exported):
+    index_path, copy = exported
+    import_cache_index(copy.parent.parent, index_path)
+    assert {key: value for key, value in _cached(copy).items() if value} == HASHES
+
+
+def test_changed_files_are_not_imported(exported):
+    index_path, copy = exported
+    copy.write_bytes(b"changed")
+    import_cache_index(copy.parent.parent, index_path)
+    assert _cached(copy) is None
+
+
+def test_version_1_index_is_still_imported(exported):
+    index_path, copy = exported
+    index = sqlite3.connect(index_path)
+    index.execute("ALTER TABLE entries DROP COLUMN tree_sha256")
+    index.execute("ALTER TABLE entries DROP COLUMN dates_text")
+    index.execute("PRAGMA user_version = 1")
+    index.commit()
+    index.close()
+    import_cache_index(copy.parent.parent, index_path)
+    cached = _cached(copy)
+    assert cached["md5"] == HASHES["md5"]
+    assert cached["create_date"] == "2021:06:01 12:30:45"
+    assert cached["tree_sha256"] is None
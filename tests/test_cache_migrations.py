@@ -0,0 +1,86 @@
+import os
+import sqlite3
+
+from file_manager_meta.cache_manager import SCHEMA_VERSION, get_cached_hashes, init_cache, set_cached_hashes
+from file_manager_meta.cache_paths import _get_cache_db_path
+from file_manager_meta.records import FileRecord
+
+MD5 = "5d41402abc4b2a76b9719d911017c592"
+SHA1 = "aaf4c61ddcc5e8a2dabede0f3b482cd9aea9434d"
+SHA256 = "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"
+
+
+def _write_v1_cache(directory, rows):
+    """A cache as the first release wrote it: text columns, a REAL mtime and no user_version."""
+    conn = sqlite3.connect(_get_cache_db_path(directory))
+    conn.execute("""
+        CREATE TABLE file_hashes (
+            path TEXT PRIMARY KEY,
+            mtime REAL NOT NULL,
+            size INTEGER NOT NULL,
+            md5 TEXT,
+            sha1 TEXT,
+            sha256 TEXT,
+            exiftool_file_type TEXT,
+            create_date TEXT,
+            date_time_original TEXT,
+            file_modify_date TEXT
+        )
+    """)
+    conn.executemany("INSERT INTO file_hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def test_v1_cache_is_migrated_with_its_hashes_and_dates(tmp_path):
+    kept = tmp_path / "kept.jpg"
+    kept.write_bytes(b"hello")
+    stale = tmp_path / "stale.jpg"
+    stale.write_bytes(b"world")
+    stat_info = os.stat(kept)
+    _write_v1_cache(tmp_path, [
+        (str(kept), stat_info.st_mtime, 5, MD5, SHA1, SHA256, "JPEG",
+         "2021:06:01 12:30:45.12+02:00", "2021:06:01 12:30:45", "0000:00:00 00:00:00"),
+        (str(stale), 0.0, 5, MD5, SHA1, SHA256, "JPEG", None, None, None),
+    ])
+
+    conn, _ = init_cache(tmp_path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        assert conn.execute("SELECT path FROM file_hashes").fetchall() == [(str(kept),)]
+        cached = get_cached_hashes(conn, kept, FileRecord.from_path(kept))
+    finally:
+        conn.close()
+    assert cached["md5"] == MD5
+    assert cached["sha256"] == SHA256
+    assert cached["exiftool_file_type"] == "JPEG"
+    assert cached["create_date"] == "2021:06:01 12:30:45.12+02:00"
+    assert cached["date_time_original"] == "2021:06:01 12:30:45"
+    assert cached["file_modify_date"] == "0000:00:00 00:00:00"
+
+
+def test_migrated_cache_opens_without_migrating_again(tmp_path):
+    _write_v1_cache(tmp_path, [])
+    init_cache(tmp_path)[0].close()
+    conn, _ = init_cache(tmp_path)
+    try:
+        columns = [info[1] for info in conn.execute("PRAGMA table_info(file_hashes)")]
+    finally:
+        conn.close()
+    assert {"mtime_ns", "last_verified", "tree_sha256", "dates_text"} <= set(columns)
+
+
+def test_updates_keep_the_fields_they_dont_give(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"hello")
+    record = FileRecord.from_path(path)
+    conn, _ = init_cache(tmp_path)
+    try:
+        set_cached_hashes(conn, path, record, {"exiftool_file_type": "JPEG", "create_date": "2021:06:01 12:30:45Z"})
+        set_cached_hashes(conn, path, record, {"md5": MD5, "sha1": SHA1, "sha256": SHA256})
+        cached = get_cached_hashes(conn, path, record)
+    finally:
+        conn.close()
+    assert cached["md5"] == MD5
+    assert cached["exiftool_file_type"] == "JPEG"
+    assert cached["create_date"] == "2021:06:01 12:30:45Z"
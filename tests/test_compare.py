@@ -0,0 +1,50 @@
+import hashlib
+
+from file_manager_meta.compare import split_and_hash_by_content, split_by_content, split_large_group
+from file_manager_meta.records import FileRecord
+
+
+def _files(tmp_path, contents):
+    records = []
+    for i, content in enumerate(contents):
+        path = tmp_path / f"f{i}.bin"
+        path.write_bytes(content)
+        records.append(FileRecord.from_path(path))
+    return records
+
+
+def _names(groups):
+    return sorted(sorted(record.path.name for record in group) for group in groups)
+
+
+def test_split_by_content_groups_identical_files(tmp_path):
+    files = _files(tmp_path, [b"aaaa" * 100, b"aaaa" * 100, b"aaab" * 100, b"aaaa" * 100, b"aaab" * 100, b"zzzz" * 100])
+    assert _names(split_by_content(files, block_size=64)) == [["f0.bin", "f1.bin", "f3.bin"], ["f2.bin", "f4.bin"]]
+
+
+def test_split_by_content_tells_apart_files_differing_in_the_last_block(tmp_path):
+    files = _files(tmp_path, [b"x" * 1000 + b"1", b"x" * 1000 + b"2"])
+    assert split_by_content(files, block_size=100) == []
+
+
+def test_files_that_disappear_are_left_out(tmp_path):
+    files = _files(tmp_path, [b"same", b"same", b"same"])
+    files[2].path.unlink()
+    assert _names(split_by_content(files)) == [["f0.bin", "f1.bin"]]
+
+
+def test_split_and_hash_gives_each_group_its_digests(tmp_path):
+    contents = [b"hello" * 1000, b"hello" * 1000, b"hellp" * 1000, b"hellp" * 1000]
+    groups = split_and_hash_by_content(_files(tmp_path, contents), block_size=256)
+    by_name = {tuple(sorted(record.path.name for record in group)): hashes for group, hashes in groups}
+    assert by_name[("f0.bin", "f1.bin")] == {"md5": hashlib.md5(contents[0]).hexdigest(),
+                                             "sha1": hashlib.sha1(contents[0]).hexdigest(),
+                                             "sha256": hashlib.sha256(contents[0]).hexdigest()}
+    assert by_name[("f2.bin", "f3.bin")]["sha256"] == hashlib.sha256(contents[2]).hexdigest()
+
+
+def test_split_large_group_matches_split_by_content(tmp_path):
+    contents = [b"%d" % (i % 3) * 50 for i in range(11)] + [b"9" * 50]
+    files = _files(tmp_path, contents)
+    assert _names(split_large_group(files, max_open_files=4)) == _names(split_by_content(files))
+    assert len(split_large_group(files, max_open_files=4)) == 3
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+from rich.console import Console
+
+from file_manager_meta.cache_manager import get_cached_hashes, init_cache, set_cached_hashes
+from file_manager_meta.deletion import TRASH_RUN_FORMAT, create_trash_run, purge_trash, remove_files
+from file_manager_meta.records import FileRecord
+
+
+def _make_files(directory, names):
+    paths = []
+    for name in names:
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(name.encode())
+        paths.append(path)
+    return paths
+
+
+def test_remove_files_deletes_and_reports_failures(tmp_path):
+    directory = tmp_path / "tree"
+    paths = _make_files(directory, ["a.txt", "sub/b.txt"])
+    missing = directory / "missing.txt"
+    removed, failures = remove_files(Console(), [*paths, missing], directory)
+    assert sorted(removed) == sorted(paths)
+    assert [path for path, _ in failures] == [missing]
+    assert not any(path.exists() for path in paths)
+
+
+def test_remove_files_drops_removed_files_from_the_cache(tmp_path):
+    directory = tmp_path / "tree"
+    kept, removed_path = _make_files(directory, ["kept.txt", "removed.txt"])
+    conn, _ = init_cache(directory)
+    try:
+        for path in (kept, removed_path):
+            set_cached_hashes(conn, path, FileRecord.from_path(path), {"md5": "00" * 16})
+        stat_info = FileRecord.from_path(removed_path)
+        remove_files(Console(), [removed_path], directory, conn=conn)
+        assert get_cached_hashes(conn, removed_path, stat_info) is None
+        assert get_cached_hashes(conn, kept, FileRecord.from_path(kept)) is not None
+    finally:
+        conn.close()
+
+
+def test_remove_files_moves_into_the_trash_keeping_relative_paths(tmp_path):
+    directory = tmp_path / "tree"
+    paths = _make_files(directory, ["a.txt", "sub/b.txt"])
+    staging_dir = create_trash_run(directory, tmp_path / "trash")
+    removed, failures = remove_files(Console(), paths, directory, staging_dir)
+    assert not failures and len(removed) == 2
+    assert (staging_dir / "a.txt").read_bytes() == b"a.txt"
+    assert (staging_dir / "sub" / "b.txt").read_bytes() == b"sub/b.txt"
+
+
+def test_trash_inside_the_directory_must_be_hidden(tmp_path):
+    directory = tmp_path / "tree"
+    directory.mkdir()
+    with pytest.raises(ValueError):
+        create_trash_run(directory, directory / "trash")
+    assert create_trash_run(directory, directory / ".trash").parent == directory / ".trash"
+
+
+def test_purge_trash_removes_old_runs_only(tmp_path):
+    trash_dir = tmp_path / "trash"
+    old_run = trash_dir / (datetime.now() - timedelta(days=10)).strftime(TRASH_RUN_FORMAT)
+    new_run = trash_dir / datetime.now().strftime(TRASH_RUN_FORMAT)
+    _make_files(old_run, ["a.txt", "deep/er/b.txt"])
+    _make_files(new_run, ["c.txt"])
+    unrelated = _make_files(trash_dir, ["notes.txt"])[0]
+
+    purge_trash(trash_dir, older_than_days=5)
+    assert not old_run.exists()
+    assert (new_run / "c.txt").exists()
+    assert unrelated.exists()
+
+    purge_trash(trash_dir)
+    assert not new_run.exists()
+    assert unrelated.exists()
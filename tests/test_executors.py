@@ -0,0 +1,93 @@
+import hashlib
+import os
+import sys
+
+import pytest
+from rich.console import Console
+
+from file_manager_meta import api
+from file_manager_meta.cache_manager import init_cache, iter_cached_paths
+from file_manager_meta.scheduler import open_executor
+from file_manager_meta.similarity import _chunk_files, _iter_cached_chunks
+from file_manager_meta.walker import walk_files
+from file_manager_meta.watcher import _CacheWarmer
+
+EXECUTOR_KINDS = ["processes", "threads"]
+
+
+@pytest.fixture
+def tree(tmp_path):
+    directory = tmp_path / "tree"
+    (directory / "sub").mkdir(parents=True)
+    (directory / "a.bin").write_bytes(b"same content" * 1000)
+    (directory / "sub" / "b.bin").write_bytes(b"same content" * 1000)
+    (directory / "c.bin").write_bytes(os.urandom(50_000))
+    (directory / "d.txt").write_bytes(b"other")
+    return directory
+
+
+@pytest.mark.parametrize("executor_kind", EXECUTOR_KINDS)
+def test_hash_files_digests(tree, executor_kind):
+    hashed = {file.path: file for file in api.hash_files(tree, executor_kind=executor_kind)}
+    assert set(hashed) == {path for path in tree.rglob("*") if path.is_file()}
+    for path, file in hashed.items():
+        content = path.read_bytes()
+        assert (file.md5, file.sha1, file.sha256) == (hashlib.md5(content).hexdigest(), hashlib.sha1(content).hexdigest(),
+                                                      hashlib.sha256(content).hexdigest())
+
+
+@pytest.mark.parametrize("executor_kind", EXECUTOR_KINDS)
+def test_find_duplicates(tree, executor_kind):
+    for verify in (False, True):
+        duplicate_sets = list(api.find_duplicates(tree, verify=verify, executor_kind=executor_kind))
+        assert [{duplicate_set.keep.path, *(record.path for record in duplicate_set.duplicates)}
+                for duplicate_set in duplicate_sets] == [{tree / "a.bin", tree / "sub" / "b.bin"}]
+
+
+def test_threads_write_the_same_cache_as_processes(tree, tmp_path, monkeypatch):
+    cached = {}
+    for executor_kind in EXECUTOR_KINDS:
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / f"cache-{executor_kind}"))
+        list(api.find_duplicates(tree, executor_kind=executor_kind))
+        conn, _ = init_cache(tree)
+        try:
+            cached[executor_kind] = conn.execute(
+                "SELECT path, md5, sha1, sha256 FROM file_hashes ORDER BY path").fetchall()
+        finally:
+            conn.close()
+    assert cached["threads"] == cached["processes"]
+    assert len(cached["threads"]) == 2  # Only the files sharing a size get hashed
+
+
+@pytest.mark.parametrize("executor_kind", EXECUTOR_KINDS)
+def test_chunk_files(tree, executor_kind):
+    records = list(walk_files(tree))
+    conn, _ = init_cache(tree)
+    try:
+        chunked = _chunk_files(records, tree, conn, Console(quiet=True), "size", None, executor_kind)
+        assert sorted(record.path for record in chunked) == sorted(record.path for record in records)
+        chunks_by_path = dict(_iter_cached_chunks(conn, records))
+    finally:
+        conn.close()
+    assert set(chunks_by_path) == {record.path for record in records}
+    assert chunks_by_path[tree / "a.bin"] == chunks_by_path[tree / "sub" / "b.bin"]
+    assert sum(length for length, _ in chunks_by_path[tree / "c.bin"]) == 50_000
+
+
+@pytest.mark.parametrize("executor_kind", EXECUTOR_KINDS)
+def test_watcher_full_rescan(tree, executor_kind):
+    warmer = _CacheWarmer(tree, executor_kind)
+    try:
+        assert warmer.full_rescan() == 4
+        assert warmer.full_rescan() == 0
+        assert set(iter_cached_paths(warmer.conn)) == {path for path in tree.rglob("*") if path.is_file()}
+    finally:
+        warmer.close()
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="nice values are per thread on Linux only")
+def test_low_priority_threads_leave_the_caller_alone():
+    before = os.getpriority(os.PRIO_PROCESS, 0)
+    with open_executor("threads", 2, low_priority=True) as executor:
+        assert executor.submit(os.getpriority, os.PRIO_PROCESS, 0).result() == 19
+    assert os.getpriority(os.PRIO_PROCESS, 0) == before
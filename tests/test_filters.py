@@ -0,0 +1,85 @@
+from pathlib import Path
+
+import pytest
+
+from file_manager_meta.filters import DEFAULT_RULES, PathFilter, parse_size
+
+
+def test_default_rules_skip_hidden_and_system_entries():
+    path_filter = PathFilter()
+    assert path_filter.excludes_file("", ".DS_Store")
+    assert path_filter.excludes_dir("photos", ".git")
+    assert path_filter.excludes_dir("", "System Volume Information")
+    assert not path_filter.excludes_file("photos", "a.jpg")
+
+
+def test_unanchored_rule_matches_at_any_depth():
+    path_filter = PathFilter(["*.tmp"])
+    assert path_filter.excludes_file("", "a.tmp")
+    assert path_filter.excludes_file("a/b/c", "a.tmp")
+    assert not path_filter.excludes_file("a", "a.txt")
+
+
+def test_anchored_rule_matches_from_the_root_only():
+    path_filter = PathFilter(["/build/", "docs/*.pdf"])
+    assert path_filter.excludes_dir("", "build")
+    assert not path_filter.excludes_dir("src", "build")
+    assert path_filter.excludes_file("docs", "manual.pdf")
+    assert not path_filter.excludes_file("src/docs", "manual.pdf")
+
+
+def test_negation_reincludes_what_an_earlier_rule_excluded():
+    path_filter = PathFilter([*DEFAULT_RULES, "*.log", "!keep.log", "!.config/"])
+    assert path_filter.excludes_file("", "debug.log")
+    assert not path_filter.excludes_file("logs", "keep.log")
+    assert not path_filter.excludes_dir("", ".config")
+    assert path_filter.excludes_dir("", ".cache")
+
+
+def test_dir_only_rule_leaves_files_of_that_name():
+    path_filter = PathFilter(["cache/"])
+    assert path_filter.excludes_dir("a", "cache")
+    assert not path_filter.excludes_file("a", "cache")
+
+
+def test_includes_keep_directories_at_any_depth_unless_anchored():
+    path_filter = PathFilter(includes=["photos/"])
+    assert not path_filter.excludes_file("photos", "a.jpg")
+    assert not path_filter.excludes_file("2020/photos/trip", "a.jpg")
+    assert path_filter.excludes_file("music", "a.mp3")
+
+    anchored = PathFilter(includes=["/photos"])
+    assert not anchored.excludes_file("photos", "a.jpg")
+    assert anchored.excludes_file("2020/photos", "a.jpg")
+
+
+def test_extensions_and_sizes():
+    path_filter = PathFilter(extensions=["JPG", ".png"], min_size=10, max_size=100)
+    assert not path_filter.excludes_file("", "a.jpg")
+    assert path_filter.excludes_file("", "a.gif")
+    assert path_filter.excludes_size(5)
+    assert not path_filter.excludes_size(50)
+    assert path_filter.excludes_size(101)
+
+
+def test_excludes_path_checks_every_parent():
+    path_filter = PathFilter()
+    root = Path("/data")
+    assert path_filter.excludes_path(root / ".trash" / "run" / "a.txt", root, is_dir=False)
+    assert not path_filter.excludes_path(root / "a" / "b.txt", root, is_dir=False)
+
+
+def test_fingerprint_follows_the_settings():
+    assert PathFilter().fingerprint == PathFilter().fingerprint
+    assert PathFilter().fingerprint != PathFilter(extensions=["jpg"]).fingerprint
+    assert PathFilter().fingerprint != PathFilter(min_size=1).fingerprint
+
+
+@pytest.mark.parametrize("value, expected", [("500", 500), ("64K", 65536), ("1.5M", 1572864), ("2GiB", 2 * 1024 ** 3)])
+def test_parse_size(value, expected):
+    assert parse_size(value) == expected
+
+
+def test_parse_size_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_size("ten")
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+
+from file_manager_meta import hashes, tuning
+from file_manager_meta.hashes import _hash_leaf, limit_leaf_reads, tree_hash_file
+from file_manager_meta.scheduler import open_executor
+from file_manager_meta.tuning import StorageProfile
+
+LEAF = 64 * 1024
+
+
+@pytest.fixture(autouse=True)
+def small_leaves(monkeypatch):
+    """Leaves of 64 KB instead of 16 MB, and no leaf limit left over from other tests."""
+    monkeypatch.setattr(hashes, "TREE_LEAF_SIZE", LEAF)
+    hashes._zero_leaf_digest.cache_clear()
+    hashes.set_leaf_slots(None)
+    yield
+    hashes._zero_leaf_digest.cache_clear()
+    hashes.set_leaf_slots(None)
+
+
+def _expected_tree_hash(content: bytes) -> str:
+    leaves = [hashlib.sha256(content[offset:offset + LEAF]).digest() for offset in range(0, len(content), LEAF)]
+    return hashlib.sha256(b"".join(leaves)).hexdigest()
+
+
+def test_tree_hash_file(tmp_path):
+    content = os.urandom(5 * LEAF + 1234)  # The last leaf is short
+    path = tmp_path / "big.bin"
+    path.write_bytes(content)
+    assert tree_hash_file(path, len(content)) == _expected_tree_hash(content)
+    # A file that changed size since it was listed
+    assert tree_hash_file(path, len(content) + 1) is None
+    assert tree_hash_file(tmp_path / "missing.bin", 1) is None
+
+
+def test_tree_hash_of_sparse_file(tmp_path):
+    path = tmp_path / "sparse.bin"
+    with open(path, "wb") as f:
+        f.truncate(8 * LEAF)
+        f.seek(3 * LEAF + 100)
+        f.write(b"data")
+    assert tree_hash_file(path, 8 * LEAF) == _expected_tree_hash(path.read_bytes())
+
+
+def test_hash_leaf_without_preadv(tmp_path):
+    content = os.urandom(2 * LEAF + 10)
+    path = tmp_path / "file.bin"
+    path.write_bytes(content)
+    # fd None: the leaf opens the file itself
+    assert _hash_leaf(path, None, None, LEAF) == (hashlib.sha256(content[LEAF:2 * LEAF]).digest(), LEAF, LEAF)
+    assert _hash_leaf(path, None, None, 2 * LEAF) == (hashlib.sha256(content[2 * LEAF:]).digest(), 10, 10)
+
+
+def test_leaf_reads_respect_the_run_limit(tmp_path, monkeypatch):
+    content = os.urandom(12 * LEAF)
+    path = tmp_path / "big.bin"
+    path.write_bytes(content)
+    lock = threading.Lock()
+    active = [0, 0]  # Now, most at once
+
+    def slow_read(length):
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+
+    monkeypatch.setattr(hashes, "throttle_read", slow_read)
+    monkeypatch.setattr(hashes, "_buffer_pool", hashes.BufferPool(LEAF // 4))  # Several reads per leaf
+    limit_leaf_reads(1)
+    assert hashes._get_leaf_executor()._max_workers == 1
+    # Two files hashed at once, like two workers of a thread pool, still read one leaf at a time
+    with open_executor("threads", 2) as executor:
+        results = list(executor.map(lambda _: tree_hash_file(path, len(content)), range(2)))
+    assert results == [_expected_tree_hash(content)] * 2
+    assert active[1] == 1
+
+
+def _worker_leaf_limit():
+    return hashes.leaf_slots()[0]
+
+
+def test_process_workers_share_the_leaf_limit():
+    limit_leaf_reads(3)
+    with open_executor("processes", 2) as executor:
+        assert executor.submit(_worker_leaf_limit).result() == 3
+
+
+@pytest.mark.parametrize("kind, device_workers, expected", [("hdd", None, 1), ("ssd", None, 6), ("hdd", 2, 2)])
+def test_tune_sizes_the_leaf_limit(tmp_path, monkeypatch, kind, device_workers, expected):
+    monkeypatch.setattr(tuning, "storage_profile", lambda directory: StorageProfile(kind, 6, 1024 * 1024, None, True))
+    monkeypatch.setattr(tuning, "is_rotational", lambda dev: False)
+    monkeypatch.setattr(tuning, "_active", None)
+    try:
+        tuning.tune(tmp_path, device_workers)
+    finally:
+        tuning.apply(None)
+    assert hashes.leaf_slots()[0] == expected
@@ -0,0 +1,17 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+# Each command imports what it needs, so the CLI itself must start without these
+LAZY_MODULES = ["exiftool", "sqlite3", "concurrent.futures"]
+
+
+def test_cli_import_leaves_heavy_modules_unloaded():
+    probe = f"import json, sys; import file_manager_meta.cli; print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    env = {**os.environ, "PYTHONPATH": str(SRC)}
+    result = subprocess.run([sys.executable, "-c", probe], env=env, capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout) == []
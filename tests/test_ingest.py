@@ -0,0 +1,124 @@
+import hashlib
+import os
+import random
+
+import pytest
+import typer
+
+from file_manager_meta import api
+from file_manager_meta.cache_manager import init_cache
+from file_manager_meta.ingest import BloomFilter, LibraryIndex, check_ingest
+from file_manager_meta.records import FileRecord
+
+
+def _key(rng: random.Random) -> tuple[int, bytes]:
+    return rng.randrange(1, 10 ** 9), rng.randbytes(16)
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    rng = random.Random(1)
+    keys = [_key(rng) for _ in range(5000)]
+    bloom = BloomFilter(len(keys))
+    for size, md5 in keys:
+        bloom.add(size, md5)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(_key(rng) in bloom for _ in range(20_000))
+    assert false_positives < 20_000 * 0.02
+
+
+def _hash_library(library):
+    for _ in api.hash_files(library, executor_kind="threads"):
+        pass
+
+
+@pytest.fixture
+def library(tmp_path):
+    directory = tmp_path / "library"
+    (directory / "photos").mkdir(parents=True)
+    (directory / "photos" / "kept.jpg").write_bytes(b"photo" * 1000)
+    (directory / "doc.txt").write_bytes(b"document" * 100)
+    _hash_library(directory)
+    return directory
+
+
+@pytest.fixture
+def incoming(tmp_path):
+    directory = tmp_path / "incoming"
+    (directory / "camera").mkdir(parents=True)
+    (directory / "camera" / "copy.jpg").write_bytes(b"photo" * 1000)
+    (directory / "camera" / "new.jpg").write_bytes(b"other" * 1000)  # Same size as a library file
+    (directory / "notes.txt").write_bytes(b"new notes")
+    return directory
+
+
+def test_library_index_finds_unchanged_library_files(library, incoming):
+    copy = FileRecord.from_path(incoming / "camera" / "copy.jpg")
+    hashes = {"md5": hashlib.md5(b"photo" * 1000).hexdigest(), "sha256": hashlib.sha256(b"photo" * 1000).hexdigest()}
+    conn, _ = init_cache(library)
+    try:
+        index = LibraryIndex(conn)
+        assert index.file_count == 2
+        assert index.has_size(5000) and not index.has_size(9)
+        assert index.find(copy, hashes) == library / "photos" / "kept.jpg"
+        # Same MD5, different content
+        assert index.find(copy, {**hashes, "sha256": "0" * 64}) is None
+        # The library file changed since it was hashed
+        os.utime(library / "photos" / "kept.jpg", ns=(0, 0))
+        assert index.find(copy, hashes) is None
+    finally:
+        conn.close()
+
+
+def test_skip_prints_only_new_files(library, incoming, capsys):
+    check_ingest(incoming, library, action="skip", executor_kind="threads")
+    printed = capsys.readouterr().out.split()
+    assert sorted(printed) == [str(incoming / "camera" / "new.jpg"), str(incoming / "notes.txt")]
+    assert (incoming / "camera" / "copy.jpg").exists()
+
+
+def test_quarantine_moves_duplicates_under_their_relative_path(library, incoming, tmp_path):
+    quarantine = tmp_path / "quarantine"
+    check_ingest(incoming, library, action="quarantine", quarantine_dir=quarantine, executor_kind="threads")
+    assert not (incoming / "camera" / "copy.jpg").exists()
+    assert (quarantine / "camera" / "copy.jpg").read_bytes() == b"photo" * 1000
+    assert (incoming / "camera" / "new.jpg").exists()
+
+    # A duplicate whose place in the quarantine is taken stays where it is, and the run fails
+    (incoming / "camera" / "copy.jpg").write_bytes(b"photo" * 1000)
+    with pytest.raises(typer.Exit) as exc_info:
+        check_ingest(incoming, library, action="quarantine", quarantine_dir=quarantine, executor_kind="threads")
+    assert exc_info.value.exit_code == 1
+    assert (incoming / "camera" / "copy.jpg").exists()
+
+
+def test_quarantine_inside_the_ingest_folder_is_refused(library, incoming):
+    with pytest.raises(typer.Exit):
+        check_ingest(incoming, library, action="quarantine", quarantine_dir=incoming / "dups")
+    # Hidden directories aren't walked, so they can hold the quarantine
+    check_ingest(incoming, library, action="quarantine", quarantine_dir=incoming / ".dups", executor_kind="threads")
+    assert (incoming / ".dups" / "camera" / "copy.jpg").exists()
+
+
+def test_an_ingest_folder_inside_the_library_is_not_its_own_duplicate(library):
+    incoming = library / "incoming"
+    incoming.mkdir()
+    (incoming / "only_here.bin").write_bytes(b"unique" * 100)
+    (incoming / "also_in_photos.jpg").write_bytes(b"photo" * 1000)
+    _hash_library(library)  # The library's cache now holds the incoming files too
+
+    checked = {result.path.name: result for result in api.check_ingest(incoming, library, executor_kind="threads")}
+    assert checked["only_here.bin"].library_file is None
+    assert checked["also_in_photos.jpg"].library_file == library / "photos" / "kept.jpg"
+
+
+def test_api_check_ingest(library, incoming, tmp_path):
+    quarantine = tmp_path / "quarantine"
+    checked = sorted(api.check_ingest(incoming, library, quarantine, executor_kind="threads"))
+    assert checked == [
+        api.IngestedFile(incoming / "camera" / "copy.jpg", library / "photos" / "kept.jpg",
+                         quarantine / "camera" / "copy.jpg", None),
+        api.IngestedFile(incoming / "camera" / "new.jpg", None, None, None),
+        api.IngestedFile(incoming / "notes.txt", None, None, None),
+    ]
+    with pytest.raises(ValueError):
+        list(api.check_ingest(incoming, library, incoming / "dups"))
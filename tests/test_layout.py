@@ -0,0 +1,60 @@
+from file_manager_meta import layout
+from file_manager_meta.layout import physical_sort_keys, resolve_read_order
+from file_manager_meta.records import FileRecord
+
+
+def _records(tmp_path, count: int) -> list[FileRecord]:
+    records = []
+    for index in range(count):
+        path = tmp_path / f"{index}.bin"
+        path.write_bytes(b"x" * (index + 1))
+        records.append(FileRecord.from_path(path))
+    return records
+
+
+def test_physical_sort_keys_by_inode(tmp_path, monkeypatch):
+    asked = []
+    monkeypatch.setattr(layout, "first_extent_offset", asked.append)
+    records = _records(tmp_path, 3)
+    assert physical_sort_keys(records, use_fiemap=False) == [(record.dev, 1, record.ino) for record in records]
+    assert asked == []
+
+
+def test_physical_sort_keys_by_extent(tmp_path, monkeypatch):
+    records = _records(tmp_path, 3)
+    offsets = {records[0].path: 8192, records[1].path: 4096, records[2].path: None}
+    monkeypatch.setattr(layout.sys, "platform", "linux")
+    monkeypatch.setattr(layout, "first_extent_offset", offsets.get)
+    keys = physical_sort_keys(records, use_fiemap=True)
+    assert keys[:2] == [(records[0].dev, 0, 8192), (records[1].dev, 0, 4096)]
+    # A file without an extent falls back to its inode, after the files sorted by offset
+    assert keys[2] == (records[2].dev, 1, records[2].ino)
+    assert sorted(range(3), key=keys.__getitem__) == [1, 0, 2]
+
+
+def test_physical_sort_keys_stop_asking_a_device_without_fiemap(tmp_path, monkeypatch):
+    records = _records(tmp_path, 3)
+    empty = FileRecord(tmp_path / "empty", 0, 0, 0, records[0].dev, 1)
+    asked = []
+
+    def no_fiemap(path):
+        asked.append(path)
+        return None
+
+    monkeypatch.setattr(layout.sys, "platform", "linux")
+    monkeypatch.setattr(layout, "first_extent_offset", no_fiemap)
+    keys = physical_sort_keys([empty, *records], use_fiemap=True)
+    assert keys == [(record.dev, 1, record.ino) for record in (empty, *records)]
+    # An empty file has no extents anyway, so only the first file with data decides
+    assert asked == [empty.path, records[0].path]
+
+
+def test_resolve_read_order(tmp_path, monkeypatch):
+    assert resolve_read_order(tmp_path, "inode") == "inode"
+    monkeypatch.setattr(layout, "is_rotational", lambda dev: False)
+    assert resolve_read_order(tmp_path, "auto") == "size"
+    monkeypatch.setattr(layout, "is_rotational", lambda dev: True)
+    monkeypatch.setattr(layout.sys, "platform", "linux")
+    assert resolve_read_order(tmp_path, "auto") == "fiemap"
+    monkeypatch.setattr(layout.sys, "platform", "darwin")
+    assert resolve_read_order(tmp_path, "auto") == "inode"
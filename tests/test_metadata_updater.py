@@ -0,0 +1,13 @@
+from file_manager_meta import filters
+from file_manager_meta.metadata_updater import _walk_all_files
+
+
+def test_dates_are_updated_in_every_file_hidden_ones_included(tmp_path, monkeypatch):
+    for relative_path in ["20200101_a.jpg", ".20200102_b.jpg", ".hidden/20200103_c.jpg", "sub/20200104_d.jpg"]:
+        path = tmp_path / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+    # The run's filter doesn't apply: the user pointed at these files
+    monkeypatch.setattr(filters, "_active", filters.PathFilter(["sub/"]))
+    names = sorted(record.path.name for record in _walk_all_files(tmp_path))
+    assert names == [".20200102_b.jpg", "20200101_a.jpg", "20200103_c.jpg", "20200104_d.jpg"]
@@ -0,0 +1,54 @@
+from file_manager_meta.metrics import Metrics, measured_call, metrics, timed_call
+
+
+def _work(files: int) -> str:
+    metrics.count("files_walked", files)
+    with metrics.timer("hashing"):
+        pass
+    return "done"
+
+
+def test_measured_call_results_are_absorbed_by_the_parent():
+    parent = Metrics()
+    parent.count("files_walked", 2)
+    # Each call starts from clean metrics, as a worker process reused for several tasks would
+    for files in (3, 4):
+        assert parent.absorb(measured_call(_work, files)) == "done"
+    assert parent.counters["files_walked"] == 9
+    assert "hashing" in parent.timers
+    assert parent.worker_busy_seconds > 0
+
+
+def test_timed_call_only_returns_the_busy_time():
+    result, counters, timers, busy_seconds = timed_call(sum, [1, 2])
+    assert (result, counters, timers) == (3, {}, {})
+    assert busy_seconds >= 0
+
+
+def test_write_prometheus(tmp_path):
+    run = Metrics()
+    run.command = "deduplicate"
+    run.count("files_walked", 5)
+    run.count("cache_hits_full", 3)
+    run.count("cache_misses", 1)
+    with run.phase("walk"):
+        pass
+    with run.timer("cache_lookup"):
+        pass
+    path = tmp_path / "fmm.prom"
+    run.write_prometheus(path)
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert not (tmp_path / "fmm.prom.tmp").exists()
+    samples = dict(line.rsplit(" ", 1) for line in lines if not line.startswith("#"))
+    labels = 'command="deduplicate"'
+    assert samples[f'file_manager_meta_count{{{labels},name="files_walked"}}'] == "5"
+    assert samples[f'file_manager_meta_ratio{{{labels},name="cache_full_hit_rate"}}'] == "0.75"
+    assert f'file_manager_meta_phase_seconds{{{labels},phase="walk"}}' in samples
+    assert f'file_manager_meta_timer_seconds{{{labels},operation="cache_lookup"}}' in samples
+    # Ratios without a denominator (no worker pool here) are left out rather than written as None
+    assert f'file_manager_meta_ratio{{{labels},name="worker_utilization"}}' not in samples
+    assert all(float(value) >= 0 for value in samples.values())
+    # Every metric has its HELP and TYPE lines
+    names = {sample.split("{")[0] for sample in samples}
+    assert all(f"# TYPE {name} gauge" in lines for name in names)
@@ -0,0 +1,18 @@
+from rich.console import Console
+
+from file_manager_meta.pipeline import _sort_stage
+from file_manager_meta.walker import walk_files
+
+
+def test_dry_run_sorts_files_under_their_planned_repair_names(tmp_path):
+    directory = tmp_path / "tree"
+    directory.mkdir()
+    (directory / "a.txt").write_bytes(b"a")
+    (directory / "photo").write_bytes(b"b")
+    (directory / "unknown").write_bytes(b"c")
+    records = list(walk_files(directory))
+    planned_renames = {directory / "photo": directory / "photo.jpg"}
+
+    assert _sort_stage(Console(), records, directory, directory, "ext", None, None, True) == (1, 2)
+    assert _sort_stage(Console(), records, directory, directory, "ext", None, None, True, planned_renames) == (2, 1)
+    assert sorted(path.name for path in directory.iterdir()) == ["a.txt", "photo", "unknown"]
@@ -0,0 +1,74 @@
+from pathlib import Path
+
+import pytest
+
+from file_manager_meta.records import FileRecord
+from file_manager_meta.scan_store import MemoryScanStore, SpilledScanStore, open_scan_store
+
+
+def _records(count):
+    # More rows than one spilled batch holds, spread over a few directories and sizes
+    return [FileRecord(Path(f"/data/d{i % 7}/f{i}.bin"), i % 13, i, i, 1, i) for i in range(count)]
+
+
+def _paths(groups):
+    return sorted(sorted(str(record.path) for record in group) for group in groups)
+
+
+@pytest.fixture
+def stores(tmp_path):
+    memory, spilled = MemoryScanStore(), SpilledScanStore(1, temp_dir=tmp_path)
+    yield memory, spilled
+    memory.close()
+    spilled.close()
+
+
+def test_open_scan_store_spills_only_with_a_limit():
+    store = open_scan_store(64)
+    try:
+        assert isinstance(store, SpilledScanStore)
+    finally:
+        store.close()
+    assert isinstance(open_scan_store(), MemoryScanStore)
+
+
+def test_spilled_store_gives_the_same_groups_as_memory(stores):
+    records = _records(2500)
+    for store in stores:
+        store.add_all(records)
+    memory, spilled = stores
+    assert len(spilled) == len(memory) == 2500
+    assert spilled.total_size() == memory.total_size()
+    assert _paths(spilled.iter_size_groups()) == _paths(memory.iter_size_groups())
+    assert [group[0].size for group in spilled.iter_size_groups()] == list(range(12, -1, -1))
+    assert sorted(spilled.iter_size_counts()) == sorted(memory.iter_size_counts())
+    assert [record.size for record in spilled.iter_files_by_size()] == \
+           [record.size for record in memory.iter_files_by_size()]
+    assert [(directory, [r.path for r in files]) for directory, files in spilled.iter_directories()] == \
+           [(directory, [r.path for r in files]) for directory, files in memory.iter_directories()]
+
+
+def test_spilled_records_keep_their_stat_fields(stores):
+    _, spilled = stores
+    record = FileRecord(Path("/data/a.txt"), 5, 123456789, 987654321, 42, 7)
+    spilled.add_all([record, FileRecord(Path("/data/b.txt"), 5, 1, 1, 42, 8)])
+    first = next(r for r in spilled.iter_files_by_size() if r.path == record.path)
+    assert (first.size, first.mtime_ns, first.ctime_ns, first.dev, first.ino) == (5, 123456789, 987654321, 42, 7)
+
+
+def test_duplicate_sets_only_hold_shared_keys(stores):
+    records = _records(2500)
+    for store in stores:
+        for record in records:
+            store.add_match(record, f"key{record.ino % 1200}" if record.ino < 2400 else f"unique{record.ino}")
+    memory, spilled = stores
+    spilled_sets = dict(spilled.iter_duplicate_sets())
+    assert len(spilled_sets) == 1200
+    assert _paths(spilled_sets.values()) == _paths(files for _, files in memory.iter_duplicate_sets())
+
+
+def test_close_removes_the_spill_file(tmp_path):
+    store = SpilledScanStore(1, temp_dir=tmp_path)
+    store.add_all(_records(10))
+    store.close()
+    assert not list(tmp_path.glob("fmm_scan_*.db"))
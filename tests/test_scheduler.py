@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from file_manager_meta import scheduler
+from file_manager_meta.records import FileRecord
+from file_manager_meta.scheduler import (ITEM_OVERHEAD_BYTES, _dispatch_per_device, bounded_map, iter_batches,
+                                         open_executor, schedule)
+
+
+class _Concurrency:
+    """Counts the calls running at once, per key."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = defaultdict(int)
+        self.most = defaultdict(int)
+
+    def run(self, key, seconds: float = 0.01):
+        with self.lock:
+            self.active[key] += 1
+            self.most[key] = max(self.most[key], self.active[key])
+        time.sleep(seconds)
+        with self.lock:
+            self.active[key] -= 1
+
+
+def test_iter_batches():
+    target = 10 * ITEM_OVERHEAD_BYTES
+    sizes = [0] * 12 + [target] + [0] * 3
+    batches = list(iter_batches(sizes, lambda size: size, target))
+    # Small items fill a batch until it reaches the target, a large one goes alone without cutting the batch short
+    assert [len(batch) for batch in batches] == [10, 1, 5]
+    assert batches[1] == [target]
+    assert [len(batch) for batch in iter_batches([0] * 7, lambda size: size, target, max_items=3)] == [3, 3, 1]
+    assert list(iter_batches([], lambda size: size, target)) == []
+
+
+def test_bounded_map_limits_the_tasks_in_flight():
+    concurrency = _Concurrency()
+    pulled = []
+
+    def items():
+        for item in range(10):
+            pulled.append(item)
+            yield item
+
+    def work(item):
+        concurrency.run("all")
+        return item * 2
+
+    with open_executor("threads", 6) as executor:
+        seen = 0
+        for item, result in bounded_map(executor, work, items(), max_in_flight=3):
+            assert result == item * 2
+            seen += 1
+            # Items are pulled lazily: no more than max_in_flight ahead of what was yielded
+            assert len(pulled) - seen < 3
+    assert seen == 10
+    assert concurrency.most["all"] <= 3
+
+
+def test_dispatch_per_device_limits_each_device():
+    concurrency = _Concurrency()
+
+    def work(batch):
+        dev, index = batch
+        concurrency.run(dev)
+        return index
+
+    batches_by_device = {1: iter([(1, index) for index in range(6)]), 2: iter([(2, index) for index in range(6)])}
+    with open_executor("threads", 8) as executor:
+        finished = list(_dispatch_per_device(executor, work, batches_by_device, {1: 1, 2: 3}, max_in_flight=8))
+    assert sorted(batch for batch, _ in finished) == [(dev, index) for dev in (1, 2) for index in range(6)]
+    assert all(batch[1] == result for batch, result in finished)
+    assert concurrency.most[1] == 1
+    assert 1 < concurrency.most[2] <= 3
+    # One batch at a time reads the device's batches in their order
+    assert [index for (dev, index), _ in finished if dev == 1] == list(range(6))
+
+
+def test_dispatch_per_device_respects_max_in_flight():
+    concurrency = _Concurrency()
+
+    def work(batch):
+        concurrency.run("all")
+        return batch
+
+    batches_by_device = {dev: iter([dev] * 4) for dev in range(4)}
+    with open_executor("threads", 8) as executor:
+        finished = list(_dispatch_per_device(executor, work, batches_by_device, dict.fromkeys(range(4), 4), max_in_flight=2))
+    assert len(finished) == 16
+    assert concurrency.most["all"] <= 2
+
+
+def test_schedule_in_disk_order(tmp_path, monkeypatch):
+    records = []
+    for index in range(5):
+        path = tmp_path / f"{index}.bin"
+        path.write_bytes(b"x" * index)
+        records.append(FileRecord.from_path(path))
+    monkeypatch.setattr(scheduler, "is_rotational", lambda dev: True)
+    with open_executor("threads", 4) as executor:
+        results = dict(schedule(executor, lambda record: record.size, records, 4, lambda record: record.size,
+                                read_order="inode"))
+    assert {record.path: size for record, size in results.items()} == {record.path: record.size for record in records}
+
+
+def test_schedule_by_size_yields_every_item():
+    items = [Path(f"{index}") for index in range(40)]
+    with open_executor("threads", 3) as executor:
+        results = list(schedule(executor, str, items, 3, lambda item: int(item.name) * 1024, largest_first=True))
+    assert sorted(results) == sorted((item, str(item)) for item in items)
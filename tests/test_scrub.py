@@ -0,0 +1,59 @@
+import os
+
+import pytest
+import typer
+
+from file_manager_meta.cache_manager import get_cached_hashes, init_cache
+from file_manager_meta.hashes import calculate_hashes
+from file_manager_meta.records import FileRecord
+from file_manager_meta.scrub import scrub_cache
+
+
+@pytest.fixture
+def hashed_tree(tmp_path):
+    directory = tmp_path / "tree"
+    directory.mkdir()
+    paths = []
+    for name in ("f1.bin", "f2.bin", "f3.bin"):
+        path = directory / name
+        path.write_bytes(bytes(100_000))
+        paths.append(path)
+    conn, _ = init_cache(directory)
+    try:
+        for path in paths:
+            calculate_hashes(FileRecord.from_path(path), conn)
+    finally:
+        conn.close()
+    return directory, paths
+
+
+def _corrupt(path):
+    """Changes one byte without touching the modification time, as bit rot would."""
+    stat_info = os.stat(path)
+    with open(path, "r+b") as f:
+        f.seek(10)
+        f.write(b"x")
+    os.utime(path, ns=(stat_info.st_atime_ns, stat_info.st_mtime_ns))
+
+
+def test_clean_tree_passes(hashed_tree):
+    directory, _ = hashed_tree
+    scrub_cache(directory, executor_kind="threads")
+
+
+def test_mismatch_exits_with_an_error_and_drops_the_digests(hashed_tree):
+    directory, (corrupt, intact, _) = hashed_tree
+    _corrupt(corrupt)
+    with pytest.raises(typer.Exit) as exc_info:
+        scrub_cache(directory, executor_kind="threads")
+    assert exc_info.value.exit_code == 1
+
+    conn, _ = init_cache(directory)
+    try:
+        assert get_cached_hashes(conn, corrupt, FileRecord.from_path(corrupt))["md5"] is None
+        assert get_cached_hashes(conn, intact, FileRecord.from_path(intact))["md5"] is not None
+        # The next hashing run stores the digests of what the file now holds
+        assert calculate_hashes(FileRecord.from_path(corrupt), conn)["md5"] != \
+               calculate_hashes(FileRecord.from_path(intact), conn)["md5"]
+    finally:
+        conn.close()
@@ -0,0 +1,74 @@
+import pytest
+import typer
+
+from file_manager_meta.sharding import merge_shards, scan_shard, shard_of
+
+
+def _names_in(shard_index, count, shard_count=2):
+    """Top-level names that fall into the given shard."""
+    names = (f"dir{i}" for i in range(1000))
+    return [name for name in names if shard_of(name, shard_count) == shard_index][:count]
+
+
+@pytest.fixture
+def tree(tmp_path):
+    directory = tmp_path / "tree"
+    (first,), (second,) = _names_in(1, 1), _names_in(2, 1)
+    # One duplicate pair within the first shard, one only across shards, and a file of a size shared across shards
+    for relative_path, content in [(f"{first}/a.txt", b"same"), (f"{first}/b.txt", b"same"),
+                                   (f"{first}/c.txt", b"cross"), (f"{second}/c.txt", b"cross"),
+                                   (f"{second}/d.txt", b"other")]:
+        path = directory / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return directory
+
+
+def _scan(directory, kind, tmp_path):
+    shard_files = []
+    for index in (1, 2):
+        output = tmp_path / f"{kind}-{index}.fmm"
+        scan_shard(directory, kind, index, 2, output, executor_kind="threads")
+        shard_files.append(output)
+    return shard_files
+
+
+def _remaining(directory):
+    return sorted(path.relative_to(directory).as_posix() for path in directory.rglob("*") if path.is_file())
+
+
+def test_merge_finds_duplicates_within_and_across_shards(tree, tmp_path):
+    merge_shards(tree, _scan(tree, "deduplicate", tmp_path), delete=True, executor_kind="threads")
+    names = [path.split("/")[1] for path in _remaining(tree)]
+    # One of each duplicate pair is kept
+    assert len(names) == 3 and {"c.txt", "d.txt"} < set(names) and len({"a.txt", "b.txt"} & set(names)) == 1
+
+
+def test_merge_without_delete_leaves_files(tree, tmp_path):
+    before = _remaining(tree)
+    merge_shards(tree, _scan(tree, "report", tmp_path), output=tmp_path / "report.html", executor_kind="threads")
+    assert _remaining(tree) == before
+    assert "File Hashes" in (tmp_path / "report.html").read_text(encoding="utf-8")
+
+
+def test_merge_rejects_missing_or_repeated_shards(tree, tmp_path):
+    first, _ = _scan(tree, "deduplicate", tmp_path)
+    with pytest.raises(typer.Exit):
+        merge_shards(tree, [first])
+    with pytest.raises(typer.Exit):
+        merge_shards(tree, [first, first])
+
+
+def test_merge_rejects_shards_of_another_directory(tree, tmp_path):
+    shard_files = _scan(tree, "deduplicate", tmp_path)
+    other = tmp_path / "other"
+    other.mkdir()
+    with pytest.raises(typer.Exit):
+        merge_shards(other, shard_files)
+
+
+def test_merge_rejects_shards_of_different_kinds(tree, tmp_path):
+    deduplicate_first, _ = _scan(tree, "deduplicate", tmp_path)
+    _, report_second = _scan(tree, "report", tmp_path)
+    with pytest.raises(typer.Exit):
+        merge_shards(tree, [deduplicate_first, report_second])
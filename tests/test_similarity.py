@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from file_manager_meta import chunking, similarity
+from file_manager_meta.chunking import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, _cut_point, _mix, chunk_file
+from file_manager_meta.similarity import SpilledPostings, _group_identical, _score_pairs, open_postings
+
+
+def _cut_points(data: bytes) -> list[int]:
+    mixed = _mix(data)
+    cuts = [0]
+    while cuts[-1] < len(data):
+        cuts.append(_cut_point(mixed, cuts[-1], len(data)))
+    return cuts[1:]
+
+
+def test_cut_points_move_with_inserted_content():
+    data = random.Random(1).randbytes(2 * 1024 * 1024)
+    cuts = _cut_points(data)
+    assert all(MIN_CHUNK_SIZE < b - a <= MAX_CHUNK_SIZE for a, b in zip([0] + cuts, cuts[:-1]))
+
+    prefix = b"a few inserted bytes"
+    shifted = _cut_points(prefix + data)
+    # Past the chunk the insertion landed in, every cut point is the same, just offset by the insertion
+    assert {cut - len(prefix) for cut in shifted[1:]} == set(cuts[1:])
+
+
+def test_cut_points_ignore_the_offset_of_the_buffer():
+    data = random.Random(2).randbytes(512 * 1024)
+    cuts = _cut_points(data)
+    # Cutting from one of the cut points gives the same remaining cuts, whatever precedes it in the buffer
+    start = cuts[3]
+    assert [start + cut for cut in _cut_points(data[start:])] == cuts[4:]
+
+
+def test_chunk_file_does_not_depend_on_read_size(tmp_path, monkeypatch):
+    data = random.Random(3).randbytes(1024 * 1024)
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    chunks = chunk_file(path)
+    assert [length for length, _ in chunks] == [b - a for a, b in zip([0] + _cut_points(data), _cut_points(data))]
+    monkeypatch.setattr(chunking, "READ_SIZE", 100_000)
+    assert chunk_file(path) == chunks
+
+
+def test_chunk_file_of_repeated_bytes(tmp_path):
+    path = tmp_path / "zeros.bin"
+    path.write_bytes(bytes(300_000))
+    chunks = chunk_file(path)
+    assert sum(length for length, _ in chunks) == 300_000
+    assert all(MIN_CHUNK_SIZE < length <= MAX_CHUNK_SIZE for length, _ in chunks[:-1])
+    assert chunk_file(tmp_path / "missing.bin") is None
+
+
+@pytest.fixture(params=["memory", "spilled"])
+def postings(request, tmp_path):
+    postings = open_postings() if request.param == "memory" else SpilledPostings(1, temp_dir=tmp_path)
+    yield postings
+    postings.close()
+
+
+def _chunks(*names: str) -> list[tuple[int, bytes]]:
+    # Chunk "x" is 10 bytes long, "yy" 20...
+    return [(10 * len(name), name.encode()) for name in names]
+
+
+def test_score_pairs(postings):
+    chunk_lists = [
+        ("/a", _chunks("x", "yy", "zzz")),
+        ("/b", _chunks("x", "yy", "zzz")),  # Identical to a
+        ("/c", _chunks("x", "yy", "zzz", "x", "wwww")),  # a plus a repeated chunk and a new one
+        ("/d", _chunks("vvvvv")),
+    ]
+    groups, distinct_bytes = _group_identical(chunk_lists, postings)
+    assert groups == [["/a", "/b"], ["/c"], ["/d"]]
+    assert distinct_bytes == [60, 100, 50]
+    assert postings.unique_bytes() == 150
+
+    assert _score_pairs(postings, distinct_bytes, 0.5) == [(0.6, 1.0, 60, 0, 1)]
+    assert _score_pairs(postings, distinct_bytes, 0.7) == []
+
+
+def test_score_pairs_skips_chunks_shared_by_too_many_files(postings, monkeypatch):
+    monkeypatch.setattr(similarity, "MAX_CHUNK_POSTINGS", 2)
+    chunk_lists = [(f"/{i}", _chunks("common", f"own{i}")) for i in range(3)] + [("/3", _chunks("own0", "common", "more"))]
+    groups, distinct_bytes = _group_identical(chunk_lists, postings)
+    assert len(groups) == 4
+    # Only own0 counts for the 0-3 pair: "common" is in four files
+    assert _score_pairs(postings, distinct_bytes, 0.0) == [(40 / 200, 40 / 100, 40, 0, 3)]
@@ -0,0 +1,75 @@
+import hashlib
+import os
+
+import pytest
+
+from file_manager_meta.hashes import _calculate_hashes_from_file
+from file_manager_meta.sparse import ExtentMap, extent_map, update_with_zeros
+
+MB = 1024 * 1024
+
+
+def _make_sparse(path, size, chunks):
+    """Writes the given (offset, data) chunks into a file of size bytes, leaving the rest as holes."""
+    with open(path, "wb") as f:
+        f.truncate(size)
+        for offset, data in chunks:
+            f.seek(offset)
+            f.write(data)
+    content = bytearray(size)
+    for offset, data in chunks:
+        content[offset:offset + len(data)] = data
+    return bytes(content)
+
+
+def _extent_map_of(path):
+    with open(path, "rb") as f:
+        return extent_map(f.fileno())
+
+
+def test_extent_map_segments():
+    extents = ExtentMap([(10, 20), (40, 50)], 60)
+    assert extents.data_bytes() == 20
+    assert list(extents.segments(0, 60)) == [(0, 10, False), (10, 20, True), (20, 40, False), (40, 50, True),
+                                             (50, 60, False)]
+    assert list(extents.segments(15, 45)) == [(15, 20, True), (20, 40, False), (40, 45, True)]
+    assert extents.is_hole(20, 40)
+    assert not extents.is_hole(15, 25)
+    assert extents.next_data(25) == 40
+    assert extents.next_data(12) == 12
+    assert extents.next_data(55) == 60
+
+
+def test_update_with_zeros_matches_reading_zeros():
+    fed, read = hashlib.sha256(), hashlib.sha256()
+    update_with_zeros([fed], 3 * MB + 5)
+    read.update(bytes(3 * MB + 5))
+    assert fed.hexdigest() == read.hexdigest()
+
+
+def test_file_without_holes_has_no_extent_map(tmp_path):
+    path = tmp_path / "dense.bin"
+    path.write_bytes(os.urandom(64 * 1024))
+    assert _extent_map_of(path) is None
+
+
+def test_sparse_file_is_mapped_and_hashed_as_read(tmp_path):
+    path = tmp_path / "sparse.bin"
+    content = _make_sparse(path, 8 * MB, [(MB, b"x" * 4096), (6 * MB, os.urandom(MB))])
+    extents = _extent_map_of(path)
+    if extents is None:
+        pytest.skip("the filesystem of the temporary directory doesn't report holes")
+    assert extents.size == 8 * MB
+    assert extents.is_hole(0, MB)
+    assert not extents.is_hole(MB, MB + 4096)
+    assert extents.data_bytes() < 8 * MB
+
+    hashes = _calculate_hashes_from_file(path)
+    assert hashes == {"md5": hashlib.md5(content).hexdigest(), "sha1": hashlib.sha1(content).hexdigest(),
+                      "sha256": hashlib.sha256(content).hexdigest()}
+
+
+def test_file_ending_in_a_hole_is_hashed_whole(tmp_path):
+    path = tmp_path / "tail.bin"
+    content = _make_sparse(path, 4 * MB, [(0, b"head")])
+    assert _calculate_hashes_from_file(path)["sha256"] == hashlib.sha256(content).hexdigest()
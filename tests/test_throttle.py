@@ -0,0 +1,99 @@
+import pytest
+
+from file_manager_meta import throttle
+
+
+class FakeClock:
+    """Stands in for the time module: sleeping only moves the clock forward."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(throttle, "time", fake)
+    # configure() sets module globals; restored after each test
+    monkeypatch.setattr(throttle, "_settings", None)
+    monkeypatch.setattr(throttle, "_state", None)
+    return fake
+
+
+def test_no_limits_never_sleep(clock):
+    for _ in range(1000):
+        throttle.throttle_open()
+        throttle.throttle_read(1024 * 1024)
+    assert clock.slept == 0
+
+
+def test_open_rate_allows_a_burst_then_holds_the_rate(clock):
+    throttle.configure(max_open_rate=10)
+    for _ in range(5):  # BURST_SECONDS worth of opens
+        throttle.throttle_open()
+    assert clock.slept == 0
+    for _ in range(100):
+        throttle.throttle_open()
+    # Each open books 0.1 s of a timeline that started BURST_SECONDS in the past; the last one waits for its start
+    assert clock.slept == pytest.approx((5 + 100 - 1) / 10 - throttle.BURST_SECONDS)
+
+
+def test_read_rate_is_shared_per_byte(clock):
+    throttle.configure(max_read_rate=1024 * 1024)
+    for _ in range(40):
+        throttle.throttle_read(256 * 1024)
+    # 10 MB at 1 MB/s, less the burst the idle limiter lets through and the last read's own slot
+    assert clock.slept == pytest.approx((40 - 1) * 0.25 - throttle.BURST_SECONDS)
+
+
+def _feed(clock, seconds_per_mb, count):
+    for _ in range(count):
+        clock.now += throttle.ADJUST_INTERVAL
+        throttle.record_latency(seconds_per_mb, throttle.LATENCY_UNIT)
+
+
+def test_slow_reads_lower_the_rate_multiplicatively_down_to_the_floor(clock):
+    ceiling = 100 * 1024 * 1024
+    throttle.configure(max_read_rate=ceiling, target_latency=0.01)
+    _feed(clock, 0.05, 1)
+    assert throttle.current_read_rate() == pytest.approx(ceiling * throttle.DECREASE_FACTOR)
+    _feed(clock, 0.05, 100)
+    assert throttle.current_read_rate() == pytest.approx(ceiling * throttle.MIN_RATE_SHARE)
+
+
+def test_fast_reads_raise_the_rate_additively_up_to_the_ceiling(clock):
+    ceiling = 100 * 1024 * 1024
+    throttle.configure(max_read_rate=ceiling, target_latency=0.01)
+    _feed(clock, 0.05, 100)
+    floor = throttle.current_read_rate()
+    # The moving average needs a few fast samples before it drops under the target
+    _feed(clock, 0.001, 20)
+    assert floor < throttle.current_read_rate() < ceiling
+    _feed(clock, 0.001, 100)
+    assert throttle.current_read_rate() == pytest.approx(ceiling)
+
+
+def test_short_reads_weigh_less(clock):
+    throttle.configure(max_read_rate=100 * 1024 * 1024, target_latency=0.01)
+    _feed(clock, 0.001, 1)
+    # A 4 KB read taking 1 ms is 256 ms per MB, but only nudges the average
+    clock.now += throttle.ADJUST_INTERVAL
+    throttle.record_latency(0.001, 4096)
+    assert throttle._state[throttle._LATENCY] < 0.01
+
+
+@pytest.mark.parametrize("options", [{"target_latency": 0.01}, {"max_read_rate": 0}, {"max_open_rate": -1}])
+def test_configure_rejects_invalid_limits(clock, options):
+    with pytest.raises(ValueError):
+        throttle.configure(**options)
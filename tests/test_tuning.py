@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from file_manager_meta import filters, throttle, tuning
+from file_manager_meta.cache_paths import _get_cache_dir
+from file_manager_meta.tuning import StorageProfile
+
+
+@pytest.fixture
+def calibration_tree(tmp_path, monkeypatch):
+    """A tree with a few 64 KB files, and calibration constants small enough to calibrate on it quickly."""
+    directory = tmp_path / "tree"
+    for relative in ("a.bin", "sub/b.bin", "sub/deeper/c.bin"):
+        path = directory / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(os.urandom(64 * 1024))
+    monkeypatch.setattr(tuning, "CALIBRATION_MIN_FILE_SIZE", 1)
+    monkeypatch.setattr(tuning, "CALIBRATION_MIN_BYTES", 1)
+    monkeypatch.setattr(tuning, "CALIBRATION_SECONDS", 0.01)
+    monkeypatch.setattr(tuning, "CALIBRATION_QUEUE_DEPTHS", (1, 2))
+    monkeypatch.setattr(tuning, "CALIBRATION_BLOCK_SIZES", (4096, 8192))
+    monkeypatch.setattr(throttle, "_settings", None)
+    monkeypatch.setattr(throttle, "_state", None)
+    return directory
+
+
+def test_sample_files_applies_anchored_rules(calibration_tree, monkeypatch):
+    (calibration_tree / "other" / "sub").mkdir(parents=True)
+    (calibration_tree / "other" / "sub" / "d.bin").write_bytes(b"d")
+    monkeypatch.setattr(filters, "_active", filters.PathFilter([*filters.DEFAULT_RULES, "/sub/"]))
+    sampled = {os.path.relpath(path, calibration_tree) for path, _ in tuning._sample_files(calibration_tree)}
+    assert sampled == {"a.bin", os.path.join("other", "sub", "d.bin")}
+
+
+@pytest.mark.parametrize("direct", [True, False])
+def test_calibration_is_throttled_and_only_drops_what_it_read(calibration_tree, monkeypatch, direct):
+    if not direct:
+        monkeypatch.delattr(os, "O_DIRECT", raising=False)
+    throttled_reads, opens, advice = [], [], []
+    monkeypatch.setattr(tuning, "throttle_read", throttled_reads.append)
+    monkeypatch.setattr(tuning, "throttle_open", lambda: opens.append(1))
+    monkeypatch.setattr(os, "posix_fadvise", lambda *args: advice.append(args), raising=False)
+
+    profile = StorageProfile("ssd", 1, 4096, None, calibrated=False)
+    calibrated = tuning._calibrate(calibration_tree, "ssd", profile)
+    assert calibrated.calibrated and calibrated.read_block_size in (4096, 8192)
+    assert len(opens) == 3
+    assert throttled_reads and all(0 < length <= 8192 for length in throttled_reads)
+    # Never the whole file (length 0): only the blocks that were read, and only those read through the page cache
+    assert all(0 < length <= 8192 and offset % 4096 == 0 and flag == os.POSIX_FADV_DONTNEED
+               for _, offset, length, flag in advice)
+    if not direct:
+        assert advice
+
+
+def test_profiles_calibrated_under_a_read_limit_are_not_saved(calibration_tree, monkeypatch):
+    monkeypatch.setattr(tuning, "_overrides", tuning.TuningOverrides(None, None, None, True))
+    profiles_file = _get_cache_dir() / tuning.PROFILES_FILE_NAME
+
+    throttle.configure(max_read_rate=10 ** 12)
+    assert tuning.storage_profile(calibration_tree).calibrated
+    assert not profiles_file.exists()
+
+    monkeypatch.setattr(throttle, "_settings", None)
+    assert tuning.storage_profile(calibration_tree).calibrated
+    assert profiles_file.exists()
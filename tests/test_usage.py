@@ -0,0 +1,64 @@
+import os
+
+from file_manager_meta import filters
+from file_manager_meta.cache_manager import init_cache
+from file_manager_meta.usage import scan_usage
+
+
+def _make_tree(tmp_path):
+    directory = tmp_path / "tree"
+    for relative_path, size in [("a.txt", 10), ("photos/b.jpg", 2000), ("photos/c.jpg", 3000),
+                                ("music/d.mp3", 500), (".hidden/e.txt", 1)]:
+        path = directory / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * size)
+    return directory
+
+
+def _scan(directory):
+    conn, _ = init_cache(directory)
+    try:
+        return scan_usage(directory, conn)
+    finally:
+        conn.close()
+
+
+def test_scan_usage_summarizes_each_directory(tmp_path):
+    directory = _make_tree(tmp_path)
+    usage, reused, rescanned = _scan(directory)
+    assert (reused, rescanned) == (0, 3)  # The hidden directory is skipped like in every other command
+    assert usage[str(directory / "photos")]["files"] == 2
+    assert usage[str(directory / "photos")]["bytes"] == 5000
+    assert usage[str(directory / "photos")]["extensions"] == {".jpg": [2, 5000]}
+
+
+def test_unchanged_directories_are_reused(tmp_path):
+    directory = _make_tree(tmp_path)
+    first, _, _ = _scan(directory)
+    usage, reused, rescanned = _scan(directory)
+    assert (reused, rescanned) == (3, 0)
+    assert usage == first
+
+
+def test_changed_directory_is_rescanned(tmp_path):
+    directory = _make_tree(tmp_path)
+    _scan(directory)
+    (directory / "music" / "f.mp3").write_bytes(b"y" * 100)
+    # Some filesystems keep the directory's mtime for a burst of changes; make the change visible
+    stat_info = os.stat(directory / "music")
+    os.utime(directory / "music", ns=(stat_info.st_atime_ns, stat_info.st_mtime_ns + 1_000_000_000))
+    usage, reused, rescanned = _scan(directory)
+    assert (reused, rescanned) == (2, 1)
+    assert usage[str(directory / "music")]["files"] == 2
+
+
+def test_snapshots_taken_with_another_filter_are_rescanned(tmp_path, monkeypatch):
+    directory = _make_tree(tmp_path)
+    monkeypatch.setattr(filters, "_active", filters.PathFilter(extensions=["jpg"]))
+    usage, _, _ = _scan(directory)
+    assert usage[str(directory / "music")]["files"] == 0
+
+    monkeypatch.setattr(filters, "_active", filters.PathFilter())
+    usage, reused, rescanned = _scan(directory)
+    assert (reused, rescanned) == (0, 3)
+    assert usage[str(directory / "music")]["files"] == 1
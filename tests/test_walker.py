@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from file_manager_meta import filters
+from file_manager_meta.walker import is_excluded_file, walk_files
+
+
+def _make_tree(directory, relative_paths):
+    for relative_path in relative_paths:
+        path = directory / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+
+
+def _walked(directory):
+    return sorted(record.path.relative_to(directory).as_posix() for record in walk_files(directory))
+
+
+def test_walk_skips_hidden_entries_and_prunes_excluded_directories(tmp_path, monkeypatch):
+    _make_tree(tmp_path, ["a.txt", ".b.txt", ".git/c", "build/d.o", "src/build/e.o", "src/f.py"])
+    assert _walked(tmp_path) == ["a.txt", "build/d.o", "src/build/e.o", "src/f.py"]
+    monkeypatch.setattr(filters, "_active", filters.PathFilter([*filters.DEFAULT_RULES, "/build/"]))
+    assert _walked(tmp_path) == ["a.txt", "src/build/e.o", "src/f.py"]
+
+
+def test_explicit_files_follow_anchored_rules(tmp_path, monkeypatch):
+    _make_tree(tmp_path, ["docs/a.pdf", "src/docs/b.pdf", "build/c", "d"])
+    monkeypatch.setattr(filters, "_active", filters.PathFilter([*filters.DEFAULT_RULES, "docs/*.pdf", "/build/"]))
+    assert is_excluded_file(tmp_path / "docs" / "a.pdf", tmp_path)
+    assert not is_excluded_file(tmp_path / "src" / "docs" / "b.pdf", tmp_path)
+    assert is_excluded_file(tmp_path / "build" / "c", tmp_path)
+    assert not is_excluded_file(tmp_path / "d", tmp_path)
+    # Outside the root only the name counts
+    assert not is_excluded_file(tmp_path / "docs" / "a.pdf", tmp_path / "src")
+
+
+def test_explicit_files_follow_includes_and_hidden_rules(tmp_path, monkeypatch):
+    assert is_excluded_file(tmp_path / ".hidden", tmp_path)
+    monkeypatch.setattr(filters, "_active", filters.PathFilter(includes=["photos/"]))
+    assert not is_excluded_file(tmp_path / "photos" / "a", tmp_path)
+    assert is_excluded_file(tmp_path / "music" / "a", tmp_path)
+    assert is_excluded_file(Path("music") / "a", Path("."))
@@ -0,0 +1,28 @@
+from file_manager_meta import filters
+from file_manager_meta.cache_manager import init_cache, iter_cached_paths, set_cached_hashes
+from file_manager_meta.records import FileRecord
+from file_manager_meta.watcher import _CacheWarmer
+
+
+def test_full_rescan_hashes_misses_and_prunes_only_vanished_files(tmp_path, monkeypatch):
+    directory = tmp_path / "tree"
+    directory.mkdir()
+    for name in (".hidden.jpg", "x.tmp", "y.txt", "gone.txt", "new.txt"):
+        (directory / name).write_bytes(name.encode())
+    conn, _ = init_cache(directory)
+    try:
+        for name in (".hidden.jpg", "x.tmp", "y.txt", "gone.txt"):
+            path = directory / name
+            set_cached_hashes(conn, path, FileRecord.from_path(path), {"create_date": "2021:06:01 12:30:45"})
+    finally:
+        conn.close()
+    (directory / "gone.txt").unlink()
+    monkeypatch.setattr(filters, "_active", filters.PathFilter([*filters.DEFAULT_RULES, "*.tmp"]))
+
+    warmer = _CacheWarmer(directory)
+    try:
+        assert warmer.full_rescan() == 2  # y.txt only had a date, new.txt wasn't cached
+        cached = {path.name for path in iter_cached_paths(warmer.conn)}
+    finally:
+        warmer.close()
+    assert cached == {".hidden.jpg", "x.tmp", "y.txt", "new.txt"}